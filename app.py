@@ -5,21 +5,39 @@
 системой хеширования паролей: SHA1(salt + password)., пока что работает только наоборот
 """
 from dateutil.relativedelta import relativedelta
-from datetime import datetime, date, timezone
+from datetime import datetime, date, timedelta, timezone
 import os
 import hashlib
 from sqlalchemy import func, case, and_, or_
 from flask_sqlalchemy import SQLAlchemy
 from decimal import Decimal, InvalidOperation
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from dotenv import load_dotenv
+import click
 from flask import Flask, flash, redirect, render_template, request, url_for, abort, send_file, Response, jsonify
 from werkzeug.utils import secure_filename
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 
 
-from models import Equipment, Nome, Org, Places, Users, db, GroupNome, Vendor, Department, Knt, Invoices, InvoiceEquipment, UsersRoles, UsersProfile, Category, Move, AppComponents, NomeComponents, PostUsers, News, EquipmentTempUsage
+from models import Equipment, Nome, Org, Places, Users, db, GroupNome, Vendor, Department, Knt, Invoices, InvoiceEquipment, UsersRoles, UsersProfile, Category, Move, AppComponents, NomeComponents, PostUsers, News, EquipmentTempUsage, ReportJob, IngestReceipt, EnrichmentJob, InventoryAudit
+from services import (AUDIT_SCAN_BATCH, GPU_API_DATA_FILE, INGEST_BATCH, LOOKUP_BATCH, MOVE_SORT,
+                      SSE_FLASK_FALLBACK, AuditClosed, EquipmentFilter, IngestQueueFull, MoveHistoryResolver,
+                      add_scans, apply_v1_payload, apply_v2_payload, artifact_exists, audit_params,
+                      audit_status, availability, availability_window, build_dashboard_stats,
+                      build_machine_stats, classify_disk_model, classify_disk_models, clean_gpu_model,
+                      close_audit, device_statuses, enqueue_cpu_enrichment, enqueue_payload, enqueue_report,
+                      enrichment_status, fetch_cpu_data, find_vendor_id, find_vendor_name,
+                      form8_equipment_query, form8_params, get_department_stats, get_gpu_catalog,
+                      get_place_stats, get_user_summary, gpu_match_pair, ingest_queued, invalidate_vendors,
+                      iter_keyset_batches, job_params, job_status, keyset_page, last_transition_id,
+                      lookup_code, lookup_codes, lookup_stats, match_machine_equipment, nav_params,
+                      network_devices_query, open_audit, page_args, parse_last_event_id, queue_stats,
+                      rebuild_stats_rollup, receipt_status, reconcile_audit, replace_gpu_catalog,
+                      resolve_gpu_matches, run_enrichment_worker, run_ingest_worker, run_monitor, run_worker,
+                      search_equipment, snapshot_age, snapshot_events, snapshot_is_stale, status_changes,
+                      stored_match, sync_machine_to_equipment, touch_artifact, update_gpu_entry,
+                      uptime_by_device, uptime_percent, uptime_totals)
 
 # Загружаем переменные окружения из .env
 load_dotenv()
@@ -81,9 +99,6 @@ app.jinja_env.globals['convert_health_status'] = convert_health_status_to_russia
 def inject_user_data():
     """Добавляет данные пользователя во все шаблоны."""
     if current_user.is_authenticated:
-        is_admin = current_user.mode == 1
-        is_mol = current_user_has_role(1)
-        
         # В тестовом режиме используем мок-данные
         if TEST_MODE:
             return {
@@ -91,47 +106,28 @@ def inject_user_data():
                 'user_photo': url_for('static', filename='uploads/noimage.jpg'),
                 'tmc_count': 0,  # Тестовые данные
                 'total_cost': 0,  # Тестовые данные
-                'is_admin': is_admin,
-                'is_mol': is_mol,
+                'is_admin': current_user.mode == 1,
+                'is_mol': current_user_has_role(1),
                 'user_org_name': 'Тестовая организация',
                 'user_org_id': current_user.orgid if hasattr(current_user, 'orgid') else 1,
                 'test_mode': True
             }
         
-        # Реальный режим: запрос ТМЦ для пользователя или всех (если админ)
-        if is_admin:
-            tmc_query = Equipment.query.filter_by(active=True, os=True)
-        else:
-            tmc_query = Equipment.query.filter_by(usersid=current_user.id, active=True, os=True)
-        
-        tmc_count = tmc_query.count()
-        total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-            Equipment.id.in_([eq.id for eq in tmc_query.all()])
-        ).scalar() or 0
-        
-        # Фото пользователя
-        from models import UsersProfile
-        profile = UsersProfile.query.filter_by(usersid=current_user.id).first()
-        if profile and profile.jpegphoto and profile.jpegphoto != 'noimage.jpg':
-            user_photo = url_for('static', filename=f'uploads/{profile.jpegphoto}')
+        # Реальный режим: шапка пользователя (ТМЦ, фото, организация, роли) из кэша
+        summary = get_user_summary(current_user)
+        if summary['photo']:
+            user_photo = url_for('static', filename=f"uploads/{summary['photo']}")
         else:
             user_photo = url_for('static', filename='uploads/noimage.jpg')
-        
-        # Название организации пользователя
-        user_org_name = None
-        if hasattr(current_user, 'orgid') and current_user.orgid:
-            org = db.session.get(Org, current_user.orgid)
-            if org:
-                user_org_name = org.name
-        
+
         return {
             'user_login': current_user.login,
             'user_photo': user_photo,
-            'tmc_count': tmc_count,
-            'total_cost': total_cost,
-            'is_admin': is_admin,
-            'is_mol': is_mol,
-            'user_org_name': user_org_name,
+            'tmc_count': summary['tmc_count'],
+            'total_cost': summary['total_cost'],
+            'is_admin': summary['is_admin'],
+            'is_mol': summary['is_mol'],
+            'user_org_name': summary['org_name'],
             'user_org_id': current_user.orgid if hasattr(current_user, 'orgid') else None,
             'test_mode': False
         }
@@ -313,144 +309,13 @@ def index():
                              is_admin=is_admin,
                              user_login=current_user.login)
     
-    # Реальный режим: запрос ТМЦ для пользователя или всех (если админ)
-    if is_admin:
-        tmc_query = Equipment.query.filter_by(active=True, os=True)
-    else:
-        tmc_query = Equipment.query.filter_by(usersid=current_user.id, active=True, os=True)
-
-    tmc_count = tmc_query.count()
-    total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-        Equipment.id.in_([eq.id for eq in tmc_query.all()])
-    ).scalar()
-
-    # Подсчёт активных пользователей (только для админа)
-    active_users = 0
-    stats_data = {}
-    
-    if is_admin:
-        active_users = db.session.query(Equipment.usersid).filter(
-            Equipment.active == True,
-            Equipment.os == True
-        ).distinct().count()
-        
-        # Статистика по категориям (количество ТМЦ)
-        category_stats = db.session.query(
-            Category.name.label('category_name'),
-            func.count(Equipment.id).label('count')
-        ).join(GroupNome, Category.id == GroupNome.category_id)\
-         .join(Nome, GroupNome.id == Nome.groupid)\
-         .join(Equipment, Nome.id == Equipment.nomeid)\
-         .filter(Equipment.active == True, Equipment.os == True)\
-         .group_by(Category.id, Category.name)\
-         .order_by(func.count(Equipment.id).desc())\
-         .all()
-        
-        stats_data['category_labels'] = [row.category_name for row in category_stats] if category_stats else []
-        stats_data['category_counts'] = [row.count for row in category_stats] if category_stats else []
-        
-        # Статистика по категориям (стоимость)
-        category_cost_stats = db.session.query(
-            Category.name.label('category_name'),
-            func.coalesce(func.sum(Equipment.cost), 0).label('total_cost')
-        ).join(GroupNome, Category.id == GroupNome.category_id)\
-         .join(Nome, GroupNome.id == Nome.groupid)\
-         .join(Equipment, Nome.id == Equipment.nomeid)\
-         .filter(Equipment.active == True, Equipment.os == True)\
-         .group_by(Category.id, Category.name)\
-         .order_by(func.sum(Equipment.cost).desc())\
-         .all()
-        
-        stats_data['category_cost_labels'] = [row.category_name for row in category_cost_stats] if category_cost_stats else []
-        stats_data['category_costs'] = [float(row.total_cost) for row in category_cost_stats] if category_cost_stats else []
-        
-        # Статистика по отделам
-        department_stats = db.session.query(
-            Department.name.label('department_name'),
-            func.count(Equipment.id).label('count')
-        ).join(Equipment, Department.id == Equipment.department_id)\
-         .filter(Equipment.active == True, Equipment.os == True)\
-         .group_by(Department.id, Department.name)\
-         .order_by(func.count(Equipment.id).desc())\
-         .limit(10)\
-         .all()
-        
-        stats_data['department_labels'] = [row.department_name for row in department_stats] if department_stats else []
-        stats_data['department_counts'] = [row.count for row in department_stats] if department_stats else []
-        
-        # Топ пользователей по количеству ТМЦ
-        user_stats = db.session.query(
-            Users.login.label('user_login'),
-            func.count(Equipment.id).label('count')
-        ).join(Equipment, Users.id == Equipment.usersid)\
-         .filter(Equipment.active == True, Equipment.os == True)\
-         .group_by(Users.id, Users.login)\
-         .order_by(func.count(Equipment.id).desc())\
-         .limit(10)\
-         .all()
-        
-        stats_data['user_labels'] = [row.user_login for row in user_stats] if user_stats else []
-        stats_data['user_counts'] = [row.count for row in user_stats] if user_stats else []
-        
-        # Динамика добавления ТМЦ по месяцам (последние 12 месяцев)
-        twelve_months_ago = datetime.now() - relativedelta(days=365)
-        
-        # Получаем все ТМЦ за последний год
-        all_equipment = Equipment.query.filter(
-            Equipment.active == True,
-            Equipment.os == True,
-            Equipment.datepost >= twelve_months_ago
-        ).all()
-        
-        # Группируем по месяцам в Python
-        monthly_dict = {}
-        for eq in all_equipment:
-            month_key = eq.datepost.strftime('%Y-%m') if eq.datepost else None
-            if month_key:
-                monthly_dict[month_key] = monthly_dict.get(month_key, 0) + 1
-        
-        # Сортируем по месяцам
-        sorted_months = sorted(monthly_dict.keys())
-        stats_data['monthly_labels'] = sorted_months if sorted_months else []
-        stats_data['monthly_counts'] = [monthly_dict[month] for month in sorted_months] if sorted_months else []
-        
-        # Статусы ТМЦ
-        repair_count = Equipment.query.filter_by(active=True, os=True, repair=True).count()
-        active_count = Equipment.query.filter_by(active=True, os=True, repair=False).count()
-        
-        stats_data['status_labels'] = ['Активные', 'В ремонте']
-        stats_data['status_counts'] = [active_count, repair_count]
-        
-        # Статистика по категориям компьютерной периферии (группировка по группам)
-        # Получаем статистику по группам периферии (os=False)
-        peripheral_stats = db.session.query(
-            GroupNome.name.label('group_name'),
-            func.count(Equipment.id).label('count')
-        ).join(Nome, GroupNome.id == Nome.groupid)\
-         .join(Equipment, Nome.id == Equipment.nomeid)\
-         .filter(Equipment.active == True, Equipment.os == False)\
-         .group_by(GroupNome.id, GroupNome.name)\
-         .order_by(func.count(Equipment.id).desc())\
-         .all()
-        
-        stats_data['peripheral_stats'] = [
-            {'name': row.group_name, 'count': row.count} 
-            for row in peripheral_stats
-        ] if peripheral_stats else []
-
-    # Фото пользователя (только в реальном режиме)
-    if not TEST_MODE:
-        from models import UsersProfile
-        profile = UsersProfile.query.filter_by(usersid=current_user.id).first()
-        if profile and profile.jpegphoto and profile.jpegphoto != 'noimage.jpg':
-            user_photo = url_for('static', filename=f'uploads/{profile.jpegphoto}')
-        else:
-            user_photo = url_for('static', filename='uploads/noimage.jpg')
+    # Статистика для админа: все виджеты считаются общим модулем агрегатов
+    stats_data = build_dashboard_stats() if is_admin else {}
 
     # Новости: закрепленные сверху, затем остальные, максимум 5 (только в реальном режиме)
     if not TEST_MODE:
-        pinned_news = News.query.filter_by(stiker=True, pinned=True).order_by(News.dt.desc()).all()
-        unpinned_news = News.query.filter_by(stiker=True, pinned=False).order_by(News.dt.desc()).all()
+        pinned_news = News.query.filter_by(stiker=True, pinned=True).order_by(News.dt.desc()).limit(1).all()
+        unpinned_news = News.query.filter_by(stiker=True, pinned=False).order_by(News.dt.desc()).limit(5).all()
         
         # Объединяем: сначала закрепленные, затем остальные, максимум 5
         news_list = []
@@ -470,24 +335,12 @@ def index():
     else:
         news_list = []
 
-    # Подготавливаем переменные для шаблона
-    template_vars = {
-        'news_list': news_list,
-        'is_admin': is_admin,
-        'user_login': current_user.login
-    }
-    
-    # Добавляем stats_data только если он был создан (для админа)
-    if 'stats_data' in locals():
-        template_vars['stats_data'] = stats_data
-    else:
-        template_vars['stats_data'] = {}
-    
-    # Добавляем user_photo если он был создан
-    if 'user_photo' in locals():
-        template_vars['user_photo'] = user_photo
-    
-    return render_template('tmc/index.html', **template_vars)
+    # Фото пользователя добавляется контекстным процессором inject_user_data
+    return render_template('tmc/index.html',
+                           news_list=news_list,
+                           stats_data=stats_data,
+                           is_admin=is_admin,
+                           user_login=current_user.login)
 
 
 @app.route('/add', methods=['GET', 'POST'])
@@ -1019,6 +872,8 @@ def add_vendor_ajax():
             db.text("INSERT INTO vendor (name, active, comment) VALUES (:name, :active, :comment)"),
             {'name': name, 'active': 1, 'comment': ''}
         )
+        # Прямой SQL не проходит через ORM — сбрасываем справочник производителей сами
+        invalidate_vendors()
         db.session.commit()
         # Получаем ID вставленной записи
         vendor_id = result.lastrowid
@@ -1068,9 +923,10 @@ def bulk_edit_nome(nome_id):
         flash('Доступ запрещён. Групповое редактирование доступно только администраторам.', 'danger')
         return redirect(url_for('index'))
     
-    # Получаем все ТМЦ с этим nomeid
-    tmc_list = Equipment.query.filter_by(nomeid=nome_id).all()
-    if not tmc_list:
+    # ТМЦ с этим nomeid обрабатываются пачками, целиком в память не загружаются
+    tmc_query = Equipment.query.filter_by(nomeid=nome_id)
+    tmc_count = tmc_query.count()
+    if not tmc_count:
         flash('Нет ТМЦ с таким наименованием.', 'warning')
         return redirect(url_for('index'))
     # Получаем объект Nome для обновления фото
@@ -1079,6 +935,7 @@ def bulk_edit_nome(nome_id):
     suppliers = Knt.query.filter_by(active=1).all()
     if request.method == 'POST':
         try:
+            new_photo = None
             # Обработка фото для группы
             if 'nome_photo' in request.files:
                 file = request.files['nome_photo']
@@ -1099,10 +956,8 @@ def bulk_edit_nome(nome_id):
                                 os.remove(old_path)
                     # Устанавливаем новое фото для Nome
                     nome.photo = photo_filename
-                    # Применяем это фото ко всем ТМЦ с пустым полем photo
-                    for tmc in tmc_list:
-                        if not tmc.photo:  # обрабатывает и None, и пустую строку
-                            tmc.photo = photo_filename
+                    # Это фото применяется ко всем ТМЦ с пустым полем photo (в цикле ниже)
+                    new_photo = photo_filename
 
             cost_str = request.form.get('cost', '').strip()
             currentcost_str = request.form.get('currentcost', '').strip()
@@ -1123,36 +978,40 @@ def bulk_edit_nome(nome_id):
             # Сохраняем комментарий для модели Nome
             nome.comment = comment if comment else None
             
-            for tmc in tmc_list:
-                tmc.cost = cost
-                tmc.currentcost = currentcost
-                tmc.os = is_os
-                tmc.kntid = kntid
-                # Устанавливаем комментарий
-                if apply_to_tmc:
-                    tmc.comment = comment if comment else None
-                
-                if date_start_str:
-                    start_date = datetime.strptime(date_start_str, '%Y-%m-%d')
-                    tmc.datepost = start_date
-                    # Гарантия: если не задана — +1 год
-                    if not dtendgar_str:
-                        tmc.dtendgar = (start_date + relativedelta(years=1)).date()
-                    else:
-                        tmc.dtendgar = datetime.strptime(dtendgar_str, '%Y-%m-%d').date()
-                    # Срок службы: если не задан — +5 лет
-                    if not dtendlife_str:
-                        tmc.dtendlife = (start_date + relativedelta(years=5)).date()
+            start_date = datetime.strptime(date_start_str, '%Y-%m-%d') if date_start_str else None
+            dtendgar = datetime.strptime(dtendgar_str, '%Y-%m-%d').date() if dtendgar_str else None
+            dtendlife = datetime.strptime(dtendlife_str, '%Y-%m-%d').date() if dtendlife_str else None
+
+            # Пачками по id: после flush пачка выгружается из сессии, так что память
+            # не растет с количеством ТМЦ, а изменения видят обработчики after_flush
+            for batch in iter_keyset_batches(tmc_query, [(Equipment.id, False)]):
+                for tmc in batch:
+                    if new_photo and not tmc.photo:  # обрабатывает и None, и пустую строку
+                        tmc.photo = new_photo
+                    tmc.cost = cost
+                    tmc.currentcost = currentcost
+                    tmc.os = is_os
+                    tmc.kntid = kntid
+                    # Устанавливаем комментарий
+                    if apply_to_tmc:
+                        tmc.comment = comment if comment else None
+
+                    if start_date:
+                        tmc.datepost = start_date
+                        # Гарантия: если не задана — +1 год; срок службы: если не задан — +5 лет
+                        tmc.dtendgar = dtendgar or (start_date + relativedelta(years=1)).date()
+                        tmc.dtendlife = dtendlife or (start_date + relativedelta(years=5)).date()
                     else:
-                        tmc.dtendlife = datetime.strptime(dtendlife_str, '%Y-%m-%d').date()
-                else:
-                    # Если дата начала не указана — сохраняем только то, что вручную задано
-                    if dtendgar_str:
-                        tmc.dtendgar = datetime.strptime(dtendgar_str, '%Y-%m-%d').date()
-                    if dtendlife_str:
-                        tmc.dtendlife = datetime.strptime(dtendlife_str, '%Y-%m-%d').date()
+                        # Если дата начала не указана — сохраняем только то, что вручную задано
+                        if dtendgar:
+                            tmc.dtendgar = dtendgar
+                        if dtendlife:
+                            tmc.dtendlife = dtendlife
+                db.session.flush()
+                for tmc in batch:
+                    db.session.expunge(tmc)
             db.session.commit()
-            flash(f'Групповое редактирование успешно выполнено для {len(tmc_list)} ТМЦ!', 'success')
+            flash(f'Групповое редактирование успешно выполнено для {tmc_count} ТМЦ!', 'success')
             return redirect(url_for('index'))
         except (ValueError, InvalidOperation) as e:
             flash('Ошибка: Некорректный формат данных. Проверьте стоимость (например: 123.45) и даты (в формате ГГГГ-ММ-ДД).', 'danger')
@@ -1160,12 +1019,12 @@ def bulk_edit_nome(nome_id):
             db.session.rollback()
             flash(f'Произошла ошибка при сохранении: {str(e)}', 'danger')
     # Для GET-запроса: предзаполняем форму данными из первого ТМЦ
-    first_tmc = tmc_list[0]
+    first_tmc = tmc_query.order_by(Equipment.id).first()
     return render_template('nomenclature/bulk_edit_nome.html',
                        nome=nome,
                        nome_id=nome_id,
                        nome_name=nome.name,
-                       tmc_count=len(tmc_list),
+                       tmc_count=tmc_count,
                        first_tmc=first_tmc,
                        suppliers=suppliers)
 
@@ -1253,6 +1112,9 @@ def edit_nome_group(nome_id):
                          is_admin=is_admin,
                          is_mol=is_mol)
 
+# Порядок постраничного вывода ТМЦ наименования: инвентарный номер, затем id
+LIST_BY_NOME_SORT = [(func.coalesce(Equipment.invnum, ''), False), (Equipment.id, False)]
+
 @app.route('/list_by_nome/<int:nome_id>')
 @login_required
 def list_by_nome(nome_id):
@@ -1270,6 +1132,7 @@ def list_by_nome(nome_id):
         return render_template('tmc/list_by_nome.html',
                              nome=nome,
                              tmc_list=[],
+                             tmc_count=0,
                              component_template=[],
                              is_admin=current_user.mode == 1,
                              is_mol=current_user_has_role(1))
@@ -1278,13 +1141,16 @@ def list_by_nome(nome_id):
     # Проверяем, является ли пользователь администратором
     is_admin = current_user.mode == 1
 
-    # Получаем список ТМЦ, фильтруя по nomeid и, если пользователь не админ, по его id
-    query = Equipment.query.filter_by(nomeid=nome_id)
-
-    if not is_admin:
-        query = query.filter_by(usersid=current_user.id)
-
-    tmc_list = query.all()
+    # ТМЦ наименования (для не-админа — только свои): постранично по (invnum, id)
+    tmc_filter = EquipmentFilter(nome_id=nome_id, user_id=None if is_admin else current_user.id,
+                                 os=None, active=None)
+    tmc_count = tmc_filter.query().count()
+    try:
+        page = keyset_page(tmc_filter.query().options(db.joinedload(Equipment.nome)),
+                           LIST_BY_NOME_SORT, **page_args(request.args))
+    except ValueError:
+        abort(400)
+    tmc_list = page.items
 
     # Получаем шаблон комплекта для этого типа
     component_template = NomeComponents.query.filter_by(id_nome_main=nome_id).order_by(NomeComponents.sort_order).all()
@@ -1292,110 +1158,15 @@ def list_by_nome(nome_id):
     # Проверяем, является ли пользователь МОЛ
     is_mol = current_user_has_role(1)
     
-    # Собираем статистику по машинам, привязанным к ТМЦ этой группы
-    machine_stats = None
-    tmc_ids = [tmc.id for tmc in tmc_list]
-    
-    if tmc_ids:
-        from models import Machine, PCGraphicsCard, PCHardDrive, PCMemoryModule
-        from sqlalchemy import func, case
-        from collections import Counter
-        
-        # Получаем все машины, привязанные к ТМЦ этой группы
-        machines = Machine.query.filter(Machine.equipment_id.in_(tmc_ids)).all()
-        
-        if machines:
-            total_machines = len(machines)
-            
-            # 1. Статистика по ОС
-            os_counter = Counter()
-            for m in machines:
-                if m.os_name:
-                    os_name = m.os_name
-                    if m.os_version:
-                        os_name += f" {m.os_version}"
-                    os_counter[os_name] += 1
-            most_common_os = os_counter.most_common(1)[0] if os_counter else None
-            os_percent = round((most_common_os[1] / total_machines * 100), 1) if most_common_os else 0
-            
-            # 2. Статистика по материнским платам
-            mb_counter = Counter()
-            for m in machines:
-                if m.motherboard:
-                    mb_counter[m.motherboard] += 1
-            most_common_mb = mb_counter.most_common(1)[0] if mb_counter else None
-            mb_percent = round((most_common_mb[1] / total_machines * 100), 1) if most_common_mb else 0
-            
-            # 3. Статистика по видеокартам
-            machine_ids = [m.id for m in machines]
-            graphics_cards = PCGraphicsCard.query.filter(
-                PCGraphicsCard.machine_id.in_(machine_ids),
-                PCGraphicsCard.active == True
-            ).all()
-            gpu_counter = Counter()
-            for gc in graphics_cards:
-                if gc.model:
-                    gpu_counter[gc.model] += 1
-            most_common_gpu = gpu_counter.most_common(1)[0] if gpu_counter else None
-            total_gpus = len(graphics_cards)
-            gpu_percent = round((most_common_gpu[1] / total_gpus * 100), 1) if most_common_gpu and total_gpus > 0 else 0
-            
-            # 4. Статистика по HDD
-            hard_drives = PCHardDrive.query.filter(
-                PCHardDrive.machine_id.in_(machine_ids),
-                PCHardDrive.active == True
-            ).all()
-            hdd_counter = Counter()
-            for hd in hard_drives:
-                if hd.model:
-                    hdd_counter[hd.model] += 1
-            most_common_hdd = hdd_counter.most_common(1)[0] if hdd_counter else None
-            total_hdds = len(hard_drives)
-            hdd_percent = round((most_common_hdd[1] / total_hdds * 100), 1) if most_common_hdd and total_hdds > 0 else 0
-            
-            # 5. Статистика по ОЗУ (по комбинации capacity_gb + memory_type)
-            memory_modules = PCMemoryModule.query.filter(
-                PCMemoryModule.machine_id.in_(machine_ids),
-                PCMemoryModule.active == True
-            ).all()
-            ram_counter = Counter()
-            for mm in memory_modules:
-                if mm.capacity_gb:
-                    ram_str = f"{mm.capacity_gb}GB"
-                    if mm.memory_type:
-                        ram_str += f" {mm.memory_type}"
-                    ram_counter[ram_str] += 1
-            most_common_ram = ram_counter.most_common(1)[0] if ram_counter else None
-            total_ram_modules = len(memory_modules)
-            ram_percent = round((most_common_ram[1] / total_ram_modules * 100), 1) if most_common_ram and total_ram_modules > 0 else 0
-            
-            machine_stats = {
-                'total_machines': total_machines,
-                'os': {
-                    'name': most_common_os[0] if most_common_os else None,
-                    'percent': os_percent
-                },
-                'motherboard': {
-                    'name': most_common_mb[0] if most_common_mb else None,
-                    'percent': mb_percent
-                },
-                'graphics_card': {
-                    'name': most_common_gpu[0] if most_common_gpu else None,
-                    'percent': gpu_percent
-                },
-                'hard_drive': {
-                    'name': most_common_hdd[0] if most_common_hdd else None,
-                    'percent': hdd_percent
-                },
-                'memory': {
-                    'name': most_common_ram[0] if most_common_ram else None,
-                    'percent': ram_percent
-                }
-            }
+    # Статистика по машинам, привязанным ко всем ТМЦ этой группы (не только к текущей странице)
+    machine_stats = build_machine_stats(tmc_filter.ids_subquery()) if tmc_count else None
 
     return render_template('tmc/list_by_nome.html',
                            nome=nome,
                            tmc_list=tmc_list,
+                           tmc_count=tmc_count,
+                           page=page,
+                           nav_params=nav_params(request.args, nome_id=nome_id),
                            component_template=component_template,
                            machine_stats=machine_stats,
                            # Передаём переменные в шаблон
@@ -1615,17 +1386,21 @@ def info_tmc(tmc_id):
         equipment_id=tmc_id
     ).order_by(EquipmentTempUsage.dt_start.desc()).all()
     
+    # Организации, помещения и пользователи для всей истории — одним запросом на таблицу
+    resolver = MoveHistoryResolver(
+        moves, with_equipment=False,
+        extra_user_ids=[i for usage in temp_usages for i in (usage.mol_userid, usage.user_temp_id)],
+    )
+    
     # Объединяем в один список с унифицированной структурой
     history = []
     
     # Обрабатываем перемещения
-    for move in moves:
-        org_from = Org.query.get(move.orgidfrom)
-        org_to = Org.query.get(move.orgidto)
-        place_from = Places.query.get(move.placesidfrom)
-        place_to = Places.query.get(move.placesidto)
-        user_from = Users.query.get(move.useridfrom)
-        user_to = Users.query.get(move.useridto)
+    for item in resolver.rows():
+        move = item['move']
+        org_from, org_to = item['org_from'], item['org_to']
+        place_from, place_to = item['place_from'], item['place_to']
+        user_from, user_to = item['user_from'], item['user_to']
         
         history.append({
             'type': 'move',
@@ -1643,8 +1418,8 @@ def info_tmc(tmc_id):
     
     # Обрабатываем временные выдачи
     for usage in temp_usages:
-        mol_user = usage.mol_user
-        temp_user = usage.temp_user
+        mol_user = resolver.users.get(usage.mol_userid)
+        temp_user = resolver.users.get(usage.user_temp_id)
         
         history.append({
             'type': 'temp_usage',
@@ -2071,6 +1846,171 @@ def equipment_by_user(user_id):
         ]
     }
 
+@app.route('/api/equipment')
+@login_required
+def api_equipment_page():
+    """
+    Постраничный список активных ТМЦ в JSON с курсором.
+
+    Параметры: nome_id, place_id, department_id, user_id (только для администратора;
+    МОЛ видит только свои ТМЦ), after / before (курсоры), per_page.
+    Порядок — по инвентарному номеру, затем по id.
+    """
+    if TEST_MODE:
+        return jsonify({'equipment': [], 'page': {'has_next': False, 'has_prev': False,
+                                                  'next_cursor': None, 'prev_cursor': None}})
+
+    is_admin = current_user.mode == 1
+    tmc_filter = EquipmentFilter(
+        user_id=request.args.get('user_id', type=int) if is_admin else current_user.id,
+        nome_id=request.args.get('nome_id', type=int),
+        place_id=request.args.get('place_id', type=int),
+        department_id=request.args.get('department_id', type=int),
+        os=None,
+    )
+    try:
+        page = keyset_page(tmc_filter.query().options(db.joinedload(Equipment.nome)),
+                           LIST_BY_NOME_SORT, **page_args(request.args))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Некорректный курсор'}), 400
+
+    return jsonify({
+        'equipment': [
+            {
+                'id': eq.id,
+                'nomeid': eq.nomeid,
+                'nome': eq.nome.name if eq.nome else None,
+                'buhname': eq.buhname,
+                'sernum': eq.sernum,
+                'invnum': eq.invnum,
+                'placesid': eq.placesid,
+                'usersid': eq.usersid,
+                'cost': float(eq.cost) if eq.cost else 0.0,
+                'os': bool(eq.os),
+                'repair': bool(eq.repair),
+                'lost': bool(eq.lost),
+            }
+            for eq in page.items
+        ],
+        'page': page.to_dict(),
+    })
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """
+    Поиск активных ТМЦ по инвентарному и серийному номеру, штрихкоду, наименованию,
+    IP, комментариям, hostname и MAC-адресу привязанной машины.
+
+    Параметры: q (слова запроса; совпадение точное, по префиксу или с одной
+    опечаткой), limit (до 200). МОЛ видит только свои ТМЦ.
+    """
+    if TEST_MODE:
+        return jsonify({'results': []})
+
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': 'Пустой запрос'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+    user_id = None if current_user.mode == 1 else current_user.id
+
+    return jsonify({
+        'results': [
+            {
+                'id': item['document'].id,
+                'buhname': item['document'].buhname,
+                'invnum': item['document'].invnum,
+                'sernum': item['document'].sernum,
+                'shtrihkod': item['document'].shtrihkod,
+                'ip': item['document'].ip,
+                'hostname': item['document'].hostname,
+                'mac_address': item['document'].mac_address,
+                'usersid': item['document'].usersid,
+                'score': item['score'],
+                'matched_fields': item['fields'],
+            }
+            for item in search_equipment(query, user_id=user_id, limit=limit)
+        ],
+    })
+
+@app.route('/api/lookup', methods=['GET', 'POST'])
+@login_required
+def api_lookup():
+    """
+    Карточки активных ТМЦ по штрихкоду или инвентарному номеру (сканеры склада).
+
+    GET ?code=... — один код: 404, если ТМЦ не найдено.
+    POST {"codes": [...]} — до LOOKUP_BATCH кодов за запрос (инвентаризация):
+    карточки по каждому коду и список ненайденных кодов.
+    """
+    if request.method == 'GET':
+        code = (request.args.get('code') or '').strip()
+        if not code:
+            return jsonify({'success': False, 'message': 'Не указан код'}), 400
+        items = lookup_code(code)
+        if not items:
+            return jsonify({'success': False, 'code': code, 'message': 'ТМЦ не найдено'}), 404
+        return jsonify({'success': True, 'code': code, 'items': items})
+
+    data = request.get_json(silent=True) or {}
+    codes = data.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return jsonify({'success': False, 'message': 'Ожидается непустой список codes'}), 400
+    if len(codes) > LOOKUP_BATCH:
+        return jsonify({'success': False, 'message': f'Не больше {LOOKUP_BATCH} кодов за запрос'}), 400
+    codes = [str(code).strip() for code in codes if isinstance(code, (str, int)) and str(code).strip()]
+    results = lookup_codes(codes)
+    return jsonify({
+        'success': True,
+        'results': results,
+        'not_found': [code for code, items in results.items() if not items],
+    })
+
+@app.route('/api/lookup/stats')
+@login_required
+def api_lookup_stats():
+    """Задержка поиска по коду (p50/p99) и попадания в кэш в этом процессе."""
+    if current_user.mode != 1:
+        return jsonify({'success': False, 'message': 'Доступ запрещён'}), 403
+    return jsonify({'success': True, 'stats': lookup_stats()})
+
+@app.route('/api/hard_drives')
+@login_required
+def api_hard_drives_page():
+    """Постраничный список активных жестких дисков в JSON (порядок как на странице списка)."""
+    if current_user.mode != 1:
+        return jsonify({'success': False, 'message': 'Доступ запрещён'}), 403
+    if TEST_MODE:
+        return jsonify({'hard_drives': [], 'page': {'has_next': False, 'has_prev': False,
+                                                    'next_cursor': None, 'prev_cursor': None}})
+
+    from models import PCHardDrive
+
+    query, sort_keys = hard_drives_query(PCHardDrive.active == True)
+    try:
+        page = keyset_page(query.options(db.joinedload(PCHardDrive.vendor)), sort_keys, **page_args(request.args))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Некорректный курсор'}), 400
+
+    return jsonify({
+        'hard_drives': [
+            {
+                'id': drive.id,
+                'vendor': drive.vendor.name if drive.vendor else None,
+                'model': drive.model,
+                'capacity_gb': drive.capacity_gb,
+                'serial_number': drive.serial_number,
+                'drive_type': drive.drive_type,
+                'interface': drive.interface,
+                'health_status': drive.health_status,
+                'power_on_hours': drive.power_on_hours,
+                'machine_id': drive.machine_id,
+            }
+            for drive in page.items
+        ],
+        'page': page.to_dict(),
+    })
+
 @app.route('/invoice/<int:invoice_id>')
 @login_required
 def invoice_detail(invoice_id):
@@ -2316,44 +2256,14 @@ def all_tmc():
     filter_department_id = request.args.get('department_id', type=int)
     filter_category_id = request.args.get('category_id', type=int)
     
-    # Базовый запрос для фильтрации
-    base_query = Equipment.query.filter_by(active=True, os=True)
-    
-    # Применяем фильтры
-    if filter_user_id:
-        base_query = base_query.filter_by(usersid=filter_user_id)
-    if filter_department_id:
-        base_query = base_query.filter_by(department_id=filter_department_id)
-    if filter_category_id:
-        base_query = base_query.join(Nome, Equipment.nomeid == Nome.id)\
-                              .join(GroupNome, Nome.groupid == GroupNome.id)\
-                              .filter(GroupNome.category_id == filter_category_id)
-    
-    # Подсчет общего количества и стоимости
-    tmc_count = base_query.count()
-    total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0))\
-                          .select_from(Equipment)\
-                          .filter(Equipment.id.in_([eq.id for eq in base_query.all()]))\
-                          .scalar() or 0
-    
-    # Получаем все ID ТМЦ для подсчета статистики
-    tmc_ids = [eq.id for eq in base_query.all()]
-    
-    # Запрос для группировки с подсчетом статистики по статусам
-    grouped_query = db.session.query(
-        Equipment.nomeid,
-        func.coalesce(Nome.name, '⚠️ Неизвестное наименование').label('nome_name'),
-        func.count(Equipment.id).label('quantity'),
-        func.coalesce(Nome.photo, '').label('nome_photo'),
-        func.sum(case((Equipment.repair == True, 1), else_=0)).label('repair_count'),
-        func.sum(case((Equipment.lost == True, 1), else_=0)).label('lost_count'),
-        func.sum(case((and_(Equipment.repair == False, Equipment.lost == False), 1), else_=0)).label('active_count')
-    ).join(Nome, Equipment.nomeid == Nome.id)\
-     .filter(Equipment.id.in_(tmc_ids))\
-     .group_by(Equipment.nomeid, Nome.name, Nome.photo)\
-     .order_by(Nome.name)
-    
-    grouped_tmc = grouped_query.all()
+    # Фильтры применяются на стороне БД, наружу — только агрегаты
+    tmc_filter = EquipmentFilter(user_id=filter_user_id,
+                                 department_id=filter_department_id,
+                                 category_id=filter_category_id)
+    tmc_count, total_cost = tmc_filter.totals()
+    
+    # Группировка по наименованиям с подсчетом статистики по статусам
+    grouped_tmc = tmc_filter.grouped_by_nome()
     
     # Загрузка данных для фильтров (пользователи, отделы, категории)
     all_users = Users.query.join(Equipment, Users.id == Equipment.usersid)\
@@ -2404,56 +2314,14 @@ def list_my_tmc():
     filter_department_id = request.args.get('department_id', type=int)
     filter_category_id = request.args.get('category_id', type=int)
 
-    # Базовый запрос
-    base_query = Equipment.query.filter_by(
-        usersid=current_user.id,
-        active=True,
-        os=True
-    )
+    # Фильтры применяются на стороне БД, наружу — только агрегаты
+    tmc_filter = EquipmentFilter(user_id=current_user.id,
+                                 department_id=filter_department_id,
+                                 category_id=filter_category_id)
+    tmc_count, total_cost = tmc_filter.totals()
 
-    # Применение фильтров
-    if filter_department_id:
-        base_query = base_query.filter_by(department_id=filter_department_id)
-    if filter_category_id:
-        base_query = base_query.join(Nome, Equipment.nomeid == Nome.id)\
-                               .join(GroupNome, Nome.groupid == GroupNome.id)\
-                               .filter(GroupNome.category_id == filter_category_id)
-
-    # Подсчёт
-    tmc_count = base_query.count()
-    total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0))\
-                          .select_from(Equipment)\
-                          .filter(Equipment.id.in_(base_query.with_entities(Equipment.id)))\
-                          .scalar() or 0
-
-    # Получаем все ID ТМЦ для подсчета статистики
-    tmc_ids = [eq.id for eq in base_query.with_entities(Equipment.id).all()]
-    
-    # Группировка с подсчетом статистики по статусам
-    grouped_query = db.session.query(
-        Equipment.nomeid,
-        func.coalesce(Nome.name, '⚠️ Неизвестное наименование').label('nome_name'),
-        func.count(Equipment.id).label('quantity'),
-        func.coalesce(Nome.photo, '').label('nome_photo'),
-        func.sum(case((Equipment.repair == True, 1), else_=0)).label('repair_count'),
-        func.sum(case((Equipment.lost == True, 1), else_=0)).label('lost_count'),
-        func.sum(case((and_(Equipment.repair == False, Equipment.lost == False), 1), else_=0)).label('active_count')
-    ).select_from(Equipment)\
-     .join(Nome, Equipment.nomeid == Nome.id)
-
-    # Применяем те же фильтры
-    if filter_department_id:
-        grouped_query = grouped_query.filter(Equipment.department_id == filter_department_id)
-    if filter_category_id:
-        grouped_query = grouped_query.join(GroupNome, Nome.groupid == GroupNome.id)\
-                                     .filter(GroupNome.category_id == filter_category_id)
-
-    grouped_query = grouped_query.filter(
-        Equipment.id.in_(tmc_ids)
-    ).group_by(Equipment.nomeid, Nome.name, Nome.photo)\
-     .order_by(Nome.name)
-
-    grouped_tmc = grouped_query.all()
+    # Группировка по наименованиям с подсчетом статистики по статусам
+    grouped_tmc = tmc_filter.grouped_by_nome()
 
     # Загрузка фильтров
     all_departments = Department.query.join(Equipment, Department.id == Equipment.department_id)\
@@ -2552,27 +2420,17 @@ def peripherals():
         flash('Доступ запрещён', 'danger')
         return redirect(url_for('index'))
 
-    # Фильтруем только НЕ основные средства
-    base_query = Equipment.query.filter_by(active=True, os=False)
-
     # Применяем фильтры (по пользователю, отделу, категории, группе — по аналогии с all_tmc)
     filter_user_id = request.args.get('user_id', type=int)
     filter_department_id = request.args.get('department_id', type=int)
     filter_category_id = request.args.get('category_id', type=int)
     filter_group_id = request.args.get('group_id', type=int)
 
-    if filter_user_id:
-        base_query = base_query.filter_by(usersid=filter_user_id)
-    if filter_department_id:
-        base_query = base_query.filter_by(department_id=filter_department_id)
-    if filter_category_id:
-        base_query = base_query.join(Nome, Equipment.nomeid == Nome.id)\
-                                .join(GroupNome, Nome.groupid == GroupNome.id)\
-                                .filter(GroupNome.category_id == filter_category_id)
-
-    equipment_list = base_query.all()
-    tmc_count = len(equipment_list)
-    total_cost = sum(eq.cost for eq in equipment_list if eq.cost is not None)
+    # Итоги по НЕ основным средствам (без учета выбранной группы)
+    tmc_count, total_cost = EquipmentFilter(user_id=filter_user_id,
+                                            department_id=filter_department_id,
+                                            category_id=filter_category_id,
+                                            os=False).totals()
 
     # Логика отображения:
     # 1. Если выбрана группа - показываем наименования в этой группе
@@ -3279,6 +3137,31 @@ def graphics_cards_list():
                          is_admin=is_admin,
                          user_login=current_user.login)
 
+def hard_drives_query(base_filter):
+    """
+    Запрос жестких дисков и ключ постраничной сортировки: группы моделей по
+    максимальному объему (по убыванию), модель, объем (по убыванию), id.
+    """
+    from models import PCHardDrive
+
+    subquery = (
+        db.session.query(
+            PCHardDrive.model,
+            func.max(PCHardDrive.capacity_gb).label('max_capacity')
+        )
+        .filter(base_filter)
+        .group_by(PCHardDrive.model)
+        .subquery()
+    )
+    query = PCHardDrive.query.filter(base_filter).join(subquery, PCHardDrive.model == subquery.c.model)
+    sort_keys = [
+        (subquery.c.max_capacity, True),
+        (PCHardDrive.model, False),
+        (PCHardDrive.capacity_gb, True),
+        (PCHardDrive.id, False),
+    ]
+    return query, sort_keys
+
 @app.route('/pc_components/hard_drives')
 @login_required
 def hard_drives_list():
@@ -3337,31 +3220,17 @@ def hard_drives_list():
             PCHardDrive.health_status.in_(['Тревога', 'Неработает', 'Caution', 'Bad'])
         )
     
-    # Получаем жесткие диски с сортировкой:
+    # Жесткие диски постранично, с сортировкой:
     # 1. По максимальному объему в группе модели (по убыванию)
     # 2. По модели (для группировки)
-    # 3. По объему внутри группы (по убыванию)
-    subquery = (
-        db.session.query(
-            PCHardDrive.model,
-            func.max(PCHardDrive.capacity_gb).label('max_capacity')
-        )
-        .filter(base_filter)
-        .group_by(PCHardDrive.model)
-        .subquery()
-    )
-    
-    hard_drives = (
-        PCHardDrive.query
-        .filter(base_filter)
-        .join(subquery, PCHardDrive.model == subquery.c.model)
-        .order_by(
-            subquery.c.max_capacity.desc(),  # Сначала группы по максимальному объему
-            PCHardDrive.model.asc(),         # Затем по модели для группировки
-            PCHardDrive.capacity_gb.desc()   # Внутри группы по объему по убыванию
-        )
-        .all()
-    )
+    # 3. По объему внутри группы (по убыванию), затем по id
+    query, sort_keys = hard_drives_query(base_filter)
+    try:
+        page = keyset_page(query.options(db.joinedload(PCHardDrive.vendor), db.joinedload(PCHardDrive.machine)),
+                           sort_keys, **page_args(request.args))
+    except ValueError:
+        abort(400)
+    total_drives = PCHardDrive.query.filter(base_filter).count()
     
     # Статистика по дискам, требующим замены
     # Диски со статусом "Тревога" или "Неработает" (учитываем и английские, и русские статусы)
@@ -3389,11 +3258,10 @@ def hard_drives_list():
         PCHardDrive.power_on_hours > 50000
     ).count()
     
-    # Общее количество активных дисков
-    total_drives = len(hard_drives)
-    
     return render_template('pc_components/hard_drives_list.html',
-                         hard_drives=hard_drives,
+                         hard_drives=page.items,
+                         page=page,
+                         nav_params=nav_params(request.args),
                          total_drives=total_drives,
                          drives_need_replacement=drives_need_replacement,
                          drives_warning=drives_warning,
@@ -3687,8 +3555,7 @@ def add_graphics_card():
         db.session.add(graphics_card)
         db.session.commit()
         
-        vendor = Vendor.query.get(vendor_id)
-        vendor_name = vendor.name if vendor else 'Unknown'
+        vendor_name = find_vendor_name(vendor_id) or 'Unknown'
         flash(f'Видеокарта {vendor_name} {model} успешно добавлена', 'success')
         return redirect(url_for('graphics_cards_list'))
     
@@ -3765,8 +3632,7 @@ def add_hard_drive():
         db.session.add(hard_drive)
         db.session.commit()
         
-        vendor = Vendor.query.get(vendor_id)
-        vendor_name = vendor.name if vendor else 'Unknown'
+        vendor_name = find_vendor_name(vendor_id) or 'Unknown'
         flash(f'Жесткий диск {vendor_name} {model} успешно добавлен', 'success')
         return redirect(url_for('hard_drives_list'))
     
@@ -3897,8 +3763,7 @@ def edit_graphics_card(card_id):
         
         db.session.commit()
         
-        vendor = Vendor.query.get(vendor_id)
-        vendor_name = vendor.name if vendor else 'Unknown'
+        vendor_name = find_vendor_name(vendor_id) or 'Unknown'
         flash(f'Видеокарта {vendor_name} {model} успешно обновлена', 'success')
         return redirect(url_for('graphics_cards_list'))
     
@@ -4042,8 +3907,7 @@ def edit_hard_drive(drive_id):
         
         db.session.commit()
         
-        vendor = Vendor.query.get(vendor_id)
-        vendor_name = vendor.name if vendor else 'Unknown'
+        vendor_name = find_vendor_name(vendor_id) or 'Unknown'
         flash(f'Жесткий диск {vendor_name} {model} успешно обновлен', 'success')
         return redirect(url_for('hard_drives_list'))
     
@@ -4358,54 +4222,12 @@ def auto_link_machine_equipment(machine_id):
     
     machine = Machine.query.get_or_404(machine_id)
     
-    # Ищем ТМЦ по MAC-адресу (приоритет), hostname, IP или серийному номеру
-    equipment = None
-    
-    # Поиск по MAC-адресу (приоритетный, так как MAC-адрес реже меняется)
-    if machine.mac_address:
-        mac_address = machine.mac_address.strip().upper()
-        # Ищем MAC-адрес в комментариях, бухгалтерском наименовании или серийном номере
-        equipment = Equipment.query.filter(
-            db.or_(
-                Equipment.comment.like(f'%{mac_address}%'),
-                Equipment.comment.like(f'%{machine.mac_address}%'),
-                Equipment.buhname.like(f'%{mac_address}%'),
-                Equipment.buhname.like(f'%{machine.mac_address}%'),
-                Equipment.sernum == mac_address,
-                Equipment.sernum == machine.mac_address
-            ),
-            Equipment.active == True,
-            Equipment.os == True
-        ).first()
-    
-    # Поиск по hostname в бухгалтерском наименовании или комментарии
-    if not equipment and machine.hostname:
-        equipment = Equipment.query.filter(
-            db.or_(
-                Equipment.buhname.like(f'%{machine.hostname}%'),
-                Equipment.comment.like(f'%{machine.hostname}%'),
-                Equipment.sernum == machine.hostname
-            ),
-            Equipment.active == True,
-            Equipment.os == True
-        ).first()
-    
-    # Поиск по IP-адресу
-    if not equipment and machine.ip_address:
-        equipment = Equipment.query.filter(
-            Equipment.ip == machine.ip_address,
-            Equipment.active == True,
-            Equipment.os == True
-        ).first()
-    
-    # Поиск по серийному номеру
-    if not equipment and machine.hostname:
-        equipment = Equipment.query.filter(
-            Equipment.sernum == machine.hostname,
-            Equipment.active == True,
-            Equipment.os == True
-        ).first()
-    
+    # Ищем ТМЦ по MAC-адресу (приоритет), hostname или IP через поисковый индекс
+    # (MAC-адрес реже меняется; hostname ищется и в серийном номере)
+    equipment_id = match_machine_equipment(hostname=machine.hostname, mac_address=machine.mac_address,
+                                           ip_address=machine.ip_address)
+    equipment = db.session.get(Equipment, equipment_id) if equipment_id else None
+
     if equipment:
         # Проверяем, не привязано ли это ТМЦ уже к другой машине (связь один к одному)
         existing_machine = Machine.query.filter_by(equipment_id=equipment.id).first()
@@ -4858,110 +4680,6 @@ def my_temp_tmc():
                          tmc_count=tmc_count,
                          total_cost=total_cost)
 
-def calculate_stats_data(tmc_query, is_admin=False):
-    """Вспомогательная функция для расчета статистики."""
-    stats_data = {}
-    
-    # Получаем ID всех ТМЦ из запроса
-    tmc_ids = [eq.id for eq in tmc_query.all()]
-    
-    if not tmc_ids:
-        return stats_data
-    
-    # Статистика по категориям (количество ТМЦ)
-    category_stats = db.session.query(
-        Category.name.label('category_name'),
-        func.count(Equipment.id).label('count')
-    ).join(GroupNome, Category.id == GroupNome.category_id)\
-     .join(Nome, GroupNome.id == Nome.groupid)\
-     .join(Equipment, Nome.id == Equipment.nomeid)\
-     .filter(Equipment.id.in_(tmc_ids))\
-     .group_by(Category.id, Category.name)\
-     .order_by(func.count(Equipment.id).desc())\
-     .all()
-    
-    stats_data['category_labels'] = [row.category_name for row in category_stats] if category_stats else []
-    stats_data['category_counts'] = [row.count for row in category_stats] if category_stats else []
-    
-    # Статистика по категориям (стоимость)
-    category_cost_stats = db.session.query(
-        Category.name.label('category_name'),
-        func.coalesce(func.sum(Equipment.cost), 0).label('total_cost')
-    ).join(GroupNome, Category.id == GroupNome.category_id)\
-     .join(Nome, GroupNome.id == Nome.groupid)\
-     .join(Equipment, Nome.id == Equipment.nomeid)\
-     .filter(Equipment.id.in_(tmc_ids))\
-     .group_by(Category.id, Category.name)\
-     .order_by(func.sum(Equipment.cost).desc())\
-     .all()
-    
-    stats_data['category_cost_labels'] = [row.category_name for row in category_cost_stats] if category_cost_stats else []
-    stats_data['category_costs'] = [float(row.total_cost) for row in category_cost_stats] if category_cost_stats else []
-    
-    # Статистика по отделам (только для админа)
-    if is_admin:
-        department_stats = db.session.query(
-            Department.name.label('department_name'),
-            func.count(Equipment.id).label('count')
-        ).join(Equipment, Department.id == Equipment.department_id)\
-         .filter(Equipment.id.in_(tmc_ids))\
-         .group_by(Department.id, Department.name)\
-         .order_by(func.count(Equipment.id).desc())\
-         .limit(10)\
-         .all()
-        
-        stats_data['department_labels'] = [row.department_name for row in department_stats] if department_stats else []
-        stats_data['department_counts'] = [row.count for row in department_stats] if department_stats else []
-        
-        # Топ пользователей по количеству ТМЦ
-        user_stats = db.session.query(
-            Users.login.label('user_login'),
-            func.count(Equipment.id).label('count')
-        ).join(Equipment, Users.id == Equipment.usersid)\
-         .filter(Equipment.id.in_(tmc_ids))\
-         .group_by(Users.id, Users.login)\
-         .order_by(func.count(Equipment.id).desc())\
-         .limit(10)\
-         .all()
-        
-        stats_data['user_labels'] = [row.user_login for row in user_stats] if user_stats else []
-        stats_data['user_counts'] = [row.count for row in user_stats] if user_stats else []
-    
-    # Динамика добавления ТМЦ по месяцам (последние 12 месяцев)
-    twelve_months_ago = datetime.now() - relativedelta(days=365)
-    
-    # Получаем все ТМЦ за последний год из нашего запроса
-    all_equipment = Equipment.query.filter(
-        Equipment.id.in_(tmc_ids),
-        Equipment.datepost >= twelve_months_ago
-    ).all()
-    
-    # Группируем по месяцам в Python
-    monthly_dict = {}
-    for eq in all_equipment:
-        month_key = eq.datepost.strftime('%Y-%m') if eq.datepost else None
-        if month_key:
-            monthly_dict[month_key] = monthly_dict.get(month_key, 0) + 1
-    
-    # Сортируем по месяцам
-    sorted_months = sorted(monthly_dict.keys())
-    stats_data['monthly_labels'] = sorted_months if sorted_months else []
-    stats_data['monthly_counts'] = [monthly_dict[month] for month in sorted_months] if sorted_months else []
-    
-    # Статусы ТМЦ
-    repair_count = Equipment.query.filter(Equipment.id.in_(tmc_ids), Equipment.repair == True).count()
-    active_count = Equipment.query.filter(Equipment.id.in_(tmc_ids), Equipment.repair == False).count()
-    
-    stats_data['status_labels'] = ['Активные', 'В ремонте']
-    stats_data['status_counts'] = [active_count, repair_count]
-    
-    # Общее количество компьютерной периферии (только для админа)
-    if is_admin:
-        components_count = Equipment.query.filter_by(active=True, os=False).count()
-        stats_data['components_count'] = components_count
-    
-    return stats_data
-
 @app.route('/all_stats')
 @login_required
 def all_stats():
@@ -5000,27 +4718,13 @@ def all_stats():
         flash('Доступ запрещён. Только администратор может просматривать общую статистику.', 'danger')
         return redirect(url_for('index'))
     
-    # Запрос всех ТМЦ
-    tmc_query = Equipment.query.filter_by(active=True, os=True)
-    tmc_count = tmc_query.count()
-    total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-        Equipment.id.in_([eq.id for eq in tmc_query.all()])
-    ).scalar()
-    
-    # Подсчёт активных пользователей
-    active_users = db.session.query(Equipment.usersid).filter(
-        Equipment.active == True,
-        Equipment.os == True
-    ).distinct().count()
-    
-    # Рассчитываем статистику
-    stats_data = calculate_stats_data(tmc_query, is_admin=True)
-    stats_data['components_count'] = Equipment.query.filter_by(active=True, os=False).count()
+    # Статистика по всем ТМЦ — тот же модуль агрегатов, что и на главной странице
+    stats_data = build_dashboard_stats()
     
     return render_template('reports/stats.html',
-                         tmc_count=tmc_count,
-                         total_cost=total_cost,
-                         active_users=active_users,
+                         tmc_count=stats_data['tmc_count'],
+                         total_cost=stats_data['total_cost'],
+                         active_users=stats_data['active_users'],
                          stats_data=stats_data,
                          is_admin=True,
                          page_title='Статистика системы')
@@ -5049,77 +4753,21 @@ def my_stats():
         flash('Доступ запрещён. Только МОЛ может просматривать свою статистику.', 'danger')
         return redirect(url_for('index'))
     
-    # Запрос ТМЦ текущего МОЛ
-    tmc_query = Equipment.query.filter_by(usersid=current_user.id, active=True, os=True)
-    tmc_ids = [eq.id for eq in tmc_query.all()]
-    tmc_count = len(tmc_ids)
-    total_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-        Equipment.id.in_(tmc_ids)
-    ).scalar() or 0
+    # Статистика по ТМЦ текущего МОЛ из предагрегированной таблицы
+    stats_data = build_dashboard_stats(user_id=current_user.id)
+    tmc_count = stats_data['tmc_count']
+    total_cost = stats_data['total_cost']
     
-    # Рассчитываем базовую статистику
-    stats_data = calculate_stats_data(tmc_query, is_admin=False)
-    
-    # Дополнительная статистика по статусам (включая "Потерян")
-    if tmc_ids:
-        # Количество по статусам
-        active_count = Equipment.query.filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.repair == False,
-            Equipment.lost == False
-        ).count()
-        repair_count = Equipment.query.filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.repair == True
-        ).count()
-        lost_count = Equipment.query.filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.lost == True
-        ).count()
-        
-        # Стоимость по статусам
-        active_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.repair == False,
-            Equipment.lost == False
-        ).scalar() or 0
-        
-        repair_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.repair == True
-        ).scalar() or 0
-        
-        lost_cost = db.session.query(func.coalesce(func.sum(Equipment.cost), 0)).filter(
-            Equipment.id.in_(tmc_ids),
-            Equipment.lost == True
-        ).scalar() or 0
-        
+    # Рейтинг пользователей показывается только в общей статистике
+    stats_data.pop('user_labels')
+    stats_data.pop('user_counts')
+    
+    # Статистика по статусам (включая "Потерян")
+    if tmc_count:
+        status_totals = stats_data['status_totals']
         stats_data['status_labels'] = ['В эксплуатации', 'В ремонте', 'Потерян']
-        stats_data['status_counts'] = [active_count, repair_count, lost_count]
-        stats_data['status_costs'] = [float(active_cost), float(repair_cost), float(lost_cost)]
-    
-    # Статистика по отделам для МОЛ
-    if tmc_ids:
-        department_stats = db.session.query(
-            Department.name.label('department_name'),
-            func.count(Equipment.id).label('count')
-        ).join(Equipment, Department.id == Equipment.department_id)\
-         .filter(Equipment.id.in_(tmc_ids))\
-         .group_by(Department.id, Department.name)\
-         .order_by(func.count(Equipment.id).desc())\
-         .limit(10)\
-         .all()
-        
-        stats_data['department_labels'] = [row.department_name for row in department_stats] if department_stats else []
-        stats_data['department_counts'] = [row.count for row in department_stats] if department_stats else []
-    
-    # Статистика по компьютерной периферии МОЛ
-    components_count = Equipment.query.filter_by(
-        usersid=current_user.id,
-        active=True,
-        os=False
-    ).count()
-    stats_data['components_count'] = components_count
+        stats_data['status_counts'] = [status_totals[status]['count'] for status in ('active', 'repair', 'lost')]
+        stats_data['status_costs'] = [status_totals[status]['cost'] for status in ('active', 'repair', 'lost')]
     
     return render_template('reports/stats.html',
                          tmc_count=tmc_count,
@@ -5144,28 +4792,17 @@ def all_moves():
         flash('Доступ запрещён. Только администратор может просматривать все перемещения.', 'danger')
         return redirect(url_for('index'))
     
-    # Получаем все перемещения, отсортированные по дате (новые сначала)
-    moves = Move.query.order_by(Move.dt.desc()).limit(100).all()
-    
-    # Загружаем связанные данные для отображения
-    moves_data = []
-    for move in moves:
-        equipment = Equipment.query.get(move.eqid)
-        place_from = Places.query.get(move.placesidfrom) if move.placesidfrom else None
-        place_to = Places.query.get(move.placesidto) if move.placesidto else None
-        user_from = Users.query.get(move.useridfrom) if move.useridfrom else None
-        user_to = Users.query.get(move.useridto) if move.useridto else None
-        
-        moves_data.append({
-            'move': move,
-            'equipment': equipment,
-            'place_from': place_from,
-            'place_to': place_to,
-            'user_from': user_from,
-            'user_to': user_to
-        })
+    # Перемещения постранично, новые сначала
+    try:
+        page = keyset_page(Move.query, MOVE_SORT, **page_args(request.args))
+    except ValueError:
+        abort(400)
+    
+    # Связанные ТМЦ, помещения и пользователи — одним запросом на таблицу
+    moves_data = MoveHistoryResolver(page.items).rows()
     
-    return render_template('reports/all_moves.html', moves_data=moves_data)
+    return render_template('reports/all_moves.html', moves_data=moves_data,
+                           page=page, nav_params=nav_params(request.args))
 
 @app.route('/my_moves')
 @login_required
@@ -5183,54 +4820,21 @@ def my_moves():
         flash('Доступ запрещён. Только МОЛ может просматривать свои перемещения.', 'danger')
         return redirect(url_for('index'))
     
-    # Получаем все ТМЦ, которые числятся за текущим МОЛ
-    my_equipment_ids = db.session.query(Equipment.id).filter_by(
-        usersid=current_user.id,
-        active=True
-    ).all()
-    my_equipment_ids = [eq[0] for eq in my_equipment_ids]
+    # Перемещения ТМЦ, которые числятся за текущим МОЛ (подзапрос на стороне БД).
+    # Перемещения компьютерной периферии записываются через их основное ТМЦ
+    # (id_main_asset), которое тоже числится за МОЛ, поэтому уже входит в выборку.
+    my_equipment_ids = EquipmentFilter(user_id=current_user.id, os=None).ids_subquery()
+    try:
+        page = keyset_page(Move.query.filter(Move.eqid.in_(my_equipment_ids)),
+                           MOVE_SORT, **page_args(request.args))
+    except ValueError:
+        abort(400)
     
-    # Получаем ID основного ТМЦ для компьютерной периферии, которая связана с ТМЦ МОЛ
-    # Перемещения периферии записываются через их основное ТМЦ (id_main_asset)
-    my_components_main_asset_ids = db.session.query(AppComponents.id_main_asset).join(
-        Equipment, AppComponents.id_main_asset == Equipment.id
-    ).filter(
-        Equipment.usersid == current_user.id,
-        Equipment.active == True
-    ).distinct().all()
-    my_components_main_asset_ids = [comp[0] for comp in my_components_main_asset_ids]
-    
-    # Объединяем ID ТМЦ и основных ТМЦ для компьютерной периферии
-    all_equipment_ids = list(set(my_equipment_ids + my_components_main_asset_ids))
-    
-    # Получаем перемещения для ТМЦ МОЛ
-    # Перемещения компьютерной периферии уже включены через их основное ТМЦ
-    if all_equipment_ids:
-        moves = Move.query.filter(
-            Move.eqid.in_(all_equipment_ids)
-        ).order_by(Move.dt.desc()).limit(100).all()
-    else:
-        moves = []
-    
-    # Загружаем связанные данные для отображения
-    moves_data = []
-    for move in moves:
-        equipment = Equipment.query.get(move.eqid)
-        place_from = Places.query.get(move.placesidfrom) if move.placesidfrom else None
-        place_to = Places.query.get(move.placesidto) if move.placesidto else None
-        user_from = Users.query.get(move.useridfrom) if move.useridfrom else None
-        user_to = Users.query.get(move.useridto) if move.useridto else None
-        
-        moves_data.append({
-            'move': move,
-            'equipment': equipment,
-            'place_from': place_from,
-            'place_to': place_to,
-            'user_from': user_from,
-            'user_to': user_to
-        })
+    # Связанные ТМЦ, помещения и пользователи — одним запросом на таблицу
+    moves_data = MoveHistoryResolver(page.items).rows()
     
-    return render_template('reports/my_moves.html', moves_data=moves_data, is_mol=is_mol)
+    return render_template('reports/my_moves.html', moves_data=moves_data, is_mol=is_mol,
+                           page=page, nav_params=nav_params(request.args))
 
 @app.route('/my_friends')
 @login_required
@@ -5545,62 +5149,8 @@ def my_departments():
                              departments=[],
                              is_admin=is_admin)
     
-    if is_admin:
-        # Для админа - все отделы
-        departments = Department.query.filter_by(active=True).order_by(Department.name).all()
-    else:
-        # Для МОЛ - только отделы, где у него есть ТМЦ
-        departments = db.session.query(Department).join(
-            Equipment, Department.id == Equipment.department_id
-        ).filter(
-            Equipment.usersid == current_user.id,
-            Equipment.active == True,
-            Equipment.os == True,
-            Department.active == True
-        ).distinct().order_by(Department.name).all()
-    
-    # Подсчёт статистики по каждому отделу
-    department_stats = []
-    for dept in departments:
-        if is_admin:
-            # Для админа - все ТМЦ в отделе
-            tmc_count = Equipment.query.filter_by(
-                department_id=dept.id,
-                active=True,
-                os=True
-            ).count()
-            total_cost = db.session.query(
-                func.coalesce(func.sum(Equipment.cost), 0)
-            ).filter_by(
-                department_id=dept.id,
-                active=True,
-                os=True
-            ).scalar()
-        else:
-            # Для МОЛ - только его ТМЦ в отделе
-            tmc_count = Equipment.query.filter_by(
-                department_id=dept.id,
-                usersid=current_user.id,
-                active=True,
-                os=True
-            ).count()
-            total_cost = db.session.query(
-                func.coalesce(func.sum(Equipment.cost), 0)
-            ).filter_by(
-                department_id=dept.id,
-                usersid=current_user.id,
-                active=True,
-                os=True
-            ).scalar()
-        
-        department_stats.append({
-            'department': dept,
-            'tmc_count': tmc_count,
-            'total_cost': float(total_cost) if total_cost else 0.0
-        })
-    
-    # Сортировка по убыванию суммы (от большей к меньшей)
-    department_stats.sort(key=lambda x: x['total_cost'], reverse=True)
+    # Количество и стоимость ТМЦ по всем отделам — одним запросом с группировкой (кэш на пользователя)
+    department_stats = get_department_stats(current_user)
     
     return render_template('departments/my_departments.html',
                           department_stats=department_stats,
@@ -5609,175 +5159,98 @@ def my_departments():
 @app.route('/my_monitoring')
 @login_required
 def my_monitoring():
-    """Мониторинг сетевых устройств по помещениям. Доступен всем пользователям."""
-    import subprocess
-    import socket
-    import platform
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
+    """
+    Мониторинг сетевых устройств по помещениям. Доступен всем пользователям.
+    Состояние устройств читается из снимка фонового опросчика (network-monitor).
+    """
     is_admin = current_user.mode == 1
     
-    # Получаем все помещения, где есть ТМЦ с IP адресами (для всех пользователей)
-    places_with_network_devices = db.session.query(Places).join(
-        Equipment, Places.id == Equipment.placesid
-    ).join(
-        Nome, Equipment.nomeid == Nome.id
-    ).join(
-        GroupNome, Nome.groupid == GroupNome.id
+    # Все сетевые устройства с IP в активных помещениях — одним запросом
+    rows = network_devices_query().join(
+        Places, Places.id == Equipment.placesid
     ).filter(
-        Equipment.active == True,
-        Equipment.os == True,
-        Equipment.ip != '',
-        Equipment.ip.isnot(None),
-        GroupNome.is_network_device == True,
         Places.active == True
-    ).distinct().order_by(Places.name).all()
+    ).options(
+        db.contains_eager(Equipment.places), db.joinedload(Equipment.nome)
+    ).order_by(Places.name, Equipment.id).all()
+    statuses = device_statuses(eq.id for eq in rows)
     
     # Собираем данные по помещениям и устройствам
     places_data = []
-    all_ips = []  # Для параллельной проверки ping
-    
-    for place in places_with_network_devices:
-        # Получаем все устройства с IP адресами в помещении (для всех пользователей)
-        equipment_list = db.session.query(Equipment).join(
-            Nome, Equipment.nomeid == Nome.id
-        ).join(
-            GroupNome, Nome.groupid == GroupNome.id
-        ).filter(
-            Equipment.placesid == place.id,
-            Equipment.active == True,
-            Equipment.os == True,
-            Equipment.ip != '',
-            Equipment.ip.isnot(None),
-            GroupNome.is_network_device == True
-        ).all()
-        
-        devices = []
-        for eq in equipment_list:
-            ip = eq.ip.strip()
-            if ip:
-                devices.append({
-                    'id': eq.id,
-                    'name': eq.buhname,
-                    'ip': ip,
-                    'nome': eq.nome.name if eq.nome else 'Неизвестно',
-                    'status': None  # Будет заполнено после ping
-                })
-                all_ips.append((place.id, eq.id, ip))
-        
-        if devices:
-            places_data.append({
-                'place': place,
-                'devices': devices,
-                'total_devices': len(devices),
+    places_index = {}
+    for eq in rows:
+        ip = eq.ip.strip()
+        if not ip:
+            continue
+        status = statuses.get(eq.id)
+        online = status.online if status else None  # None — устройство еще не проверялось
+        place_info = places_index.get(eq.placesid)
+        if place_info is None:
+            place_info = places_index[eq.placesid] = {
+                'place': eq.places,
+                'devices': [],
+                'total_devices': 0,
                 'online_count': 0,
-                'offline_count': 0
-            })
-    
-    # Функция для проверки ping
-    def check_ping(ip):
-        """Проверяет доступность IP адреса через ping."""
-        try:
-            # Используем ping с таймаутом 1 секунда и 1 попыткой
-            # Для Linux: ping -c 1 -W 1
-            # Для Windows: ping -n 1 -w 1000
-            if platform.system().lower() == 'windows':
-                result = subprocess.run(
-                    ['ping', '-n', '1', '-w', '1000', ip],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=2
-                )
-            else:
-                result = subprocess.run(
-                    ['ping', '-c', '1', '-W', '1', ip],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=2
-                )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-            # Если ping недоступен, пробуем через socket (проверка порта)
-            try:
-                # Пробуем подключиться к порту 80 или 443
-                for port in [80, 443, 22]:
-                    try:
-                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        sock.settimeout(1)
-                        result = sock.connect_ex((ip, port))
-                        sock.close()
-                        if result == 0:
-                            return True
-                    except:
-                        continue
-                return False
-            except (socket.timeout, socket.error, OSError, Exception):
-                return False
-    
-    # Параллельная проверка всех IP адресов
-    ip_status = {}
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_ip = {executor.submit(check_ping, ip): (place_id, eq_id, ip) 
-                        for place_id, eq_id, ip in all_ips}
-        
-        for future in as_completed(future_to_ip):
-            place_id, eq_id, ip = future_to_ip[future]
-            try:
-                is_online = future.result()
-                ip_status[(place_id, eq_id)] = is_online
-            except Exception as e:
-                ip_status[(place_id, eq_id)] = False
+                'offline_count': 0,
+                'unknown_count': 0
+            }
+            places_data.append(place_info)
+        place_info['devices'].append({
+            'id': eq.id,
+            'name': eq.buhname,
+            'ip': ip,
+            'nome': eq.nome.name if eq.nome else 'Неизвестно',
+            'status': online
+        })
+        place_info['total_devices'] += 1
+        if online is None:
+            place_info['unknown_count'] += 1
+        elif online:
+            place_info['online_count'] += 1
+        else:
+            place_info['offline_count'] += 1
     
-    # Обновляем статусы устройств и подсчитываем статистику
+    # Доступность помещений за последние сутки из почасовых агрегатов (один запрос на все устройства)
+    totals = uptime_totals((eq.id for eq in rows), datetime.utcnow() - timedelta(hours=24), 'hour')
     for place_info in places_data:
-        online = 0
-        offline = 0
-        for device in place_info['devices']:
-            status = ip_status.get((place_info['place'].id, device['id']), False)
-            device['status'] = status
-            if status:
-                online += 1
-            else:
-                offline += 1
-        place_info['online_count'] = online
-        place_info['offline_count'] = offline
+        place_totals = [totals[device['id']] for device in place_info['devices'] if device['id'] in totals]
+        place_info['uptime_24h'] = uptime_percent(sum(online for online, _ in place_totals),
+                                                  sum(observed for _, observed in place_totals))
     
+    age = snapshot_age(statuses.values())
     return render_template('monitoring/my_monitoring.html',
                           places_data=places_data,
+                          last_event_id=last_transition_id(),
+                          snapshot_age=age,
+                          snapshot_stale=snapshot_is_stale(age),
                           is_admin=is_admin)
 
 @app.route('/monitoring_place_devices/<int:place_id>')
 @login_required
 def monitoring_place_devices(place_id):
-    """Отображение устройств конкретного помещения в табличном виде. Доступно всем пользователям."""
-    import subprocess
-    import socket
-    import platform
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
+    """
+    Отображение устройств конкретного помещения в табличном виде. Доступно всем пользователям.
+    Состояние устройств читается из снимка фонового опросчика (network-monitor).
+    """
     is_admin = current_user.mode == 1
     
     # Получаем помещение
     place = Places.query.get_or_404(place_id)
     
     # Получаем все устройства с IP адресами в помещении (для всех пользователей)
-    from models import Machine
-    equipment_list = db.session.query(Equipment).join(
-        Nome, Equipment.nomeid == Nome.id
-    ).join(
-        GroupNome, Nome.groupid == GroupNome.id
-    ).filter(
-        Equipment.placesid == place_id,
-        Equipment.active == True,
-        Equipment.os == True,
-        Equipment.ip != '',
-        Equipment.ip.isnot(None),
-        GroupNome.is_network_device == True
+    equipment_list = network_devices_query().filter(
+        Equipment.placesid == place_id
+    ).options(
+        db.joinedload(Equipment.nome), db.joinedload(Equipment.machine)
     ).order_by(Equipment.buhname).all()
+    statuses = device_statuses(eq.id for eq in equipment_list)
+    # Доступность за последние 7 суток из суточных агрегатов
+    uptime_7d = uptime_by_device((eq.id for eq in equipment_list), datetime.utcnow() - timedelta(days=7))
     
     # Подготавливаем данные для таблицы
     devices_data = []
-    all_ips = []
+    online_count = 0
+    offline_count = 0
     
     for eq in equipment_list:
         ip = eq.ip.strip()
@@ -5786,6 +5259,12 @@ def monitoring_place_devices(place_id):
             # Используем relationship через backref 'machine' из модели Equipment
             machine = eq.machine
             display_name = machine.hostname if machine and machine.hostname else eq.buhname
+            status = statuses.get(eq.id)
+            online = status.online if status else None  # None — устройство еще не проверялось
+            if online:
+                online_count += 1
+            elif online is not None:
+                offline_count += 1
             
             devices_data.append({
                 'id': eq.id,
@@ -5795,78 +5274,87 @@ def monitoring_place_devices(place_id):
                 'nome': eq.nome.name if eq.nome else 'Неизвестно',
                 'sernum': eq.sernum or '—',
                 'invnum': eq.invnum or '—',
-                'status': None  # Будет заполнено после ping
+                'status': online,
+                'method': status.method if status else None,
+                'latency_ms': status.latency_ms if status else None,
+                'changed_at': status.changed_at if status else None,
+                'uptime_7d': uptime_7d.get(eq.id)
             })
-            all_ips.append((eq.id, ip))
-    
-    # Функция для проверки ping
-    def check_ping(ip):
-        """Проверяет доступность IP адреса через ping."""
-        try:
-            if platform.system().lower() == 'windows':
-                result = subprocess.run(
-                    ['ping', '-n', '1', '-w', '1000', ip],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=2
-                )
-            else:
-                result = subprocess.run(
-                    ['ping', '-c', '1', '-W', '1', ip],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=2
-                )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-            # Если ping недоступен, пробуем через socket
-            try:
-                for port in [80, 443, 22]:
-                    try:
-                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        sock.settimeout(1)
-                        result = sock.connect_ex((ip, port))
-                        sock.close()
-                        if result == 0:
-                            return True
-                    except:
-                        continue
-                return False
-            except (socket.timeout, socket.error, OSError, Exception):
-                return False
-    
-    # Параллельная проверка всех IP адресов
-    ip_status = {}
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_ip = {executor.submit(check_ping, ip): (eq_id, ip) 
-                        for eq_id, ip in all_ips}
-        
-        for future in as_completed(future_to_ip):
-            eq_id, ip = future_to_ip[future]
-            try:
-                is_online = future.result()
-                ip_status[eq_id] = is_online
-            except Exception as e:
-                ip_status[eq_id] = False
-    
-    # Обновляем статусы устройств
-    online_count = 0
-    offline_count = 0
-    for device in devices_data:
-        status = ip_status.get(device['id'], False)
-        device['status'] = status
-        if status:
-            online_count += 1
-        else:
-            offline_count += 1
     
+    age = snapshot_age(statuses.values())
     return render_template('monitoring/place_devices.html',
                           place=place,
                           devices_data=devices_data,
                           online_count=online_count,
                           offline_count=offline_count,
+                          last_event_id=last_transition_id(),
+                          snapshot_age=age,
+                          snapshot_stale=snapshot_is_stale(age),
                           is_admin=is_admin)
 
+@app.route('/events/monitoring')
+@login_required
+def monitoring_events():
+    """
+    Смены состояния сетевых устройств (Server-Sent Events).
+    В продакшене этот путь обслуживает асинхронная точка входа sse_app.py
+    (nginx проксирует на нее /events/monitoring). Запасной вариант здесь
+    включается SSE_FLASK_FALLBACK: отдает пропущенные смены и закрывает
+    соединение, не занимая рабочий процесс gunicorn. Выключен — ответ 204,
+    браузер не переподключается.
+    """
+    if not SSE_FLASK_FALLBACK:
+        return '', 204
+    place_id = request.args.get('place_id', type=int)
+    after_id = parse_last_event_id(request.headers.get('Last-Event-ID'), request.args.get('after'))
+    return Response(snapshot_events(after_id, place_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/monitoring/devices/<int:tmc_id>/availability')
+@login_required
+def api_device_availability(tmc_id):
+    """
+    Доступность сетевого устройства за окно: итог, ряд по часам или суткам
+    и смены состояния. Параметры: days (по умолчанию 7), granularity (hour/day).
+    """
+    equipment = db.get_or_404(Equipment, tmc_id)
+    try:
+        since, until, granularity = availability_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    data = availability([equipment.id], since, until, granularity)
+    data.pop('devices')
+    status = device_statuses([equipment.id]).get(equipment.id)
+    data.update({
+        'equipment_id': equipment.id,
+        'online': status.online if status else None,
+        'checked_at': status.checked_at.isoformat() if status else None,
+        'changes': status_changes(equipment.id, since),
+    })
+    return jsonify(data)
+
+@app.route('/api/monitoring/places/<int:place_id>/availability')
+@login_required
+def api_place_availability(place_id):
+    """
+    Доступность сетевых устройств помещения за окно: итог, ряд по часам или суткам
+    и итог по каждому устройству. Параметры: days (по умолчанию 7), granularity (hour/day).
+    """
+    place = db.get_or_404(Places, place_id)
+    try:
+        since, until, granularity = availability_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    equipment_ids = [eq_id for (eq_id,) in network_devices_query().filter(
+        Equipment.placesid == place.id
+    ).with_entities(Equipment.id)]
+    data = availability(equipment_ids, since, until, granularity)
+    data['place_id'] = place.id
+    data['devices'] = [{'equipment_id': eq_id, 'uptime_percent': data['devices'].get(eq_id)}
+                       for eq_id in equipment_ids]
+    return jsonify(data)
+
 @app.route('/my_places')
 @login_required
 def my_places():
@@ -5879,62 +5367,8 @@ def my_places():
                              places_stats=[],
                              is_admin=is_admin)
     
-    if is_admin:
-        # Для админа - все помещения
-        places = Places.query.filter_by(active=True).order_by(Places.name).all()
-    else:
-        # Для МОЛ - только помещения, где у него есть ТМЦ
-        places = db.session.query(Places).join(
-            Equipment, Places.id == Equipment.placesid
-        ).filter(
-            Equipment.usersid == current_user.id,
-            Equipment.active == True,
-            Equipment.os == True,
-            Places.active == True
-        ).distinct().order_by(Places.name).all()
-    
-    # Подсчёт статистики по каждому помещению
-    places_stats = []
-    for place in places:
-        if is_admin:
-            # Для админа - все ТМЦ в помещении
-            tmc_count = Equipment.query.filter_by(
-                placesid=place.id,
-                active=True,
-                os=True
-            ).count()
-            total_cost = db.session.query(
-                func.coalesce(func.sum(Equipment.cost), 0)
-            ).filter_by(
-                placesid=place.id,
-                active=True,
-                os=True
-            ).scalar()
-        else:
-            # Для МОЛ - только его ТМЦ в помещении
-            tmc_count = Equipment.query.filter_by(
-                placesid=place.id,
-                usersid=current_user.id,
-                active=True,
-                os=True
-            ).count()
-            total_cost = db.session.query(
-                func.coalesce(func.sum(Equipment.cost), 0)
-            ).filter_by(
-                placesid=place.id,
-                usersid=current_user.id,
-                active=True,
-                os=True
-            ).scalar()
-        
-        places_stats.append({
-            'place': place,
-            'tmc_count': tmc_count,
-            'total_cost': float(total_cost) if total_cost else 0.0
-        })
-    
-    # Сортировка по убыванию суммы (от большей к меньшей)
-    places_stats.sort(key=lambda x: x['total_cost'], reverse=True)
+    # Количество и стоимость ТМЦ по всем помещениям — одним запросом с группировкой (кэш на пользователя)
+    places_stats = get_place_stats(current_user)
     
     return render_template('places/my_places.html',
                           places_stats=places_stats,
@@ -6079,6 +5513,9 @@ def delete_place(place_id):
     
     return redirect(url_for('my_places'))
 
+# Порядок постраничного вывода ТМЦ помещения: инвентарный номер, наименование, id
+PLACE_EQUIPMENT_SORT = [(func.coalesce(Equipment.invnum, ''), False), (Equipment.buhname, False), (Equipment.id, False)]
+
 @app.route('/place_equipment/<int:place_id>')
 @login_required
 def place_equipment(place_id):
@@ -6102,32 +5539,24 @@ def place_equipment(place_id):
             flash('Доступ запрещён', 'danger')
             return redirect(url_for('my_places'))
     
-    # Получаем ТМЦ помещения
-    if is_admin:
-        equipment_list = Equipment.query.filter_by(
-            placesid=place_id,
-            active=True,
-            os=True
-        ).order_by(Equipment.invnum, Equipment.buhname).all()
-    else:
-        equipment_list = Equipment.query.filter_by(
-            placesid=place_id,
-            usersid=current_user.id,
-            active=True,
-            os=True
-        ).order_by(Equipment.invnum, Equipment.buhname).all()
-    
-    # Подсчёт статистики
-    tmc_count = len(equipment_list)
-    total_cost = sum(float(eq.cost) if eq.cost else 0.0 for eq in equipment_list)
+    # ТМЦ помещения (для МОЛ — только свои): итоги одним запросом, список постранично
+    place_filter = EquipmentFilter(place_id=place_id, user_id=None if is_admin else current_user.id)
+    tmc_count, total_cost = place_filter.totals()
+    try:
+        page = keyset_page(place_filter.query().options(db.joinedload(Equipment.nome)),
+                           PLACE_EQUIPMENT_SORT, **page_args(request.args))
+    except ValueError:
+        abort(400)
     
     is_mol = current_user_has_role(1)
     
     return render_template('places/place_equipment.html',
                           place=place,
-                          equipment_list=equipment_list,
+                          equipment_list=page.items,
+                          page=page,
+                          nav_params=nav_params(request.args, place_id=place_id),
                           tmc_count=tmc_count,
-                          total_cost=total_cost,
+                          total_cost=float(total_cost),
                           is_admin=is_admin,
                           is_mol=is_mol)
 
@@ -6358,10 +5787,11 @@ def delete_department(department_id):
 @app.route('/generate_form8/<int:department_id>')
 @login_required
 def generate_form8(department_id):
-    """Генерация формы 8 (Книга учета материальных ценностей) для отдела."""
-    from import_export.pdf_export import generate_form8_pdf
-    import models
-    
+    """
+    Генерация формы 8 (Книга учета материальных ценностей) для отдела.
+    Отчет ставится в очередь фонового обработчика; пользователь попадает на
+    страницу ожидания, которая откроет PDF, когда он будет готов.
+    """
     is_admin = current_user.mode == 1
     department = Department.query.get_or_404(department_id)
     
@@ -6378,1183 +5808,288 @@ def generate_form8(department_id):
             flash('Доступ запрещён', 'danger')
             return redirect(url_for('my_departments'))
     
-    # Получаем ТМЦ отдела
-    if is_admin:
-        equipment_list = Equipment.query.filter_by(
-            department_id=department_id,
-            active=True,
-            os=True
-        ).order_by(Equipment.invnum, Equipment.buhname).all()
-    else:
-        equipment_list = Equipment.query.filter_by(
-            department_id=department_id,
-            usersid=current_user.id,
-            active=True,
-            os=True
-        ).order_by(Equipment.invnum, Equipment.buhname).all()
-    
-    if not equipment_list:
+    # Администратор получает все ТМЦ отдела, МОЛ — только свои
+    scope_user_id = None if is_admin else current_user.id
+    if not form8_equipment_query(department.id, scope_user_id).first():
         flash('В отделе нет ТМЦ для формирования отчета', 'warning')
         return redirect(url_for('my_departments'))
     
-    # Получаем организацию пользователя
-    user_org = None
-    if hasattr(current_user, 'orgid') and current_user.orgid:
-        user_org = db.session.get(Org, current_user.orgid)
-    org_name = user_org.name if user_org else 'Не указано'
-    
-    # Получаем МОЛ (берем первого из списка ТМЦ или текущего пользователя)
-    mol_name = 'Не указано'
-    if equipment_list and equipment_list[0].users:
-        mol_name = equipment_list[0].users.login
-    elif current_user:
-        mol_name = current_user.login
+    org_id = current_user.orgid if getattr(current_user, 'orgid', None) else None
+    job, _ = enqueue_report('form8', form8_params(department.id, scope_user_id, org_id),
+                            requested_by=current_user.id)
     
-    # Генерируем PDF файл формы 8
-    return generate_form8_pdf(department, equipment_list, org_name, mol_name, db.session, models)
+    # Такой же отчет по неизменным данным уже сформирован — отдаем сразу
+    if job.status == 'done':
+        return redirect(url_for('report_job_download', job_id=job.id))
+    return redirect(url_for('report_job', job_id=job.id))
+
+def _audit_or_404(audit_id):
+    """Сеанс инвентаризации, доступный текущему пользователю (администратору — любой)."""
+    audit = db.get_or_404(InventoryAudit, audit_id)
+    if current_user.mode == 1 or current_user.id in (audit.created_by, audit.user_id):
+        return audit
+    abort(404)
+
+@app.route('/api/audits', methods=['POST'])
+@login_required
+def api_audit_open():
+    """
+    Открывает сеанс инвентаризации помещения и (или) отдела.
+
+    JSON: place_id, department_id (хотя бы одно), user_id (только для
+    администратора; МОЛ проверяет только свои ТМЦ).
+    """
+    data = request.get_json(silent=True) or {}
+    is_admin = current_user.mode == 1
+    try:
+        place_id = int(data['place_id']) if data.get('place_id') else None
+        department_id = int(data['department_id']) if data.get('department_id') else None
+        user_id = (int(data['user_id']) if data.get('user_id') else None) if is_admin else current_user.id
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Некорректные параметры'}), 400
+    if place_id and db.session.get(Places, place_id) is None:
+        return jsonify({'success': False, 'message': 'Помещение не найдено'}), 404
+    if department_id and db.session.get(Department, department_id) is None:
+        return jsonify({'success': False, 'message': 'Отдел не найден'}), 404
+    try:
+        audit = open_audit(place_id, department_id, user_id, created_by=current_user.id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    response = jsonify({'success': True, 'audit': audit_status(audit)})
+    response.status_code = 201
+    response.headers['Location'] = url_for('api_audit', audit_id=audit.id)
+    return response
+
+@app.route('/api/audits/<int:audit_id>')
+@login_required
+def api_audit(audit_id):
+    """Состояние сеанса и итог сверки (списки ТМЦ — при details=1)."""
+    audit = _audit_or_404(audit_id)
+    result = reconcile_audit(audit)
+    data = {'success': True, 'audit': audit_status(audit), 'summary': result['summary']}
+    if request.args.get('details', type=int):
+        data.update({key: result[key] for key in ('found', 'missing', 'unexpected', 'unknown')})
+    return jsonify(data)
+
+@app.route('/api/audits/<int:audit_id>/scans', methods=['POST'])
+@login_required
+def api_audit_scans(audit_id):
+    """Пачка отсканированных кодов: JSON {"codes": [...]} (до AUDIT_SCAN_BATCH кодов)."""
+    audit = _audit_or_404(audit_id)
+    data = request.get_json(silent=True) or {}
+    codes = data.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return jsonify({'success': False, 'message': 'Ожидается непустой список codes'}), 400
+    if len(codes) > AUDIT_SCAN_BATCH:
+        return jsonify({'success': False, 'message': f'Не больше {AUDIT_SCAN_BATCH} кодов за запрос'}), 400
+    codes = [str(code) for code in codes if isinstance(code, (str, int))]
+    try:
+        result = add_scans(audit, codes, user_id=current_user.id)
+    except AuditClosed as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    return jsonify({'success': True, **result})
+
+@app.route('/api/audits/<int:audit_id>/close', methods=['POST'])
+@login_required
+def api_audit_close(audit_id):
+    """Закрывает сеанс и фиксирует итог сверки."""
+    audit = _audit_or_404(audit_id)
+    result = close_audit(audit)
+    return jsonify({'success': True, 'audit': audit_status(audit), 'summary': result['summary'],
+                    'export_url': url_for('audit_export', audit_id=audit.id)})
+
+@app.route('/audits/<int:audit_id>/export')
+@login_required
+def audit_export(audit_id):
+    """
+    Сличительная ведомость закрытого сеанса в PDF. Отчет ставится в очередь
+    фонового обработчика, как и форма 8.
+    """
+    audit = _audit_or_404(audit_id)
+    if audit.status != 'closed':
+        flash('Инвентаризация еще не закрыта', 'warning')
+        return redirect(url_for('index'))
+    job, _ = enqueue_report('inventory_audit', audit_params(audit), requested_by=current_user.id)
+    if job.status == 'done':
+        return redirect(url_for('report_job_download', job_id=job.id))
+    return redirect(url_for('report_job', job_id=job.id))
+
+def _report_job_or_404(job_id):
+    """Задание на отчет, доступное текущему пользователю (администратору — любое)."""
+    job = db.get_or_404(ReportJob, job_id)
+    if current_user.mode == 1:
+        return job
+    if job.requested_by == current_user.id or job_params(job).get('user_id') == current_user.id:
+        return job
+    abort(404)
+
+@app.route('/reports/jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    """Страница ожидания фонового отчета."""
+    job = _report_job_or_404(job_id)
+    return render_template('reports/report_job.html', job=job)
+
+@app.route('/api/reports/jobs/<int:job_id>')
+@login_required
+def api_report_job_status(job_id):
+    """Статус задания на отчет (для опроса со страницы ожидания)."""
+    job = _report_job_or_404(job_id)
+    data = job_status(job)
+    data['download_url'] = url_for('report_job_download', job_id=job.id) if job.status == 'done' else None
+    return jsonify(data)
+
+@app.route('/reports/jobs/<int:job_id>/download')
+@login_required
+def report_job_download(job_id):
+    """Готовый файл отчета."""
+    job = _report_job_or_404(job_id)
+    if job.status != 'done' or not artifact_exists(job):
+        flash('Отчет еще не готов или был удален. Сформируйте его заново.', 'warning')
+        return redirect(url_for('report_job', job_id=job.id))
+    touch_artifact(job.artifact_path)
+    # Ключ задания определяет содержимое файла: повторный запрос с If-None-Match
+    # или If-Modified-Since получает 304 без передачи файла
+    try:
+        response = send_file(job.artifact_path, mimetype=job.mimetype, download_name=job.filename,
+                             etag=job.dedup_key,
+                             last_modified=datetime.fromtimestamp(os.path.getmtime(job.artifact_path), timezone.utc))
+    except FileNotFoundError:
+        # Файл вытеснен из кэша между проверкой и отдачей
+        flash('Отчет был удален из кэша. Сформируйте его заново.', 'warning')
+        return redirect(url_for('report_job', job_id=job.id))
+    response.cache_control.private = True
+    return response
 
 # === API ДЛЯ СБОРА ДАННЫХ О ЖЕСТКИХ ДИСКАХ ===
 
+def _enqueue_agent_report(api, data, error_response):
+    """
+    Ставит отчет агента в очередь (режим INGEST_MODE=queue) и отвечает 202 с номером квитанции.
+    error_response(message) формирует тело ответа об ошибке в формате версии API.
+    """
+    try:
+        receipt, stats = enqueue_payload(api, data)
+    except ValueError as e:
+        return jsonify(error_response(str(e))), 400
+    except IngestQueueFull as e:
+        body = error_response('Ingest queue is full, retry later')
+        body['queue'] = e.stats
+        response = jsonify(body)
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.stats['retry_after'])
+        return response
+    response = jsonify({
+        'success': True,
+        'queued': True,
+        'receipt': receipt.receipt,
+        'status_url': url_for('api_hdd_collect_receipt', receipt=receipt.receipt),
+        'queue': stats,
+        'timestamp': datetime.utcnow().isoformat() + 'Z'
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_hdd_collect_receipt', receipt=receipt.receipt)
+    return response
+
+
 @app.route('/api/hdd_collect', methods=['POST'])
 def api_hdd_collect():
     """API endpoint для приема данных о жестких дисках с Windows ПК."""
+    data = request.get_json(silent=True)
+    if ingest_queued() and data and data.get('disks'):
+        return _enqueue_agent_report('v1', data, lambda message: {'error': message})
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        hostname = data.get('hostname')
-        disks = data.get('disks', [])
-        
-        if not disks:
-            return jsonify({'error': 'No disks provided', 'processed': 0, 'total': 0, 'new': 0, 'updated': 0}), 200
-        
-        from models import PCHardDrive, Vendor
-        
-        new_count = 0
-        updated_count = 0
-        error_count = 0
-        errors = []
+        response = apply_v1_payload(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Invalid request: {str(e)}'}), 400
-    
-    # Вспомогательная функция для получения или создания производителя
-    def get_or_create_vendor(manufacturer_name):
-        """
-        Получает производителя из базы или создает нового, если его нет.
-        Поиск выполняется без учета регистра.
-        
-        Args:
-            manufacturer_name: Название производителя
-            
-        Returns:
-            Vendor: Объект производителя
-        """
-        if not manufacturer_name or not manufacturer_name.strip():
-            manufacturer_name = 'Unknown'
-        else:
-            manufacturer_name = manufacturer_name.strip()
-        
-        # Ищем производителя без учета регистра
-        vendor = Vendor.query.filter(
-            func.lower(Vendor.name) == func.lower(manufacturer_name),
-            Vendor.active == True
-        ).first()
-        
-        # Если не найден, создаем нового
-        if not vendor:
-            vendor = Vendor(name=manufacturer_name, active=True)
-            db.session.add(vendor)
-            db.session.flush()
-        
-        return vendor
-    
-    # Вспомогательная функция для определения производителя по модели
-    def detect_manufacturer_by_model(model):
-        """
-        Определяет производителя по модели диска.
-        
-        Args:
-            model: Модель диска
-            
-        Returns:
-            str: Название производителя
-        """
-        if not model:
-            return 'Unknown'
-        
-        model_upper = model.upper()
-        
-        # Определяем производителя по характерным признакам в модели
-        # Проверяем в порядке специфичности (более специфичные сначала)
-        if 'BESHTAU' in model_upper:
-            return 'БЕШТАУ'
-        elif 'XRAYDISK' in model_upper:
-            return 'XrayDisk'
-        elif 'WD' in model_upper or 'WESTERN' in model_upper:
-            return 'Western Digital'
-        elif 'SEAGATE' in model_upper or model_upper.startswith('ST'):
-            return 'Seagate'
-        elif 'TOSHIBA' in model_upper or model_upper.startswith('DT'):
-            return 'Toshiba'
-        elif 'HP' in model_upper or 'HEWLETT' in model_upper:
-            return 'HP'
-        elif 'SAMSUNG' in model_upper:
-            return 'Samsung'
-        elif 'KINGSTON' in model_upper:
-            return 'Kingston'
-        elif 'CRUCIAL' in model_upper:
-            return 'Crucial'
-        elif 'INTEL' in model_upper:
-            return 'Intel'
-        elif 'SANDISK' in model_upper or 'SAN DISK' in model_upper:
-            return 'SanDisk'
-        elif 'ADATA' in model_upper:
-            return 'ADATA'
-        elif 'CORSAIR' in model_upper:
-            return 'Corsair'
-        else:
-            return 'Unknown'
-    
-    for disk_data in disks:
-        try:
-            serial = disk_data.get('serial_number')
-            
-            if not serial:
-                error_count += 1
-                errors.append(f'Disk skipped: missing serial_number')
-                continue
-            
-            # Проверяем, существует ли диск в базе
-            existing_disk = PCHardDrive.query.filter_by(serial_number=serial).first()
-            
-            # Для новых дисков проверяем обязательные поля
-            if not existing_disk:
-                model = disk_data.get('model', '').strip()
-                size_gb = disk_data.get('size_gb')
-                
-                # Пропускаем только если model пустой или size_gb не указан (None)
-                # size_gb = 0 считается валидным значением (может быть для некоторых дисков)
-                if not model:
-                    error_count += 1
-                    errors.append(f'Disk {serial}: missing model')
-                    continue
-                
-                if size_gb is None:
-                    error_count += 1
-                    errors.append(f'Disk {serial}: missing size_gb')
-                    continue
-            
-            if existing_disk:
-                # Обновляем существующий диск
-                print(f"Updating existing disk: serial={serial}")
-                
-                if 'model' in disk_data:
-                    existing_disk.model = disk_data.get('model')
-                if 'size_gb' in disk_data:
-                    existing_disk.capacity_gb = disk_data.get('size_gb')
-                if 'interface' in disk_data:
-                    existing_disk.interface = disk_data.get('interface')
-                if 'power_on_hours' in disk_data:
-                    existing_disk.power_on_hours = disk_data.get('power_on_hours')
-                if 'power_on_count' in disk_data:
-                    existing_disk.power_on_count = disk_data.get('power_on_count')
-                if 'health_status' in disk_data:
-                    # Конвертируем английский статус в русский
-                    health_status = disk_data.get('health_status')
-                    existing_disk.health_status = convert_health_status_to_russian(health_status)
-                
-                # Обновляем производителя (если указан явно или можно определить по модели)
-                manufacturer = disk_data.get('manufacturer', '').strip() if 'manufacturer' in disk_data else ''
-                if not manufacturer and 'model' in disk_data:
-                    # Пытаемся определить по модели
-                    model = disk_data.get('model', '').strip()
-                    manufacturer = detect_manufacturer_by_model(model)
-                
-                if manufacturer:
-                    vendor = get_or_create_vendor(manufacturer)
-                    existing_disk.vendor_id = vendor.id
-                    print(f"Updated vendor for disk {serial}: {manufacturer} (vendor_id={vendor.id})")
-                
-                # Сохраняем старые значения для сравнения
-                old_health_check_date = existing_disk.health_check_date
-                old_power_on_count = existing_disk.power_on_count
-                old_power_on_hours = existing_disk.power_on_hours
-                old_health_status = existing_disk.health_status
-                
-                # Обновляем дату последней проверки
-                current_date = datetime.now().date()
-                existing_disk.health_check_date = current_date
-                
-                # Обновляем комментарий с информацией о hostname
-                if hostname:
-                    existing_disk.comment = f'Последний раз обнаружен на {hostname}'
-                
-                # Активируем диск, если он был деактивирован (автоматическое восстановление)
-                # Деактивированные диски автоматически активируются при обновлении через API
-                # Это позволяет автоматически восстанавливать удаленные диски при получении данных
-                if not existing_disk.active:
-                    existing_disk.active = True
-                    print(f"Disk {serial} reactivated (was inactive)")
-                
-                # Получаем актуальные значения после обновления
-                new_power_on_hours = existing_disk.power_on_hours
-                new_power_on_count = existing_disk.power_on_count
-                new_health_status = existing_disk.health_status
-                
-                # Создаем запись в истории при каждом обновлении через API
-                from models import PCHardDriveHistory
-                
-                # Проверяем, изменились ли параметры состояния
-                state_changed = (
-                    old_health_check_date != current_date or
-                    old_power_on_count != new_power_on_count or
-                    old_power_on_hours != new_power_on_hours or
-                    old_health_status != new_health_status
-                )
-                
-                # Создаем запись в истории при каждом обновлении (даже если параметры не изменились)
-                # Это позволяет отслеживать все обновления с актуальной временной меткой
-                history_comment = f'Обновление через API'
-                if hostname:
-                    history_comment += f' с {hostname}'
-                
-                history_record = PCHardDriveHistory(
-                    hard_drive_id=existing_disk.id,
-                    check_date=current_date,
-                    # Основные характеристики диска
-                    drive_type=existing_disk.drive_type,
-                    vendor_id=existing_disk.vendor_id,
-                    model=existing_disk.model,
-                    capacity_gb=existing_disk.capacity_gb,
-                    serial_number=existing_disk.serial_number,
-                    interface=existing_disk.interface,
-                    # Состояние диска
-                    power_on_hours=new_power_on_hours,
-                    power_on_count=new_power_on_count,
-                    health_status=new_health_status,
-                    # Дополнительная информация
-                    purchase_date=existing_disk.purchase_date,
-                    purchase_cost=existing_disk.purchase_cost,
-                    machine_id=existing_disk.machine_id,
-                    active=existing_disk.active,
-                    comment=history_comment
-                )
-                db.session.add(history_record)
-                print(f"History record created for disk {serial} (check_date={current_date})")
-                
-                print(f"Disk {serial} updated successfully (active={existing_disk.active})")
-                updated_count += 1
-            else:
-                # Создаем новый диск
-                # Получаем данные (если не были получены ранее в проверке)
-                model = disk_data.get('model', '').strip()
-                size_gb = disk_data.get('size_gb')
-                
-                # Определяем тип диска
-                media_type = disk_data.get('media_type', '').upper()
-                if 'SSD' in media_type or 'SOLID' in media_type:
-                    drive_type = 'SSD'
-                elif 'NVMe' in model.upper() or 'NVME' in model.upper():
-                    drive_type = 'NVMe'
-                else:
-                    drive_type = 'HDD'
-                
-                # Определяем производителя
-                manufacturer = disk_data.get('manufacturer', '').strip()
-                if not manufacturer:
-                    # Пытаемся определить по модели
-                    manufacturer = detect_manufacturer_by_model(model)
-                
-                # Получаем или создаем производителя
-                vendor = get_or_create_vendor(manufacturer)
-                
-                # Конвертируем статус здоровья из английского в русский
-                health_status = disk_data.get('health_status')
-                health_status_ru = convert_health_status_to_russian(health_status) if health_status else None
-                
-                # Логируем создание диска для отладки
-                print(f"Creating disk: serial={serial}, model={model}, size_gb={size_gb}, vendor_id={vendor.id}, drive_type={drive_type}")
-                
-                new_disk = PCHardDrive(
-                    serial_number=serial,
-                    model=model,
-                    capacity_gb=size_gb,
-                    drive_type=drive_type,
-                    vendor_id=vendor.id,
-                    interface=disk_data.get('interface'),
-                    power_on_hours=disk_data.get('power_on_hours'),
-                    power_on_count=disk_data.get('power_on_count'),
-                    health_status=health_status_ru,
-                    health_check_date=datetime.now().date(),
-                    comment=f'Автоматически добавлен с {hostname}' if hostname else 'Автоматически добавлен'
-                )
-                db.session.add(new_disk)
-                print(f"Disk {serial} added to session, new_count will be {new_count + 1}")
-                new_count += 1
-        except Exception as e:
-            error_count += 1
-            serial = disk_data.get('serial_number', 'unknown')
-            error_msg = f'Disk {serial}: {str(e)}'
-            errors.append(error_msg)
-            # Логируем ошибку для отладки
-            import traceback
-            print(f"ERROR processing disk {serial}: {str(e)}")
-            print(traceback.format_exc())
-            db.session.rollback()
-            continue
-    
+
     try:
-        print(f"Committing transaction: new={new_count}, updated={updated_count}, total_disks={len(disks)}")
         db.session.commit()
-        print(f"Transaction committed successfully")
     except Exception as e:
         db.session.rollback()
         import traceback
         error_trace = traceback.format_exc()
         print(f"ERROR committing transaction: {str(e)}")
         print(error_trace)
-        return jsonify({
+        response.update({
             'error': f'Database error: {str(e)}',
-            'processed': new_count + updated_count,
-            'total': len(disks),
-            'new': new_count,
-            'updated': updated_count,
-            'errors': errors[:10],  # Первые 10 ошибок
+            'errors': response.get('errors', [])[:10],  # Первые 10 ошибок
             'traceback': error_trace
-        }), 500
-    
-    response = {
-        'processed': new_count + updated_count,
-        'total': len(disks),
-        'new': new_count,
-        'updated': updated_count
-    }
-    
-    if error_count > 0:
-        response['error_count'] = error_count
-        response['errors'] = errors[:10]  # Первые 10 ошибок
-    
+        })
+        response.pop('error_count', None)
+        return jsonify(response), 500
     return jsonify(response), 200
 
-def fix_windows_version(version):
-    """
-    Исправляет 'Windows 6' на 'Windows 7' только для этого случая.
-    """
-    if version and str(version).strip() == '6':
-        return '7'
-    return version
-
-def sync_machine_to_equipment(machine, changed_fields=None):
-    """
-    Синхронизирует данные из Machine в связанный Equipment (ТМЦ).
-    Приоритет данных: Machine -> Equipment (данные из Machine перезаписывают Equipment).
-    Это избавляет от дублирования данных и обеспечивает единый источник истины.
-    
-    Args:
-        machine: Объект Machine
-        changed_fields: Список измененных полей (для логирования)
-    
-    Returns:
-        dict: Информация об обновленных полях Equipment
-    """
-    if not machine.equipment_id:
-        return {'updated': False, 'fields': []}
-    
-    from models import Equipment, MachineHistory
-    
-    equipment = Equipment.query.get(machine.equipment_id)
-    if not equipment:
-        return {'updated': False, 'fields': []}
-    
-    updated_fields = []
-    sync_mapping = {
-        'ip_address': ('ip', str),  # Machine.ip_address -> Equipment.ip
-        # Можно добавить другие поля для синхронизации в будущем
-        # 'hostname': ('buhname', str),  # Например, если нужно синхронизировать имя
-    }
-    
-    for machine_field, (equipment_field, converter) in sync_mapping.items():
-        machine_value = getattr(machine, machine_field, None)
-        equipment_value = getattr(equipment, equipment_field, None)
-        
-        # Преобразуем значение если нужно
-        if machine_value is not None:
-            if converter == str:
-                machine_value = str(machine_value).strip() if machine_value else ''
-            else:
-                machine_value = converter(machine_value)
-        
-        # Обновляем только если значения различаются
-        if machine_value != equipment_value:
-            old_value = equipment_value
-            setattr(equipment, equipment_field, machine_value)
-            updated_fields.append({
-                'field': equipment_field,
-                'old_value': old_value,
-                'new_value': machine_value
-            })
-            
-            # Записываем в историю машины
-            history_record = MachineHistory(
-                machine_id=machine.id,
-                changed_field=f'equipment_{equipment_field}',
-                old_value=str(old_value) if old_value else None,
-                new_value=str(machine_value) if machine_value else None,
-                comment=f'Поле ТМЦ "{equipment_field}" синхронизировано из Machine.{machine_field}'
-            )
-            db.session.add(history_record)
-    
-    if updated_fields:
-        db.session.flush()  # Сохраняем изменения Equipment
-    
-    return {
-        'updated': len(updated_fields) > 0,
-        'fields': [f['field'] for f in updated_fields]
-    }
-
 @app.route('/api/hdd_collect/v2', methods=['POST'])
 def api_hdd_collect_v2():
     """
     API v2 endpoint для приема данных о компьютерах и жестких дисках.
     Поддерживает расширенную информацию о машинах, ОС, железе и сетевых настройках.
+    Запись выполняется пакетно (services/hdd_ingest.py) с одним commit на запрос;
+    в режиме INGEST_MODE=queue отчет только ставится в очередь (ответ 202).
     """
+    if ingest_queued():
+        return _enqueue_agent_report('v2', request.get_json(silent=True), lambda message: {
+            'success': False,
+            'error': message,
+            'timestamp': datetime.utcnow().isoformat() + 'Z'
+        })
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'No data provided',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }), 400
-        
-        # Проверяем наличие подтверждения для обновления данных
-        confirm_update = data.get('confirm', False) or request.args.get('confirm', 'false').lower() == 'true'
-        
-        # Проверка обязательных полей
-        machine_data = data.get('machine')
-        if not machine_data:
-            return jsonify({
-                'success': False,
-                'error': 'Field "machine" is required',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }), 400
-        
-        hostname = machine_data.get('hostname')
-        mac_address = machine_data.get('mac_address')
-        
-        # MAC-адрес обязателен для API v2 (уникальный идентификатор машины)
-        if not mac_address or not mac_address.strip():
-            return jsonify({
-                'success': False,
-                'error': 'Field "machine.mac_address" is required for API v2. Machines are identified by unique MAC address.',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }), 400
-        
-        # Нормализуем MAC-адрес
-        mac_address = mac_address.strip().upper()
-        
-        # Проверяем формат MAC-адреса (базовая валидация)
-        if len(mac_address) < 12 or len(mac_address) > 17:
-            return jsonify({
-                'success': False,
-                'error': f'Invalid MAC address format: "{mac_address}". Expected format: XX:XX:XX:XX:XX:XX or XXXXXXXXXXXX',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }), 400
-        
-        disks = data.get('disks', [])
-        collection_info = data.get('collection_info', {})
-        
-        from models import PCHardDrive, Vendor, Machine, MachineHistory, PCGraphicsCard, PCMemoryModule
-        
-        # === ОБРАБОТКА МАШИНЫ ===
-        # Идентификация ТОЛЬКО по MAC-адресу (уникальный идентификатор)
-        machine = Machine.query.filter_by(mac_address=mac_address).first()
-        found_by_mac = machine is not None
-        
-        machine_status = 'updated'
-        machine_changes = []
-        
-        if machine:
-            # Обновляем существующую машину (найдена по MAC-адресу)
-            print(f"Info: Machine found by MAC address '{mac_address}'. Updating data (machine ID: {machine.id})")
-            old_values = {}
-            
-            # Базовые поля
-            if 'ip_address' in machine_data and machine_data['ip_address'] != machine.ip_address:
-                old_values['ip_address'] = machine.ip_address
-                machine.ip_address = machine_data.get('ip_address')
-                machine_changes.append('ip_address')
-            
-            # MAC-адрес не обновляем, так как он уникальный идентификатор
-            # Но если он изменился в запросе, это ошибка (MAC должен быть постоянным)
-            if 'mac_address' in machine_data and machine_data['mac_address'].strip().upper() != machine.mac_address:
-                print(f"Warning: MAC address mismatch for machine {machine.id}. Requested: {machine_data['mac_address']}, Current: {machine.mac_address}")
-            
-            # Обновляем hostname, если он изменился
-            if hostname and hostname != machine.hostname:
-                # Проверяем, не используется ли новый hostname другой машиной
-                existing_machine_with_hostname = Machine.query.filter_by(hostname=hostname).first()
-                
-                if existing_machine_with_hostname and existing_machine_with_hostname.id != machine.id:
-                    # Машина найдена по MAC-адресу (приоритет), обновляем hostname принудительно
-                    # Освобождаем hostname у старой машины
-                    old_hostname_for_other = existing_machine_with_hostname.hostname
-                    # Устанавливаем временный hostname для старой машины, чтобы освободить уникальный hostname
-                    existing_machine_with_hostname.hostname = f"OLD-{old_hostname_for_other}-{existing_machine_with_hostname.id}"
-                    print(f"Info: Hostname '{hostname}' was used by machine {existing_machine_with_hostname.id}. Freed for machine {machine.id} (found by MAC)")
-                
-                # Обновляем hostname
-                old_values['hostname'] = machine.hostname
-                machine.hostname = hostname
-                machine_changes.append('hostname')
-                print(f"Info: Hostname updated from '{old_values['hostname']}' to '{hostname}' for machine {machine.id}")
-            
-            # Операционная система
-            os_data = machine_data.get('os', {})
-            if os_data:
-                os_fields = ['os_name', 'os_version', 'os_build', 'os_edition', 'os_architecture']
-                for field in os_fields:
-                    os_field = field.replace('os_', '')
-                    if os_field in os_data:
-                        old_val = getattr(machine, field, None)
-                        new_val = os_data[os_field]
-                        # Исправляем 'Windows 6' на 'Windows 7' только для os_version
-                        if field == 'os_version':
-                            new_val = fix_windows_version(new_val)
-                        if old_val != new_val:
-                            old_values[field] = old_val
-                            setattr(machine, field, new_val)
-                            machine_changes.append(field)
-            
-            # Аппаратное обеспечение
-            hardware_data = machine_data.get('hardware', {})
-            if hardware_data:
-                hw_fields = ['processor', 'memory_gb', 'motherboard', 'bios_version']
-                for field in hw_fields:
-                    if field in hardware_data:
-                        old_val = getattr(machine, field, None)
-                        new_val = hardware_data[field]
-                        if old_val != new_val:
-                            old_values[field] = old_val
-                            setattr(machine, field, new_val)
-                            machine_changes.append(field)
-            
-            # Сетевая информация
-            network_data = machine_data.get('network', {})
-            if network_data:
-                net_fields = ['domain', 'computer_role', 'dns_suffix']
-                for field in net_fields:
-                    if field in network_data:
-                        old_val = getattr(machine, field, None)
-                        new_val = network_data[field]
-                        if old_val != new_val:
-                            old_values[field] = old_val
-                            setattr(machine, field, new_val)
-                            machine_changes.append(field)
-            
-            # Обновляем last_seen
-            machine.last_seen = datetime.utcnow()
-            machine.updated_at = datetime.utcnow()
-            
-            # Синхронизируем данные Machine -> Equipment при каждом обновлении
-            # Это избавляет от дублирования данных и обеспечивает единый источник истины
-            # Приоритет данных: Machine -> Equipment (данные из Machine перезаписывают Equipment)
-            # Функция обновит только те поля Equipment, которые отличаются от Machine
-            sync_result = sync_machine_to_equipment(machine, changed_fields=machine_changes)
-            
-            # Записываем изменения в историю
-            if machine_changes:
-                for field in machine_changes:
-                    history_record = MachineHistory(
-                        machine_id=machine.id,
-                        changed_field=field,
-                        old_value=str(old_values.get(field, '')) if old_values.get(field) is not None else None,
-                        new_value=str(getattr(machine, field, '')),
-                        comment=collection_info.get('comment', 'Обновление через API v2')
-                    )
-                    db.session.add(history_record)
-        else:
-            # Создаем новую машину по уникальному MAC-адресу
-            # Если нет hostname, используем MAC как hostname
-            if not hostname:
-                hostname = f"MAC-{mac_address.replace(':', '-')}"
-            
-            # Проверяем, не существует ли уже машина с таким hostname
-            existing_machine_with_hostname = Machine.query.filter_by(hostname=hostname).first()
-            if existing_machine_with_hostname:
-                # Если hostname занят, добавляем суффикс
-                hostname = f"{hostname}-{mac_address.replace(':', '')[-6:]}"
-                print(f"Info: Hostname was occupied, using '{hostname}' for new machine with MAC {mac_address}")
-            
-            os_data = machine_data.get('os', {})
-            hardware_data = machine_data.get('hardware', {})
-            network_data = machine_data.get('network', {})
-            
-            machine = Machine(
-                hostname=hostname,
-                ip_address=machine_data.get('ip_address'),
-                mac_address=mac_address,  # Уже нормализован выше
-                os_name=os_data.get('name') if os_data else None,
-                os_version=fix_windows_version(os_data.get('version')) if os_data else None,
-                os_build=os_data.get('build') if os_data else None,
-                os_edition=os_data.get('edition') if os_data else None,
-                os_architecture=os_data.get('architecture') if os_data else None,
-                processor=hardware_data.get('processor') if hardware_data else None,
-                memory_gb=hardware_data.get('memory_gb') if hardware_data else None,
-                motherboard=hardware_data.get('motherboard') if hardware_data else None,
-                bios_version=hardware_data.get('bios_version') if hardware_data else None,
-                domain=network_data.get('domain') if network_data else None,
-                computer_role=network_data.get('computer_role') if network_data else None,
-                dns_suffix=network_data.get('dns_suffix') if network_data else None,
-                first_seen=datetime.utcnow(),
-                last_seen=datetime.utcnow()
-            )
-            db.session.add(machine)
-            db.session.flush()  # Получаем ID машины
-            
-            # Записываем в историю создание машины
-            history_record = MachineHistory(
-                machine_id=machine.id,
-                changed_field='created',
-                comment=collection_info.get('comment', 'Машина создана через API v2')
-            )
-            db.session.add(history_record)
-            machine_status = 'created'
-        
-        # === ОБРАБОТКА ДИСКОВ ===
-        # Используем существующую логику обработки дисков, но добавляем связь с машиной
-        new_count = 0
-        updated_count = 0
-        error_count = 0
-        errors = []
-        
-        # Вспомогательные функции (копируем из v1)
-        def get_or_create_vendor(manufacturer_name):
-            if not manufacturer_name:
-                return None
-            vendor = Vendor.query.filter(
-                db.func.lower(Vendor.name) == manufacturer_name.lower(),
-                Vendor.active == True
-            ).first()
-            if not vendor:
-                vendor = Vendor(name=manufacturer_name, active=True)
-                db.session.add(vendor)
-                db.session.flush()
-            return vendor
-        
-        def detect_manufacturer_by_model(model):
-            if not model:
-                return 'Unknown'
-            model_upper = model.upper()
-            if 'BESHTAU' in model_upper:
-                return 'БЕШТАУ'
-            elif 'XRAYDISK' in model_upper:
-                return 'XrayDisk'
-            elif 'WD' in model_upper or 'WESTERN' in model_upper:
-                return 'Western Digital'
-            elif 'SEAGATE' in model_upper or model_upper.startswith('ST'):
-                return 'Seagate'
-            elif 'TOSHIBA' in model_upper or model_upper.startswith('DT'):
-                return 'Toshiba'
-            elif 'HP' in model_upper or 'HEWLETT' in model_upper:
-                return 'HP'
-            elif 'SAMSUNG' in model_upper:
-                return 'Samsung'
-            elif 'KINGSTON' in model_upper:
-                return 'Kingston'
-            elif 'CRUCIAL' in model_upper:
-                return 'Crucial'
-            elif 'INTEL' in model_upper:
-                return 'Intel'
-            elif 'SANDISK' in model_upper or 'SAN DISK' in model_upper:
-                return 'SanDisk'
-            elif 'ADATA' in model_upper:
-                return 'ADATA'
-            elif 'CORSAIR' in model_upper:
-                return 'Corsair'
-            else:
-                return 'Unknown'
-        
-        def convert_health_status_to_russian(status):
-            if not status:
-                return None
-            status_upper = status.upper()
-            if status_upper == 'GOOD':
-                return 'Здоров'
-            elif status_upper == 'CAUTION':
-                return 'Тревога'
-            elif status_upper == 'BAD':
-                return 'Неработает'
-            else:
-                return 'Неизвестно'
-        
-        # Обрабатываем диски
-        for disk_data in disks:
-            try:
-                serial = disk_data.get('serial_number')
-                if not serial:
-                    error_count += 1
-                    errors.append(f'Disk skipped: missing serial_number')
-                    continue
-                
-                existing_disk = PCHardDrive.query.filter_by(serial_number=serial).first()
-                
-                if existing_disk:
-                    # Обновляем существующий диск
-                    if 'model' in disk_data:
-                        existing_disk.model = disk_data.get('model')
-                    # Обновляем размер диска (capacity_gb) - всегда обновляем, если поле присутствует
-                    if 'size_gb' in disk_data:
-                        size_gb = disk_data.get('size_gb')
-                        if size_gb is not None:
-                            old_capacity = existing_disk.capacity_gb
-                            new_capacity = int(size_gb)
-                            existing_disk.capacity_gb = new_capacity
-                            if old_capacity != new_capacity:
-                                print(f"Info: Disk {serial} capacity updated from {old_capacity} GB to {new_capacity} GB")
-                            else:
-                                print(f"Debug: Disk {serial} capacity unchanged ({new_capacity} GB)")
-                        else:
-                            print(f"Warning: Disk {serial} size_gb is None, skipping capacity update")
-                    else:
-                        print(f"Debug: Disk {serial} - size_gb not in disk_data")
-                    if 'interface' in disk_data:
-                        existing_disk.interface = disk_data.get('interface')
-                    if 'power_on_hours' in disk_data:
-                        existing_disk.power_on_hours = disk_data.get('power_on_hours')
-                    if 'power_on_count' in disk_data:
-                        existing_disk.power_on_count = disk_data.get('power_on_count')
-                    if 'health_status' in disk_data:
-                        health_status = disk_data.get('health_status')
-                        existing_disk.health_status = convert_health_status_to_russian(health_status)
-                    
-                    # Обновляем производителя
-                    manufacturer = disk_data.get('manufacturer', '').strip() if 'manufacturer' in disk_data else ''
-                    if not manufacturer and 'model' in disk_data:
-                        model = disk_data.get('model', '').strip()
-                        manufacturer = detect_manufacturer_by_model(model)
-                    
-                    if manufacturer:
-                        vendor = get_or_create_vendor(manufacturer)
-                        if vendor:
-                            existing_disk.vendor_id = vendor.id
-                    
-                    # Связываем с машиной
-                    # Для USB дисков (съемных) всегда обновляем привязку к текущей машине,
-                    # так как они могут подключаться к разным машинам
-                    interface = disk_data.get('interface', existing_disk.interface or '').upper()
-                    is_usb = 'USB' in interface
-                    
-                    # Всегда обновляем machine_id для USB дисков (они съемные и могут подключаться к разным машинам)
-                    # Для остальных дисков также обновляем, если они обнаружены на этой машине
-                    existing_disk.machine_id = machine.id
-                    
-                    # Обновляем дату проверки здоровья
-                    current_date = datetime.now().date()
-                    existing_disk.health_check_date = current_date
-                    
-                    # Комментарий обновляем только если его еще нет (при первом добавлении)
-                    # При обновлении существующего диска комментарий не меняем
-                    if not existing_disk.comment or existing_disk.comment.strip() == '':
-                        # Формируем комментарий только если его нет
-                        comment_text = f'Автоматически добавлен с {hostname} через API v2'
-                        if collection_info.get('comment'):
-                            comment_text += f'. {collection_info.get("comment")}'
-                        # Если есть комментарий в disk_data, он имеет приоритет
-                        if disk_data.get('comment'):
-                            comment_text = disk_data.get('comment')
-                            if collection_info.get('comment'):
-                                comment_text += f' ({collection_info.get("comment")})'
-                        existing_disk.comment = comment_text
-                    
-                    # Активируем диск, если был деактивирован
-                    if not existing_disk.active:
-                        existing_disk.active = True
-                    
-                    # Создаем запись в истории для отслеживания наработки и включений по датам
-                    # Комментарий в истории не добавляем (оставляем NULL)
-                    from models import PCHardDriveHistory
-                    history_record = PCHardDriveHistory(
-                        hard_drive_id=existing_disk.id,
-                        check_date=current_date,
-                        # Основные характеристики диска
-                        drive_type=existing_disk.drive_type,
-                        vendor_id=existing_disk.vendor_id,
-                        model=existing_disk.model,
-                        capacity_gb=existing_disk.capacity_gb,
-                        serial_number=existing_disk.serial_number,
-                        interface=existing_disk.interface,
-                        # Состояние диска
-                        power_on_hours=existing_disk.power_on_hours,
-                        power_on_count=existing_disk.power_on_count,
-                        health_status=existing_disk.health_status,
-                        # Дополнительная информация
-                        purchase_date=existing_disk.purchase_date,
-                        purchase_cost=existing_disk.purchase_cost,
-                        machine_id=existing_disk.machine_id,
-                        active=existing_disk.active,
-                        comment=None  # Комментарий не добавляем при автоматических обновлениях через API
-                    )
-                    db.session.add(history_record)
-                    
-                    updated_count += 1
-                else:
-                    # Создаем новый диск
-                    model = disk_data.get('model', '').strip()
-                    size_gb = disk_data.get('size_gb')
-                    
-                    if not model:
-                        error_count += 1
-                        errors.append(f'Disk {serial}: missing model')
-                        continue
-                    
-                    if size_gb is None:
-                        error_count += 1
-                        errors.append(f'Disk {serial}: missing size_gb')
-                        continue
-                    
-                    # Определяем тип диска
-                    media_type = disk_data.get('media_type', '').upper()
-                    if 'SSD' in media_type or 'SOLID' in media_type:
-                        drive_type = 'SSD'
-                    elif 'NVMe' in model.upper() or 'NVME' in model.upper():
-                        drive_type = 'NVMe'
-                    else:
-                        drive_type = 'HDD'
-                    
-                    # Определяем производителя
-                    manufacturer = disk_data.get('manufacturer', '').strip()
-                    if not manufacturer:
-                        manufacturer = detect_manufacturer_by_model(model)
-                    
-                    vendor = get_or_create_vendor(manufacturer)
-                    if not vendor:
-                        error_count += 1
-                        errors.append(f'Disk {serial}: could not create vendor for {manufacturer}')
-                        continue
-                    
-                    # Конвертируем статус здоровья
-                    health_status = disk_data.get('health_status')
-                    health_status_ru = convert_health_status_to_russian(health_status) if health_status else None
-                    
-                    # Формируем комментарий
-                    comment_text = f'Автоматически добавлен с {hostname} через API v2'
-                    # Добавляем комментарий из collection_info, если есть
-                    if collection_info.get('comment'):
-                        comment_text += f'. {collection_info.get("comment")}'
-                    # Добавляем комментарий из disk_data, если есть (приоритет)
-                    if disk_data.get('comment'):
-                        comment_text = disk_data.get('comment')
-                        if collection_info.get('comment'):
-                            comment_text += f' ({collection_info.get("comment")})'
-                    
-                    new_disk = PCHardDrive(
-                        serial_number=serial,
-                        model=model,
-                        capacity_gb=size_gb,
-                        drive_type=drive_type,
-                        vendor_id=vendor.id,
-                        interface=disk_data.get('interface'),
-                        power_on_hours=disk_data.get('power_on_hours'),
-                        power_on_count=disk_data.get('power_on_count'),
-                        health_status=health_status_ru,
-                        health_check_date=datetime.now().date(),
-                        machine_id=machine.id,
-                        comment=comment_text
-                    )
-                    db.session.add(new_disk)
-                    new_count += 1
-                    
-            except Exception as e:
-                error_count += 1
-                serial = disk_data.get('serial_number', 'unknown')
-                error_msg = f'Disk {serial}: {str(e)}'
-                errors.append(error_msg)
-                import traceback
-                print(f"ERROR processing disk {serial}: {str(e)}")
-                print(traceback.format_exc())
-                db.session.rollback()
-                continue
-        
-        # === ОБРАБОТКА ВИДЕОКАРТ ===
-        graphics_cards = data.get('graphics_cards', [])
-        graphics_new_count = 0
-        graphics_updated_count = 0
-        graphics_error_count = 0
-        graphics_errors = []
-        
-        def detect_graphics_manufacturer_by_model(model):
-            """Определяет производителя видеокарты по модели."""
-            if not model:
-                return 'Unknown'
-            model_upper = model.upper()
-            if 'NVIDIA' in model_upper or 'GEFORCE' in model_upper or 'RTX' in model_upper or 'GTX' in model_upper:
-                return 'NVIDIA'
-            elif 'AMD' in model_upper or 'RADEON' in model_upper or 'RX' in model_upper:
-                return 'AMD'
-            elif 'INTEL' in model_upper:
-                return 'Intel'
-            else:
-                return 'Unknown'
-        
-        for gpu_data in graphics_cards:
-            try:
-                serial = gpu_data.get('serial_number')
-                model = gpu_data.get('model', '').strip()
-                
-                if not model:
-                    graphics_error_count += 1
-                    graphics_errors.append(f'Graphics card skipped: missing model')
-                    continue
-                
-                # Ищем существующую видеокарту по серийному номеру или модели + машине
-                existing_gpu = None
-                if serial:
-                    existing_gpu = PCGraphicsCard.query.filter_by(serial_number=serial).first()
-                
-                # Если не найдено по серийному номеру, ищем по модели и машине
-                if not existing_gpu and machine:
-                    existing_gpu = PCGraphicsCard.query.filter_by(
-                        model=model,
-                        machine_id=machine.id
-                    ).first()
-                
-                if existing_gpu:
-                    # Обновляем существующую видеокарту
-                    if 'memory_size' in gpu_data:
-                        existing_gpu.memory_size = gpu_data.get('memory_size')
-                    if 'memory_type' in gpu_data:
-                        existing_gpu.memory_type = gpu_data.get('memory_type')
-                    if serial:
-                        existing_gpu.serial_number = serial
-                    
-                    # Обновляем производителя
-                    manufacturer = gpu_data.get('manufacturer', '').strip()
-                    if not manufacturer:
-                        manufacturer = detect_graphics_manufacturer_by_model(model)
-                    
-                    if manufacturer:
-                        vendor = get_or_create_vendor(manufacturer)
-                        if vendor:
-                            existing_gpu.vendor_id = vendor.id
-                    
-                    # Связываем с машиной
-                    if machine:
-                        existing_gpu.machine_id = machine.id
-                    
-                    # Обновляем комментарий
-                    comment_text = f'Последний раз обнаружена на {hostname}'
-                    if collection_info.get('comment'):
-                        comment_text += f'. {collection_info.get("comment")}'
-                    existing_gpu.comment = comment_text
-                    
-                    # Активируем видеокарту, если была деактивирована
-                    if not existing_gpu.active:
-                        existing_gpu.active = True
-                    
-                    graphics_updated_count += 1
-                else:
-                    # Создаем новую видеокарту
-                    # Определяем производителя
-                    manufacturer = gpu_data.get('manufacturer', '').strip()
-                    if not manufacturer:
-                        manufacturer = detect_graphics_manufacturer_by_model(model)
-                    
-                    vendor = get_or_create_vendor(manufacturer)
-                    if not vendor:
-                        graphics_error_count += 1
-                        graphics_errors.append(f'Graphics card {model}: could not create vendor for {manufacturer}')
-                        continue
-                    
-                    new_gpu = PCGraphicsCard(
-                        vendor_id=vendor.id,
-                        model=model,
-                        memory_size=gpu_data.get('memory_size'),
-                        memory_type=gpu_data.get('memory_type'),
-                        serial_number=serial,
-                        machine_id=machine.id if machine else None,
-                        comment=f'Автоматически добавлена с {hostname} через API v2'
-                    )
-                    db.session.add(new_gpu)
-                    graphics_new_count += 1
-                    
-            except Exception as e:
-                graphics_error_count += 1
-                model = gpu_data.get('model', 'unknown')
-                error_msg = f'Graphics card {model}: {str(e)}'
-                graphics_errors.append(error_msg)
-                import traceback
-                print(f"ERROR processing graphics card {model}: {str(e)}")
-                print(traceback.format_exc())
-                db.session.rollback()
-                continue
-        
-        # === ОБРАБОТКА МОДУЛЕЙ ОЗУ ===
-        memory_modules = data.get('memory_modules', [])
-        memory_new_count = 0
-        memory_updated_count = 0
-        memory_error_count = 0
-        memory_errors = []
-        
-        for memory_data in memory_modules:
-            try:
-                capacity_gb = memory_data.get('capacity_gb')
-                serial_number = memory_data.get('serial_number')
-                location = memory_data.get('location')
-                
-                if not capacity_gb:
-                    memory_error_count += 1
-                    memory_errors.append(f'Memory module skipped: missing capacity_gb')
-                    continue
-                
-                # Ищем существующий модуль по серийному номеру или location + машине
-                existing_memory = None
-                if serial_number:
-                    existing_memory = PCMemoryModule.query.filter_by(serial_number=serial_number).first()
-                
-                # Если не найдено по серийному номеру, ищем по location и машине
-                if not existing_memory and location and machine:
-                    existing_memory = PCMemoryModule.query.filter_by(
-                        location=location,
-                        machine_id=machine.id
-                    ).first()
-                
-                if existing_memory:
-                    # Обновляем существующий модуль
-                    if 'capacity_gb' in memory_data:
-                        existing_memory.capacity_gb = memory_data.get('capacity_gb')
-                    if 'memory_type' in memory_data:
-                        existing_memory.memory_type = memory_data.get('memory_type')
-                    if 'speed_mhz' in memory_data:
-                        existing_memory.speed_mhz = memory_data.get('speed_mhz')
-                    if 'manufacturer' in memory_data:
-                        existing_memory.manufacturer = memory_data.get('manufacturer')
-                    if 'part_number' in memory_data:
-                        existing_memory.part_number = memory_data.get('part_number')
-                    if serial_number:
-                        existing_memory.serial_number = serial_number
-                    if location:
-                        existing_memory.location = location
-                    
-                    # Связываем с машиной
-                    if machine:
-                        existing_memory.machine_id = machine.id
-                    
-                    # Обновляем комментарий
-                    comment_text = f'Последний раз обнаружен на {hostname}'
-                    if collection_info.get('comment'):
-                        comment_text += f'. {collection_info.get("comment")}'
-                    existing_memory.comment = comment_text
-                    
-                    # Активируем модуль, если был деактивирован
-                    if not existing_memory.active:
-                        existing_memory.active = True
-                    
-                    memory_updated_count += 1
-                else:
-                    # Создаем новый модуль
-                    new_memory = PCMemoryModule(
-                        capacity_gb=capacity_gb,
-                        memory_type=memory_data.get('memory_type'),
-                        speed_mhz=memory_data.get('speed_mhz'),
-                        manufacturer=memory_data.get('manufacturer'),
-                        part_number=memory_data.get('part_number'),
-                        serial_number=serial_number,
-                        location=location,
-                        machine_id=machine.id if machine else None,
-                        comment=f'Автоматически добавлен с {hostname} через API v2'
-                    )
-                    db.session.add(new_memory)
-                    memory_new_count += 1
-                    
-            except Exception as e:
-                memory_error_count += 1
-                location = memory_data.get('location', 'unknown')
-                error_msg = f'Memory module {location}: {str(e)}'
-                memory_errors.append(error_msg)
-                import traceback
-                print(f"ERROR processing memory module {location}: {str(e)}")
-                print(traceback.format_exc())
-                db.session.rollback()
-                continue
-        
-        # Коммитим все изменения
-        try:
-            db.session.commit()
-            print(f"API v2: Machine {hostname} {machine_status}, Disks: new={new_count}, updated={updated_count}, Graphics: new={graphics_new_count}, updated={graphics_updated_count}, Memory: new={memory_new_count}, updated={memory_updated_count}")
-        except Exception as e:
-            db.session.rollback()
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"ERROR committing transaction: {str(e)}")
-            print(error_trace)
-            return jsonify({
-                'success': False,
-                'error': f'Database error: {str(e)}',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }), 500
-        
-        # Формируем ответ
-        response = {
-            'success': True,
-            'machine': {
-                'id': machine.id,
-                'hostname': machine.hostname,
-                'status': machine_status,
-                'message': f'Machine information {machine_status}'
-            },
-            'disks': {
-                'processed': new_count + updated_count,
-                'total': len(disks),
-                'new': new_count,
-                'updated': updated_count
-            },
-            'graphics_cards': {
-                'processed': graphics_new_count + graphics_updated_count,
-                'total': len(graphics_cards),
-                'new': graphics_new_count,
-                'updated': graphics_updated_count
-            },
-            'memory_modules': {
-                'processed': memory_new_count + memory_updated_count,
-                'total': len(memory_modules),
-                'new': memory_new_count,
-                'updated': memory_updated_count
-            },
+        response = apply_v2_payload(request.get_json(silent=True))
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e),
             'timestamp': datetime.utcnow().isoformat() + 'Z'
-        }
-        
-        if error_count > 0:
-            response['disks']['error_count'] = error_count
-            response['disks']['errors'] = errors[:10]
-        
-        if graphics_error_count > 0:
-            response['graphics_cards']['error_count'] = graphics_error_count
-            response['graphics_cards']['errors'] = graphics_errors[:10]
-        
-        if memory_error_count > 0:
-            response['memory_modules']['error_count'] = memory_error_count
-            response['memory_modules']['errors'] = memory_errors[:10]
-        
-        return jsonify(response), 200
-        
+        }), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        import traceback
+        print(f"ERROR committing transaction: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': f'Database error: {str(e)}',
+            'timestamp': datetime.utcnow().isoformat() + 'Z'
+        }), 500
     except Exception as e:
+        db.session.rollback()
         import traceback
-        error_trace = traceback.format_exc()
         print(f"ERROR in API v2: {str(e)}")
-        print(error_trace)
+        print(traceback.format_exc())
         return jsonify({
             'success': False,
             'error': f'Invalid request: {str(e)}',
             'timestamp': datetime.utcnow().isoformat() + 'Z'
         }), 400
+    return jsonify(response), 200
+
+@app.route('/api/hdd_collect/receipts/<receipt>')
+def api_hdd_collect_receipt(receipt):
+    """Состояние отчета агента, принятого в очередь (по номеру квитанции)."""
+    item = IngestReceipt.query.filter_by(receipt=receipt).first()
+    if item is None:
+        return jsonify({'success': False, 'error': 'Receipt not found'}), 404
+    return jsonify({'success': True, **receipt_status(item)})
+
+@app.route('/api/hdd_collect/queue')
+def api_hdd_collect_queue():
+    """Состояние очереди отчетов агентов: глубина, возраст старейшего отчета, прием новых."""
+    stats = queue_stats()
+    response = jsonify({'success': True, 'mode': 'queue' if ingest_queued() else 'inline', 'queue': stats})
+    if not stats['accepting']:
+        response.headers['Retry-After'] = str(stats['retry_after'])
+    return response
 
 def get_cpu_data_from_cpubenchmark(cpu_name):
     """
     Получает полную информацию о процессоре с сайта cpubenchmark.net.
+    Страница берется из дискового кэша, если она там есть (services/cpu_enrichment.py).
     
     Args:
         cpu_name: Название процессора (например, "Intel Core i5-3450" или "Intel Core i5-3450 @ 3.10GHz")
@@ -7567,309 +6102,7 @@ def get_cpu_data_from_cpubenchmark(cpu_name):
                   graphics_frequency_mhz, pcie_version, pcie_lanes, unlocked_multiplier, ecc_support
     """
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        import re
-        from urllib.parse import quote_plus
-        
-        # Очищаем название процессора от лишних символов и нормализуем
-        # Убираем "@" и частоту, если они есть (например, "Intel Core i5-3450 @ 3.10GHz" -> "Intel Core i5-3450")
-        cpu_clean = re.sub(r'\s*@\s*\d+\.?\d*\s*[GM]?Hz', '', cpu_name, flags=re.IGNORECASE)
-        cpu_clean = cpu_clean.strip()
-        
-        # Формируем URL для поиска процессора
-        # Используем quote_plus для правильного кодирования URL
-        cpu_encoded = quote_plus(cpu_clean)
-        url = f"https://www.cpubenchmark.net/cpu.php?cpu={cpu_encoded}"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9"
-        }
-        
-        response = requests.get(url, headers=headers, timeout=15)
-        
-        cpu_data = {}
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Получаем весь текст страницы для парсинга
-            page_text = soup.get_text()
-            
-            # 1. Рейтинг (CPU Mark)
-            score_tag = soup.select_one('span[itemprop="ratingValue"]')
-            if score_tag:
-                rating_text = score_tag.text.replace(',', '').strip()
-                try:
-                    cpu_data['benchmark_rating'] = int(rating_text)
-                except ValueError:
-                    pass
-            
-            # Альтернативный поиск рейтинга
-            if 'benchmark_rating' not in cpu_data:
-                cpu_mark_match = re.search(r'CPU\s*Mark[:\s]+(\d{1,3}(?:,\d{3})+)', page_text, re.IGNORECASE)
-                if cpu_mark_match:
-                    try:
-                        cpu_data['benchmark_rating'] = int(cpu_mark_match.group(1).replace(',', ''))
-                    except ValueError:
-                        pass
-            
-            # 2. Сокет - ищем в тексте "Socket: LGA1155"
-            socket_match = re.search(r'Socket[:\s]+([A-Z0-9-]+)', page_text, re.IGNORECASE)
-            if socket_match:
-                cpu_data['socket'] = socket_match.group(1).strip()
-            
-            # 3. Количество ядер - ищем "Cores: 4" или "Cores: 4 шт."
-            cores_match = re.search(r'Cores[:\s]+(\d+)', page_text, re.IGNORECASE)
-            if cores_match:
-                try:
-                    cpu_data['cores'] = int(cores_match.group(1))
-                except ValueError:
-                    pass
-            
-            # 4. Количество потоков - ищем "Threads: 4" или "Threads: 4 шт."
-            threads_match = re.search(r'Threads[:\s]+(\d+)', page_text, re.IGNORECASE)
-            if threads_match:
-                try:
-                    cpu_data['threads'] = int(threads_match.group(1))
-                except ValueError:
-                    pass
-            
-            # 5. Базовая частота - ищем "Clockspeed: 3.1 GHz" или "Частота процессора: 3100 МГц"
-            clockspeed_match = re.search(r'Clockspeed[:\s]+([\d.]+)\s*GHz', page_text, re.IGNORECASE)
-            if clockspeed_match:
-                try:
-                    freq_ghz = float(clockspeed_match.group(1))
-                    cpu_data['base_clock_mhz'] = int(freq_ghz * 1000)
-                except ValueError:
-                    pass
-            else:
-                # Альтернативный формат: "Частота процессора: 3100 МГц"
-                freq_match = re.search(r'Частота\s+процессора[:\s]+(\d+)\s*МГц', page_text, re.IGNORECASE)
-                if freq_match:
-                    try:
-                        cpu_data['base_clock_mhz'] = int(freq_match.group(1))
-                    except ValueError:
-                        pass
-            
-            # 6. Turbo частота - ищем "Turbo Speed: 3.5 GHz" или "Максимальная частота с Turbo Boost: 3500 МГц"
-            turbo_match = re.search(r'Turbo\s*Speed[:\s]+([\d.]+)\s*GHz', page_text, re.IGNORECASE)
-            if turbo_match:
-                try:
-                    freq_ghz = float(turbo_match.group(1))
-                    cpu_data['boost_clock_mhz'] = int(freq_ghz * 1000)
-                except ValueError:
-                    pass
-            else:
-                # Альтернативный формат
-                turbo_match2 = re.search(r'Максимальная\s+частота[:\s]+(\d+)\s*МГц', page_text, re.IGNORECASE)
-                if turbo_match2:
-                    try:
-                        cpu_data['boost_clock_mhz'] = int(turbo_match2.group(1))
-                    except ValueError:
-                        pass
-            
-            # 7. TDP - ищем "Typical TDP: 77 W" или "Тепловыделение: 77 Вт"
-            tdp_match = re.search(r'Typical\s*TDP[:\s]+(\d+)\s*W', page_text, re.IGNORECASE)
-            if tdp_match:
-                try:
-                    cpu_data['tdp_watts'] = int(tdp_match.group(1))
-                except ValueError:
-                    pass
-            else:
-                # Альтернативный формат
-                tdp_match2 = re.search(r'Тепловыделение[:\s]+(\d+)\s*Вт', page_text, re.IGNORECASE)
-                if tdp_match2:
-                    try:
-                        cpu_data['tdp_watts'] = int(tdp_match2.group(1))
-                    except ValueError:
-                        pass
-            
-            # 8. Кэш L1, L2, L3
-            # L1 Cache
-            l1_match = re.search(r'L1\s*(?:Instruction|Data)?\s*Cache[:\s]+(?:\d+\s*x\s*)?([\d.]+)\s*KB', page_text, re.IGNORECASE)
-            if l1_match:
-                try:
-                    l1_value = float(l1_match.group(1))
-                    # Если указано "4 x 32 KB", берем общее значение
-                    l1_total_match = re.search(r'L1\s*(?:Instruction|Data)?\s*Cache[:\s]+(\d+)\s*x\s*([\d.]+)\s*KB', page_text, re.IGNORECASE)
-                    if l1_total_match:
-                        count = int(l1_total_match.group(1))
-                        size = float(l1_total_match.group(2))
-                        cpu_data['cache_l1_kb'] = int(count * size)
-                    else:
-                        cpu_data['cache_l1_kb'] = int(l1_value)
-                except (ValueError, IndexError):
-                    pass
-            
-            # L2 Cache
-            l2_match = re.search(r'L2\s*Cache[:\s]+(?:\d+\s*x\s*)?([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
-            if l2_match:
-                try:
-                    l2_value = float(l2_match.group(1))
-                    unit = l2_match.group(2).upper()
-                    l2_total_match = re.search(r'L2\s*Cache[:\s]+(\d+)\s*x\s*([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
-                    if l2_total_match:
-                        count = int(l2_total_match.group(1))
-                        size = float(l2_total_match.group(2))
-                        unit = l2_total_match.group(3).upper()
-                        if unit == 'MB':
-                            cpu_data['cache_l2_kb'] = int(count * size * 1024)
-                        else:
-                            cpu_data['cache_l2_kb'] = int(count * size)
-                    else:
-                        if unit == 'MB':
-                            cpu_data['cache_l2_kb'] = int(l2_value * 1024)
-                        else:
-                            cpu_data['cache_l2_kb'] = int(l2_value)
-                except (ValueError, IndexError):
-                    pass
-            
-            # L3 Cache
-            l3_match = re.search(r'L3\s*Cache[:\s]+([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
-            if l3_match:
-                try:
-                    l3_value = float(l3_match.group(1))
-                    unit = l3_match.group(2).upper()
-                    if unit == 'MB':
-                        cpu_data['cache_l3_kb'] = int(l3_value * 1024)
-                    else:
-                        cpu_data['cache_l3_kb'] = int(l3_value)
-                except (ValueError, IndexError):
-                    pass
-            
-            # 9. Тип памяти - ищем "Type memory: DDR3" или "Тип памяти: DDR3"
-            memory_type_match = re.search(r'(?:Type\s+memory|Тип\s+памяти)[:\s]+(DDR\d+)', page_text, re.IGNORECASE)
-            if memory_type_match:
-                cpu_data['memory_support'] = memory_type_match.group(1)
-            
-            # 10. Частота памяти - ищем "Memory frequency: 1333/1600" или "Частота памяти: 1333/1600"
-            memory_freq_match = re.search(r'(?:Memory\s+frequency|Частота\s+памяти)[:\s]+([\d/]+)', page_text, re.IGNORECASE)
-            if memory_freq_match:
-                cpu_data['memory_frequency_mhz'] = memory_freq_match.group(1).strip()
-            
-            # 11. Максимальный объем памяти - ищем "Max memory: 32 GB" или "Максимальный объем памяти: 32"
-            max_memory_match = re.search(r'(?:Max\s+memory|Максимальный\s+объем\s+памяти)[:\s]+(\d+)\s*(GB|MB|ГБ|МБ)?', page_text, re.IGNORECASE)
-            if max_memory_match:
-                try:
-                    max_mem_value = int(max_memory_match.group(1))
-                    unit = max_memory_match.group(2) if max_memory_match.lastindex >= 2 else 'GB'
-                    if unit and unit.upper() in ['GB', 'ГБ']:
-                        cpu_data['max_memory_gb'] = max_mem_value
-                    elif unit and unit.upper() in ['MB', 'МБ']:
-                        cpu_data['max_memory_gb'] = max_mem_value // 1024
-                    else:
-                        # По умолчанию считаем ГБ
-                        cpu_data['max_memory_gb'] = max_mem_value
-                except (ValueError, IndexError):
-                    pass
-            
-            # 12. Количество каналов памяти - ищем "Memory channels: 2" или "Максимальное количество каналов памяти: 2 шт."
-            memory_channels_match = re.search(r'(?:Memory\s+channels|каналов\s+памяти)[:\s]+(\d+)', page_text, re.IGNORECASE)
-            if memory_channels_match:
-                try:
-                    cpu_data['memory_channels'] = int(memory_channels_match.group(1))
-                except ValueError:
-                    pass
-            
-            # 13. Интегрированная графика - ищем "Integrated graphics: Yes" или "Интегрированное графическое ядро: Да"
-            integrated_graphics_match = re.search(r'(?:Integrated\s+graphics|Интегрированное\s+графическое\s+ядро)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
-            if integrated_graphics_match:
-                graphics_text = integrated_graphics_match.group(1).lower()
-                cpu_data['integrated_graphics'] = graphics_text in ['yes', 'да']
-            
-            # 14. Название графического ядра - ищем "Graphics name: HD Graphics 2500" или "Название графического ядра: HD Graphics 2500"
-            graphics_name_match = re.search(r'(?:Graphics\s+name|Название\s+графического\s+ядра)[:\s]+([A-Za-z0-9\s\-]+)', page_text, re.IGNORECASE)
-            if graphics_name_match:
-                cpu_data['graphics_name'] = graphics_name_match.group(1).strip()[:100]
-            
-            # 15. Частота графического ядра - ищем "Graphics frequency: 1100" или "Максимальная частота графического ядра: 1100"
-            graphics_freq_match = re.search(r'(?:Graphics\s+frequency|Максимальная\s+частота\s+графического\s+ядра)[:\s]+(\d+)\s*(MHz|МГц)?', page_text, re.IGNORECASE)
-            if graphics_freq_match:
-                try:
-                    cpu_data['graphics_frequency_mhz'] = int(graphics_freq_match.group(1))
-                except ValueError:
-                    pass
-            
-            # 16. Версия PCI Express - ищем "PCI-Express: 3.0" или "Версия PCI-Express: 3.0"
-            pcie_version_match = re.search(r'(?:PCI[-\s]?Express|Версия\s+PCI[-\s]?Express)[:\s]+([\d.]+)', page_text, re.IGNORECASE)
-            if pcie_version_match:
-                cpu_data['pcie_version'] = pcie_version_match.group(1).strip()
-            
-            # 17. Количество каналов PCI Express - ищем "PCI Express lanes: 16" или "Макс. кол-во каналов PCI Express: 16 шт."
-            pcie_lanes_match = re.search(r'(?:PCI[-\s]?Express\s+lanes|каналов\s+PCI\s+Express)[:\s]+(\d+)', page_text, re.IGNORECASE)
-            if pcie_lanes_match:
-                try:
-                    cpu_data['pcie_lanes'] = int(pcie_lanes_match.group(1))
-                except ValueError:
-                    pass
-            
-            # 18. Разблокированный множитель - ищем "Unlocked multiplier: No" или "Разблокированный множитель: Нет"
-            unlocked_match = re.search(r'(?:Unlocked\s+multiplier|Разблокированный\s+множитель)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
-            if unlocked_match:
-                unlocked_text = unlocked_match.group(1).lower()
-                cpu_data['unlocked_multiplier'] = unlocked_text in ['yes', 'да']
-            
-            # 19. Поддержка ECC - ищем "ECC support: No" или "Поддержка ECC: Нет"
-            ecc_match = re.search(r'(?:ECC\s+support|Поддержка\s+ECC)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
-            if ecc_match:
-                ecc_text = ecc_match.group(1).lower()
-                cpu_data['ecc_support'] = ecc_text in ['yes', 'да']
-            
-            # Также парсим данные из секции Description (если есть)
-            # Ищем блок с описанием процессора
-            desc_sections = soup.find_all(['div', 'section'], class_=lambda x: x and ('description' in str(x).lower() or 'spec' in str(x).lower()))
-            for desc_section in desc_sections:
-                desc_text = desc_section.get_text()
-                # Дополнительный парсинг из описания
-                # Можно добавить специфичные для описания паттерны
-            
-            # Парсим данные из таблиц характеристик
-            tables = soup.find_all('table')
-            for table in tables:
-                rows = table.find_all('tr')
-                for row in rows:
-                    cells = row.find_all(['td', 'th'])
-                    if len(cells) >= 2:
-                        label = cells[0].get_text().strip()
-                        value = cells[1].get_text().strip()
-                        label_lower = label.lower()
-                        
-                        # Socket
-                        if 'socket' in label_lower and not cpu_data.get('socket'):
-                            cpu_data['socket'] = value[:50]
-                        
-                        # Cores
-                        if 'cores' in label_lower and not cpu_data.get('cores'):
-                            cores_num = re.search(r'(\d+)', value)
-                            if cores_num:
-                                try:
-                                    cpu_data['cores'] = int(cores_num.group(1))
-                                except ValueError:
-                                    pass
-                        
-                        # Threads
-                        if 'threads' in label_lower and not cpu_data.get('threads'):
-                            threads_num = re.search(r'(\d+)', value)
-                            if threads_num:
-                                try:
-                                    cpu_data['threads'] = int(threads_num.group(1))
-                                except ValueError:
-                                    pass
-                        
-                        # TDP
-                        if ('tdp' in label_lower or 'thermal' in label_lower) and not cpu_data.get('tdp_watts'):
-                            tdp_num = re.search(r'(\d+)\s*W', value, re.IGNORECASE)
-                            if tdp_num:
-                                try:
-                                    cpu_data['tdp_watts'] = int(tdp_num.group(1))
-                                except ValueError:
-                                    pass
-            
-            return cpu_data if cpu_data else None
-        
+        return fetch_cpu_data(cpu_name)
     except Exception as e:
         print(f"Ошибка при получении данных CPU для {cpu_name}: {e}")
         import traceback
@@ -7897,10 +6130,9 @@ def get_hdd_data_from_external_sources(model_name, vendor_name='', capacity_gb=N
     Получает дополнительные данные о жестком диске из внешних источников.
     
     К сожалению, прямых opensource API для спецификаций HDD не существует.
-    Эта функция использует эвристические методы для определения характеристик:
-    1. Определение интерфейса по модели и объему
-    2. Определение типа диска (HDD/SSD/NVMe) по модели
-    3. В будущем можно добавить веб-скрапинг с сайтов производителей
+    Характеристики (интерфейс, тип, форм-фактор, скорость вращения) определяются
+    по модели правилами из data/disk_rules.json (services/disk_rules.py).
+    В будущем можно добавить веб-скрапинг с сайтов производителей.
     
     Args:
         model_name: Название модели диска
@@ -7911,62 +6143,9 @@ def get_hdd_data_from_external_sources(model_name, vendor_name='', capacity_gb=N
         dict: Словарь с дополнительными данными о диске или None
     """
     try:
-        import re
-        
-        hdd_data = {}
-        
-        # Нормализуем название производителя и модели
-        vendor_normalized = vendor_name.upper().strip()
-        model_normalized = model_name.upper().strip()
-        
-        # Определяем интерфейс по модели (если не указан)
-        if any(keyword in model_normalized for keyword in ['NVME', 'NVMe', 'M.2', 'M2']):
-            hdd_data['interface'] = 'NVMe'
-        elif any(keyword in model_normalized for keyword in ['SAS']):
-            hdd_data['interface'] = 'SAS'
-        elif any(keyword in model_normalized for keyword in ['SATA', 'SAT']):
-            hdd_data['interface'] = 'SATA'
-        elif any(keyword in model_normalized for keyword in ['IDE', 'PATA', 'ATA']):
-            hdd_data['interface'] = 'IDE'
-        elif any(keyword in model_normalized for keyword in ['USB', 'EXTERNAL']):
-            hdd_data['interface'] = 'USB'
-        elif any(keyword in model_normalized for keyword in ['SSD']):
-            # Для SSD без явного указания интерфейса
-            if capacity_gb and capacity_gb < 500:
-                hdd_data['interface'] = 'SATA'  # Малые SSD обычно SATA
-            else:
-                hdd_data['interface'] = 'SATA'
-        else:
-            # По умолчанию для HDD - SATA
-            hdd_data['interface'] = 'SATA'
-        
-        # Определяем тип диска по модели
-        if any(keyword in model_normalized for keyword in ['SSD', 'SOLID', 'STATE']):
-            hdd_data['drive_type'] = 'SSD'
-        elif any(keyword in model_normalized for keyword in ['NVME', 'NVMe', 'M.2', 'M2']):
-            hdd_data['drive_type'] = 'NVMe'
-        elif any(keyword in model_normalized for keyword in ['HDD', 'HARD', 'DISK']):
-            hdd_data['drive_type'] = 'HDD'
-        
-        # Попытка определить форм-фактор по модели
-        if any(keyword in model_normalized for keyword in ['2.5', '2.5"', '2.5INCH']):
-            hdd_data['form_factor'] = '2.5"'
-        elif any(keyword in model_normalized for keyword in ['3.5', '3.5"', '3.5INCH']):
-            hdd_data['form_factor'] = '3.5"'
-        elif any(keyword in model_normalized for keyword in ['M.2', 'M2', '2280', '2242']):
-            hdd_data['form_factor'] = 'M.2'
-        
-        # Попытка определить скорость вращения для HDD (по модели)
-        if hdd_data.get('drive_type') == 'HDD' or 'HDD' in model_normalized:
-            if any(keyword in model_normalized for keyword in ['7200', '7.2K']):
-                hdd_data['rpm'] = 7200
-            elif any(keyword in model_normalized for keyword in ['5400', '5.4K']):
-                hdd_data['rpm'] = 5400
-            elif any(keyword in model_normalized for keyword in ['10000', '10K', '10.000']):
-                hdd_data['rpm'] = 10000
-            elif any(keyword in model_normalized for keyword in ['15000', '15K', '15.000']):
-                hdd_data['rpm'] = 15000
-        
+        hdd_data = classify_disk_model(model_name)
+        # Производитель хранится в справочнике и здесь не возвращается
+        hdd_data.pop('manufacturer', None)
         return hdd_data if hdd_data else None
         
     except Exception as e:
@@ -8000,21 +6179,15 @@ def update_hard_drives_from_external():
         updated_count = 0
         errors = []
         
-        for drive in hard_drives:
+        # Все модели разбираются одним вызовом (повторяющиеся — один раз)
+        classified = classify_disk_models([drive.model or '' for drive in hard_drives])
+        
+        for drive, external_data in zip(hard_drives, classified):
             try:
-                vendor_name = drive.vendor.name if drive.vendor else ''
-                model_name = drive.model.strip()
-                
-                if not model_name:
+                if not (drive.model or '').strip():
                     continue
                 
-                # Получаем данные из внешних источников
-                external_data = get_hdd_data_from_external_sources(
-                    model_name, 
-                    vendor_name, 
-                    drive.capacity_gb
-                )
-                
+                external_data.pop('manufacturer', None)
                 if external_data:
                     # Обновляем интерфейс, если он был определен
                     if 'interface' in external_data and not drive.interface:
@@ -8065,8 +6238,8 @@ def load_gpu_api_data(force_refresh=False):
     from datetime import datetime, timedelta
     
     # Путь к локальному файлу
-    local_file_path = os.path.join('data', 'gpu_api_data.json')
-    metadata_file_path = os.path.join('data', 'gpu_api_metadata.json')
+    local_file_path = GPU_API_DATA_FILE
+    metadata_file_path = os.path.join(os.path.dirname(GPU_API_DATA_FILE), 'gpu_api_metadata.json')
     
     # Проверяем, нужно ли обновлять данные
     should_refresh = force_refresh
@@ -8088,16 +6261,13 @@ def load_gpu_api_data(force_refresh=False):
         else:
             should_refresh = True
     
-    # Загружаем данные из локального файла, если он существует и не нужно обновлять
+    # Данные из локального файла — из каталога процесса (файл разбирается один раз)
     if not should_refresh and os.path.exists(local_file_path):
-        try:
-            with open(local_file_path, 'r', encoding='utf-8') as f:
-                gpu_data_all = json.load(f)
-                print(f"✅ Данные загружены из локального файла: {len(gpu_data_all)} видеокарт")
-                return gpu_data_all
-        except Exception as e:
-            print(f"⚠️  Ошибка при чтении локального файла: {e}, загружаем из API")
-            should_refresh = True
+        catalog = get_gpu_catalog()
+        if catalog is not None:
+            return catalog.data
+        print("⚠️  Ошибка при чтении локального файла, загружаем из API")
+        should_refresh = True
     
     # Загружаем данные из API
     api_url = "https://raw.githubusercontent.com/voidful/gpu-info-api/gpu-data/gpu.json"
@@ -8113,17 +6283,13 @@ def load_gpu_api_data(force_refresh=False):
         if response.status_code != 200:
             print(f"Ошибка при получении данных из API: статус {response.status_code}")
             # Пробуем загрузить из локального файла как резервный вариант
-            if os.path.exists(local_file_path):
-                with open(local_file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return None
+            catalog = get_gpu_catalog()
+            return catalog.data if catalog is not None else None
         
         gpu_data_all = response.json()
         
-        # Сохраняем данные в локальный файл
-        os.makedirs('data', exist_ok=True)
-        with open(local_file_path, 'w', encoding='utf-8') as f:
-            json.dump(gpu_data_all, f, ensure_ascii=False, indent=2)
+        # Сохраняем данные в локальный файл (компактный JSON и снимок каталога, правки очищаются)
+        replace_gpu_catalog(gpu_data_all)
         
         # Сохраняем метаданные
         metadata = {
@@ -8139,45 +6305,26 @@ def load_gpu_api_data(force_refresh=False):
     except Exception as e:
         print(f"❌ Ошибка при загрузке данных из API: {e}")
         # Пробуем загрузить из локального файла как резервный вариант
-        if os.path.exists(local_file_path):
-            try:
-                with open(local_file_path, 'r', encoding='utf-8') as f:
-                    print(f"⚠️  Используем локальный файл как резервный вариант")
-                    return json.load(f)
-            except Exception:
-                pass
+        catalog = get_gpu_catalog()
+        if catalog is not None:
+            print(f"⚠️  Используем локальный файл как резервный вариант")
+            return catalog.data
         return None
 
 def update_local_gpu_api_data(gpu_key, gpu_data):
     """
-    Обновляет данные конкретной видеокарты в локальном файле API.
+    Обновляет данные конкретной видеокарты в локальных данных API.
+    Правка дописывается в файл правок каталога, файл данных не перезаписывается.
     
     Args:
         gpu_key: Ключ видеокарты в API (например, "NVIDIA_GP107-300-A1")
         gpu_data: Словарь с обновленными данными видеокарты
     """
-    import json
-    
-    local_file_path = os.path.join('data', 'gpu_api_data.json')
-    
-    if not os.path.exists(local_file_path):
+    if not os.path.exists(GPU_API_DATA_FILE):
         return
     
     try:
-        # Загружаем текущие данные
-        with open(local_file_path, 'r', encoding='utf-8') as f:
-            gpu_data_all = json.load(f)
-        
-        # Обновляем данные видеокарты
-        if gpu_key in gpu_data_all:
-            gpu_data_all[gpu_key].update(gpu_data)
-        else:
-            gpu_data_all[gpu_key] = gpu_data
-        
-        # Сохраняем обновленные данные
-        with open(local_file_path, 'w', encoding='utf-8') as f:
-            json.dump(gpu_data_all, f, ensure_ascii=False, indent=2)
-        
+        update_gpu_entry(gpu_key, gpu_data)
         print(f"✅ Локальный файл API обновлен для видеокарты: {gpu_key}")
         
     except Exception as e:
@@ -8222,103 +6369,45 @@ def get_gpu_data_from_api(gpu_model, vendor_name=''):
         - gpu_type: Тип GPU (Desktop, Mobile, etc.)
     """
     try:
-        from datetime import datetime
-        import re
-        
-        # Загружаем данные из локального файла или API
-        gpu_data_all = load_gpu_api_data()
-        
-        if not gpu_data_all or not isinstance(gpu_data_all, dict):
+        # Загружаем данные из локального файла или API (файл разбирается один раз на процесс)
+        if not load_gpu_api_data():
             return None
+        catalog = get_gpu_catalog()
+        if catalog is None:
+            return None
+        return gpu_api_result(catalog.match(gpu_model, vendor_name), gpu_model, vendor_name)
         
-        # Нормализуем название модели и производителя для поиска
-        model_normalized = gpu_model.strip().upper()
-        vendor_normalized = vendor_name.strip().upper() if vendor_name else ''
-        
-        # Извлекаем ключевые слова из модели для поиска
-        # Например, "GeForce GTX 1050 Ti" -> ["GEFORCE", "GTX", "1050", "TI"]
-        model_words = [word for word in model_normalized.split() if len(word) > 1]
-        # Извлекаем числа из модели (например, "1050" из "GTX 1050 Ti")
-        model_numbers = [word for word in model_words if word.isdigit()]
-        
-        # Ищем совпадение по модели в данных API
-        matched_gpu = None
-        matched_key = None
-        best_match_score = 0
-        
-        # Сначала пытаемся найти точное совпадение по полю "Model"
-        for key, gpu_info in gpu_data_all.items():
-            if not isinstance(gpu_info, dict):
-                continue
-            
-            api_model = gpu_info.get('Model', '').strip().upper()
-            api_vendor = gpu_info.get('Vendor', '').strip().upper()
-            api_code_name = gpu_info.get('Code name', '').strip().upper()
-            key_upper = key.upper()
-            
-            # Пропускаем записи с "nan" в модели
-            model_is_nan = api_model == 'NAN' or api_model == ''
-            
-            match_score = 0
-            matched = False
-            
-            # Проверяем совпадение по модели (если модель не "nan")
-            if not model_is_nan and api_model:
-                # Точное совпадение или одно содержит другое
-                if model_normalized == api_model:
-                    match_score += 20  # Максимальный балл за точное совпадение
-                    matched = True
-                elif model_normalized in api_model or api_model in model_normalized:
-                    match_score += 10
-                    matched = True
-                # Проверяем совпадение по ключевым словам (нужно минимум 3 совпадения для надежности)
-                elif model_words and len(model_words) >= 2:
-                    matching_words = sum(1 for word in model_words if word in api_model)
-                    # Для моделей с числами требуем совпадение числа
-                    if model_numbers:
-                        number_match = any(num in api_model for num in model_numbers)
-                        if number_match and matching_words >= 2:
-                            match_score += matching_words * 2
-                            matched = True
-                    elif matching_words >= 3:
-                        match_score += matching_words
-                        matched = True
-            
-            # Если модель "nan", ищем по кодовому имени и ключу
-            if model_is_nan:
-                # Ищем совпадения в кодовом имени (например, GP107 для GTX 1050)
-                if api_code_name and model_numbers:
-                    if any(num in api_code_name for num in model_numbers):
-                        # Проверяем, что это правильный производитель
-                        if not vendor_normalized or vendor_normalized in key_upper or 'NVIDIA' in key_upper:
-                            match_score += 5
-                            matched = True
-                
-                # Также проверяем ключ (например, GP107-300-A1 для GTX 1050 Ti)
-                if key_upper and model_numbers:
-                    if any(num in key_upper for num in model_numbers):
-                        # Проверяем, что это правильный производитель
-                        if not vendor_normalized or vendor_normalized in key_upper:
-                            match_score += 3
-                            matched = True
-            
-            if matched:
-                # Проверяем производителя, если указан
-                vendor_match = True
-                if vendor_normalized:
-                    vendor_match = (vendor_normalized in api_vendor or api_vendor in vendor_normalized or 
-                                  vendor_normalized in key_upper or 
-                                  ('NVIDIA' in api_vendor and 'NVIDIA' in vendor_normalized))
-                
-                if vendor_match and match_score > best_match_score:
-                    matched_gpu = gpu_info
-                    matched_key = key
-                    best_match_score = match_score
+    except Exception as e:
+        print(f"Ошибка при получении данных о видеокарте из API: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def gpu_api_result(match, gpu_model, vendor_name=''):
+    """
+    Данные видеокарты для карточки PCGraphicsCard по совпадению в каталоге
+    (GpuCatalog.match / match_many).
+    
+    Args:
+        match: Совпадение в каталоге (key, gpu, score) или None
+        gpu_model: Название модели видеокарты (для сообщений)
+        vendor_name: Название производителя (для сообщений)
+    
+    Returns:
+        dict: {'data': поля видеокарты, 'match_info': сведения о совпадении} или None
+    """
+    try:
+        from datetime import datetime
+        import re
         
-        if not matched_gpu:
+        if not match:
             print(f"⚠️  Видеокарта не найдена в API: {vendor_name} {gpu_model}")
             return None
         
+        matched_gpu = match['gpu']
+        matched_key = match['key']
+        best_match_score = match['score']
+        
         # Формируем результат
         result = {}
         
@@ -8625,6 +6714,52 @@ def get_gpu_data_from_api(gpu_model, vendor_name=''):
         traceback.print_exc()
         return None
 
+def discrete_graphics_cards_query():
+    """
+    Активные видеокарты без встроенных и стандартных адаптеров
+    (те же фильтры, что и на странице graphics_cards).
+    """
+    from models import PCGraphicsCard
+    return PCGraphicsCard.query.filter_by(active=True).filter(
+        # Исключаем встроенные видеокарты по названию модели
+        ~func.upper(PCGraphicsCard.model).like('%HD GRAPHICS%'),
+        ~func.upper(PCGraphicsCard.model).like('%UHD GRAPHICS%'),
+        ~func.upper(PCGraphicsCard.model).like('%IRIS%'),
+        ~func.upper(PCGraphicsCard.model).like('%INTEGRATED%'),
+        ~func.upper(PCGraphicsCard.model).like('%VEGA%'),
+        ~func.upper(PCGraphicsCard.model).like('%RADEON GRAPHICS%'),
+        # Исключаем стандартные VGA адаптеры
+        ~func.upper(PCGraphicsCard.model).like('%VGA%'),
+        ~func.upper(PCGraphicsCard.model).like('%STANDARD%'),
+        ~func.upper(PCGraphicsCard.model).like('%ГРАФИЧЕСКИЙ АДАПТЕР%'),
+        # Исключаем базовые видеоадаптеры Microsoft
+        ~func.upper(PCGraphicsCard.model).like('%БАЗОВЫЙ%'),
+        ~func.upper(PCGraphicsCard.model).like('%ВИДЕОАДАПТЕР%'),
+        ~func.upper(PCGraphicsCard.model).like('%МАЙКРОСОФТ%'),
+        ~func.upper(PCGraphicsCard.model).like('%MICROSOFT%'),
+        ~func.upper(PCGraphicsCard.model).like('%BASIC%'),
+        # Также исключаем по типу GPU, если указан
+        or_(PCGraphicsCard.gpu_type.is_(None), PCGraphicsCard.gpu_type != 'Integrated')
+    )
+
+def stored_gpu_api_result(match, catalog, gpu_model, vendor_name=''):
+    """
+    Данные видеокарты по сохраненному совпадению (resolve_gpu_matches): сначала
+    запись, найденная с учетом производителя, при отсутствии данных — найденная
+    только по модели.
+    
+    Returns:
+        dict: как gpu_api_result или None
+    """
+    if not match:
+        return None
+    api_result = gpu_api_result(stored_match(catalog, match['matched_key'], match['score']),
+                                gpu_model, vendor_name)
+    if not api_result:
+        api_result = gpu_api_result(stored_match(catalog, match['fallback_key'], match['fallback_score']),
+                                    gpu_model)
+    return api_result
+
 @app.route('/api/graphics_cards/update_from_api', methods=['POST'])
 @login_required
 def update_graphics_cards_from_api():
@@ -8657,40 +6792,35 @@ def update_graphics_cards_from_api():
                 # Если не удалось распарсить JSON, используем значения по умолчанию
                 pass
         
-        # Применяем те же фильтры, что и на странице graphics_cards (исключаем встроенные видеокарты)
-        graphics_cards_query = PCGraphicsCard.query.filter_by(active=True).filter(
-            # Исключаем встроенные видеокарты по названию модели
-            ~func.upper(PCGraphicsCard.model).like('%HD GRAPHICS%'),
-            ~func.upper(PCGraphicsCard.model).like('%UHD GRAPHICS%'),
-            ~func.upper(PCGraphicsCard.model).like('%IRIS%'),
-            ~func.upper(PCGraphicsCard.model).like('%INTEGRATED%'),
-            ~func.upper(PCGraphicsCard.model).like('%VEGA%'),
-            ~func.upper(PCGraphicsCard.model).like('%RADEON GRAPHICS%'),
-            # Исключаем стандартные VGA адаптеры
-            ~func.upper(PCGraphicsCard.model).like('%VGA%'),
-            ~func.upper(PCGraphicsCard.model).like('%STANDARD%'),
-            ~func.upper(PCGraphicsCard.model).like('%ГРАФИЧЕСКИЙ АДАПТЕР%'),
-            # Исключаем базовые видеоадаптеры Microsoft
-            ~func.upper(PCGraphicsCard.model).like('%БАЗОВЫЙ%'),
-            ~func.upper(PCGraphicsCard.model).like('%ВИДЕОАДАПТЕР%'),
-            ~func.upper(PCGraphicsCard.model).like('%МАЙКРОСОФТ%'),
-            ~func.upper(PCGraphicsCard.model).like('%MICROSOFT%'),
-            ~func.upper(PCGraphicsCard.model).like('%BASIC%'),
-            # Также исключаем по типу GPU, если указан
-            or_(PCGraphicsCard.gpu_type.is_(None), PCGraphicsCard.gpu_type != 'Integrated')
-        )
+        graphics_cards_query = discrete_graphics_cards_query()
         
         # Если указаны конкретные ID для обновления слабых совпадений
         if weak_match_card_ids:
             graphics_cards_query = graphics_cards_query.filter(PCGraphicsCard.id.in_(weak_match_card_ids))
         
-        graphics_cards = graphics_cards_query.all()
+        graphics_cards = graphics_cards_query.options(db.joinedload(PCGraphicsCard.vendor)).all()
         
         updated_count = 0
         not_found_count = 0
         weak_matches = []  # Список видеокарт со слабыми совпадениями
         errors = []
         
+        # Каталог загружается один раз, все карты сопоставляются одним вызовом
+        load_gpu_api_data()
+        catalog = get_gpu_catalog()
+        if catalog is None:
+            return jsonify({
+                'success': False,
+                'error': 'Не удалось загрузить данные из API.'
+            }), 500
+        
+        # Совпадения берутся из gpu_match_results; заново ищутся только новые пары
+        # (модель, производитель) и пары, сохраненные для другой версии каталога
+        matches, _ = resolve_gpu_matches(
+            [(card.model, card.vendor.name if card.vendor else '') for card in graphics_cards], catalog
+        )
+        api_results = {}
+        
         for card in graphics_cards:
             try:
                 vendor_name = card.vendor.name if card.vendor else ''
@@ -8700,21 +6830,12 @@ def update_graphics_cards_from_api():
                     not_found_count += 1
                     continue
                 
-                # Очищаем модель от производителя, если он есть в начале модели
-                # Например, "AMD Radeon HD 6470M" -> "Radeon HD 6470M"
-                model_cleaned = model_name
-                vendor_prefixes = ['NVIDIA', 'AMD', 'INTEL', 'ATI', 'Advanced Micro Devices, Inc.']
-                for prefix in vendor_prefixes:
-                    if model_cleaned.upper().startswith(prefix.upper()):
-                        model_cleaned = model_cleaned[len(prefix):].strip()
-                        break
-                
-                # Получаем данные из API (используем очищенную модель)
-                api_result = get_gpu_data_from_api(model_cleaned, vendor_name)
-                
-                if not api_result:
-                    # Пробуем поиск только по очищенной модели
-                    api_result = get_gpu_data_from_api(model_cleaned)
+                # Данные из API по сохраненному совпадению (одинаковые пары разбираются один раз)
+                pair = gpu_match_pair(model_name, vendor_name)
+                if pair not in api_results:
+                    api_results[pair] = stored_gpu_api_result(matches.get(pair), catalog,
+                                                              clean_gpu_model(model_name), vendor_name)
+                api_result = api_results[pair]
                 
                 if not api_result:
                     not_found_count += 1
@@ -8730,10 +6851,8 @@ def update_graphics_cards_from_api():
                     matched_key = match_info.get('matched_key')
                     
                     # Получаем производителя из API данных, если доступен
-                    if matched_key:
-                        gpu_data_all = load_gpu_api_data()
-                        if gpu_data_all and matched_key in gpu_data_all:
-                            api_vendor_name = gpu_data_all[matched_key].get('Vendor', '').strip()
+                    if matched_key and catalog.get(matched_key):
+                        api_vendor_name = catalog.get(matched_key).get('Vendor', '').strip()
                     
                     # Если слабое совпадение и не разрешено обновление
                     if is_weak_match and not allow_weak_matches and card.id not in weak_match_card_ids:
@@ -8743,7 +6862,8 @@ def update_graphics_cards_from_api():
                             'model': model_name,
                             'score': match_info.get('score', 0),
                             'matched_model': match_info.get('matched_model', ''),
-                            'matched_key': match_info.get('matched_key', '')
+                            'matched_key': match_info.get('matched_key', ''),
+                            'candidates': matches[pair]['candidates']
                         })
                         continue
                 else:
@@ -8754,43 +6874,11 @@ def update_graphics_cards_from_api():
                 if gpu_data and isinstance(gpu_data, dict):
                     # Обновляем производителя из API, если он указан и отличается
                     if api_vendor_name:
-                        # Нормализуем названия производителей для сопоставления
-                        api_vendor_normalized = api_vendor_name.upper()
-                        current_vendor_normalized = vendor_name.upper() if vendor_name else ''
-                        
-                        # Маппинг названий производителей
-                        vendor_mapping = {
-                            'AMD': ['AMD', 'ADVANCED MICRO DEVICES', 'ADVANCED MICRO DEVICES, INC.', 'ATI'],
-                            'NVIDIA': ['NVIDIA'],
-                            'Intel': ['INTEL', 'INTEL CORPORATION']
-                        }
-                        
-                        # Определяем правильное название производителя из маппинга
-                        target_vendor_name = None
-                        for standard_name, variants in vendor_mapping.items():
-                            if any(variant in api_vendor_normalized for variant in variants):
-                                target_vendor_name = standard_name
-                                break
-                        
-                        # Если производитель из API отличается от текущего, обновляем
-                        if target_vendor_name and target_vendor_name.upper() not in current_vendor_normalized:
-                            # Ищем производителя в базе данных
-                            from models import Vendor
-                            vendor = Vendor.query.filter(
-                                func.upper(Vendor.name).like(f'%{target_vendor_name.upper()}%')
-                            ).first()
-                            
-                            if vendor:
-                                card.vendor_id = vendor.id
-                                print(f"✅ Обновлен производитель для {model_name}: {vendor_name} -> {vendor.name}")
-                            else:
-                                # Если не нашли точного совпадения, пробуем найти по полному названию из API
-                                vendor = Vendor.query.filter(
-                                    func.upper(Vendor.name).like(f'%{api_vendor_normalized}%')
-                                ).first()
-                                if vendor:
-                                    card.vendor_id = vendor.id
-                                    print(f"✅ Обновлен производитель для {model_name}: {vendor_name} -> {vendor.name}")
+                        # Псевдонимы (ATI, Advanced Micro Devices, Intel Corporation...) сводятся справочником
+                        vendor_id = find_vendor_id(api_vendor_name)
+                        if vendor_id and vendor_id != card.vendor_id:
+                            card.vendor_id = vendor_id
+                            print(f"✅ Обновлен производитель для {model_name}: {vendor_name} -> {find_vendor_name(vendor_id)}")
                     
                     # Обновляем все доступные поля
                     # Обновляем все доступные поля
@@ -8879,79 +6967,62 @@ def update_graphics_cards_from_api():
                     
                     card.api_data_updated_at = datetime.now(timezone.utc)
                     
-                    # Обновляем локальный файл API с данными из базы
+                    # Обновляем локальные данные API данными из базы (правка дописывается, файл не перезаписывается)
                     if matched_key:
-                        # Загружаем данные из локального файла
-                        local_file_path = os.path.join('data', 'gpu_api_data.json')
-                        if os.path.exists(local_file_path):
-                            try:
-                                import json
-                                with open(local_file_path, 'r', encoding='utf-8') as f:
-                                    gpu_data_all = json.load(f)
-                                
-                                # Обновляем данные видеокарты в локальном файле данными из базы
-                                if matched_key in gpu_data_all:
-                                    # Обновляем все поля, которые были обновлены в базе
-                                    if card.launch_date:
-                                        gpu_data_all[matched_key]['Launch'] = card.launch_date.strftime('%Y-%m-%d %H:%M:%S') if isinstance(card.launch_date, date) else str(card.launch_date)
-                                    if card.code_name:
-                                        gpu_data_all[matched_key]['Code name'] = card.code_name
-                                    if card.core_clock_mhz:
-                                        gpu_data_all[matched_key]['Core clock (MHz)'] = card.core_clock_mhz
-                                    if card.boost_clock_mhz:
-                                        gpu_data_all[matched_key]['Boost clock (MHz)'] = card.boost_clock_mhz
-                                    if card.memory_clock_mhz:
-                                        gpu_data_all[matched_key]['Memory clock (MHz)'] = card.memory_clock_mhz
-                                    if card.memory_bandwidth_gbps:
-                                        gpu_data_all[matched_key]['Memory Bandwidth (GB/s)'] = card.memory_bandwidth_gbps
-                                    if card.memory_bus_width_bits:
-                                        gpu_data_all[matched_key]['Memory Bus width (bit)'] = card.memory_bus_width_bits
-                                    if card.memory_size:
-                                        gpu_data_all[matched_key]['Memory Size (MiB)'] = str(card.memory_size)
-                                    if card.memory_type:
-                                        gpu_data_all[matched_key]['Memory Type'] = card.memory_type
-                                    if card.tdp_watts:
-                                        gpu_data_all[matched_key]['TDP (Watts)'] = str(card.tdp_watts)
-                                    if card.bus_interface:
-                                        gpu_data_all[matched_key]['Bus interface'] = card.bus_interface
-                                    if card.fab_nm:
-                                        gpu_data_all[matched_key]['Fab (nm)'] = str(card.fab_nm)
-                                    if card.die_size_mm2:
-                                        gpu_data_all[matched_key]['Die size (mm)'] = card.die_size_mm2
-                                    if card.core_config:
-                                        gpu_data_all[matched_key]['Core config'] = card.core_config
-                                    if card.fillrate_pixel_gps:
-                                        gpu_data_all[matched_key]['Fillrate Pixel (GP/s)'] = card.fillrate_pixel_gps
-                                    if card.fillrate_texture_gts:
-                                        gpu_data_all[matched_key]['Fillrate Texture (GT/s)'] = card.fillrate_texture_gts
-                                    if card.release_price_usd:
-                                        gpu_data_all[matched_key]['Release Price (USD)'] = card.release_price_usd
-                                    if card.sm_count:
-                                        gpu_data_all[matched_key]['SM Count'] = card.sm_count
-                                    if card.process:
-                                        gpu_data_all[matched_key]['Process'] = card.process
-                                    if card.transistors_billion:
-                                        gpu_data_all[matched_key]['Transistors (billion)'] = card.transistors_billion
-                                    if card.l_cache_mb:
-                                        gpu_data_all[matched_key]['L2 cache'] = f"{card.l_cache_mb} MB"
-                                    if card.single_precision_tflops:
-                                        gpu_data_all[matched_key]['Processing power (TFLOPS) Single precision'] = card.single_precision_tflops
-                                    if card.double_precision_tflops:
-                                        gpu_data_all[matched_key]['Processing power (TFLOPS) Double precision'] = card.double_precision_tflops
-                                    if card.half_precision_tflops:
-                                        gpu_data_all[matched_key]['Processing power (TFLOPS) Half precision'] = card.half_precision_tflops
-                                    if card.pixel_shader_count:
-                                        gpu_data_all[matched_key]['Pixel Shader Count'] = card.pixel_shader_count
-                                    if card.gpu_type:
-                                        gpu_data_all[matched_key]['GPU Type'] = card.gpu_type
-                                    
-                                    # Сохраняем обновленные данные
-                                    with open(local_file_path, 'w', encoding='utf-8') as f:
-                                        json.dump(gpu_data_all, f, ensure_ascii=False, indent=2)
-                                    
-                                    print(f"✅ Локальный файл API обновлен для видеокарты: {matched_key}")
-                            except Exception as e:
-                                print(f"⚠️  Ошибка при обновлении локального файла API: {e}")
+                        api_fields = {}
+                        if card.launch_date:
+                            api_fields['Launch'] = card.launch_date.strftime('%Y-%m-%d %H:%M:%S') if isinstance(card.launch_date, date) else str(card.launch_date)
+                        if card.code_name:
+                            api_fields['Code name'] = card.code_name
+                        if card.core_clock_mhz:
+                            api_fields['Core clock (MHz)'] = card.core_clock_mhz
+                        if card.boost_clock_mhz:
+                            api_fields['Boost clock (MHz)'] = card.boost_clock_mhz
+                        if card.memory_clock_mhz:
+                            api_fields['Memory clock (MHz)'] = card.memory_clock_mhz
+                        if card.memory_bandwidth_gbps:
+                            api_fields['Memory Bandwidth (GB/s)'] = card.memory_bandwidth_gbps
+                        if card.memory_bus_width_bits:
+                            api_fields['Memory Bus width (bit)'] = card.memory_bus_width_bits
+                        if card.memory_size:
+                            api_fields['Memory Size (MiB)'] = str(card.memory_size)
+                        if card.memory_type:
+                            api_fields['Memory Type'] = card.memory_type
+                        if card.tdp_watts:
+                            api_fields['TDP (Watts)'] = str(card.tdp_watts)
+                        if card.bus_interface:
+                            api_fields['Bus interface'] = card.bus_interface
+                        if card.fab_nm:
+                            api_fields['Fab (nm)'] = str(card.fab_nm)
+                        if card.die_size_mm2:
+                            api_fields['Die size (mm)'] = card.die_size_mm2
+                        if card.core_config:
+                            api_fields['Core config'] = card.core_config
+                        if card.fillrate_pixel_gps:
+                            api_fields['Fillrate Pixel (GP/s)'] = card.fillrate_pixel_gps
+                        if card.fillrate_texture_gts:
+                            api_fields['Fillrate Texture (GT/s)'] = card.fillrate_texture_gts
+                        if card.release_price_usd:
+                            api_fields['Release Price (USD)'] = card.release_price_usd
+                        if card.sm_count:
+                            api_fields['SM Count'] = card.sm_count
+                        if card.process:
+                            api_fields['Process'] = card.process
+                        if card.transistors_billion:
+                            api_fields['Transistors (billion)'] = card.transistors_billion
+                        if card.l_cache_mb:
+                            api_fields['L2 cache'] = f"{card.l_cache_mb} MB"
+                        if card.single_precision_tflops:
+                            api_fields['Processing power (TFLOPS) Single precision'] = card.single_precision_tflops
+                        if card.double_precision_tflops:
+                            api_fields['Processing power (TFLOPS) Double precision'] = card.double_precision_tflops
+                        if card.half_precision_tflops:
+                            api_fields['Processing power (TFLOPS) Half precision'] = card.half_precision_tflops
+                        if card.pixel_shader_count:
+                            api_fields['Pixel Shader Count'] = card.pixel_shader_count
+                        if card.gpu_type:
+                            api_fields['GPU Type'] = card.gpu_type
+                        update_local_gpu_api_data(matched_key, api_fields)
                     
                     updated_count += 1
                 else:
@@ -8994,6 +7065,61 @@ def update_graphics_cards_from_api():
             'timestamp': datetime.now(timezone.utc).isoformat()
         }), 500
 
+@app.route('/api/graphics_cards/weak_matches')
+@login_required
+def graphics_cards_weak_matches():
+    """
+    Видеокарты со слабым совпадением в каталоге gpu-info-api и сохраненные кандидаты
+    для проверки. Подтвержденные карты отправляются в update_from_api
+    (weak_match_card_ids, allow_weak_matches).
+    """
+    if current_user.mode != 1:
+        return jsonify({'success': False, 'error': 'Доступ запрещён.'}), 403
+    
+    from models import PCGraphicsCard
+    load_gpu_api_data()
+    catalog = get_gpu_catalog()
+    if catalog is None:
+        return jsonify({'success': False, 'error': 'Не удалось загрузить данные из API.'}), 500
+    
+    graphics_cards = discrete_graphics_cards_query().options(db.joinedload(PCGraphicsCard.vendor)).all()
+    matches, computed = resolve_gpu_matches(
+        [(card.model, card.vendor.name if card.vendor else '') for card in graphics_cards], catalog
+    )
+    api_results = {}
+    weak_matches = []
+    for card in graphics_cards:
+        vendor_name = card.vendor.name if card.vendor else ''
+        model_name = (card.model or '').strip()
+        pair = gpu_match_pair(model_name, vendor_name)
+        match = matches.get(pair)
+        if not match:
+            continue
+        if pair not in api_results:
+            api_results[pair] = stored_gpu_api_result(match, catalog, clean_gpu_model(model_name), vendor_name)
+        match_info = (api_results[pair] or {}).get('match_info')
+        if not match_info or not match_info['weak_match']:
+            continue
+        weak_matches.append({
+            'id': card.id,
+            'vendor': vendor_name,
+            'model': model_name,
+            'score': match_info['score'],
+            'matched_model': match_info['matched_model'],
+            'matched_key': match_info['matched_key'],
+            'candidates': match['candidates']
+        })
+    if computed:
+        db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'catalog_version': catalog.match_version,
+        'recomputed': computed,
+        'weak_matches': weak_matches,
+        'weak_matches_count': len(weak_matches)
+    })
+
 @app.route('/api/graphics_cards/refresh_local_cache', methods=['POST'])
 @login_required
 def refresh_gpu_api_local_cache():
@@ -9040,6 +7166,8 @@ def refresh_gpu_api_local_cache():
 def update_cpus_benchmark_ratings():
     """
     Обновление рейтингов производительности процессоров с cpubenchmark.net.
+    Ставит задание фоновому обработчику (enrichment-worker) и сразу возвращает
+    его номер; ход выполнения — /api/cpus/update_benchmark_ratings/<id>.
     """
     is_admin = current_user.mode == 1
     
@@ -9049,149 +7177,74 @@ def update_cpus_benchmark_ratings():
             'error': 'Доступ запрещён. Только администратор может обновлять данные.'
         }), 403
     
-    try:
-        from models import PCCPU
-        import time
-        from datetime import datetime, timezone
-        import traceback
-        
-        # Импортируем функцию get_cpu_data_from_cpubenchmark из текущего модуля
-        import sys
-        current_module = sys.modules[__name__]
-        get_cpu_rating_func = getattr(current_module, 'get_cpu_data_from_cpubenchmark', None)
-        if not get_cpu_rating_func:
-            return jsonify({
-                'success': False,
-                'error': 'Функция get_cpu_data_from_cpubenchmark не найдена в модуле'
-            }), 500
-        
-        # Получаем все процессоры из базы
-        cpus = PCCPU.query.filter_by(active=True).all()
-        
-        updated_count = 0
-        not_found_count = 0
-        errors = []
-        
-        for cpu in cpus:
-            try:
-                vendor_name = cpu.vendor.name if cpu.vendor else ''
-                model_name = cpu.model.strip()
-                
-                if not model_name:
-                    not_found_count += 1
-                    continue
-                
-                # Формируем полное название процессора для поиска
-                full_cpu_name = f"{vendor_name} {model_name}".strip()
-                
-                # Получаем полные данные с cpubenchmark.net
-                cpu_data = get_cpu_rating_func(full_cpu_name)
-                
-                if not cpu_data:
-                    # Пробуем поиск только по модели
-                    cpu_data = get_cpu_rating_func(model_name)
-                
-                if cpu_data and isinstance(cpu_data, dict):
-                    # Обновляем все доступные поля
-                    if 'benchmark_rating' in cpu_data and cpu_data['benchmark_rating']:
-                        cpu.benchmark_rating = cpu_data['benchmark_rating']
-                    
-                    if 'socket' in cpu_data and cpu_data['socket']:
-                        cpu.socket = cpu_data['socket'][:50]
-                    
-                    if 'cores' in cpu_data and cpu_data['cores']:
-                        cpu.cores = cpu_data['cores']
-                    
-                    if 'threads' in cpu_data and cpu_data['threads']:
-                        cpu.threads = cpu_data['threads']
-                    
-                    if 'base_clock_mhz' in cpu_data and cpu_data['base_clock_mhz']:
-                        cpu.base_clock_mhz = cpu_data['base_clock_mhz']
-                    
-                    if 'boost_clock_mhz' in cpu_data and cpu_data['boost_clock_mhz']:
-                        cpu.boost_clock_mhz = cpu_data['boost_clock_mhz']
-                    
-                    if 'tdp_watts' in cpu_data and cpu_data['tdp_watts']:
-                        cpu.tdp_watts = cpu_data['tdp_watts']
-                    
-                    if 'cache_l1_kb' in cpu_data and cpu_data['cache_l1_kb']:
-                        cpu.cache_l1_kb = cpu_data['cache_l1_kb']
-                    
-                    if 'cache_l2_kb' in cpu_data and cpu_data['cache_l2_kb']:
-                        cpu.cache_l2_kb = cpu_data['cache_l2_kb']
-                    
-                    if 'cache_l3_kb' in cpu_data and cpu_data['cache_l3_kb']:
-                        cpu.cache_l3_kb = cpu_data['cache_l3_kb']
-                    
-                    if 'memory_support' in cpu_data and cpu_data['memory_support']:
-                        cpu.memory_support = cpu_data['memory_support'][:100]
-                    
-                    if 'max_memory_gb' in cpu_data and cpu_data['max_memory_gb']:
-                        cpu.max_memory_gb = cpu_data['max_memory_gb']
-                    
-                    if 'memory_channels' in cpu_data and cpu_data['memory_channels']:
-                        cpu.memory_channels = cpu_data['memory_channels']
-                    
-                    if 'memory_frequency_mhz' in cpu_data and cpu_data['memory_frequency_mhz']:
-                        cpu.memory_frequency_mhz = cpu_data['memory_frequency_mhz'][:50]
-                    
-                    if 'integrated_graphics' in cpu_data and cpu_data['integrated_graphics'] is not None:
-                        cpu.integrated_graphics = cpu_data['integrated_graphics']
-                    
-                    if 'graphics_name' in cpu_data and cpu_data['graphics_name']:
-                        cpu.graphics_name = cpu_data['graphics_name'][:100]
-                    
-                    if 'graphics_frequency_mhz' in cpu_data and cpu_data['graphics_frequency_mhz']:
-                        cpu.graphics_frequency_mhz = cpu_data['graphics_frequency_mhz']
-                    
-                    if 'pcie_version' in cpu_data and cpu_data['pcie_version']:
-                        cpu.pcie_version = cpu_data['pcie_version'][:20]
-                    
-                    if 'pcie_lanes' in cpu_data and cpu_data['pcie_lanes']:
-                        cpu.pcie_lanes = cpu_data['pcie_lanes']
-                    
-                    if 'unlocked_multiplier' in cpu_data and cpu_data['unlocked_multiplier'] is not None:
-                        cpu.unlocked_multiplier = cpu_data['unlocked_multiplier']
-                    
-                    if 'ecc_support' in cpu_data and cpu_data['ecc_support'] is not None:
-                        cpu.ecc_support = cpu_data['ecc_support']
-                    
-                    cpu.api_data_updated_at = datetime.now(timezone.utc)
-                    updated_count += 1
-                else:
-                    not_found_count += 1
-                    errors.append(f"Данные не найдены для {vendor_name} {model_name}")
-                
-                # Уважаем сервер - делаем паузу между запросами
-                time.sleep(2)
-                    
-            except Exception as e:
-                errors.append(f"Ошибка при обработке процессора {cpu.vendor.name if cpu.vendor else 'Unknown'} {cpu.model}: {str(e)}")
-                db.session.rollback()
-                continue
-        
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'message': f'Обновлено {updated_count} процессоров с данными из cpubenchmark.net, не найдено {not_found_count}.',
-            'updated_count': updated_count,
-            'not_found_count': not_found_count,
-            'errors': errors[:10]  # Ограничиваем количество ошибок в ответе
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        from datetime import timezone
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"ERROR in update_cpus_benchmark_ratings: {str(e)}")
-        print(error_trace)
-        return jsonify({
-            'success': False,
-            'error': f'Произошла ошибка: {str(e)}',
-            'traceback': error_trace if app.debug else None,
-            'timestamp': datetime.now(timezone.utc).isoformat()
-        }), 500
+    job, created = enqueue_cpu_enrichment(requested_by=current_user.id)
+    return jsonify({
+        'success': True,
+        'message': 'Обновление процессоров поставлено в очередь.' if created
+                   else 'Обновление процессоров уже выполняется.',
+        'job_id': job.id,
+        'status_url': url_for('cpus_benchmark_ratings_job', job_id=job.id),
+        'job': enrichment_status(job)
+    }), 202
+
+@app.route('/api/cpus/update_benchmark_ratings/<int:job_id>')
+@login_required
+def cpus_benchmark_ratings_job(job_id):
+    """Ход выполнения задания обновления процессоров с cpubenchmark.net."""
+    if current_user.mode != 1:
+        return jsonify({'success': False, 'error': 'Доступ запрещён.'}), 403
+    job = EnrichmentJob.query.filter_by(id=job_id, kind='cpu').first()
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задание не найдено'}), 404
+    data = enrichment_status(job)
+    if job.status == 'done':
+        data['message'] = (f"Обновлено {job.updated_count} процессоров с данными из cpubenchmark.net, "
+                           f"не найдено {job.not_found_count}.")
+    return jsonify({'success': True, **data})
+
+
+# === КОМАНДЫ CLI ===
+
+@app.cli.command('rebuild-stats-rollup')
+def rebuild_stats_rollup_command():
+    """Полностью пересобирает предагрегированную статистику (таблица stats_rollup)."""
+    db.create_all()
+    rows = rebuild_stats_rollup()
+    print(f"Таблица stats_rollup пересобрана: {rows} строк")
+
+
+@app.cli.command('report-worker')
+@click.option('--once', is_flag=True, help='Обработать текущую очередь и завершиться')
+def report_worker_command(once):
+    """Обработчик очереди фоновых отчетов (форма 8 и др.)."""
+    db.create_all()
+    run_worker(once=once)
+
+
+@app.cli.command('ingest-worker')
+@click.option('--once', is_flag=True, help='Обработать текущую очередь и завершиться')
+@click.option('--batch', default=None, type=int, help='Сколько отчетов забирать за раз')
+def ingest_worker_command(once, batch):
+    """Обработчик очереди отчетов агентов сбора (режим INGEST_MODE=queue)."""
+    db.create_all()
+    run_ingest_worker(once=once, batch=batch or INGEST_BATCH)
+
+
+@app.cli.command('enrichment-worker')
+@click.option('--once', is_flag=True, help='Обработать текущую очередь и завершиться')
+def enrichment_worker_command(once):
+    """Обработчик заданий обогащения справочников (процессоры с cpubenchmark.net)."""
+    db.create_all()
+    run_enrichment_worker(once=once)
+
+
+@app.cli.command('network-monitor')
+@click.option('--once', is_flag=True, help='Выполнить один цикл проверки и завершиться')
+def network_monitor_command(once):
+    """Фоновая проверка доступности сетевых устройств (таблица device_status)."""
+    db.create_all()
+    run_monitor(once=once)
+
 
 # === ЗАПУСК ПРИЛОЖЕНИЯ ===
 
@@ -3,9 +3,11 @@
 Модуль для экспорта отчетов в PDF формат.
 Содержит функции для генерации различных форм и отчетов.
 """
-from io import BytesIO
+import tempfile
+import threading
 from datetime import datetime
 from urllib.parse import quote
+from xml.sax.saxutils import escape
 from flask import Response
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
@@ -18,9 +20,32 @@ from reportlab.pdfbase.ttfonts import TTFont
 import os
 from collections import defaultdict
 
+# Размер PDF, до которого файл формируется в памяти; больше — во временном файле на диске
+SPOOL_MAX_SIZE = int(os.environ.get('PDF_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+
+# Размер блока при отдаче PDF клиенту
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Сколько ID подставлять в один запрос WHERE id IN (...)
+_IN_CHUNK_SIZE = 500
+
+# Шрифты регистрируются в reportlab один раз на процесс
+_fonts = None
+_fonts_lock = threading.Lock()
+
 
 def _setup_fonts():
-    """Настраивает шрифты для PDF документов."""
+    """Настраивает шрифты для PDF документов (регистрация выполняется один раз на процесс)."""
+    global _fonts
+    if _fonts is None:
+        with _fonts_lock:
+            if _fonts is None:
+                _fonts = _register_fonts()
+    return _fonts
+
+
+def _register_fonts():
+    """Находит системный шрифт с кириллицей и регистрирует его в reportlab."""
     # Регистрируем шрифт Times New Roman (или Liberation Serif как аналог)
     # Пытаемся найти системный шрифт с кириллицей (Times New Roman или аналог)
     times_font_paths = [
@@ -83,32 +108,157 @@ def _setup_fonts():
     return font_name, bold_font_name
 
 
+def _chunks(values, size=_IN_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _load_by_ids(db_session, model, ids):
+    """Объекты модели по набору ID: {id: объект}, по одному запросу на каждые _IN_CHUNK_SIZE ID."""
+    result = {}
+    for chunk in _chunks({i for i in ids if i}):
+        for obj in db_session.query(model).filter(model.id.in_(chunk)).all():
+            result[obj.id] = obj
+    return result
+
+
+def _prefetch_form8_data(equipment_list, db_session, models):
+    """
+    Загружает все справочные данные для формы 8 несколькими запросами:
+    наименования, производителей, помещения, первую (самую раннюю) накладную
+    каждого ТМЦ, поставщиков и пользователей из этих накладных.
+    """
+    nomes = _load_by_ids(db_session, models.Nome, (eq.nomeid for eq in equipment_list))
+    vendors = _load_by_ids(db_session, models.Vendor, (nome.vendorid for nome in nomes.values()))
+    places = _load_by_ids(db_session, models.Places, (eq.placesid for eq in equipment_list))
+
+    first_invoice = {}
+    for chunk in _chunks(eq.id for eq in equipment_list):
+        rows = db_session.query(models.InvoiceEquipment.equipment_id, models.Invoices).join(
+            models.Invoices, models.Invoices.id == models.InvoiceEquipment.invoice_id
+        ).filter(
+            models.InvoiceEquipment.equipment_id.in_(chunk)
+        ).order_by(
+            models.InvoiceEquipment.equipment_id,
+            models.Invoices.invoice_date.asc(),
+            models.Invoices.id.asc()
+        ).all()
+        for equipment_id, invoice in rows:
+            first_invoice.setdefault(equipment_id, invoice)
+
+    knts = _load_by_ids(db_session, models.Knt, (inv.from_knt_id for inv in first_invoice.values()))
+    users = _load_by_ids(db_session, models.Users,
+                         [inv.from_user_id for inv in first_invoice.values()]
+                         + [eq.usersid for eq in equipment_list])
+    return {
+        'nomes': nomes,
+        'vendors': vendors,
+        'places': places,
+        'first_invoice': first_invoice,
+        'knts': knts,
+        'users': users,
+    }
+
+
+def _invoice_source(invoice, knts, users):
+    """Строка «От кого получено» по накладной."""
+    if invoice.type == 'Склад-МОЛ':
+        if invoice.from_knt_id:
+            knt = knts.get(invoice.from_knt_id)
+            if knt and knt.name:
+                return knt.name
+            return f'Склад ID {invoice.from_knt_id}'
+        return 'Склад (не указан)'
+    if invoice.type in ('МОЛ-МОЛ', 'МОЛ-Склад'):
+        if invoice.from_user_id:
+            from_user = users.get(invoice.from_user_id)
+            if from_user and from_user.login:
+                return from_user.login
+            return f'МОЛ ID {invoice.from_user_id}'
+        return 'МОЛ (не указан)'
+    return 'Не указано'
+
+
+def form8_filenames(department):
+    """Имя файла формы 8: (ASCII-вариант, UTF-8-вариант)."""
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_dept_name = department.name.replace(' ', '_').encode('ascii', 'ignore').decode('ascii')
+    if not safe_dept_name:
+        safe_dept_name = 'department'
+    return f"form8_{safe_dept_name}_{stamp}.pdf", f"form8_{department.name}_{stamp}.pdf"
+
+
+def _stream_file(fileobj, chunk_size=STREAM_CHUNK_SIZE):
+    """Отдает файл блоками и закрывает его по окончании (временный файл при этом удаляется)."""
+    try:
+        fileobj.seek(0)
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
 def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_session, models):
     """
     Генерирует PDF файл формы 8 (Книга учета материальных ценностей) для отдела.
     
+    PDF пишется во временный файл (в памяти до SPOOL_MAX_SIZE, дальше на диске)
+    и отдается клиенту блоками.
+    
     Args:
         department: Объект Department
         equipment_list: Список объектов Equipment
         org_name: Название организации
         mol_name: Имя МОЛ
         db_session: SQLAlchemy сессия для запросов
-        models: Модуль models с моделями (Nome, Vendor, Users, Knt, Invoices, InvoiceEquipment)
+        models: Модуль models с моделями (Nome, Vendor, Places, Users, Knt, Invoices, InvoiceEquipment)
     
     Returns:
         Response объект Flask с PDF файлом
     """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        build_form8_pdf(spool, department, equipment_list, org_name, mol_name, db_session, models)
+        size = spool.tell()
+    except Exception:
+        spool.close()
+        raise
+    
+    filename_ascii, filename_utf8 = form8_filenames(department)
+    filename_encoded = quote(filename_utf8.encode('utf-8'))
+    
+    return Response(
+        _stream_file(spool),
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'inline; filename="{filename_ascii}"; filename*=UTF-8\'\'{filename_encoded}',
+            'Content-Length': str(size),
+        },
+        direct_passthrough=True
+    )
+
+
+def build_form8_pdf(output, department, equipment_list, org_name, mol_name, db_session, models):
+    """
+    Формирует PDF формы 8 и записывает его в output (файловый объект, открытый на запись в бинарном режиме).
+    
+    Аргументы — как у generate_form8_pdf.
+    """
     if not equipment_list:
         raise ValueError("Список ТМЦ пуст")
     
     # Настраиваем шрифты
     font_name, bold_font_name = _setup_fonts()
     
-    # Создаем буфер для PDF
-    buffer = BytesIO()
+    # Справочники для всех страниц — несколькими запросами заранее
+    prefetched = _prefetch_form8_data(equipment_list, db_session, models)
     
     # Создаем документ в альбомной ориентации
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4),
+    doc = SimpleDocTemplate(output, pagesize=landscape(A4),
                            rightMargin=10*mm, leftMargin=10*mm,
                            topMargin=10*mm, bottomMargin=10*mm)
     
@@ -244,9 +394,10 @@ def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_sessio
         equipment_by_nome[eq.nomeid].append(eq)
     
     # Для каждой группы ТМЦ создаем отдельную страницу
+    last_nome_id = list(equipment_by_nome.keys())[-1]
     for nome_id, nome_equipment_list in equipment_by_nome.items():
         # Получаем название группы ТМЦ
-        nome = db_session.query(models.Nome).get(nome_id)
+        nome = prefetched['nomes'].get(nome_id)
         nome_name = nome.name if nome else f'Группа ID {nome_id}'
         
         # Создаем единую таблицу для всей страницы
@@ -256,7 +407,8 @@ def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_sessio
             """Безопасное преобразование в строку, возвращает '' если None"""
             return str(value) if value is not None else ''
         
-        warehouse = safe_str(first_eq.places.name) if first_eq and first_eq.places else ''
+        first_place = prefetched['places'].get(first_eq.placesid) if first_eq else None
+        warehouse = safe_str(first_place.name) if first_place else ''
         rack = safe_str(getattr(first_eq, 'warehouse_rack', None)) if first_eq else ''
         cell = safe_str(getattr(first_eq, 'warehouse_cell', None)) if first_eq else ''
         unit_name = safe_str(getattr(first_eq, 'unit_name', None)) if first_eq else ''
@@ -264,13 +416,13 @@ def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_sessio
         price = f"{float(first_eq.cost):,.2f}".replace(',', ' ') if first_eq and first_eq.cost else ''
         
         brand = ''
-        if first_eq and first_eq.nome and first_eq.nome.vendorid:
-            vendor = db_session.query(models.Vendor).get(first_eq.nome.vendorid)
+        if nome and nome.vendorid:
+            vendor = prefetched['vendors'].get(nome.vendorid)
             brand = safe_str(vendor.name) if vendor else ''
         
         category = ''
-        if first_eq and first_eq.nome and first_eq.nome.category_sort:
-            category = str(first_eq.nome.category_sort)
+        if nome and nome.category_sort:
+            category = str(nome.category_sort)
         profile = safe_str(getattr(first_eq, 'profile', None)) if first_eq else ''
         size = safe_str(getattr(first_eq, 'size', None)) if first_eq else ''
         stock_norm = safe_str(getattr(first_eq, 'stock_norm', None)) if first_eq else ''
@@ -390,55 +542,17 @@ def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_sessio
             doc_date = date_str
             doc_number = ''
             
-            # Пытаемся найти первую накладную для этого ТМЦ
-            invoice_eq = db_session.query(models.InvoiceEquipment).join(
-                models.Invoices
-            ).filter(
-                models.InvoiceEquipment.equipment_id == eq.id
-            ).order_by(models.Invoices.invoice_date.asc()).first()
+            # Первая накладная для этого ТМЦ (загружена заранее)
+            invoice = prefetched['first_invoice'].get(eq.id)
             
-            if invoice_eq and invoice_eq.invoice:
+            if invoice:
                 doc_name = 'Накладная'
-                doc_date = invoice_eq.invoice.invoice_date.strftime('%d.%m.%Y') if invoice_eq.invoice.invoice_date else date_str
-                doc_number = invoice_eq.invoice.invoice_number or ''
-                
-                invoice = invoice_eq.invoice
-                from_info = ''
-                
-                if invoice.type == 'Склад-МОЛ':
-                    if invoice.from_knt_id:
-                        knt = db_session.query(models.Knt).get(invoice.from_knt_id)
-                        if knt and knt.name:
-                            from_info = knt.name
-                        else:
-                            from_info = f'Склад ID {invoice.from_knt_id}'
-                    else:
-                        from_info = 'Склад (не указан)'
-                elif invoice.type == 'МОЛ-МОЛ':
-                    if invoice.from_user_id:
-                        from_user = db_session.query(models.Users).get(invoice.from_user_id)
-                        if from_user and from_user.login:
-                            from_info = from_user.login
-                        else:
-                            from_info = f'МОЛ ID {invoice.from_user_id}'
-                    else:
-                        from_info = 'МОЛ (не указан)'
-                elif invoice.type == 'МОЛ-Склад':
-                    if invoice.from_user_id:
-                        from_user = db_session.query(models.Users).get(invoice.from_user_id)
-                        if from_user and from_user.login:
-                            from_info = from_user.login
-                        else:
-                            from_info = f'МОЛ ID {invoice.from_user_id}'
-                    else:
-                        from_info = 'МОЛ (не указан)'
-                else:
-                    from_info = 'Не указано'
-                
-                from_to_info = from_info
+                doc_date = invoice.invoice_date.strftime('%d.%m.%Y') if invoice.invoice_date else date_str
+                doc_number = invoice.invoice_number or ''
+                from_to_info = _invoice_source(invoice, prefetched['knts'], prefetched['users'])
             else:
-                mol_name = eq.users.login if eq.users else 'Не указан'
-                from_to_info = mol_name
+                eq_user = prefetched['users'].get(eq.usersid)
+                from_to_info = eq_user.login if eq_user else 'Не указан'
             
             factory_num = eq.sernum or ''
             inv_num = eq.invnum or ''
@@ -533,32 +647,142 @@ def generate_form8_pdf(department, equipment_list, org_name, mol_name, db_sessio
         elements.append(table)
         
         # Разрыв страницы перед следующей группой (кроме последней)
-        nome_ids_list = list(equipment_by_nome.keys())
-        if nome_id != nome_ids_list[-1]:
+        if nome_id != last_nome_id:
             elements.append(PageBreak())
     
     # Собираем PDF
     doc.build(elements)
-    
-    # Подготовка ответа
-    buffer.seek(0)
-    
-    # Создаем безопасное имя файла
-    safe_dept_name = department.name.replace(' ', '_').encode('ascii', 'ignore').decode('ascii')
-    if not safe_dept_name:
-        safe_dept_name = 'department'
-    filename_ascii = f"form8_{safe_dept_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    
-    filename_utf8 = f"form8_{department.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    filename_encoded = quote(filename_utf8.encode('utf-8'))
-    
-    response = Response(
-        buffer.getvalue(),
-        mimetype='application/pdf',
-        headers={
-            'Content-Disposition': f'inline; filename="{filename_ascii}"; filename*=UTF-8\'\'{filename_encoded}'
-        }
-    )
-    
-    return response
 
+
+def audit_filenames(audit):
+    """Имя файла результата инвентаризации: (ASCII-вариант, UTF-8-вариант)."""
+    stamp = (audit.closed_at or datetime.now()).strftime('%Y%m%d_%H%M%S')
+    name = f"inventory_audit_{audit.id}_{stamp}.pdf"
+    return name, name
+
+
+def _money(value):
+    return f"{value:,.2f}".replace(',', ' ') if value else ''
+
+
+def build_audit_pdf(output, audit, result, place_name, department_name, mol_name):
+    """
+    Формирует PDF результата инвентаризации (сличительную ведомость) и записывает его в output.
+
+    Args:
+        output: файловый объект, открытый на запись в бинарном режиме
+        audit: объект InventoryAudit (закрытый)
+        result: итог сверки (services/inventory_audit.reconcile_audit): списки
+            found, missing (карточки ТМЦ), unexpected (код и карточки), unknown (коды)
+        place_name, department_name, mol_name: строки для заголовка ('' — не указано)
+    """
+    font_name, bold_font_name = _setup_fonts()
+
+    doc = SimpleDocTemplate(output, pagesize=landscape(A4),
+                            rightMargin=10*mm, leftMargin=10*mm,
+                            topMargin=10*mm, bottomMargin=10*mm)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('AuditTitle', parent=styles['Heading1'], fontSize=14,
+                                 alignment=TA_CENTER, spaceAfter=6, fontName=bold_font_name)
+    section_style = ParagraphStyle('AuditSection', parent=styles['Heading2'], fontSize=11,
+                                   alignment=TA_LEFT, spaceBefore=6, spaceAfter=4, fontName=bold_font_name)
+    normal_style = ParagraphStyle('AuditNormal', parent=styles['Normal'], fontSize=9,
+                                  alignment=TA_LEFT, fontName=font_name)
+    cell_style = ParagraphStyle('AuditCell', parent=styles['Normal'], fontSize=7, leading=8,
+                                alignment=TA_LEFT, fontName=font_name)
+    number_style = ParagraphStyle('AuditNumber', parent=cell_style, alignment=TA_RIGHT)
+    header_style = ParagraphStyle('AuditHeader', parent=cell_style, alignment=TA_CENTER,
+                                  fontName=bold_font_name)
+
+    def cell(value, style=cell_style):
+        # Paragraph разбирает разметку: '<', '>' и '&' в данных экранируются
+        return Paragraph(escape(str(value)) if value not in (None, '') else '', style)
+
+    def table(header, rows, widths):
+        data = [[cell(title, header_style) for title in header]] + rows
+        result_table = Table(data, colWidths=widths, repeatRows=1)
+        result_table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#EEEEEE')),
+            ('LEFTPADDING', (0, 0), (-1, -1), 2),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ]))
+        return result_table
+
+    card_header = ['№', 'Инвентарный номер', 'Штрихкод', 'Наименование', 'Заводской номер',
+                   'Помещение', 'МОЛ', 'Стоимость']
+    card_widths = [10*mm, 30*mm, 32*mm, 75*mm, 35*mm, 40*mm, 25*mm, 25*mm]
+
+    def card_rows(cards):
+        return [[
+            cell(idx),
+            cell(card['invnum']),
+            cell(card['shtrihkod']),
+            cell(card['buhname']),
+            cell(card['sernum']),
+            cell(card['place']['name']),
+            cell(card['user']['login']),
+            cell(_money(card['cost']), number_style),
+        ] for idx, card in enumerate(cards, 1)]
+
+    summary = result['summary']
+    elements = [
+        Paragraph('СЛИЧИТЕЛЬНАЯ ВЕДОМОСТЬ<br/>результатов инвентаризации', title_style),
+        Spacer(1, 4*mm),
+    ]
+    info = [
+        ('Инвентаризация №', str(audit.id)),
+        ('Помещение', place_name or 'Все'),
+        ('Отдел', department_name or 'Все'),
+        ('Материально ответственное лицо', mol_name or 'Все'),
+        ('Начата', audit.created_at.strftime('%d.%m.%Y %H:%M') if audit.created_at else ''),
+        ('Окончена', audit.closed_at.strftime('%d.%m.%Y %H:%M') if audit.closed_at else ''),
+        ('Числится / найдено / не найдено',
+         f"{summary['expected']} / {summary['found']} / {summary['missing']}"),
+        ('Сверх учета / неизвестных кодов', f"{summary['unexpected']} / {summary['unknown']}"),
+    ]
+    info_table = Table([[Paragraph(label, normal_style), Paragraph(escape(value), normal_style)] for label, value in info],
+                       colWidths=[70*mm, 110*mm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (0, -1), bold_font_name),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    elements.append(info_table)
+
+    missing_cost = sum(card['cost'] for card in result['missing'])
+    elements.append(Paragraph(f"Не найдено ({summary['missing']}, на сумму {_money(missing_cost) or '0.00'} руб.)",
+                              section_style))
+    if result['missing']:
+        elements.append(table(card_header, card_rows(result['missing']), card_widths))
+
+    elements.append(Paragraph(f"Обнаружено сверх учета ({summary['unexpected']})", section_style))
+    if result['unexpected']:
+        rows = []
+        for idx, item in enumerate(result['unexpected'], 1):
+            for card in item['items']:
+                rows.append([
+                    cell(idx), cell(item['code']), cell(card['invnum']), cell(card['buhname']),
+                    cell(card['place']['name']), cell((card['department'] or {}).get('name')),
+                    cell(card['user']['login']), cell(_money(card['cost']), number_style),
+                ])
+        elements.append(table(['№', 'Код', 'Инвентарный номер', 'Наименование', 'Числится в помещении',
+                               'Отдел', 'МОЛ', 'Стоимость'], rows,
+                              [10*mm, 32*mm, 30*mm, 75*mm, 40*mm, 30*mm, 25*mm, 25*mm]))
+
+    elements.append(Paragraph(f"Коды, не найденные в учете ({summary['unknown']})", section_style))
+    if result['unknown']:
+        elements.append(table(['№', 'Код'], [[cell(idx), cell(code)] for idx, code in enumerate(result['unknown'], 1)],
+                              [10*mm, 80*mm]))
+
+    elements.append(Paragraph(f"Найдено ({summary['found']})", section_style))
+    if result['found']:
+        elements.append(table(card_header, card_rows(result['found']), card_widths))
+
+    elements.append(Spacer(1, 10*mm))
+    elements.append(Paragraph('Председатель комиссии ____________________ &nbsp;&nbsp;&nbsp; '
+                              'Материально ответственное лицо ____________________', normal_style))
+    doc.build(elements)
@@ -0,0 +1,10 @@
+-- Миграция: Индексы для поиска ТМЦ по штрихкоду и инвентарному номеру
+-- Описание: API /api/lookup (сканеры склада) ищет ТМЦ по точному значению
+-- shtrihkod или invnum, пачками по несколько сотен кодов; индексы позволяют
+-- обходиться без полного просмотра таблицы equipment.
+-- Индексы не уникальные: номера в учете могут повторяться (и пустые значения
+-- у ТМЦ без номера), поиск возвращает все ТМЦ с кодом.
+
+ALTER TABLE `equipment`
+ADD INDEX `idx_equipment_shtrihkod` (`shtrihkod`),
+ADD INDEX `idx_equipment_invnum` (`invnum`);
@@ -0,0 +1,10 @@
+-- Миграция: Индекс для постраничного вывода истории перемещений
+-- Описание: страницы /all_moves и /my_moves выбираются по ключу (dt, id) в порядке
+-- убывания; индекс позволяет читать страницу без сортировки всей таблицы move.
+-- Выборка по ТМЦ (info_tmc, my_moves) использует индекс по eqid.
+
+ALTER TABLE `move`
+ADD INDEX `idx_move_dt_id` (`dt`, `id`);
+
+-- Индекс по eqid (создается вместе с внешним ключом; добавить вручную, если его нет)
+-- ALTER TABLE `move` ADD INDEX `idx_move_eqid_dt` (`eqid`, `dt`);
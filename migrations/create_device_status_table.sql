@@ -0,0 +1,16 @@
+-- Миграция: Таблица состояния сетевых устройств
+-- Описание: последний результат проверки доступности каждого сетевого ТМЦ.
+--           Заполняется фоновым опросчиком: flask --app app network-monitor
+--           Страницы /my_monitoring и /monitoring_place_devices только читают таблицу.
+
+CREATE TABLE IF NOT EXISTS `device_status` (
+    `equipment_id` INT NOT NULL PRIMARY KEY COMMENT 'ТМЦ',
+    `ip` VARCHAR(100) NOT NULL COMMENT 'Адрес на момент проверки',
+    `online` BOOLEAN NOT NULL DEFAULT 0 COMMENT 'Устройство в сети',
+    `method` VARCHAR(10) NULL COMMENT 'Чем подтверждена доступность: icmp, tcp:<порт>',
+    `latency_ms` FLOAT NULL COMMENT 'Время ответа, мс',
+    `checked_at` DATETIME NOT NULL COMMENT 'Время последней проверки (UTC)',
+    `changed_at` DATETIME NOT NULL COMMENT 'Когда устройство перешло в текущее состояние (UTC)',
+    INDEX `idx_device_status_checked` (`checked_at`),
+    CONSTRAINT `fk_device_status_equipment` FOREIGN KEY (`equipment_id`) REFERENCES `equipment` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Состояние сетевых устройств';
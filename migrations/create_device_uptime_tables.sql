@@ -0,0 +1,26 @@
+-- Миграция: История состояний и агрегаты доступности сетевых устройств
+-- Описание: device_status_history — одна строка на смену состояния устройства;
+--           device_uptime — время наблюдения и время «в сети» по часам и суткам (UTC),
+--           пополняется опросчиком (flask --app app network-monitor) после каждого цикла.
+--           Часовые строки старше MONITOR_HOURLY_RETENTION_DAYS удаляются опросчиком.
+
+CREATE TABLE IF NOT EXISTS `device_status_history` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `equipment_id` INT NOT NULL COMMENT 'ТМЦ',
+    `online` BOOLEAN NOT NULL COMMENT 'Новое состояние',
+    `changed_at` DATETIME NOT NULL COMMENT 'Время проверки, обнаружившей смену (UTC)',
+    INDEX `idx_device_status_history_eq` (`equipment_id`, `changed_at`),
+    CONSTRAINT `fk_device_status_history_equipment` FOREIGN KEY (`equipment_id`) REFERENCES `equipment` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='История состояний сетевых устройств';
+
+CREATE TABLE IF NOT EXISTS `device_uptime` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `equipment_id` INT NOT NULL COMMENT 'ТМЦ',
+    `period` VARCHAR(4) NOT NULL COMMENT 'hour или day',
+    `period_start` DATETIME NOT NULL COMMENT 'Начало часа или суток (UTC)',
+    `observed_seconds` DOUBLE NOT NULL DEFAULT 0 COMMENT 'Секунд наблюдения',
+    `online_seconds` DOUBLE NOT NULL DEFAULT 0 COMMENT 'Из них в сети',
+    UNIQUE KEY `uq_device_uptime_key` (`equipment_id`, `period`, `period_start`),
+    INDEX `idx_device_uptime_period` (`period`, `period_start`),
+    CONSTRAINT `fk_device_uptime_equipment` FOREIGN KEY (`equipment_id`) REFERENCES `equipment` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Доступность сетевых устройств по часам и суткам';
@@ -0,0 +1,25 @@
+-- Миграция: Задания фонового обогащения справочников
+-- Описание: enrichment_jobs — задания обновления процессоров с cpubenchmark.net
+--           (POST /api/cpus/update_benchmark_ratings) и ход их выполнения.
+--           Задания выполняет обработчик: flask --app app enrichment-worker
+
+CREATE TABLE IF NOT EXISTS `enrichment_jobs` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `kind` VARCHAR(20) NOT NULL COMMENT 'Что обогащается (cpu)',
+    `status` VARCHAR(10) NOT NULL DEFAULT 'queued' COMMENT 'queued, running, done, failed',
+    `requested_by` INT NULL COMMENT 'Кто поставил задание',
+    `created_at` DATETIME NOT NULL,
+    `started_at` DATETIME NULL,
+    `finished_at` DATETIME NULL,
+    `heartbeat_at` DATETIME NULL COMMENT 'Последняя отметка о ходе выполнения',
+    `worker` VARCHAR(100) NULL COMMENT 'Обработчик (host:pid)',
+    `total` INT NOT NULL DEFAULT 0 COMMENT 'Уникальных моделей к обработке',
+    `processed` INT NOT NULL DEFAULT 0 COMMENT 'Обработано моделей',
+    `cached` INT NOT NULL DEFAULT 0 COMMENT 'Из них взято из кэша страниц',
+    `updated_count` INT NOT NULL DEFAULT 0 COMMENT 'Обновлено записей',
+    `not_found_count` INT NOT NULL DEFAULT 0 COMMENT 'Записей без данных',
+    `errors` TEXT NULL COMMENT 'Первые ошибки (JSON)',
+    `error` TEXT NULL,
+    INDEX `idx_enrichment_jobs_status` (`kind`, `status`),
+    CONSTRAINT `fk_enrichment_jobs_requested_by` FOREIGN KEY (`requested_by`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Фоновые задания обогащения справочников';
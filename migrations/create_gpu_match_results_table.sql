@@ -0,0 +1,19 @@
+-- Миграция: Сохраненные совпадения видеокарт с каталогом gpu-info-api
+-- Описание: gpu_match_results — результат сопоставления для нормализованной пары
+--           (модель, производитель) и версия каталога, для которой он получен.
+--           Обновление из API пересчитывает только новые пары и пары другой версии каталога.
+
+CREATE TABLE IF NOT EXISTS `gpu_match_results` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `model` VARCHAR(200) NOT NULL COMMENT 'Модель без префикса производителя, в верхнем регистре',
+    `vendor` VARCHAR(155) NOT NULL DEFAULT '' COMMENT 'Производитель в верхнем регистре',
+    `catalog_version` VARCHAR(64) NOT NULL COMMENT 'Версия каталога при сопоставлении',
+    `matched_key` VARCHAR(255) NULL COMMENT 'Лучшая запись каталога с учетом производителя',
+    `score` INT NOT NULL DEFAULT 0,
+    `fallback_key` VARCHAR(255) NULL COMMENT 'Лучшая запись только по модели',
+    `fallback_score` INT NOT NULL DEFAULT 0,
+    `weak_match` TINYINT(1) NOT NULL DEFAULT 0 COMMENT 'Лучшее совпадение требует подтверждения',
+    `candidates` TEXT NULL COMMENT 'Лучшие совпадения для проверки (JSON)',
+    `matched_at` DATETIME NOT NULL,
+    UNIQUE KEY `uq_gpu_match_results_pair` (`model`, `vendor`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Совпадения видеокарт с каталогом gpu-info-api';
@@ -0,0 +1,24 @@
+-- Миграция: Очередь отчетов агентов сбора
+-- Описание: ingest_queue — отчеты /api/hdd_collect и /api/hdd_collect/v2, принятые
+--           в режиме INGEST_MODE=queue (ответ 202 с номером квитанции). Отчеты
+--           применяет обработчик: flask --app app ingest-worker
+
+CREATE TABLE IF NOT EXISTS `ingest_queue` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `receipt` VARCHAR(32) NOT NULL COMMENT 'Номер квитанции для агента',
+    `api` VARCHAR(2) NOT NULL COMMENT 'v1 или v2',
+    `source_key` VARCHAR(255) NULL COMMENT 'mac:<MAC> (v2) или host:<hostname> (v1)',
+    `payload` MEDIUMTEXT NOT NULL COMMENT 'JSON отчета',
+    `status` VARCHAR(10) NOT NULL DEFAULT 'queued' COMMENT 'queued, processing, done, superseded, failed',
+    `received_at` DATETIME NOT NULL,
+    `started_at` DATETIME NULL,
+    `finished_at` DATETIME NULL,
+    `worker` VARCHAR(100) NULL COMMENT 'Обработчик (host:pid)',
+    `attempts` INT NOT NULL DEFAULT 0,
+    `superseded_by` INT NULL COMMENT 'id более нового отчета той же машины',
+    `result` TEXT NULL COMMENT 'Ответ API после применения (JSON)',
+    `error` TEXT NULL,
+    UNIQUE KEY `receipt` (`receipt`),
+    INDEX `idx_ingest_queue_status` (`status`, `id`),
+    INDEX `idx_ingest_queue_source` (`source_key`, `status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Очередь отчетов агентов сбора';
@@ -0,0 +1,34 @@
+-- Миграция: Сеансы инвентаризации
+-- Описание: inventory_audits — сеанс инвентаризации помещения и (или) отдела,
+--           inventory_audit_scans — уникальные коды, отсканированные в сеансе.
+--           Сверка с ТМЦ выполняется в приложении; итог сохраняется при закрытии сеанса.
+
+CREATE TABLE IF NOT EXISTS `inventory_audits` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `place_id` INT NULL COMMENT 'Проверяемое помещение',
+    `department_id` INT NULL COMMENT 'Проверяемый отдел',
+    `user_id` INT NULL COMMENT 'Только ТМЦ этого МОЛ (NULL — все)',
+    `status` VARCHAR(10) NOT NULL DEFAULT 'open' COMMENT 'open, closed',
+    `created_by` INT NULL,
+    `created_at` DATETIME NOT NULL,
+    `closed_at` DATETIME NULL,
+    `scans_received` INT NOT NULL DEFAULT 0 COMMENT 'Принято кодов, включая повторы',
+    `result` MEDIUMTEXT NULL COMMENT 'Итог сверки при закрытии (JSON)',
+    KEY `idx_inventory_audits_status` (`status`, `created_at`),
+    CONSTRAINT `fk_inventory_audits_place` FOREIGN KEY (`place_id`) REFERENCES `places` (`id`),
+    CONSTRAINT `fk_inventory_audits_department` FOREIGN KEY (`department_id`) REFERENCES `department` (`id`),
+    CONSTRAINT `fk_inventory_audits_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
+    CONSTRAINT `fk_inventory_audits_created_by` FOREIGN KEY (`created_by`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Сеансы инвентаризации';
+
+CREATE TABLE IF NOT EXISTS `inventory_audit_scans` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `audit_id` INT NOT NULL,
+    `code` VARCHAR(100) NOT NULL COMMENT 'Код без пробелов по краям, в нижнем регистре',
+    `scanned_code` VARCHAR(100) NOT NULL COMMENT 'Код как отсканирован впервые (для показа)',
+    `scanned_at` DATETIME NOT NULL COMMENT 'Первое сканирование',
+    `scanned_by` INT NULL,
+    UNIQUE KEY `uq_inventory_audit_scans_code` (`audit_id`, `code`),
+    CONSTRAINT `fk_inventory_audit_scans_audit` FOREIGN KEY (`audit_id`) REFERENCES `inventory_audits` (`id`),
+    CONSTRAINT `fk_inventory_audit_scans_user` FOREIGN KEY (`scanned_by`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Коды, отсканированные при инвентаризации';
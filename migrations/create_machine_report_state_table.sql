@@ -0,0 +1,13 @@
+-- Миграция: Отпечатки отчетов агентов сбора
+-- Описание: machine_report_state — отпечаток (sha256) последнего примененного раздела
+--           отчета /api/hdd_collect/v2 по машине. Разделы без изменений в тот же день
+--           не записываются повторно, история дисков пишется при изменении или раз в сутки.
+
+CREATE TABLE IF NOT EXISTS `machine_report_state` (
+    `machine_id` INT NOT NULL COMMENT 'Машина',
+    `section` VARCHAR(20) NOT NULL COMMENT 'machine, disks, graphics_cards, memory_modules',
+    `fingerprint` VARCHAR(64) NOT NULL COMMENT 'sha256 нормализованного раздела',
+    `reported_on` DATE NOT NULL COMMENT 'День последнего применения раздела',
+    PRIMARY KEY (`machine_id`, `section`),
+    CONSTRAINT `fk_machine_report_state_machine` FOREIGN KEY (`machine_id`) REFERENCES `machines` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Отпечатки разделов отчетов агентов';
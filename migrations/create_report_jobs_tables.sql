@@ -0,0 +1,31 @@
+-- Миграция: Таблицы фоновой очереди отчетов
+-- Описание: data_versions — счетчики изменений данных по областям (отдел / общие
+--           справочники), по ним определяется, можно ли отдать готовый отчет повторно;
+--           report_jobs — задания на формирование тяжелых отчетов (форма 8).
+--           Задания выполняет обработчик: flask --app app report-worker
+
+CREATE TABLE IF NOT EXISTS `data_versions` (
+    `scope` VARCHAR(64) NOT NULL PRIMARY KEY COMMENT 'global или department:<id>',
+    `version` BIGINT NOT NULL DEFAULT 0 COMMENT 'Номер изменения'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Версии данных для отчетов';
+
+CREATE TABLE IF NOT EXISTS `report_jobs` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `kind` VARCHAR(50) NOT NULL COMMENT 'Тип отчета (form8)',
+    `params` TEXT NOT NULL COMMENT 'Параметры отчета (JSON)',
+    `dedup_key` VARCHAR(64) NOT NULL COMMENT 'sha256(тип, параметры, токен данных)',
+    `status` VARCHAR(10) NOT NULL DEFAULT 'queued' COMMENT 'queued, running, done, failed',
+    `requested_by` INT NULL COMMENT 'Кто поставил задание',
+    `created_at` DATETIME NOT NULL,
+    `started_at` DATETIME NULL,
+    `finished_at` DATETIME NULL,
+    `worker` VARCHAR(100) NULL COMMENT 'Обработчик (host:pid)',
+    `attempts` INT NOT NULL DEFAULT 0,
+    `artifact_path` VARCHAR(255) NULL COMMENT 'Путь к готовому файлу',
+    `filename` VARCHAR(255) NULL COMMENT 'Имя файла для скачивания',
+    `mimetype` VARCHAR(100) NULL,
+    `error` TEXT NULL,
+    INDEX `ix_report_jobs_dedup_key` (`dedup_key`),
+    INDEX `idx_report_jobs_status` (`status`, `created_at`),
+    CONSTRAINT `fk_report_jobs_requested_by` FOREIGN KEY (`requested_by`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Фоновые задания отчетов';
@@ -0,0 +1,14 @@
+-- Миграция: Журнал изменений для поискового индекса ТМЦ
+-- Описание: search_index_changes — id ТМЦ, индексируемые поля которых изменились
+--           (NULL — перестроить индекс целиком). Процессы приложения перечитывают
+--           только эти ТМЦ; строки старше суток удаляются самими процессами.
+
+CREATE TABLE IF NOT EXISTS `search_index_changes` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `equipment_id` INT NULL COMMENT 'Измененный ТМЦ (NULL — все)',
+    `changed_at` DATETIME NOT NULL,
+    KEY `ix_search_index_changes_changed_at` (`changed_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Журнал изменений для поискового индекса';
+
+-- Версия области 'search' в data_versions больше не используется
+DELETE FROM `data_versions` WHERE `scope` = 'search';
@@ -0,0 +1,37 @@
+-- Миграция: Создание таблицы предагрегированной статистики ТМЦ
+-- Описание: Количество и стоимость активных ТМЦ в разрезе
+--           (МОЛ, отдел, группа, месяц поступления, ОС/периферия, статус).
+--           Таблица поддерживается приложением инкрементально, для пересборки:
+--           flask --app app rebuild-stats-rollup
+
+CREATE TABLE IF NOT EXISTS `stats_rollup` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `usersid` INT NOT NULL COMMENT 'МОЛ',
+    `department_id` INT NOT NULL DEFAULT 0 COMMENT 'Отдел (0 - без отдела)',
+    `group_id` INT NOT NULL COMMENT 'Группа наименования',
+    `month` DATE NOT NULL COMMENT 'Первое число месяца поступления',
+    `os` BOOLEAN NOT NULL COMMENT 'Основное средство (1) или периферия (0)',
+    `status` VARCHAR(10) NOT NULL COMMENT 'active, repair, lost',
+    `count` INT NOT NULL DEFAULT 0 COMMENT 'Количество ТМЦ',
+    `cost` DECIMAL(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Сумма стоимости',
+    UNIQUE KEY `uq_stats_rollup_key` (`usersid`, `department_id`, `group_id`, `month`, `os`, `status`),
+    INDEX `idx_stats_rollup_month` (`month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Предагрегированная статистика ТМЦ';
+
+-- Первичное заполнение (повторный запуск пересобирает таблицу)
+DELETE FROM `stats_rollup`;
+
+INSERT INTO `stats_rollup` (`usersid`, `department_id`, `group_id`, `month`, `os`, `status`, `count`, `cost`)
+SELECT e.`usersid`,
+       COALESCE(e.`department_id`, 0),
+       n.`groupid`,
+       DATE_FORMAT(e.`datepost`, '%Y-%m-01'),
+       e.`os`,
+       CASE WHEN e.`repair` = 1 THEN 'repair' WHEN e.`lost` = 1 THEN 'lost' ELSE 'active' END,
+       COUNT(e.`id`),
+       COALESCE(SUM(e.`cost`), 0)
+FROM `equipment` e
+JOIN `nome` n ON n.`id` = e.`nomeid`
+WHERE e.`active` = 1
+GROUP BY e.`usersid`, COALESCE(e.`department_id`, 0), n.`groupid`, DATE_FORMAT(e.`datepost`, '%Y-%m-01'), e.`os`,
+         CASE WHEN e.`repair` = 1 THEN 'repair' WHEN e.`lost` = 1 THEN 'lost' ELSE 'active' END;
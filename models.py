@@ -6,6 +6,7 @@ from datetime import datetime, date
 from decimal import Decimal
 from flask_sqlalchemy import SQLAlchemy # <-- Только SQLAlchemy
 from sqlalchemy import DateTime # <-- DateTime из sqlalchemy
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
 from flask_login import UserMixin
 
 db = SQLAlchemy()
@@ -79,6 +80,12 @@ class Equipment(db.Model):
     users = db.relationship('Users', backref='equipment')
     knt = db.relationship('Knt', backref='equipment')
     nome = db.relationship('Nome', backref='equipment')
+
+    __table_args__ = (
+        db.Index('idx_equipment_shtrihkod', 'shtrihkod'),  # Поиск по штрихкоду (сканеры склада)
+        db.Index('idx_equipment_invnum', 'invnum'),  # Поиск по инвентарному номеру
+    )
+
     def __repr__(self):
         return f'<Equipment {self.id}: {self.buhname}>'
 
@@ -666,4 +673,309 @@ class PCComponentLink(db.Model):
     hard_drive = db.relationship('PCHardDrive', back_populates='pc_links', foreign_keys=[hard_drive_id])
     
     def __repr__(self):
-        return f'<PCComponentLink {self.id}: PC {self.equipment_id}>'
\ No newline at end of file
+        return f'<PCComponentLink {self.id}: PC {self.equipment_id}>'
+
+
+class StatsRollup(db.Model):
+    """
+    Предагрегированная статистика по ТМЦ — количество и стоимость активных ТМЦ
+    в разрезе (МОЛ, отдел, группа, месяц поступления, ОС/периферия, статус).
+    Поддерживается инкрементально при изменении Equipment (services/stats_rollup.py),
+    полностью пересобирается командой `flask --app app rebuild-stats-rollup`.
+    """
+    __tablename__ = 'stats_rollup'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    usersid = db.Column(db.Integer, nullable=False)  # МОЛ
+    department_id = db.Column(db.Integer, nullable=False, default=0)  # Отдел (0 — без отдела)
+    group_id = db.Column(db.Integer, nullable=False)  # Группа наименования (категория — через group_nome)
+    month = db.Column(db.Date, nullable=False)  # Первое число месяца поступления (datepost)
+    os = db.Column(db.Boolean, nullable=False)  # Основное средство (True) или периферия (False)
+    status = db.Column(db.String(10), nullable=False)  # active, repair, lost
+    count = db.Column(db.Integer, nullable=False, default=0)  # Количество ТМЦ
+    cost = db.Column(db.DECIMAL(precision=14, scale=2), nullable=False, default=Decimal('0.00'))  # Сумма стоимости
+
+    __table_args__ = (
+        db.UniqueConstraint('usersid', 'department_id', 'group_id', 'month', 'os', 'status', name='uq_stats_rollup_key'),
+    )
+
+    def __repr__(self):
+        return f'<StatsRollup {self.usersid}/{self.department_id}/{self.group_id} {self.month} {self.status}: {self.count}>'
+
+
+class DataVersion(db.Model):
+    """
+    Счетчики изменений данных для отчетов. Версия области (отдел или общие
+    справочники) увеличивается в той же транзакции, что и изменение данных
+    (services/data_versions.py); по версиям строится токен «данные не менялись».
+    """
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(64), primary_key=True)  # 'global' или 'department:<id>'
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.scope}: {self.version}>'
+
+
+class SearchIndexChange(db.Model):
+    """
+    Журнал изменений ТМЦ для поискового индекса в памяти процессов
+    (services/search_index.py). Строка пишется в той же транзакции, что и
+    изменение индексируемых полей; процессы перечитывают только эти ТМЦ.
+    equipment_id = NULL — перестроить индекс целиком (массовые UPDATE/DELETE).
+    """
+    __tablename__ = 'search_index_changes'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    equipment_id = db.Column(db.Integer, nullable=True)  # Измененный ТМЦ (NULL — все)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<SearchIndexChange {self.id}: {self.equipment_id}>'
+
+
+class ReportJob(db.Model):
+    """
+    Задание на формирование тяжелого отчета (например, формы 8) в фоновом
+    обработчике. Готовый файл хранится на диске (artifact_path); одинаковые
+    запросы при неизменных данных используют одно задание (dedup_key).
+    """
+    __tablename__ = 'report_jobs'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(50), nullable=False)  # Тип отчета ('form8')
+    params = db.Column(db.Text, nullable=False)  # Параметры отчета (JSON)
+    dedup_key = db.Column(db.String(64), nullable=False, index=True)  # sha256(тип, параметры, токен данных)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Кто поставил задание
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # Обработчик, взявший задание (host:pid)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    artifact_path = db.Column(db.String(255), nullable=True)  # Путь к готовому файлу
+    filename = db.Column(db.String(255), nullable=True)  # Имя файла для скачивания
+    mimetype = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_report_jobs_status', 'status', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<ReportJob {self.id}: {self.kind} {self.status}>'
+
+
+class DeviceStatus(db.Model):
+    """
+    Последний результат проверки доступности сетевого устройства (ТМЦ с IP).
+    Таблицу заполняет фоновый опросчик (services/monitoring.py); страницы
+    мониторинга только читают ее.
+    """
+    __tablename__ = 'device_status'
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id', ondelete='CASCADE'), primary_key=True)
+    ip = db.Column(db.String(100), nullable=False)  # Адрес на момент проверки
+    online = db.Column(db.Boolean, nullable=False, default=False)
+    method = db.Column(db.String(10), nullable=True)  # Чем подтверждена доступность: 'icmp', 'tcp:<порт>'
+    latency_ms = db.Column(db.Float, nullable=True)  # Время ответа, мс
+    checked_at = db.Column(db.DateTime, nullable=False)  # Время последней проверки (UTC)
+    changed_at = db.Column(db.DateTime, nullable=False)  # Когда устройство перешло в текущее состояние (UTC)
+
+    __table_args__ = (
+        db.Index('idx_device_status_checked', 'checked_at'),
+    )
+
+    def __repr__(self):
+        return f'<DeviceStatus {self.equipment_id} {self.ip}: {"online" if self.online else "offline"}>'
+
+
+class DeviceStatusHistory(db.Model):
+    """
+    История состояний сетевых устройств: одна строка на каждую смену состояния
+    (в сети / не в сети), а не на каждую проверку.
+    """
+    __tablename__ = 'device_status_history'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id', ondelete='CASCADE'), nullable=False)
+    online = db.Column(db.Boolean, nullable=False)  # Новое состояние
+    changed_at = db.Column(db.DateTime, nullable=False)  # Время проверки, обнаружившей смену (UTC)
+
+    __table_args__ = (
+        db.Index('idx_device_status_history_eq', 'equipment_id', 'changed_at'),
+    )
+
+    def __repr__(self):
+        return f'<DeviceStatusHistory {self.equipment_id} {self.changed_at}: {"online" if self.online else "offline"}>'
+
+
+class DeviceUptime(db.Model):
+    """
+    Накопленное время наблюдения и время «в сети» по устройству за час или сутки (UTC).
+    Пополняется инкрементально после каждого цикла опроса (services/uptime.py).
+    """
+    __tablename__ = 'device_uptime'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id', ondelete='CASCADE'), nullable=False)
+    period = db.Column(db.String(4), nullable=False)  # 'hour' или 'day'
+    period_start = db.Column(db.DateTime, nullable=False)  # Начало часа или суток (UTC)
+    observed_seconds = db.Column(db.Float, nullable=False, default=0)  # Сколько секунд устройство наблюдалось
+    online_seconds = db.Column(db.Float, nullable=False, default=0)  # Из них в сети
+
+    __table_args__ = (
+        db.UniqueConstraint('equipment_id', 'period', 'period_start', name='uq_device_uptime_key'),
+        db.Index('idx_device_uptime_period', 'period', 'period_start'),
+    )
+
+    def __repr__(self):
+        return f'<DeviceUptime {self.equipment_id} {self.period} {self.period_start}: {self.online_seconds}/{self.observed_seconds}>'
+
+
+class IngestReceipt(db.Model):
+    """
+    Отчет агента сбора (/api/hdd_collect, /api/hdd_collect/v2), принятый в очередь.
+    Агент получает номер квитанции (receipt) и ответ 202, данные применяет фоновый
+    обработчик (services/ingest_queue.py). Повторные отчеты одной машины (source_key),
+    ожидающие в очереди, схлопываются: применяется только последний.
+    """
+    __tablename__ = 'ingest_queue'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    receipt = db.Column(db.String(32), nullable=False, unique=True)  # Номер квитанции для агента
+    api = db.Column(db.String(2), nullable=False)  # 'v1' или 'v2'
+    source_key = db.Column(db.String(255), nullable=True)  # 'mac:<MAC>' (v2) или 'host:<hostname>' (v1)
+    payload = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=False)  # JSON отчета
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, processing, done, superseded, failed
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # Обработчик, взявший отчет (host:pid)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    superseded_by = db.Column(db.Integer, nullable=True)  # id более нового отчета той же машины
+    result = db.Column(db.Text, nullable=True)  # Ответ API после применения (JSON)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_ingest_queue_status', 'status', 'id'),
+        db.Index('idx_ingest_queue_source', 'source_key', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<IngestReceipt {self.id}: {self.api} {self.source_key} {self.status}>'
+
+
+class MachineReportState(db.Model):
+    """
+    Отпечаток последнего примененного раздела отчета агента (machine, disks,
+    graphics_cards, memory_modules) по машине. Раздел с тем же отпечатком
+    в тот же день не применяется повторно (services/hdd_ingest.py).
+    """
+    __tablename__ = 'machine_report_state'
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id', ondelete='CASCADE'), primary_key=True)
+    section = db.Column(db.String(20), primary_key=True)  # Раздел отчета
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 нормализованного раздела
+    reported_on = db.Column(db.Date, nullable=False)  # День последнего применения раздела
+
+    def __repr__(self):
+        return f'<MachineReportState {self.machine_id} {self.section} {self.reported_on}>'
+
+
+class EnrichmentJob(db.Model):
+    """
+    Задание фонового обогащения справочника комплектующих данными внешних
+    источников (kind='cpu' — процессоры с cpubenchmark.net). Выполняет обработчик
+    enrichment-worker (services/cpu_enrichment.py), ход выполнения опрашивается по id.
+    """
+    __tablename__ = 'enrichment_jobs'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(20), nullable=False)  # Что обогащается ('cpu')
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Кто поставил задание
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Последняя отметка о ходе выполнения
+    worker = db.Column(db.String(100), nullable=True)  # Обработчик, взявший задание (host:pid)
+    total = db.Column(db.Integer, nullable=False, default=0)  # Уникальных моделей к обработке
+    processed = db.Column(db.Integer, nullable=False, default=0)  # Обработано моделей
+    cached = db.Column(db.Integer, nullable=False, default=0)  # Из них взято из кэша страниц
+    updated_count = db.Column(db.Integer, nullable=False, default=0)  # Обновлено записей
+    not_found_count = db.Column(db.Integer, nullable=False, default=0)  # Записей без данных
+    errors = db.Column(db.Text, nullable=True)  # Первые ошибки (JSON-список)
+    error = db.Column(db.Text, nullable=True)  # Причина failed
+
+    __table_args__ = (
+        db.Index('idx_enrichment_jobs_status', 'kind', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<EnrichmentJob {self.id}: {self.kind} {self.status} {self.processed}/{self.total}>'
+
+
+class GpuMatchResult(db.Model):
+    """
+    Сохраненный результат сопоставления видеокарты с каталогом gpu-info-api
+    для нормализованной пары (модель, производитель). Пересчитывается, только
+    если изменилась версия каталога (services/gpu_matching.py).
+    """
+    __tablename__ = 'gpu_match_results'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    model = db.Column(db.String(200), nullable=False)  # Модель без префикса производителя, в верхнем регистре
+    vendor = db.Column(db.String(155), nullable=False, default='')  # Производитель в верхнем регистре
+    catalog_version = db.Column(db.String(64), nullable=False)  # GpuCatalog.match_version при сопоставлении
+    matched_key = db.Column(db.String(255), nullable=True)  # Лучшая запись каталога с учетом производителя
+    score = db.Column(db.Integer, nullable=False, default=0)
+    fallback_key = db.Column(db.String(255), nullable=True)  # Лучшая запись только по модели
+    fallback_score = db.Column(db.Integer, nullable=False, default=0)
+    weak_match = db.Column(db.Boolean, nullable=False, default=False)  # Лучшее совпадение требует подтверждения
+    candidates = db.Column(db.Text, nullable=True)  # Лучшие совпадения для проверки (JSON)
+    matched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('model', 'vendor', name='uq_gpu_match_results_pair'),
+    )
+
+    def __repr__(self):
+        return f'<GpuMatchResult {self.vendor} {self.model}: {self.matched_key} ({self.score})>'
+
+
+class InventoryAudit(db.Model):
+    """
+    Сеанс инвентаризации помещения и (или) отдела. Отсканированные коды
+    (InventoryAuditScan) сверяются с ТМЦ, которые числятся в помещении или отделе
+    (services/inventory_audit.py); при закрытии результат сверки сохраняется.
+    """
+    __tablename__ = 'inventory_audits'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    place_id = db.Column(db.Integer, db.ForeignKey('places.id'), nullable=True)  # Проверяемое помещение
+    department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=True)  # Проверяемый отдел
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Только ТМЦ этого МОЛ (None — все)
+    status = db.Column(db.String(10), nullable=False, default='open')  # open, closed
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)
+    scans_received = db.Column(db.Integer, nullable=False, default=0)  # Принято кодов, включая повторы
+    result = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=True)  # Итог сверки при закрытии (JSON)
+
+    place = db.relationship('Places')
+    department = db.relationship('Department')
+
+    __table_args__ = (
+        db.Index('idx_inventory_audits_status', 'status', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<InventoryAudit {self.id}: place={self.place_id} department={self.department_id} {self.status}>'
+
+
+class InventoryAuditScan(db.Model):
+    """Уникальный код (штрихкод или инвентарный номер), отсканированный в сеансе инвентаризации."""
+    __tablename__ = 'inventory_audit_scans'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    audit_id = db.Column(db.Integer, db.ForeignKey('inventory_audits.id'), nullable=False)
+    code = db.Column(db.String(100), nullable=False)  # Код без пробелов по краям, в нижнем регистре
+    scanned_code = db.Column(db.String(100), nullable=False)  # Код как отсканирован впервые (для показа)
+    scanned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Первое сканирование
+    scanned_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('audit_id', 'code', name='uq_inventory_audit_scans_code'),
+    )
+
+    def __repr__(self):
+        return f'<InventoryAuditScan {self.audit_id}: {self.code}>'
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Сервисный слой системы учета ТМЦ.
+
+Содержит функции, вынесенные из app.py для повторного использования:
+- Кэш «шапки» пользователя (количество и стоимость ТМЦ, фото, организация, роли)
+- Количество и стоимость ТМЦ по отделам и помещениям (один запрос с группировкой, кэш на пользователя)
+- Агрегаты статистики для главной страницы и страниц статистики
+- Предагрегированная статистика stats_rollup с инкрементальным обновлением
+- Построитель запросов к ТМЦ по фильтрам списков (без IN-списков в Python)
+- Постраничная выборка по ключу сортировки с курсором (keyset pagination)
+- Сводка по компьютерам, привязанным к ТМЦ наименования
+- Пакетное разрешение ссылок в истории перемещений
+- Версии данных для отчетов и фоновая очередь тяжелых отчетов (форма 8)
+- Дисковый кэш готовых отчетов с вытеснением по размеру (LRU)
+- Фоновая асинхронная проверка доступности сетевых устройств, история состояний и доступность
+- Поток смен состояния устройств для страниц мониторинга (Server-Sent Events)
+- Пакетная запись данных агента сбора (API hdd_collect и hdd_collect v2)
+- Очередь отчетов агентов сбора с фоновым обработчиком и схлопыванием повторных отчетов
+- Справочник производителей в памяти процесса (псевдонимы, определение по модели)
+- Определение характеристик диска по модели (правила из data/disk_rules.json)
+- Каталог видеокарт gpu-info-api в памяти процесса с индексом для поиска по модели,
+  снимком на диске и файлом локальных правок
+- Сохраненные совпадения видеокарт с каталогом (пересчет при смене версии каталога)
+- Фоновое обогащение процессоров с cpubenchmark.net (кэш страниц, ограничение частоты запросов)
+- Поисковый индекс ТМЦ в памяти процесса (префиксы, опечатки, MAC-адреса в любом написании)
+- Поиск ТМЦ по штрихкоду и инвентарному номеру (пачки кодов, LRU-кэш, задержка p50/p99)
+- Инвентаризация по сеансам: пачки сканов, сверка в памяти, сличительная ведомость в PDF
+"""
+
+from .code_lookup import LOOKUP_BATCH, invalidate_code_lookup, lookup_code, lookup_codes, lookup_stats
+from .cpu_enrichment import enqueue_cpu_enrichment, enrichment_status, fetch_cpu_data, run_enrichment_worker
+from .dashboard import build_dashboard_stats
+from .data_versions import data_token, department_scope
+from .disk_rules import classify_disk_model, classify_disk_models
+from .equipment_query import EquipmentFilter
+from .form8 import form8_equipment_query, form8_params
+from .gpu_catalog import GPU_API_DATA_FILE, GpuCatalog, get_gpu_catalog, replace_gpu_catalog, update_gpu_entry
+from .gpu_matching import clean_gpu_model, gpu_match_pair, resolve_gpu_matches, stored_match
+from .hdd_ingest import apply_v1_payload, apply_v2_payload, sync_machine_to_equipment
+from .ingest_queue import (INGEST_BATCH, IngestQueueFull, enqueue_payload, ingest_queued, queue_stats,
+                           receipt_status, run_ingest_worker)
+from .inventory_audit import (AUDIT_SCAN_BATCH, AuditClosed, add_scans, audit_params, audit_status, close_audit,
+                              open_audit, reconcile_audit)
+from .location_stats import get_department_stats, get_place_stats, invalidate_location_stats
+from .machine_stats import build_machine_stats
+from .monitoring import (device_statuses, network_devices_query, run_monitor, snapshot_age,
+                         snapshot_is_stale)
+from .monitoring_events import SSE_FLASK_FALLBACK, last_transition_id, parse_last_event_id, snapshot_events
+from .move_history import MOVE_SORT, MoveHistoryResolver
+from .pagination import KeysetPage, iter_keyset_batches, keyset_page, nav_params, page_args
+from .report_cache import touch_artifact
+from .report_jobs import artifact_exists, enqueue_report, job_params, job_status, run_worker
+from .search_index import invalidate_search_index, match_machine_equipment, search_equipment
+from .stats_rollup import rebuild_stats_rollup
+from .uptime import (availability, availability_window, status_changes, uptime_by_device, uptime_percent,
+                     uptime_totals)
+from .user_summary import get_user_summary, invalidate_user_summary
+from .vendor_directory import find_vendor_id, find_vendor_name, invalidate_vendors
+
+__all__ = [
+    'AUDIT_SCAN_BATCH',
+    'GPU_API_DATA_FILE',
+    'INGEST_BATCH',
+    'LOOKUP_BATCH',
+    'MOVE_SORT',
+    'SSE_FLASK_FALLBACK',
+    'AuditClosed',
+    'EquipmentFilter',
+    'GpuCatalog',
+    'IngestQueueFull',
+    'KeysetPage',
+    'MoveHistoryResolver',
+    'add_scans',
+    'apply_v1_payload',
+    'apply_v2_payload',
+    'artifact_exists',
+    'audit_params',
+    'audit_status',
+    'availability',
+    'availability_window',
+    'build_dashboard_stats',
+    'build_machine_stats',
+    'classify_disk_model',
+    'classify_disk_models',
+    'clean_gpu_model',
+    'close_audit',
+    'data_token',
+    'department_scope',
+    'device_statuses',
+    'enqueue_cpu_enrichment',
+    'enqueue_payload',
+    'enqueue_report',
+    'enrichment_status',
+    'fetch_cpu_data',
+    'find_vendor_id',
+    'find_vendor_name',
+    'form8_equipment_query',
+    'form8_params',
+    'get_department_stats',
+    'get_gpu_catalog',
+    'get_place_stats',
+    'get_user_summary',
+    'gpu_match_pair',
+    'ingest_queued',
+    'invalidate_code_lookup',
+    'invalidate_location_stats',
+    'invalidate_search_index',
+    'invalidate_user_summary',
+    'invalidate_vendors',
+    'iter_keyset_batches',
+    'job_params',
+    'job_status',
+    'keyset_page',
+    'last_transition_id',
+    'lookup_code',
+    'lookup_codes',
+    'lookup_stats',
+    'match_machine_equipment',
+    'nav_params',
+    'network_devices_query',
+    'open_audit',
+    'page_args',
+    'parse_last_event_id',
+    'queue_stats',
+    'rebuild_stats_rollup',
+    'receipt_status',
+    'reconcile_audit',
+    'replace_gpu_catalog',
+    'resolve_gpu_matches',
+    'run_enrichment_worker',
+    'run_ingest_worker',
+    'run_monitor',
+    'run_worker',
+    'search_equipment',
+    'snapshot_age',
+    'snapshot_events',
+    'snapshot_is_stale',
+    'status_changes',
+    'stored_match',
+    'sync_machine_to_equipment',
+    'touch_artifact',
+    'update_gpu_entry',
+    'uptime_by_device',
+    'uptime_percent',
+    'uptime_totals',
+]
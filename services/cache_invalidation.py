@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Сброс кэшей процесса после commit транзакции, изменившей данные.
+
+Кэш (шапка пользователя, счетчики отделов, справочник производителей, поисковый
+индекс, карточки кодов) создает один экземпляр CacheInvalidation: набор моделей,
+функцию collect, которая по измененному объекту возвращает затронутые ключи
+кэша, и функцию apply, которая их сбрасывает. Ключи копятся в session.info
+между flush и commit; после commit вызывается apply, после rollback ключи
+отбрасываются. Массовые UPDATE/DELETE через Query не проходят через flush и
+сбрасывают весь кэш.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Ключ «сбросить весь кэш»
+ALL = object()
+
+
+def attr_values(obj, attr):
+    """
+    Текущее и предыдущее (до изменения в сессии) значения атрибута.
+    Если атрибут не загружен, возвращает {ALL} — затронутые ключи не узнать.
+    """
+    history = inspect(obj).attrs[attr].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    values = {value for value in values if value is not None}
+    return values or {ALL}
+
+
+class CacheInvalidation:
+    """
+    Слушатели сессии для одного кэша.
+
+    Args:
+        key: ключ в session.info для накопления ключей кэша
+        models: модели, изменения которых затрагивают кэш
+        collect: collect(session, obj) -> ключи кэша (пусто — объект кэш не затронул);
+                 вызывается после flush для новых, измененных и удаленных объектов models
+        apply: apply(keys) сбрасывает ключи после commit; keys=None — весь кэш
+        apply_on_rollback: сбрасывать весь кэш и после rollback транзакции с
+                 изменениями (если кэш мог прочитать откаченные строки)
+        record: record(session, keys) — вызывается в той же транзакции с ключами
+                 каждого flush ({ALL} — массовый UPDATE/DELETE), например чтобы
+                 сообщить об изменении другим процессам
+    """
+
+    def __init__(self, key, models, collect, apply, apply_on_rollback=False, record=None):
+        self.key = key
+        self.models = tuple(models)
+        self.collect = collect
+        self.apply = apply
+        self.apply_on_rollback = apply_on_rollback
+        self.record = record
+        event.listen(Session, 'after_flush', self._collect_changes)
+        event.listen(Session, 'do_orm_execute', self._collect_bulk_changes)
+        event.listen(Session, 'after_commit', self._apply_invalidation)
+        event.listen(Session, 'after_rollback', self._discard_pending)
+
+    def add(self, session, keys=(ALL,)):
+        """Добавляет ключи к сбросу после commit текущей транзакции (по умолчанию — весь кэш)."""
+        session.info.setdefault(self.key, set()).update(keys)
+
+    def _collect_changes(self, session, flush_context):
+        changed = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, self.models):
+                changed.update(self.collect(session, obj) or ())
+        if changed:
+            self.add(session, changed)
+            if self.record:
+                self.record(session, changed)
+
+    def _collect_bulk_changes(self, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in self.models:
+            self.add(orm_execute_state.session)
+            if self.record:
+                self.record(orm_execute_state.session, {ALL})
+
+    def _apply_invalidation(self, session):
+        pending = session.info.pop(self.key, None)
+        if pending:
+            self.apply(None if ALL in pending else pending)
+
+    def _discard_pending(self, session):
+        if session.info.pop(self.key, None) and self.apply_on_rollback:
+            self.apply(None)
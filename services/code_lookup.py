@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск ТМЦ по штрихкоду или инвентарному номеру для сканеров склада.
+
+Коды ищутся одним запросом на пачку (индексы idx_equipment_shtrihkod и
+idx_equipment_invnum, миграция add_equipment_code_indexes.sql) и возвращаются
+компактной карточкой ТМЦ. Найденные карточки хранятся в LRU-кэше процесса
+(CODE_LOOKUP_CACHE_SIZE кодов, не дольше CODE_LOOKUP_TTL секунд). Запись
+сбрасывается после коммита, изменившего ТМЦ с этим кодом; изменение
+наименований, помещений, пользователей и отделов и массовые UPDATE/DELETE
+сбрасывают весь кэш. В других воркерах gunicorn устаревшая карточка живет не
+дольше TTL.
+
+Код сравнивается без учета регистра и пробелов по краям. Номер может
+повторяться у нескольких ТМЦ (в учете он не уникален), поэтому для кода
+возвращается список карточек.
+
+Время обработки запросов и доля попаданий в кэш считаются в памяти процесса
+(последние CODE_LOOKUP_SAMPLES запросов) для lookup_stats.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sqlalchemy import inspect, or_
+
+from models import Department, Equipment, Nome, Places, Users, db
+
+from .cache_invalidation import ALL, CacheInvalidation
+
+CODE_LOOKUP_CACHE_SIZE = int(os.getenv('CODE_LOOKUP_CACHE_SIZE', '5000'))
+CODE_LOOKUP_TTL = int(os.getenv('CODE_LOOKUP_TTL', '60'))
+CODE_LOOKUP_SAMPLES = int(os.getenv('CODE_LOOKUP_SAMPLES', '1000'))
+
+# Максимум кодов в одном запросе
+LOOKUP_BATCH = 500
+
+# Размер пачки кодов в одном IN-запросе
+_CHUNK = 200
+
+# Справочники, названия из которых входят в карточку: модель -> поле
+_REFERENCE_FIELDS = {Nome: 'name', Places: 'name', Users: 'login', Department: 'name'}
+
+_cache = OrderedDict()  # код -> (время истечения, карточки)
+_lock = threading.Lock()
+
+_samples = deque(maxlen=CODE_LOOKUP_SAMPLES)  # время обработки последних запросов, мс
+_totals = {'requests': 0, 'codes': 0, 'hits': 0, 'found': 0}
+
+
+def code_key(code):
+    """Ключ кода в кэше: без пробелов по краям, без учета регистра ('' — пустой код)."""
+    return str(code or '').strip().casefold()
+
+
+def equipment_card(row):
+    """Компактная карточка ТМЦ из строки card_query()."""
+    (equipment_id, invnum, shtrihkod, sernum, buhname, is_os, repair, lost, cost,
+     nome_id, nome, place_id, place, user_id, login, department_id, department) = row
+    return {
+        'id': equipment_id,
+        'invnum': invnum or '',
+        'shtrihkod': shtrihkod or '',
+        'sernum': sernum or '',
+        'buhname': buhname,
+        'nome': {'id': nome_id, 'name': nome},
+        'place': {'id': place_id, 'name': place},
+        'user': {'id': user_id, 'login': login},
+        'department': {'id': department_id, 'name': department} if department_id else None,
+        'os': bool(is_os),
+        'repair': bool(repair),
+        'lost': bool(lost),
+        'cost': float(cost) if cost else 0.0,
+    }
+
+
+def card_query():
+    """Запрос колонок карточки ТМЦ (с названиями наименования, помещения, МОЛ и отдела)."""
+    return db.session.query(
+        Equipment.id, Equipment.invnum, Equipment.shtrihkod, Equipment.sernum, Equipment.buhname,
+        Equipment.os, Equipment.repair, Equipment.lost, Equipment.cost,
+        Equipment.nomeid, Nome.name, Equipment.placesid, Places.name,
+        Equipment.usersid, Users.login, Equipment.department_id, Department.name,
+    ).outerjoin(Nome, Nome.id == Equipment.nomeid)\
+        .outerjoin(Places, Places.id == Equipment.placesid)\
+        .outerjoin(Users, Users.id == Equipment.usersid)\
+        .outerjoin(Department, Department.id == Equipment.department_id)
+
+
+def _query(keys, spellings):
+    """{ключ кода: [карточки]} для активных ТМЦ с таким штрихкодом или инвентарным номером."""
+    found = {key: [] for key in keys}
+    for start in range(0, len(keys), _CHUNK):
+        chunk = sorted({value for key in keys[start:start + _CHUNK] for value in spellings[key]})
+        rows = card_query()\
+            .filter(or_(Equipment.shtrihkod.in_(chunk), Equipment.invnum.in_(chunk)),
+                    Equipment.active == True)\
+            .order_by(Equipment.id)
+        for row in rows:
+            card = equipment_card(row)
+            # Сравнение в Python: в MySQL IN без учета регистра, в SQLite — с учетом
+            for key in {code_key(card['shtrihkod']), code_key(card['invnum'])}:
+                if key in found:
+                    found[key].append(card)
+    return found
+
+
+def lookup_codes(codes, record_stats=True):
+    """
+    Карточки ТМЦ по штрихкодам или инвентарным номерам.
+
+    Args:
+        codes: коды в порядке сканирования (пустые пропускаются, повторы учитываются один раз)
+        record_stats: учитывать запрос в lookup_stats (False — служебные вызовы,
+                      например сверка инвентаризации, чтобы не искажать задержку сканера)
+
+    Returns:
+        dict: {код как передан: [карточки]} (пустой список — не найдено)
+    """
+    started = time.perf_counter()
+    keys = {}
+    spellings = {}
+    for code in codes:
+        key = code_key(code)
+        if key:
+            keys.setdefault(code, key)
+            # Написания для IN: как передан и в обоих регистрах (в SQLite сравнение с учетом регистра)
+            spellings.setdefault(key, {key, key.upper()}).add(str(code).strip())
+
+    now = time.monotonic()
+    cards = {}
+    with _lock:
+        for key in set(keys.values()):
+            entry = _cache.get(key)
+            if entry and entry[0] > now:
+                _cache.move_to_end(key)
+                cards[key] = entry[1]
+    hits = len(cards)
+    missing = sorted(set(keys.values()) - set(cards))
+    if missing:
+        found = _query(missing, spellings)
+        cards.update(found)
+        expires = now + CODE_LOOKUP_TTL
+        with _lock:
+            for key, items in found.items():
+                if items:
+                    _cache[key] = (expires, items)
+                    _cache.move_to_end(key)
+            while len(_cache) > CODE_LOOKUP_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    result = {code: cards[key] for code, key in keys.items()}
+    if not record_stats:
+        return result
+    elapsed = (time.perf_counter() - started) * 1000
+    with _lock:
+        _samples.append(elapsed)
+        _totals['requests'] += 1
+        _totals['codes'] += len(cards)
+        _totals['hits'] += hits
+        _totals['found'] += sum(1 for items in cards.values() if items)
+    return result
+
+
+def lookup_code(code):
+    """Карточки ТМЦ по одному коду (пустой список — не найдено)."""
+    return lookup_codes([code]).get(code, [])
+
+
+def _percentile(values, percent):
+    """Перцентиль по рангу для отсортированного списка."""
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def lookup_stats():
+    """Задержка (p50, p99, максимум по последним запросам, мс) и счетчики кэша этого процесса."""
+    with _lock:
+        samples = sorted(_samples)
+        totals = dict(_totals)
+        cached = len(_cache)
+    return {
+        'requests': totals['requests'],
+        'codes': totals['codes'],
+        'found': totals['found'],
+        'cache_hits': totals['hits'],
+        'cache_hit_ratio': round(totals['hits'] / totals['codes'], 3) if totals['codes'] else None,
+        'cache_size': cached,
+        'samples': len(samples),
+        'p50_ms': round(_percentile(samples, 50), 2) if samples else None,
+        'p99_ms': round(_percentile(samples, 99), 2) if samples else None,
+        'max_ms': round(samples[-1], 2) if samples else None,
+        'pid': os.getpid(),
+    }
+
+
+def invalidate_code_lookup(codes=None):
+    """Сбрасывает карточки кодов (или весь кэш, если коды не указаны)."""
+    with _lock:
+        if codes is None:
+            _cache.clear()
+            return
+        for key in {code_key(code) for code in codes}:
+            _cache.pop(key, None)
+
+
+def _codes(obj):
+    """Текущие и прежние коды ТМЦ ({ALL}, если атрибуты не загружены)."""
+    state = inspect(obj)
+    codes = set()
+    for attr in ('invnum', 'shtrihkod'):
+        history = state.attrs[attr].history
+        values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+        if not values and attr in state.unloaded:
+            return {ALL}
+        codes.update(value for value in values if value)
+    return codes
+
+
+def _changed_codes(session, obj):
+    """Коды, карточки которых затронуты изменением объекта."""
+    if isinstance(obj, Equipment):
+        if obj in session.new or obj in session.deleted or session.is_modified(obj, include_collections=False):
+            return _codes(obj)
+        return None
+    if obj in session.deleted or inspect(obj).attrs[_REFERENCE_FIELDS[type(obj)]].history.has_changes():
+        return {ALL}
+    return None
+
+
+_invalidation = CacheInvalidation('code_lookup_pending', (Equipment, *_REFERENCE_FIELDS), _changed_codes,
+                                  invalidate_code_lookup)
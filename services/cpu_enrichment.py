@@ -0,0 +1,772 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновое обогащение справочника процессоров данными cpubenchmark.net
+(таблица enrichment_jobs).
+
+Веб-запрос только ставит задание и сразу возвращает его номер, ход выполнения
+опрашивается по /api/cpus/update_benchmark_ratings/<id>. Задание выполняет
+отдельный обработчик:
+
+    flask --app app enrichment-worker
+
+Процессоры сначала группируются по нормализованному названию — страница каждой
+модели запрашивается один раз, сколько бы таких процессоров ни было в учете.
+Запросы выполняются параллельно (CPU_ENRICH_WORKERS потоков) через общий
+requests.Session с пулом соединений, частоту обращений к сайту ограничивает
+«ведро токенов» (CPU_ENRICH_RATE запросов в секунду, до CPU_ENRICH_BURST подряд).
+
+Полученные страницы хранятся в дисковом кэше CPU_PAGE_CACHE_DIR как есть (HTML)
+и считаются свежими CPU_PAGE_CACHE_TTL секунд; повторный запуск и изменения
+разбора не требуют новых обращений к сайту. Файл страницы — cpu_page_path(название).
+При CPU_ENRICH_OFFLINE=1 сайт не запрашивается вовсе: используются только
+страницы из кэша (например, сохраненные заранее образцы).
+"""
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote_plus
+
+from models import PCCPU, EnrichmentJob, db
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Сколько страниц запрашивается одновременно
+CPU_ENRICH_WORKERS = int(os.environ.get('CPU_ENRICH_WORKERS', 4))
+
+# Средняя частота запросов к cpubenchmark.net (в секунду) и допустимая серия подряд
+CPU_ENRICH_RATE = float(os.environ.get('CPU_ENRICH_RATE', 1.0))
+CPU_ENRICH_BURST = int(os.environ.get('CPU_ENRICH_BURST', 2))
+
+# Дисковый кэш страниц и время их свежести (секунды; 0 — не устаревают)
+CPU_PAGE_CACHE_DIR = os.environ.get('CPU_PAGE_CACHE_DIR', os.path.join(_DATA_DIR, 'cpubenchmark_cache'))
+CPU_PAGE_CACHE_TTL = int(os.environ.get('CPU_PAGE_CACHE_TTL', 30 * 24 * 3600))
+
+# Работать только с кэшем страниц, без обращений к сайту
+CPU_ENRICH_OFFLINE = os.environ.get('CPU_ENRICH_OFFLINE', '0').strip().lower() in ('1', 'true', 'yes')
+
+# Пауза обработчика при пустой очереди (секунды)
+ENRICHMENT_WORKER_POLL = float(os.environ.get('ENRICHMENT_WORKER_POLL', 2))
+
+# Задание без отметки о ходе выполнения дольше этого времени (секунды) считается брошенным
+JOB_TIMEOUT = 600
+
+# Как часто записывать ход выполнения задания (обработано моделей / секунды)
+_PROGRESS_EVERY = 10
+_PROGRESS_INTERVAL = 5
+
+# Сколько ошибок сохранять в задании
+_MAX_ERRORS = 10
+
+_REQUEST_TIMEOUT = 15
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+# Поля PCCPU, заполняемые из разбора страницы: поле -> максимальная длина строки
+CPU_FIELDS = {
+    'benchmark_rating': None,
+    'socket': 50,
+    'cores': None,
+    'threads': None,
+    'base_clock_mhz': None,
+    'boost_clock_mhz': None,
+    'tdp_watts': None,
+    'cache_l1_kb': None,
+    'cache_l2_kb': None,
+    'cache_l3_kb': None,
+    'memory_support': 100,
+    'max_memory_gb': None,
+    'memory_channels': None,
+    'memory_frequency_mhz': 50,
+    'integrated_graphics': None,
+    'graphics_name': 100,
+    'graphics_frequency_mhz': None,
+    'pcie_version': 20,
+    'pcie_lanes': None,
+    'unlocked_multiplier': None,
+    'ecc_support': None,
+}
+
+# Логические поля: False — тоже значение (остальные пустые значения пропускаются)
+_FLAG_FIELDS = {'integrated_graphics', 'unlocked_multiplier', 'ecc_support'}
+
+
+def clean_cpu_name(cpu_name):
+    """Название без частоты: "Intel Core i5-3450 @ 3.10GHz" -> "Intel Core i5-3450"."""
+    return re.sub(r'\s*@\s*\d+\.?\d*\s*[GM]?Hz', '', cpu_name or '', flags=re.IGNORECASE).strip()
+
+
+def cpu_key(cpu_name):
+    """Ключ модели для группировки: без частоты, регистра и лишних пробелов."""
+    return ' '.join(clean_cpu_name(cpu_name).casefold().split())
+
+
+def cpu_page_url(cpu_name):
+    return f"https://www.cpubenchmark.net/cpu.php?cpu={quote_plus(clean_cpu_name(cpu_name))}"
+
+
+def cpu_page_path(cpu_name, cache_dir=None):
+    """Файл страницы процессора в дисковом кэше."""
+    digest = hashlib.sha1(cpu_page_url(cpu_name).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir or CPU_PAGE_CACHE_DIR, f'{digest}.html')
+
+
+def parse_cpu_page(html):
+    """
+    Разбирает страницу процессора cpubenchmark.net.
+
+    Returns:
+        dict: benchmark_rating, socket, cores, threads, base_clock_mhz, boost_clock_mhz,
+              tdp_watts, cache_l1_kb, cache_l2_kb, cache_l3_kb, memory_support, max_memory_gb,
+              memory_channels, memory_frequency_mhz, integrated_graphics, graphics_name,
+              graphics_frequency_mhz, pcie_version, pcie_lanes, unlocked_multiplier, ecc_support
+              (только найденные поля) или None, если ничего не найдено
+    """
+    from bs4 import BeautifulSoup
+
+    cpu_data = {}
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Получаем весь текст страницы для парсинга
+    page_text = soup.get_text()
+
+    # 1. Рейтинг (CPU Mark)
+    score_tag = soup.select_one('span[itemprop="ratingValue"]')
+    if score_tag:
+        rating_text = score_tag.text.replace(',', '').strip()
+        try:
+            cpu_data['benchmark_rating'] = int(rating_text)
+        except ValueError:
+            pass
+
+    # Альтернативный поиск рейтинга
+    if 'benchmark_rating' not in cpu_data:
+        cpu_mark_match = re.search(r'CPU\s*Mark[:\s]+(\d{1,3}(?:,\d{3})+)', page_text, re.IGNORECASE)
+        if cpu_mark_match:
+            try:
+                cpu_data['benchmark_rating'] = int(cpu_mark_match.group(1).replace(',', ''))
+            except ValueError:
+                pass
+
+    # 2. Сокет - ищем в тексте "Socket: LGA1155"
+    socket_match = re.search(r'Socket[:\s]+([A-Z0-9-]+)', page_text, re.IGNORECASE)
+    if socket_match:
+        cpu_data['socket'] = socket_match.group(1).strip()
+
+    # 3. Количество ядер - ищем "Cores: 4" или "Cores: 4 шт."
+    cores_match = re.search(r'Cores[:\s]+(\d+)', page_text, re.IGNORECASE)
+    if cores_match:
+        try:
+            cpu_data['cores'] = int(cores_match.group(1))
+        except ValueError:
+            pass
+
+    # 4. Количество потоков - ищем "Threads: 4" или "Threads: 4 шт."
+    threads_match = re.search(r'Threads[:\s]+(\d+)', page_text, re.IGNORECASE)
+    if threads_match:
+        try:
+            cpu_data['threads'] = int(threads_match.group(1))
+        except ValueError:
+            pass
+
+    # 5. Базовая частота - ищем "Clockspeed: 3.1 GHz" или "Частота процессора: 3100 МГц"
+    clockspeed_match = re.search(r'Clockspeed[:\s]+([\d.]+)\s*GHz', page_text, re.IGNORECASE)
+    if clockspeed_match:
+        try:
+            freq_ghz = float(clockspeed_match.group(1))
+            cpu_data['base_clock_mhz'] = int(freq_ghz * 1000)
+        except ValueError:
+            pass
+    else:
+        # Альтернативный формат: "Частота процессора: 3100 МГц"
+        freq_match = re.search(r'Частота\s+процессора[:\s]+(\d+)\s*МГц', page_text, re.IGNORECASE)
+        if freq_match:
+            try:
+                cpu_data['base_clock_mhz'] = int(freq_match.group(1))
+            except ValueError:
+                pass
+
+    # 6. Turbo частота - ищем "Turbo Speed: 3.5 GHz" или "Максимальная частота с Turbo Boost: 3500 МГц"
+    turbo_match = re.search(r'Turbo\s*Speed[:\s]+([\d.]+)\s*GHz', page_text, re.IGNORECASE)
+    if turbo_match:
+        try:
+            freq_ghz = float(turbo_match.group(1))
+            cpu_data['boost_clock_mhz'] = int(freq_ghz * 1000)
+        except ValueError:
+            pass
+    else:
+        # Альтернативный формат
+        turbo_match2 = re.search(r'Максимальная\s+частота[:\s]+(\d+)\s*МГц', page_text, re.IGNORECASE)
+        if turbo_match2:
+            try:
+                cpu_data['boost_clock_mhz'] = int(turbo_match2.group(1))
+            except ValueError:
+                pass
+
+    # 7. TDP - ищем "Typical TDP: 77 W" или "Тепловыделение: 77 Вт"
+    tdp_match = re.search(r'Typical\s*TDP[:\s]+(\d+)\s*W', page_text, re.IGNORECASE)
+    if tdp_match:
+        try:
+            cpu_data['tdp_watts'] = int(tdp_match.group(1))
+        except ValueError:
+            pass
+    else:
+        # Альтернативный формат
+        tdp_match2 = re.search(r'Тепловыделение[:\s]+(\d+)\s*Вт', page_text, re.IGNORECASE)
+        if tdp_match2:
+            try:
+                cpu_data['tdp_watts'] = int(tdp_match2.group(1))
+            except ValueError:
+                pass
+
+    # 8. Кэш L1, L2, L3
+    # L1 Cache
+    l1_match = re.search(r'L1\s*(?:Instruction|Data)?\s*Cache[:\s]+(?:\d+\s*x\s*)?([\d.]+)\s*KB', page_text, re.IGNORECASE)
+    if l1_match:
+        try:
+            l1_value = float(l1_match.group(1))
+            # Если указано "4 x 32 KB", берем общее значение
+            l1_total_match = re.search(r'L1\s*(?:Instruction|Data)?\s*Cache[:\s]+(\d+)\s*x\s*([\d.]+)\s*KB', page_text, re.IGNORECASE)
+            if l1_total_match:
+                count = int(l1_total_match.group(1))
+                size = float(l1_total_match.group(2))
+                cpu_data['cache_l1_kb'] = int(count * size)
+            else:
+                cpu_data['cache_l1_kb'] = int(l1_value)
+        except (ValueError, IndexError):
+            pass
+
+    # L2 Cache
+    l2_match = re.search(r'L2\s*Cache[:\s]+(?:\d+\s*x\s*)?([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
+    if l2_match:
+        try:
+            l2_value = float(l2_match.group(1))
+            unit = l2_match.group(2).upper()
+            l2_total_match = re.search(r'L2\s*Cache[:\s]+(\d+)\s*x\s*([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
+            if l2_total_match:
+                count = int(l2_total_match.group(1))
+                size = float(l2_total_match.group(2))
+                unit = l2_total_match.group(3).upper()
+                if unit == 'MB':
+                    cpu_data['cache_l2_kb'] = int(count * size * 1024)
+                else:
+                    cpu_data['cache_l2_kb'] = int(count * size)
+            else:
+                if unit == 'MB':
+                    cpu_data['cache_l2_kb'] = int(l2_value * 1024)
+                else:
+                    cpu_data['cache_l2_kb'] = int(l2_value)
+        except (ValueError, IndexError):
+            pass
+
+    # L3 Cache
+    l3_match = re.search(r'L3\s*Cache[:\s]+([\d.]+)\s*(KB|MB)', page_text, re.IGNORECASE)
+    if l3_match:
+        try:
+            l3_value = float(l3_match.group(1))
+            unit = l3_match.group(2).upper()
+            if unit == 'MB':
+                cpu_data['cache_l3_kb'] = int(l3_value * 1024)
+            else:
+                cpu_data['cache_l3_kb'] = int(l3_value)
+        except (ValueError, IndexError):
+            pass
+
+    # 9. Тип памяти - ищем "Type memory: DDR3" или "Тип памяти: DDR3"
+    memory_type_match = re.search(r'(?:Type\s+memory|Тип\s+памяти)[:\s]+(DDR\d+)', page_text, re.IGNORECASE)
+    if memory_type_match:
+        cpu_data['memory_support'] = memory_type_match.group(1)
+
+    # 10. Частота памяти - ищем "Memory frequency: 1333/1600" или "Частота памяти: 1333/1600"
+    memory_freq_match = re.search(r'(?:Memory\s+frequency|Частота\s+памяти)[:\s]+([\d/]+)', page_text, re.IGNORECASE)
+    if memory_freq_match:
+        cpu_data['memory_frequency_mhz'] = memory_freq_match.group(1).strip()
+
+    # 11. Максимальный объем памяти - ищем "Max memory: 32 GB" или "Максимальный объем памяти: 32"
+    max_memory_match = re.search(r'(?:Max\s+memory|Максимальный\s+объем\s+памяти)[:\s]+(\d+)\s*(GB|MB|ГБ|МБ)?', page_text, re.IGNORECASE)
+    if max_memory_match:
+        try:
+            max_mem_value = int(max_memory_match.group(1))
+            unit = max_memory_match.group(2) if max_memory_match.lastindex >= 2 else 'GB'
+            if unit and unit.upper() in ['GB', 'ГБ']:
+                cpu_data['max_memory_gb'] = max_mem_value
+            elif unit and unit.upper() in ['MB', 'МБ']:
+                cpu_data['max_memory_gb'] = max_mem_value // 1024
+            else:
+                # По умолчанию считаем ГБ
+                cpu_data['max_memory_gb'] = max_mem_value
+        except (ValueError, IndexError):
+            pass
+
+    # 12. Количество каналов памяти - ищем "Memory channels: 2" или "Максимальное количество каналов памяти: 2 шт."
+    memory_channels_match = re.search(r'(?:Memory\s+channels|каналов\s+памяти)[:\s]+(\d+)', page_text, re.IGNORECASE)
+    if memory_channels_match:
+        try:
+            cpu_data['memory_channels'] = int(memory_channels_match.group(1))
+        except ValueError:
+            pass
+
+    # 13. Интегрированная графика - ищем "Integrated graphics: Yes" или "Интегрированное графическое ядро: Да"
+    integrated_graphics_match = re.search(r'(?:Integrated\s+graphics|Интегрированное\s+графическое\s+ядро)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
+    if integrated_graphics_match:
+        graphics_text = integrated_graphics_match.group(1).lower()
+        cpu_data['integrated_graphics'] = graphics_text in ['yes', 'да']
+
+    # 14. Название графического ядра - ищем "Graphics name: HD Graphics 2500" или "Название графического ядра: HD Graphics 2500"
+    graphics_name_match = re.search(r'(?:Graphics\s+name|Название\s+графического\s+ядра)[:\s]+([A-Za-z0-9\s\-]+)', page_text, re.IGNORECASE)
+    if graphics_name_match:
+        cpu_data['graphics_name'] = graphics_name_match.group(1).strip()[:100]
+
+    # 15. Частота графического ядра - ищем "Graphics frequency: 1100" или "Максимальная частота графического ядра: 1100"
+    graphics_freq_match = re.search(r'(?:Graphics\s+frequency|Максимальная\s+частота\s+графического\s+ядра)[:\s]+(\d+)\s*(MHz|МГц)?', page_text, re.IGNORECASE)
+    if graphics_freq_match:
+        try:
+            cpu_data['graphics_frequency_mhz'] = int(graphics_freq_match.group(1))
+        except ValueError:
+            pass
+
+    # 16. Версия PCI Express - ищем "PCI-Express: 3.0" или "Версия PCI-Express: 3.0"
+    pcie_version_match = re.search(r'(?:PCI[-\s]?Express|Версия\s+PCI[-\s]?Express)[:\s]+([\d.]+)', page_text, re.IGNORECASE)
+    if pcie_version_match:
+        cpu_data['pcie_version'] = pcie_version_match.group(1).strip()
+
+    # 17. Количество каналов PCI Express - ищем "PCI Express lanes: 16" или "Макс. кол-во каналов PCI Express: 16 шт."
+    pcie_lanes_match = re.search(r'(?:PCI[-\s]?Express\s+lanes|каналов\s+PCI\s+Express)[:\s]+(\d+)', page_text, re.IGNORECASE)
+    if pcie_lanes_match:
+        try:
+            cpu_data['pcie_lanes'] = int(pcie_lanes_match.group(1))
+        except ValueError:
+            pass
+
+    # 18. Разблокированный множитель - ищем "Unlocked multiplier: No" или "Разблокированный множитель: Нет"
+    unlocked_match = re.search(r'(?:Unlocked\s+multiplier|Разблокированный\s+множитель)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
+    if unlocked_match:
+        unlocked_text = unlocked_match.group(1).lower()
+        cpu_data['unlocked_multiplier'] = unlocked_text in ['yes', 'да']
+
+    # 19. Поддержка ECC - ищем "ECC support: No" или "Поддержка ECC: Нет"
+    ecc_match = re.search(r'(?:ECC\s+support|Поддержка\s+ECC)[:\s]+(Yes|Да|No|Нет)', page_text, re.IGNORECASE)
+    if ecc_match:
+        ecc_text = ecc_match.group(1).lower()
+        cpu_data['ecc_support'] = ecc_text in ['yes', 'да']
+
+    # Парсим данные из таблиц характеристик
+    tables = soup.find_all('table')
+    for table in tables:
+        rows = table.find_all('tr')
+        for row in rows:
+            cells = row.find_all(['td', 'th'])
+            if len(cells) >= 2:
+                label = cells[0].get_text().strip()
+                value = cells[1].get_text().strip()
+                label_lower = label.lower()
+
+                # Socket
+                if 'socket' in label_lower and not cpu_data.get('socket'):
+                    cpu_data['socket'] = value[:50]
+
+                # Cores
+                if 'cores' in label_lower and not cpu_data.get('cores'):
+                    cores_num = re.search(r'(\d+)', value)
+                    if cores_num:
+                        try:
+                            cpu_data['cores'] = int(cores_num.group(1))
+                        except ValueError:
+                            pass
+
+                # Threads
+                if 'threads' in label_lower and not cpu_data.get('threads'):
+                    threads_num = re.search(r'(\d+)', value)
+                    if threads_num:
+                        try:
+                            cpu_data['threads'] = int(threads_num.group(1))
+                        except ValueError:
+                            pass
+
+                # TDP
+                if ('tdp' in label_lower or 'thermal' in label_lower) and not cpu_data.get('tdp_watts'):
+                    tdp_num = re.search(r'(\d+)\s*W', value, re.IGNORECASE)
+                    if tdp_num:
+                        try:
+                            cpu_data['tdp_watts'] = int(tdp_num.group(1))
+                        except ValueError:
+                            pass
+
+    return cpu_data if cpu_data else None
+
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, не более burst накопленных."""
+
+    def __init__(self, rate, burst):
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ждет свободный токен и забирает его."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PageCache:
+    """Дисковый кэш страниц: один HTML-файл на страницу, свежесть — по времени изменения."""
+
+    def __init__(self, directory=None, ttl=None):
+        self.directory = directory or CPU_PAGE_CACHE_DIR
+        self.ttl = CPU_PAGE_CACHE_TTL if ttl is None else ttl
+
+    def get(self, cpu_name):
+        path = cpu_page_path(cpu_name, self.directory)
+        try:
+            if self.ttl > 0 and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, cpu_name, html):
+        path = cpu_page_path(cpu_name, self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+
+    def purge(self):
+        """Удаляет устаревшие страницы; возвращает число удаленных файлов."""
+        if self.ttl <= 0 or not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        deadline = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class CpuBenchmarkClient:
+    """
+    Получение страниц cpubenchmark.net: сначала кэш, затем сайт через общий
+    Session с пулом соединений и ограничением частоты. Можно использовать из
+    нескольких потоков.
+    """
+
+    def __init__(self, cache=None, offline=None, workers=None, rate=None, burst=None):
+        self.cache = cache or PageCache()
+        self.offline = CPU_ENRICH_OFFLINE if offline is None else offline
+        self.bucket = TokenBucket(CPU_ENRICH_RATE if rate is None else rate,
+                                  CPU_ENRICH_BURST if burst is None else burst)
+        self._session = None
+        self._pool_size = workers or CPU_ENRICH_WORKERS
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update(_HEADERS)
+                self._session = session
+            return self._session
+
+    def fetch_page(self, cpu_name):
+        """
+        HTML страницы процессора.
+
+        Returns:
+            tuple: (html или None, взята ли страница из кэша)
+        """
+        html = self.cache.get(cpu_name)
+        if html is not None:
+            return html, True
+        if self.offline:
+            return None, False
+        self.bucket.acquire()
+        response = self._get_session().get(cpu_page_url(cpu_name), timeout=_REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            # Ошибки сайта (429, 5xx) не кэшируются — следующий запуск повторит запрос
+            return None, False
+        self.cache.put(cpu_name, response.text)
+        return response.text, False
+
+    def cpu_data(self, cpu_name):
+        """Разобранные данные процессора: (dict или None, взята ли страница из кэша)."""
+        html, cached = self.fetch_page(cpu_name)
+        return (parse_cpu_page(html) if html else None), cached
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _default_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CpuBenchmarkClient()
+        return _client
+
+
+def fetch_cpu_data(cpu_name):
+    """Данные процессора с cpubenchmark.net (через кэш страниц) или None."""
+    data, _ = _default_client().cpu_data(cpu_name)
+    return data
+
+
+def apply_cpu_data(cpu, cpu_data):
+    """Переносит найденные поля в запись PCCPU; возвращает True, если данные были."""
+    if not cpu_data:
+        return False
+    for field, max_length in CPU_FIELDS.items():
+        value = cpu_data.get(field)
+        if value is None or (not value and field not in _FLAG_FIELDS):
+            continue
+        setattr(cpu, field, value[:max_length] if max_length else value)
+    cpu.api_data_updated_at = datetime.now(timezone.utc)
+    return True
+
+
+def _lookup(client, full_name, model_name):
+    """Данные модели: сначала по полному названию, затем только по модели."""
+    cpu_data, cached = client.cpu_data(full_name)
+    if not cpu_data and model_name != full_name:
+        cpu_data, model_cached = client.cpu_data(model_name)
+        cached = cached and model_cached
+    return cpu_data, cached
+
+
+def group_cpus(cpus):
+    """
+    Группирует процессоры по нормализованному названию.
+
+    Returns:
+        tuple: ({ключ: (полное название, модель, [PCCPU, ...])}, процессоры без модели)
+    """
+    groups = {}
+    skipped = []
+    for cpu in cpus:
+        model_name = (cpu.model or '').strip()
+        if not model_name:
+            skipped.append(cpu)
+            continue
+        vendor_name = cpu.vendor.name if cpu.vendor else ''
+        full_name = f"{vendor_name} {model_name}".strip()
+        key = cpu_key(full_name)
+        if key not in groups:
+            groups[key] = (full_name, model_name, [])
+        groups[key][2].append(cpu)
+    return groups, skipped
+
+
+# === Задания ===
+
+def enqueue_cpu_enrichment(requested_by=None):
+    """
+    Ставит обогащение процессоров в очередь или возвращает уже ожидающее
+    либо выполняемое задание.
+
+    Returns:
+        tuple: (EnrichmentJob, создано ли новое задание)
+    """
+    existing = EnrichmentJob.query.filter(
+        EnrichmentJob.kind == 'cpu',
+        EnrichmentJob.status.in_(('queued', 'running')),
+    ).order_by(EnrichmentJob.id.desc()).first()
+    if existing:
+        return existing, False
+    job = EnrichmentJob(kind='cpu', status='queued', requested_by=requested_by)
+    db.session.add(job)
+    db.session.commit()
+    return job, True
+
+
+def enrichment_status(job):
+    """Состояние задания для JSON-ответа."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'progress': round(100 * job.processed / job.total) if job.total else (100 if job.status == 'done' else 0),
+        'cached': job.cached,
+        'updated_count': job.updated_count,
+        'not_found_count': job.not_found_count,
+        'errors': json.loads(job.errors) if job.errors else [],
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error if job.status == 'failed' else None,
+    }
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _fail_stale():
+    """Помечает failed задания, обработчик которых перестал отмечать ход выполнения."""
+    deadline = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT)
+    table = EnrichmentJob.__table__
+    db.session.execute(table.update().where(
+        table.c.status == 'running', table.c.heartbeat_at < deadline
+    ).values(status='failed', finished_at=datetime.utcnow(), error='Обработчик задания не отвечает'))
+    db.session.commit()
+
+
+def claim_next_enrichment(worker=None):
+    """Забирает самое старое задание из очереди (None, если очередь пуста)."""
+    worker = worker or _worker_name()
+    table = EnrichmentJob.__table__
+    candidates = db.session.query(EnrichmentJob.id).filter(EnrichmentJob.status == 'queued')\
+        .order_by(EnrichmentJob.id).limit(5).all()
+    for (job_id,) in candidates:
+        now = datetime.utcnow()
+        result = db.session.execute(table.update().where(
+            table.c.id == job_id, table.c.status == 'queued'
+        ).values(status='running', worker=worker, started_at=now, heartbeat_at=now))
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(EnrichmentJob, job_id)
+    return None
+
+
+def run_cpu_enrichment(job, client=None):
+    """
+    Выполняет задание обогащения процессоров. Страницы запрашиваются в потоках
+    (без обращений к БД), результаты переносятся в записи в текущем потоке;
+    ход выполнения и изменения записываются каждые _PROGRESS_EVERY моделей.
+    """
+    client = client or _default_client()
+    cpus = PCCPU.query.options(db.joinedload(PCCPU.vendor)).filter_by(active=True).all()
+    groups, skipped = group_cpus(cpus)
+    errors = []
+    job.total = len(groups)
+    job.processed = job.cached = job.updated_count = 0
+    job.not_found_count = len(skipped)
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+
+    last_progress = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(CPU_ENRICH_WORKERS, 1)) as pool:
+        futures = {pool.submit(_lookup, client, full_name, model_name): key
+                   for key, (full_name, model_name, _) in groups.items()}
+        for future in as_completed(futures):
+            full_name, _, group = groups[futures[future]]
+            try:
+                cpu_data, cached = future.result()
+            except Exception as e:
+                cpu_data, cached = None, False
+                errors.append(f"Ошибка при обработке процессора {full_name}: {e}")
+            else:
+                if not cpu_data:
+                    errors.append(f"Данные не найдены для {full_name}")
+            for cpu in group:
+                if apply_cpu_data(cpu, cpu_data):
+                    job.updated_count += 1
+                else:
+                    job.not_found_count += 1
+            job.processed += 1
+            job.cached += int(cached)
+            if job.processed % _PROGRESS_EVERY == 0 or time.monotonic() - last_progress > _PROGRESS_INTERVAL:
+                job.errors = json.dumps(errors[:_MAX_ERRORS], ensure_ascii=False)
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+                last_progress = time.monotonic()
+
+    job.errors = json.dumps(errors[:_MAX_ERRORS], ensure_ascii=False)
+    job.status = 'done'
+    job.finished_at = job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def run_enrichment_job(job, client=None):
+    """Выполняет задание; ошибка переводит задание в failed (уже записанные данные остаются)."""
+    try:
+        return run_cpu_enrichment(job, client)
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.error = f'{e.__class__.__name__}: {e}'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Ошибка обогащения {job.kind} (задание {job.id}): {e}")
+        print(traceback.format_exc())
+        return job
+
+
+def run_enrichment_worker(once=False, poll_interval=ENRICHMENT_WORKER_POLL):
+    """
+    Цикл обработчика заданий обогащения. Вызывается из CLI-команды
+    enrichment-worker в контексте приложения.
+
+    Args:
+        once: обработать текущую очередь и завершиться
+        poll_interval: пауза при пустой очереди (секунды)
+    """
+    worker = _worker_name()
+    cache = PageCache()
+    print(f"Обработчик обогащения {worker} запущен, кэш страниц: {cache.directory}"
+          f"{' (только кэш)' if CPU_ENRICH_OFFLINE else ''}")
+    last_stale_check = last_cleanup = 0
+    while True:
+        if time.time() - last_stale_check > 60:
+            _fail_stale()
+            last_stale_check = time.time()
+        if time.time() - last_cleanup > 3600:
+            removed = cache.purge()
+            if removed:
+                print(f"Удалено устаревших страниц из кэша: {removed}")
+            last_cleanup = time.time()
+
+        job = claim_next_enrichment(worker)
+        if job is None:
+            db.session.remove()
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        started = time.time()
+        run_enrichment_job(job)
+        print(f"Задание {job.id} ({job.kind}): {job.status}, моделей {job.processed}/{job.total} "
+              f"(из кэша {job.cached}), обновлено {job.updated_count} за {time.time() - started:.1f} с")
+        db.session.remove()
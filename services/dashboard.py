@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Агрегаты для главной страницы, общей статистики и статистики МОЛ.
+
+Все виджеты (категории, отделы, топ пользователей, помесячная динамика,
+статусы, периферия) читаются из предагрегированной таблицы stats_rollup
+(см. services/stats_rollup.py) двумя сгруппированными запросами:
+1. Сводка по (группа, отдел, пользователь, ОС/периферия, статус) — из неё
+   в Python собираются итоги, категории, отделы, пользователи и периферия.
+2. Количество ТМЦ по месяцам за последние 12 месяцев.
+"""
+from collections import defaultdict
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+
+from models import Category, Department, GroupNome, StatsRollup, Users, db
+
+# Сколько строк показывать в рейтингах отделов и пользователей
+TOP_LIMIT = 10
+
+STATUSES = ('active', 'repair', 'lost')
+
+
+def _top(totals, key, limit=None):
+    """Сортирует словарь {(id, название): {'count', 'cost'}} по убыванию выбранного поля."""
+    rows = sorted(totals.items(), key=lambda item: item[1][key], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def _summary_rows(user_id=None):
+    """Первый проход: количество и стоимость активных ТМЦ в разрезе группы, отдела, пользователя и статуса."""
+    query = db.session.query(
+        GroupNome.id.label('group_id'),
+        GroupNome.name.label('group_name'),
+        Category.id.label('category_id'),
+        Category.name.label('category_name'),
+        Department.id.label('department_id'),
+        Department.name.label('department_name'),
+        Users.id.label('user_id'),
+        Users.login.label('user_login'),
+        StatsRollup.os.label('os'),
+        StatsRollup.status.label('status'),
+        func.sum(StatsRollup.count).label('count'),
+        func.coalesce(func.sum(StatsRollup.cost), 0).label('cost'),
+    ).select_from(StatsRollup)\
+     .join(GroupNome, GroupNome.id == StatsRollup.group_id)\
+     .outerjoin(Category, Category.id == GroupNome.category_id)\
+     .outerjoin(Department, Department.id == StatsRollup.department_id)\
+     .outerjoin(Users, Users.id == StatsRollup.usersid)\
+     .filter(StatsRollup.count > 0)
+    if user_id is not None:
+        query = query.filter(StatsRollup.usersid == user_id)
+    return query.group_by(
+        GroupNome.id, GroupNome.name, Category.id, Category.name,
+        Department.id, Department.name, Users.id, Users.login,
+        StatsRollup.os, StatsRollup.status,
+    ).all()
+
+
+def _monthly_rows(user_id=None):
+    """Второй проход: количество ТМЦ (os=True) по месяцам за последние 12 месяцев, включая текущий."""
+    today = date.today()
+    first_month = date(today.year, today.month, 1) - relativedelta(months=11)
+    query = db.session.query(StatsRollup.month, func.sum(StatsRollup.count).label('count'))\
+        .filter(StatsRollup.os == True,
+                StatsRollup.count > 0,
+                StatsRollup.month >= first_month)
+    if user_id is not None:
+        query = query.filter(StatsRollup.usersid == user_id)
+    return query.group_by(StatsRollup.month).order_by(StatsRollup.month).all()
+
+
+def build_dashboard_stats(user_id=None):
+    """
+    Считает все виджеты статистики.
+
+    Args:
+        user_id: ID пользователя (МОЛ) для ограничения выборки; None — все ТМЦ
+
+    Returns:
+        dict: tmc_count, total_cost, active_users, components_count,
+        status_totals ({статус: {'count', 'cost'}}) и списки для графиков
+        (category_*, department_*, user_*, monthly_*, status_*, peripheral_stats)
+    """
+    tmc_count = 0
+    total_cost = 0
+    components_count = 0
+    active_user_ids = set()
+    status_totals = {status: {'count': 0, 'cost': 0} for status in STATUSES}
+    categories = defaultdict(lambda: {'count': 0, 'cost': 0})
+    departments = defaultdict(lambda: {'count': 0, 'cost': 0})
+    users = defaultdict(lambda: {'count': 0, 'cost': 0})
+    peripherals = defaultdict(lambda: {'count': 0, 'cost': 0})
+
+    for row in _summary_rows(user_id):
+        count = int(row.count)
+        if not row.os:
+            # Компьютерная периферия считается отдельно от основных средств
+            components_count += count
+            peripherals[(row.group_id, row.group_name)]['count'] += count
+            continue
+
+        tmc_count += count
+        total_cost += row.cost
+        status_totals[row.status]['count'] += count
+        status_totals[row.status]['cost'] += row.cost
+        if row.category_id is not None:
+            categories[(row.category_id, row.category_name)]['count'] += count
+            categories[(row.category_id, row.category_name)]['cost'] += row.cost
+        if row.department_id is not None:
+            departments[(row.department_id, row.department_name)]['count'] += count
+        if row.user_id is not None:
+            users[(row.user_id, row.user_login)]['count'] += count
+            active_user_ids.add(row.user_id)
+
+    category_by_count = _top(categories, 'count')
+    category_by_cost = _top(categories, 'cost')
+    department_top = _top(departments, 'count', TOP_LIMIT)
+    user_top = _top(users, 'count', TOP_LIMIT)
+    peripheral_top = _top(peripherals, 'count')
+    monthly = _monthly_rows(user_id)
+    repair_count = status_totals['repair']['count']
+
+    return {
+        'tmc_count': tmc_count,
+        'total_cost': total_cost,
+        'active_users': len(active_user_ids),
+        'components_count': components_count,
+        'status_totals': {status: {'count': values['count'], 'cost': float(values['cost'])}
+                          for status, values in status_totals.items()},
+        'category_labels': [name for (_, name), _ in category_by_count],
+        'category_counts': [values['count'] for _, values in category_by_count],
+        'category_cost_labels': [name for (_, name), _ in category_by_cost],
+        'category_costs': [float(values['cost']) for _, values in category_by_cost],
+        'department_labels': [name for (_, name), _ in department_top],
+        'department_counts': [values['count'] for _, values in department_top],
+        'user_labels': [name for (_, name), _ in user_top],
+        'user_counts': [values['count'] for _, values in user_top],
+        'monthly_labels': [row.month.strftime('%Y-%m') for row in monthly],
+        'monthly_counts': [int(row.count) for row in monthly],
+        'status_labels': ['Активные', 'В ремонте'],
+        'status_counts': [tmc_count - repair_count, repair_count],
+        'peripheral_stats': [{'name': name, 'count': values['count']} for (_, name), values in peripheral_top],
+    }
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Версии данных для отчетов (таблица data_versions).
+
+Отчет по отделу зависит от ТМЦ этого отдела и от общих справочников
+(наименования, производители, помещения, пользователи, поставщики,
+накладные, организации, отделы). После каждого flush версии затронутых
+областей увеличиваются в той же транзакции:
+- изменение ТМЦ — области 'department:<id>' старого и нового отдела;
+- изменение справочников и массовые UPDATE/DELETE в обход ORM — область 'global';
+- изменение производителей (название, активность) — еще и область 'vendor',
+  по ней процессы сбрасывают справочник производителей (services/vendor_directory.py).
+
+Поисковый индекс ТМЦ версию не использует: он обновляется по журналу
+search_index_changes (services/search_index.py).
+
+Токен изменений (data_token) — строка из версий нужных областей. Пока токен
+не изменился, готовый отчет можно отдавать повторно.
+"""
+import hashlib
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from models import (DataVersion, Department, Equipment, InvoiceEquipment, Invoices, Knt, Nome,
+                    Org, Places, Users, Vendor, db)
+
+GLOBAL_SCOPE = 'global'
+VENDOR_SCOPE = 'vendor'
+
+# Справочники, от которых зависят отчеты: модель -> отслеживаемые поля (None — любые)
+_REFERENCE_MODELS = {
+    Nome: None,
+    Vendor: ('name',),
+    Places: ('name',),
+    Users: ('login',),
+    Knt: ('name',),
+    Invoices: None,
+    InvoiceEquipment: None,
+    Org: ('name',),
+    Department: ('name',),
+}
+
+
+def department_scope(department_id):
+    """Область версий отдела (0 — ТМЦ без отдела)."""
+    return f'department:{department_id or 0}'
+
+
+def _changed(obj, fields):
+    state = inspect(obj)
+    names = fields or [attr.key for attr in state.mapper.column_attrs]
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+def _old_value(obj, field):
+    history = inspect(obj).attrs[field].history
+    return history.deleted[0] if history.deleted else getattr(obj, field)
+
+
+def bump_versions(connection, scopes):
+    """Увеличивает версии областей (создает строку, если ее еще нет)."""
+    table = DataVersion.__table__
+    for scope in sorted(scopes):
+        if connection.dialect.name == 'mysql':
+            statement = mysql_insert(table).values(scope=scope, version=1)
+            connection.execute(statement.on_duplicate_key_update(version=table.c.version + 1))
+            continue
+        result = connection.execute(
+            table.update().where(table.c.scope == scope).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(scope=scope, version=1))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions(session, flush_context):
+    scopes = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Equipment):
+            scopes.add(department_scope(obj.department_id))
+        elif type(obj) in _REFERENCE_MODELS:
+            scopes.add(GLOBAL_SCOPE)
+            if isinstance(obj, Vendor):
+                scopes.add(VENDOR_SCOPE)
+    for obj in session.dirty:
+        if isinstance(obj, Equipment):
+            if session.is_modified(obj, include_collections=False):
+                scopes.add(department_scope(_old_value(obj, 'department_id')))
+                scopes.add(department_scope(obj.department_id))
+        elif type(obj) in _REFERENCE_MODELS:
+            if _changed(obj, _REFERENCE_MODELS[type(obj)]):
+                scopes.add(GLOBAL_SCOPE)
+            if isinstance(obj, Vendor) and _changed(obj, ('name', 'active')):
+                scopes.add(VENDOR_SCOPE)
+    if scopes:
+        bump_versions(session.connection(), scopes)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_on_bulk(orm_execute_state):
+    # Массовые UPDATE/DELETE не проходят через flush — сбрасываем все отчеты
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    if mapper.class_ is Equipment or mapper.class_ in _REFERENCE_MODELS:
+        scopes = {GLOBAL_SCOPE, VENDOR_SCOPE} if mapper.class_ is Vendor else {GLOBAL_SCOPE}
+        bump_versions(orm_execute_state.session.connection(), scopes)
+
+
+def data_versions(*scopes):
+    """Текущие версии областей одним запросом: {область: версия} (0 — изменений еще не было)."""
+    scopes = set(scopes) | {GLOBAL_SCOPE}
+    rows = db.session.query(DataVersion.scope, DataVersion.version)\
+        .filter(DataVersion.scope.in_(scopes)).all()
+    versions = {scope: 0 for scope in scopes}
+    versions.update({scope: version for scope, version in rows})
+    return versions
+
+
+def data_token(*scopes):
+    """Короткий токен изменений для областей (всегда включает 'global')."""
+    versions = data_versions(*scopes)
+    raw = ';'.join(f'{scope}={versions[scope]}' for scope in sorted(versions))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Определение характеристик диска по строке модели: интерфейс, тип, форм-фактор,
+скорость вращения и производитель.
+
+Правила хранятся в файле data/disk_rules.json (поле version — версия набора)
+и компилируются один раз: все ключевые слова поля собираются в одно регулярное
+выражение с группой на правило, поэтому модель проверяется одним проходом на
+поле, а не цепочкой any(keyword in model ...). Приоритет — порядок правил в
+файле. Файл перечитывается, если изменилось время его модификации.
+
+Результаты запоминаются по нормализованной модели (верхний регистр, без
+лишних пробелов); classify_disk_models разбирает весь список за один вызов.
+"""
+import json
+import os
+import re
+import threading
+
+DISK_RULES_FILE = os.environ.get(
+    'DISK_RULES_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'disk_rules.json'),
+)
+
+# Сколько разобранных моделей держать в памяти процесса
+_CACHE_SIZE = 10000
+
+
+def normalize_model(model):
+    """Ключ модели: верхний регистр, пробелы схлопнуты."""
+    return ' '.join((model or '').upper().split())
+
+
+class _Field:
+    """Правила одного поля, скомпилированные в одно выражение."""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.default = spec.get('default')
+        self.values = []
+        alternatives = []
+        for index, rule in enumerate(spec.get('rules', [])):
+            parts = [re.escape(value) for value in rule.get('contains', [])]
+            parts += ['^' + re.escape(value) for value in rule.get('prefix', [])]
+            if parts:
+                alternatives.append(f"(?P<r{index}>{'|'.join(parts)})")
+            self.values.append(rule['value'])
+        # Просмотр вперед находит совпадения на каждой позиции, в том числе вложенные
+        self.pattern = re.compile(f"(?=(?:{'|'.join(alternatives)}))") if alternatives else None
+        when = spec.get('when') or {}
+        self.when = [(field, value) for field, value in when.items() if field != 'contains']
+        self.when_contains = when.get('contains', [])
+
+    def applies(self, model, result):
+        if not self.when and not self.when_contains:
+            return True
+        return any(result.get(field) == value for field, value in self.when) or \
+            any(keyword in model for keyword in self.when_contains)
+
+    def match(self, model):
+        if self.pattern is not None:
+            matched = {int(m.lastgroup[1:]) for m in self.pattern.finditer(model) if m.lastgroup}
+            if matched:
+                return self.values[min(matched)]
+        return self.default
+
+
+class DiskRules:
+    """Скомпилированный набор правил с кэшем разобранных моделей."""
+
+    def __init__(self, config):
+        self.version = config.get('version', 0)
+        self.fields = [_Field(name, spec) for name, spec in config.get('fields', {}).items()]
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _classify(self, model):
+        result = {}
+        for field in self.fields:
+            if not field.applies(model, result):
+                continue
+            value = field.match(model)
+            if value is not None:
+                result[field.name] = value
+        return result
+
+    def classify(self, model):
+        """Характеристики модели: {поле: значение} только для определенных полей."""
+        key = normalize_model(model)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._classify(key)
+            with self._lock:
+                if len(self._cache) >= _CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[key] = result
+        return dict(result)
+
+    def classify_many(self, models):
+        """Характеристики списка моделей (повторяющиеся модели разбираются один раз)."""
+        return [self.classify(model) for model in models]
+
+
+_rules = None
+_rules_mtime = None
+_load_lock = threading.Lock()
+
+
+def disk_rules():
+    """Текущий набор правил (перечитывается при изменении файла)."""
+    global _rules, _rules_mtime
+    try:
+        mtime = os.path.getmtime(DISK_RULES_FILE)
+    except OSError:
+        mtime = None
+    if _rules is not None and mtime == _rules_mtime:
+        return _rules
+    with _load_lock:
+        if _rules is None or mtime != _rules_mtime:
+            config = {}
+            if mtime is not None:
+                try:
+                    with open(DISK_RULES_FILE, encoding='utf-8') as f:
+                        config = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка чтения правил дисков {DISK_RULES_FILE}: {e}")
+                    if _rules is not None:
+                        return _rules
+            _rules = DiskRules(config)
+            _rules_mtime = mtime
+    return _rules
+
+
+def classify_disk_model(model):
+    """Характеристики диска по модели (interface, drive_type, form_factor, rpm, manufacturer)."""
+    return disk_rules().classify(model)
+
+
+def classify_disk_models(models):
+    """Характеристики дисков по списку моделей, в том же порядке."""
+    return disk_rules().classify_many(models)
+
+
+def detect_disk_manufacturer(model):
+    """Производитель диска по модели ('Unknown', если ни одно правило не подошло)."""
+    if not model:
+        return 'Unknown'
+    return classify_disk_model(model).get('manufacturer', 'Unknown')
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Общий построитель запросов к ТМЦ по фильтрам списков.
+
+Фильтры (МОЛ, отдел, наименование, помещение, категория, группа,
+ОС/периферия, статус) превращаются в условия WHERE; категория и группа —
+в подзапрос по nome/group_nome, который выполняет сервер БД. Списки ID в Python не собираются: наружу
+отдаются только агрегаты, сгруппированные строки или подзапрос ID для
+дальнейшего использования в других запросах.
+"""
+from sqlalchemy import and_, case, func
+
+from models import Equipment, GroupNome, Nome, db
+
+# Допустимые значения фильтра по статусу
+STATUS_FILTERS = ('active', 'repair', 'lost')
+
+
+class EquipmentFilter:
+    """
+    Набор фильтров по ТМЦ.
+
+    Args:
+        user_id: МОЛ (Equipment.usersid)
+        department_id: отдел
+        category_id: категория (через группу наименования)
+        group_id: группа наименования
+        nome_id: наименование
+        place_id: помещение
+        os: True — основные средства, False — периферия, None — все
+        status: 'active', 'repair', 'lost' или None
+        active: учитывать только активные ТМЦ (по умолчанию True)
+    """
+
+    def __init__(self, user_id=None, department_id=None, category_id=None, group_id=None,
+                 os=True, status=None, active=True, nome_id=None, place_id=None):
+        if status is not None and status not in STATUS_FILTERS:
+            raise ValueError(f"Неизвестный статус ТМЦ: {status}")
+        self.user_id = user_id
+        self.department_id = department_id
+        self.category_id = category_id
+        self.group_id = group_id
+        self.os = os
+        self.status = status
+        self.active = active
+        self.nome_id = nome_id
+        self.place_id = place_id
+
+    def criteria(self):
+        """Список условий WHERE по таблице equipment."""
+        conditions = []
+        if self.active is not None:
+            conditions.append(Equipment.active == self.active)
+        if self.os is not None:
+            conditions.append(Equipment.os == self.os)
+        if self.user_id:
+            conditions.append(Equipment.usersid == self.user_id)
+        if self.department_id:
+            conditions.append(Equipment.department_id == self.department_id)
+        if self.nome_id:
+            conditions.append(Equipment.nomeid == self.nome_id)
+        if self.place_id:
+            conditions.append(Equipment.placesid == self.place_id)
+        if self.category_id or self.group_id:
+            nome_ids = db.session.query(Nome.id).join(GroupNome, Nome.groupid == GroupNome.id)
+            if self.category_id:
+                nome_ids = nome_ids.filter(GroupNome.category_id == self.category_id)
+            if self.group_id:
+                nome_ids = nome_ids.filter(GroupNome.id == self.group_id)
+            conditions.append(Equipment.nomeid.in_(nome_ids.scalar_subquery()))
+        if self.status == 'repair':
+            conditions.append(Equipment.repair == True)
+        elif self.status == 'lost':
+            conditions.append(Equipment.lost == True)
+        elif self.status == 'active':
+            conditions.append(and_(Equipment.repair == False, Equipment.lost == False))
+        return conditions
+
+    def apply(self, query):
+        """Накладывает фильтры на запрос, в котором участвует Equipment."""
+        return query.filter(*self.criteria())
+
+    def query(self):
+        """Запрос ТМЦ (Equipment.query) с фильтрами — для постраничной выборки."""
+        return self.apply(Equipment.query)
+
+    def ids_subquery(self):
+        """Подзапрос ID отфильтрованных ТМЦ для IN (SELECT ...) в других запросах."""
+        return self.apply(db.session.query(Equipment.id)).scalar_subquery()
+
+    def totals(self):
+        """Количество и суммарная стоимость ТМЦ одним агрегирующим запросом."""
+        count, cost = self.apply(db.session.query(
+            func.count(Equipment.id),
+            func.coalesce(func.sum(Equipment.cost), 0),
+        )).one()
+        return count or 0, cost or 0
+
+    def grouped_by_nome(self):
+        """
+        ТМЦ, сгруппированные по наименованию, со счетчиками по статусам
+        (nomeid, nome_name, quantity, nome_photo, repair_count, lost_count, active_count).
+        """
+        query = db.session.query(
+            Equipment.nomeid,
+            func.coalesce(Nome.name, '⚠️ Неизвестное наименование').label('nome_name'),
+            func.count(Equipment.id).label('quantity'),
+            func.coalesce(Nome.photo, '').label('nome_photo'),
+            func.sum(case((Equipment.repair == True, 1), else_=0)).label('repair_count'),
+            func.sum(case((Equipment.lost == True, 1), else_=0)).label('lost_count'),
+            func.sum(case((and_(Equipment.repair == False, Equipment.lost == False), 1), else_=0)).label('active_count'),
+        ).select_from(Equipment)\
+         .join(Nome, Equipment.nomeid == Nome.id)
+        return self.apply(query)\
+            .group_by(Equipment.nomeid, Nome.name, Nome.photo)\
+            .order_by(Nome.name)\
+            .all()
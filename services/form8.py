@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Форма 8 (Книга учета материальных ценностей) как фоновый отчет.
+
+Параметры отчета: отдел, область (None — все ТМЦ отдела для администратора,
+ID МОЛ — только его ТМЦ) и организация для заголовка. Формирование — через
+import_export.pdf_export.build_form8_pdf в обработчике очереди
+(services/report_jobs.py).
+"""
+import models
+from import_export.pdf_export import build_form8_pdf, form8_filenames
+from models import Department, Equipment, Org, db
+
+from .data_versions import department_scope
+from .equipment_query import EquipmentFilter
+from .report_jobs import register_report
+
+
+def form8_params(department_id, user_id=None, org_id=None):
+    """
+    Параметры отчета.
+
+    Args:
+        department_id: отдел
+        user_id: МОЛ, чьи ТМЦ попадают в отчет; None — все ТМЦ отдела
+        org_id: организация для заголовка
+    """
+    return {'department_id': department_id, 'user_id': user_id, 'org_id': org_id}
+
+
+def form8_equipment_query(department_id, user_id=None):
+    """Активные основные средства отдела (для МОЛ — только его) в порядке формы 8."""
+    return EquipmentFilter(department_id=department_id, user_id=user_id).query()\
+        .order_by(Equipment.invnum, Equipment.buhname)
+
+
+@register_report('form8', scopes=lambda params: [department_scope(params['department_id'])])
+def render_form8(params, output):
+    """Формирует PDF формы 8 в output и возвращает имя файла для скачивания."""
+    department = db.session.get(Department, params['department_id'])
+    if department is None:
+        raise ValueError(f"Отдел {params['department_id']} не найден")
+    equipment_list = form8_equipment_query(params['department_id'], params.get('user_id'))\
+        .options(db.joinedload(Equipment.users)).all()
+    if not equipment_list:
+        raise ValueError('В отделе нет ТМЦ для формирования отчета')
+
+    org = db.session.get(Org, params['org_id']) if params.get('org_id') else None
+    org_name = org.name if org else 'Не указано'
+    # МОЛ — владелец первого ТМЦ в списке
+    mol_name = equipment_list[0].users.login if equipment_list[0].users else 'Не указано'
+
+    build_form8_pdf(output, department, equipment_list, org_name, mol_name, db.session, models)
+    return form8_filenames(department)[1]
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+"""
+Каталог видеокарт gpu-info-api (data/gpu_api_data.json) в памяти процесса.
+
+Для каждой записи заранее считаются нормализованные модель, производитель,
+кодовое имя и ключ, а по ним строится индекс подстрок (биграммы и триграммы),
+поэтому поиск оценивает только записи, которые могут дать совпадение, а не
+весь каталог.
+
+Хранение:
+- data/gpu_api_data.json — данные gpu-info-api как есть (источник);
+- data/gpu_catalog.snapshot — снимок (pickle) готового каталога: только поля,
+  которые переносятся в карточку видеокарты, нормализованные строки и индекс.
+  Строится при обновлении данных из API или при первом чтении нового файла
+  источника и загружается в несколько раз быстрее разбора JSON;
+- data/gpu_api_overlay.jsonl — локальные правки записей, только дописываются
+  (строка — ключ и измененные поля). Процесс дочитывает новые строки с места,
+  на котором остановился; обновление из API очищает правки, как и раньше
+  полная перезапись файла.
+
+Правила оценки совпадения прежние (см. _score): записи, которые могут
+совпасть, содержат число из модели (или, для моделей без чисел, не меньше
+трех слов модели), либо сама модель каталога входит в искомую строку.
+Эти записи и берутся из индекса; порядок оценки — порядок записей в файле,
+так что при равных баллах выбирается та же запись, что и при полном переборе.
+
+Версия каталога для поиска (match_version) — хэш содержимого файла источника
+и число правок, изменивших модель, производителя или кодовое имя записи; по ней
+сохраненные совпадения (services/gpu_matching.py) признаются устаревшими.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import Counter
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+GPU_API_DATA_FILE = os.path.join(_DATA_DIR, 'gpu_api_data.json')
+GPU_SNAPSHOT_FILE = os.path.join(_DATA_DIR, 'gpu_catalog.snapshot')
+GPU_OVERLAY_FILE = os.path.join(_DATA_DIR, 'gpu_api_overlay.jsonl')
+
+# Версия формата снимка: снимок другого формата перестраивается из JSON
+SNAPSHOT_FORMAT = 2
+
+# Поля записи, которые используются при поиске и переносятся в карточку видеокарты
+SNAPSHOT_FIELDS = (
+    'Model', 'Vendor', 'Code name', 'Launch', 'Core clock (MHz)', 'Clock speeds Memory (MT/s)',
+    'Memory Clock (MHz)', 'Memory Bandwidth (GB/s)', 'Memory Bus width (bit)', 'Memory Bus type & width',
+    'Memory Bus type', 'TDP (Watts)', 'Bus interface', 'Memory Size (GB)', 'Memory Size (MiB)',
+    'Clock speeds Boost core clock (MHz)', 'Fab (nm)', 'Die size (mm2)', 'Core config',
+    'Fillrate Pixel (GP/s)', 'Fillrate Texture (GT/s)', 'Release Price (USD)',
+    'Release price (USD) Founders Edition', 'SM count', 'Process', 'Transistors (billion)', 'L Cache (MB)',
+    'Single-precision TFLOPS', 'Double-precision TFLOPS', 'Half-precision TFLOPS',
+    'Pixel/unified shader count', 'GPU Type',
+)
+
+# Поля, от которых зависит поиск: их правка меняет версию каталога
+_MATCH_FIELDS = ('Model', 'Vendor', 'Code name')
+
+# Совпадение с баллом ниже порога требует подтверждения администратором
+WEAK_MATCH_SCORE = 5
+
+
+class _Entry:
+    __slots__ = ('key', 'gpu', 'model', 'vendor', 'code_name', 'key_upper', 'model_is_nan')
+
+    def __init__(self, key, gpu):
+        self.key = key
+        self.gpu = gpu
+        self.normalize()
+
+    def normalize(self):
+        gpu = self.gpu
+        self.model = gpu.get('Model', '').strip().upper()
+        self.vendor = gpu.get('Vendor', '').strip().upper()
+        self.code_name = gpu.get('Code name', '').strip().upper()
+        self.key_upper = self.key.upper()
+        # Записи с "nan" в модели ищутся по кодовому имени и ключу
+        self.model_is_nan = self.model == 'NAN' or self.model == ''
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class _SubstringIndex:
+    """Записи, в текстах которых есть подстрока (через биграммы и триграммы)."""
+
+    def __init__(self):
+        self.postings = {}
+
+    def add(self, entry_index, text):
+        for size in (2, 3):
+            for gram in _grams(text, size):
+                self.postings.setdefault(gram, set()).add(entry_index)
+
+    def candidates(self, word):
+        """Надмножество записей, содержащих word (len(word) >= 2)."""
+        grams = _grams(word, 3) if len(word) >= 3 else {word}
+        result = None
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            posting = self.postings.get(gram)
+            if not posting:
+                return set()
+            result = set(posting) if result is None else result & posting
+            if not result:
+                break
+        return result or set()
+
+
+class GpuCatalog:
+    """Разобранный каталог видеокарт с индексом для поиска по модели."""
+
+    def __init__(self, data, version=None):
+        self.data = data
+        self.version = version
+        self.entries = []
+        self.positions = {}  # ключ -> позиция записи
+        # Модели каталога (не nan) — для правил «модель входит в запрос» и по словам
+        self.models = _SubstringIndex()
+        # Кодовые имена и ключи записей с nan в модели — для поиска по числам
+        self.nan_fields = _SubstringIndex()
+        # Начало модели каталога -> записи (для поиска моделей, входящих в запрос)
+        self.model_heads = {}
+        # Позиция в файле правок, до которой правки применены
+        self.overlay_offset = 0
+        self.overlay_revision = 0
+        for key, gpu in data.items():
+            if isinstance(gpu, dict):
+                self._add(_Entry(key, gpu))
+
+    def _add(self, entry):
+        position = len(self.entries)
+        self.entries.append(entry)
+        self.positions[entry.key] = position
+        self._index(position, entry)
+
+    def _index(self, position, entry):
+        if entry.model_is_nan:
+            self.nan_fields.add(position, entry.code_name)
+            self.nan_fields.add(position, entry.key_upper)
+        else:
+            self.models.add(position, entry.model)
+            self.model_heads.setdefault(entry.model[:3], set()).add(position)
+
+    def apply(self, key, fields):
+        """
+        Правка записи (как dict.update; новая запись добавляется в конец).
+        Старые ключи индекса не удаляются: кандидаты все равно проверяются оценкой.
+        """
+        position = self.positions.get(key)
+        if position is None:
+            gpu = dict(fields)
+            self.data[key] = gpu
+            self._add(_Entry(key, gpu))
+            self.overlay_revision += 1
+            return
+        entry = self.entries[position]
+        entry.gpu.update(fields)
+        if any(field in fields for field in _MATCH_FIELDS):
+            before = (entry.model, entry.vendor, entry.code_name)
+            entry.normalize()
+            # Версия меняется, только если поиск может дать другой результат
+            if (entry.model, entry.vendor, entry.code_name) != before:
+                self._index(position, entry)
+                self.overlay_revision += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def match_version(self):
+        """Версия данных, от которых зависит результат поиска (источник и правки полей поиска)."""
+        return f'{self.version}+{self.overlay_revision}' if self.overlay_revision else str(self.version)
+
+    def get(self, key):
+        """Запись каталога по ключу (словарь полей API) или None."""
+        position = self.positions.get(key)
+        return self.entries[position].gpu if position is not None else None
+
+    def _candidates(self, model, words, numbers):
+        if not words:
+            # Без слов возможны совпадения по вхождению строки в любую модель — полный перебор
+            return range(len(self.entries))
+        positions = set()
+        if numbers:
+            for number in set(numbers):
+                positions |= self.models.candidates(number)
+                positions |= self.nan_fields.candidates(number)
+        else:
+            # Нужно не меньше min(3, число слов) вхождений слов (с повторами)
+            counts = Counter()
+            for word, repeat in Counter(words).items():
+                for position in self.models.candidates(word):
+                    counts[position] += repeat
+            need = min(3, len(words))
+            positions |= {position for position, count in counts.items() if count >= need}
+        # Модели каталога, которые целиком входят в запрос
+        for start in range(len(model)):
+            for length in (1, 2, 3):
+                positions.update(self.model_heads.get(model[start:start + length], ()))
+        return sorted(positions)
+
+    def _score(self, entry, model, words, numbers, vendor):
+        """Балл совпадения записи с моделью (0 — не совпадает), как в прежнем полном переборе."""
+        match_score = 0
+        matched = False
+        if not entry.model_is_nan:
+            api_model = entry.model
+            if model == api_model:
+                match_score += 20
+                matched = True
+            elif model in api_model or api_model in model:
+                match_score += 10
+                matched = True
+            elif words and len(words) >= 2:
+                matching_words = sum(1 for word in words if word in api_model)
+                # Для моделей с числами требуем совпадение числа
+                if numbers:
+                    if any(num in api_model for num in numbers) and matching_words >= 2:
+                        match_score += matching_words * 2
+                        matched = True
+                elif matching_words >= 3:
+                    match_score += matching_words
+                    matched = True
+        else:
+            if entry.code_name and numbers:
+                if any(num in entry.code_name for num in numbers):
+                    if not vendor or vendor in entry.key_upper or 'NVIDIA' in entry.key_upper:
+                        match_score += 5
+                        matched = True
+            if entry.key_upper and numbers:
+                if any(num in entry.key_upper for num in numbers):
+                    if not vendor or vendor in entry.key_upper:
+                        match_score += 3
+                        matched = True
+        if not matched:
+            return 0
+        if vendor:
+            api_vendor = entry.vendor
+            if not (vendor in api_vendor or api_vendor in vendor or vendor in entry.key_upper or
+                    ('NVIDIA' in api_vendor and 'NVIDIA' in vendor)):
+                return 0
+        return match_score
+
+    def _scored(self, gpu_model, vendor_name):
+        """Пары (позиция записи, балл) для всех совпавших записей в порядке файла."""
+        model = (gpu_model or '').strip().upper()
+        vendor = vendor_name.strip().upper() if vendor_name else ''
+        # "GeForce GTX 1050 Ti" -> ["GEFORCE", "GTX", "1050", "TI"], числа -> ["1050"]
+        words = [word for word in model.split() if len(word) > 1]
+        numbers = [word for word in words if word.isdigit()]
+        for position in self._candidates(model, words, numbers):
+            score = self._score(self.entries[position], model, words, numbers, vendor)
+            if score > 0:
+                yield position, score
+
+    def _result(self, position, score):
+        entry = self.entries[position]
+        return {'key': entry.key, 'gpu': entry.gpu, 'score': score, 'weak_match': score < WEAK_MATCH_SCORE}
+
+    def match(self, gpu_model, vendor_name=''):
+        """
+        Лучшее совпадение для модели видеокарты.
+
+        Returns:
+            dict: key, gpu (поля API), score, weak_match; None — совпадений нет
+        """
+        best = None
+        best_score = 0
+        for position, score in self._scored(gpu_model, vendor_name):
+            if score > best_score:
+                best, best_score = position, score
+        return self._result(best, best_score) if best is not None else None
+
+    def match_candidates(self, gpu_model, vendor_name='', limit=5):
+        """
+        Лучшие совпадения по убыванию балла (при равных — в порядке файла,
+        поэтому первое совпадение то же, что возвращает match).
+        """
+        ranked = sorted(self._scored(gpu_model, vendor_name), key=lambda item: -item[1])
+        return [self._result(position, score) for position, score in ranked[:limit]]
+
+    def match_many(self, items):
+        """
+        Совпадения для списка пар (модель, производитель) в том же порядке;
+        одинаковые пары ищутся один раз.
+        """
+        found = {}
+        result = []
+        for gpu_model, vendor_name in items:
+            pair = ((gpu_model or '').strip().upper(), (vendor_name or '').strip().upper())
+            if pair not in found:
+                found[pair] = self.match(gpu_model, vendor_name)
+            result.append(found[pair])
+        return result
+
+
+def _stamp(path):
+    """Отметка файла (время модификации, размер) или None, если файла нет."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _write_atomic(path, payload):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _build_snapshot(data, source, digest):
+    """
+    Каталог из данных API: только нужные поля; снимок сохраняется на диск.
+    Версия каталога — хэш содержимого файла источника (не зависит от времени его записи).
+    """
+    trimmed = {key: {field: gpu[field] for field in SNAPSHOT_FIELDS if field in gpu}
+               for key, gpu in data.items() if isinstance(gpu, dict)}
+    catalog = GpuCatalog(trimmed, version=digest)
+    try:
+        _write_atomic(GPU_SNAPSHOT_FILE, pickle.dumps(
+            {'format': SNAPSHOT_FORMAT, 'source': source, 'catalog': catalog}, protocol=pickle.HIGHEST_PROTOCOL
+        ))
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить снимок каталога видеокарт: {e}")
+    return catalog
+
+
+def _load_snapshot(source):
+    """Каталог из снимка, если он построен по текущему файлу источника (иначе None)."""
+    try:
+        with open(GPU_SNAPSHOT_FILE, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    if source is not None and snapshot.get('source') != source:
+        return None
+    return snapshot['catalog']
+
+
+def _digest(payload):
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def _read_source():
+    """Данные файла источника и хэш его содержимого."""
+    with open(GPU_API_DATA_FILE, 'rb') as f:
+        payload = f.read()
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError('ожидается объект JSON')
+    return data, _digest(payload)
+
+
+def _apply_overlay(catalog):
+    """Дочитывает правки из файла правок начиная с catalog.overlay_offset."""
+    try:
+        with open(GPU_OVERLAY_FILE, 'rb') as f:
+            f.seek(catalog.overlay_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # строка еще дописывается
+                catalog.overlay_offset += len(line)
+                try:
+                    change = json.loads(line)
+                    catalog.apply(change['key'], change['fields'])
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"⚠️  Пропущена поврежденная правка каталога видеокарт: {e}")
+    except FileNotFoundError:
+        pass
+
+
+_catalog = None
+_source_stamp = None
+_lock = threading.Lock()
+
+
+def _load():
+    source = _stamp(GPU_API_DATA_FILE)
+    catalog = _load_snapshot(source)
+    if catalog is None:
+        if source is None:
+            return None, None
+        try:
+            data, digest = _read_source()
+            catalog = _build_snapshot(data, source, digest)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ошибка при чтении каталога видеокарт: {e}")
+            return None, None
+    _apply_overlay(catalog)
+    print(f"✅ Каталог видеокарт загружен: {len(catalog)} видеокарт")
+    return catalog, source
+
+
+def get_gpu_catalog():
+    """
+    Каталог видеокарт процесса (None, если данных нет). Перечитывается при смене
+    файла источника; новые правки из файла правок дочитываются.
+    """
+    global _catalog, _source_stamp
+    with _lock:
+        source = _stamp(GPU_API_DATA_FILE)
+        overlay = _stamp(GPU_OVERLAY_FILE)
+        if _catalog is None or source != _source_stamp or \
+                (overlay[1] if overlay else 0) < _catalog.overlay_offset:
+            catalog, source = _load()
+            if catalog is None:
+                return _catalog
+            _catalog, _source_stamp = catalog, source
+        elif overlay and overlay[1] > _catalog.overlay_offset:
+            _apply_overlay(_catalog)
+        return _catalog
+
+
+def replace_gpu_catalog(data):
+    """
+    Сохраняет новые данные gpu-info-api: компактный JSON источника, снимок каталога;
+    локальные правки очищаются.
+    """
+    global _catalog, _source_stamp
+    with _lock:
+        os.makedirs(_DATA_DIR, exist_ok=True)
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        _write_atomic(GPU_API_DATA_FILE, payload)
+        try:
+            os.remove(GPU_OVERLAY_FILE)
+        except FileNotFoundError:
+            pass
+        source = _stamp(GPU_API_DATA_FILE)
+        _catalog, _source_stamp = _build_snapshot(data, source, _digest(payload)), source
+        return _catalog
+
+
+def update_gpu_entry(key, fields):
+    """Дописывает правку записи каталога в файл правок (без перезаписи данных)."""
+    line = json.dumps({'key': key, 'fields': fields}, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        os.makedirs(_DATA_DIR, exist_ok=True)
+        # Одна запись в режиме дозаписи: строки разных процессов не перемешиваются
+        with open(GPU_OVERLAY_FILE, 'ab') as f:
+            f.write(line.encode('utf-8'))
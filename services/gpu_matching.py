@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Сохраненные совпадения видеокарт с каталогом gpu-info-api (таблица gpu_match_results).
+
+Видеокарты учета сводятся к нормализованным парам (модель без префикса
+производителя, производитель) в верхнем регистре — одинаковые карты разных
+машин дают одну пару. Для пары сохраняются лучшая запись каталога с учетом
+производителя, лучшая запись только по модели (используется, если у первой
+нет данных), их баллы, несколько лучших кандидатов для проверки слабых
+совпадений администратором и версия каталога (GpuCatalog.match_version).
+
+Обновление из API сопоставляет заново только новые пары и пары, сохраненные
+для другой версии каталога; проверка слабых совпадений читает сохраненных
+кандидатов без поиска по каталогу.
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import GpuMatchResult, db
+
+from .gpu_catalog import WEAK_MATCH_SCORE
+
+# Префиксы производителя, отбрасываемые в начале модели ("AMD Radeon HD 6470M" -> "Radeon HD 6470M")
+VENDOR_PREFIXES = ('NVIDIA', 'AMD', 'INTEL', 'ATI', 'Advanced Micro Devices, Inc.')
+
+# Сколько лучших кандидатов сохранять для проверки слабых совпадений
+CANDIDATES_LIMIT = 5
+
+# Размер пачки моделей в запросе сохраненных совпадений
+_CHUNK = 500
+
+
+def clean_gpu_model(model_name):
+    """Модель без префикса производителя."""
+    for prefix in VENDOR_PREFIXES:
+        if model_name.upper().startswith(prefix.upper()):
+            return model_name[len(prefix):].strip()
+    return model_name
+
+
+def gpu_match_pair(model_name, vendor_name=''):
+    """Нормализованная пара (модель, производитель) — ключ сохраненного совпадения."""
+    return (clean_gpu_model((model_name or '').strip()).strip().upper()[:200],
+            (vendor_name or '').strip().upper()[:155])
+
+
+def _compute(catalog, model, vendor):
+    candidates = catalog.match_candidates(model, vendor, CANDIDATES_LIMIT)
+    best = candidates[0] if candidates else None
+    fallback_candidates = catalog.match_candidates(model, '', CANDIDATES_LIMIT) if vendor else candidates
+    fallback = fallback_candidates[0] if fallback_candidates else None
+    used = best or fallback
+    # Для проверки — кандидаты того поиска, который дал совпадение
+    candidates = candidates or fallback_candidates
+    return {
+        'catalog_version': catalog.match_version,
+        'matched_key': best['key'] if best else None,
+        'score': best['score'] if best else 0,
+        'fallback_key': fallback['key'] if fallback else None,
+        'fallback_score': fallback['score'] if fallback else 0,
+        'weak_match': bool(used) and used['score'] < WEAK_MATCH_SCORE,
+        'candidates': [{'key': match['key'], 'model': match['gpu'].get('Model', ''), 'score': match['score']}
+                       for match in candidates],
+    }
+
+
+def _stored(row):
+    return {
+        'catalog_version': row.catalog_version,
+        'matched_key': row.matched_key,
+        'score': row.score,
+        'fallback_key': row.fallback_key,
+        'fallback_score': row.fallback_score,
+        'weak_match': row.weak_match,
+        'candidates': json.loads(row.candidates) if row.candidates else [],
+    }
+
+
+def resolve_gpu_matches(items, catalog):
+    """
+    Совпадения для пар (модель, производитель) из gpu_match_results; новые пары
+    и пары другой версии каталога сопоставляются заново и записываются в текущую
+    транзакцию (flush, без commit: иначе истекут объекты, загруженные вызывающим
+    кодом). Commit выполняет вызывающий код.
+
+    Args:
+        items: пары (модель, производитель) как в учете; нормализуются gpu_match_pair
+        catalog: GpuCatalog
+
+    Returns:
+        tuple: ({пара: совпадение}, сколько пар сопоставлено заново); совпадение —
+        dict с полями matched_key, score, fallback_key, fallback_score, weak_match, candidates
+    """
+    pairs = {gpu_match_pair(model, vendor) for model, vendor in items}
+    pairs = {pair for pair in pairs if pair[0]}
+    version = catalog.match_version
+    rows = {}
+    models = sorted({model for model, _ in pairs})
+    for start in range(0, len(models), _CHUNK):
+        chunk = models[start:start + _CHUNK]
+        for row in GpuMatchResult.query.filter(GpuMatchResult.model.in_(chunk)):
+            if (row.model, row.vendor) in pairs:
+                rows[(row.model, row.vendor)] = row
+
+    results = {}
+    computed = {}
+    for pair in pairs:
+        row = rows.get(pair)
+        if row is not None and row.catalog_version == version:
+            results[pair] = _stored(row)
+            continue
+        results[pair] = computed[pair] = _compute(catalog, *pair)
+
+    if computed:
+        try:
+            # Точка сохранения: при конфликте откатываются только записи совпадений
+            with db.session.begin_nested():
+                for pair, result in computed.items():
+                    row = rows.get(pair)
+                    if row is None:
+                        row = GpuMatchResult(model=pair[0], vendor=pair[1])
+                        db.session.add(row)
+                    for field, value in result.items():
+                        if field == 'candidates':
+                            value = json.dumps(value, ensure_ascii=False)
+                        setattr(row, field, value)
+                    row.matched_at = datetime.utcnow()
+        except IntegrityError:
+            # Ту же пару одновременно сохранил другой запрос — результат все равно получен
+            pass
+    return results, len(computed)
+
+
+def stored_match(catalog, key, score):
+    """Совпадение в формате GpuCatalog.match по сохраненному ключу (None, если записи нет)."""
+    gpu = catalog.get(key) if key else None
+    if gpu is None:
+        return None
+    return {'key': key, 'gpu': gpu, 'score': score, 'weak_match': score < WEAK_MATCH_SCORE}
@@ -0,0 +1,848 @@
+# -*- coding: utf-8 -*-
+"""
+Запись данных агента сбора (POST /api/hdd_collect и /api/hdd_collect/v2).
+
+Агенты отправляют данные при входе пользователя, поэтому запросы приходят
+сотнями одновременно. Запись устроена так, чтобы число обращений к БД не
+зависело от числа комплектующих в запросе:
+
+1. машина и владелец запрошенного hostname — одним запросом;
+2. существующие диски, видеокарты и модули ОЗУ — одним запросом на таблицу
+   (по серийным номерам и по машине);
+3. производители — из справочника процесса (services/vendor_directory.py),
+   недостающие создаются одной пакетной вставкой;
+4. изменения применяются пакетными UPDATE/INSERT (executemany) на таблицу,
+   история дисков и машины — пакетными INSERT.
+
+Разделы отчета v2 (machine, disks, graphics_cards, memory_modules) получают
+отпечаток — sha256 нормализованного JSON (таблица machine_report_state). Раздел
+с тем же отпечатком, уже примененный сегодня, пропускается целиком; в примененных
+разделах записываются только изменившиеся строки. История диска пишется, если
+изменились его характеристики или состояние, и не чаще раза в сутки, если
+изменились только счетчики наработки и включений.
+
+Фиксацию транзакции (один commit) выполняет вызывающий код.
+"""
+import hashlib
+import json
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from models import (Equipment, Machine, MachineHistory, MachineReportState, PCGraphicsCard, PCHardDrive,
+                    PCHardDriveHistory, PCMemoryModule, db)
+
+from .disk_rules import detect_disk_manufacturer
+from .vendor_directory import detect_graphics_manufacturer, resolve_vendor_id, resolve_vendor_ids
+
+# Поля машины из разделов os / hardware / network запроса
+_OS_FIELDS = ('os_name', 'os_version', 'os_build', 'os_edition', 'os_architecture')
+_HARDWARE_FIELDS = ('processor', 'memory_gb', 'motherboard', 'bios_version')
+_NETWORK_FIELDS = ('domain', 'computer_role', 'dns_suffix')
+
+# Обновляемые колонки комплектующих (UPDATE всегда пишет полную строку — один executemany на таблицу)
+_DISK_UPDATE = ('model', 'capacity_gb', 'interface', 'power_on_hours', 'power_on_count', 'health_status',
+                'vendor_id', 'machine_id', 'health_check_date', 'comment', 'active')
+_GPU_UPDATE = ('memory_size', 'memory_type', 'serial_number', 'vendor_id', 'machine_id', 'comment', 'active')
+_MEMORY_UPDATE = ('capacity_gb', 'memory_type', 'speed_mhz', 'manufacturer', 'part_number', 'serial_number',
+                  'location', 'machine_id', 'comment', 'active')
+
+# Счетчики диска: их изменение само по себе дает запись истории не чаще раза в сутки
+_DISK_COUNTERS = ('power_on_hours', 'power_on_count', 'health_check_date')
+
+# Разделы отчета v2 с отпечатками
+SECTIONS = ('machine', 'disks', 'graphics_cards', 'memory_modules')
+
+# Если раздел machine не изменился, last_seen обновляется не чаще этого интервала
+LAST_SEEN_PRECISION = timedelta(minutes=15)
+
+# Колонки диска, копируемые в запись истории
+_DISK_HISTORY = ('drive_type', 'vendor_id', 'model', 'capacity_gb', 'serial_number', 'interface',
+                 'power_on_hours', 'power_on_count', 'health_status', 'purchase_date', 'purchase_cost',
+                 'machine_id', 'active')
+
+
+def fix_windows_version(version):
+    """
+    Исправляет 'Windows 6' на 'Windows 7' только для этого случая.
+    """
+    if version and str(version).strip() == '6':
+        return '7'
+    return version
+
+
+def sync_machine_to_equipment(machine, changed_fields=None):
+    """
+    Синхронизирует данные из Machine в связанный Equipment (ТМЦ).
+    Приоритет данных: Machine -> Equipment (данные из Machine перезаписывают Equipment).
+    Это избавляет от дублирования данных и обеспечивает единый источник истины.
+
+    Args:
+        machine: Объект Machine
+        changed_fields: Список измененных полей (для логирования)
+
+    Returns:
+        dict: Информация об обновленных полях Equipment
+    """
+    if not machine.equipment_id:
+        return {'updated': False, 'fields': []}
+
+    equipment = db.session.get(Equipment, machine.equipment_id)
+    if not equipment:
+        return {'updated': False, 'fields': []}
+
+    updated_fields = []
+    sync_mapping = {
+        'ip_address': ('ip', str),  # Machine.ip_address -> Equipment.ip
+        # Можно добавить другие поля для синхронизации в будущем
+        # 'hostname': ('buhname', str),  # Например, если нужно синхронизировать имя
+    }
+
+    for machine_field, (equipment_field, converter) in sync_mapping.items():
+        machine_value = getattr(machine, machine_field, None)
+        equipment_value = getattr(equipment, equipment_field, None)
+
+        # Преобразуем значение если нужно
+        if machine_value is not None:
+            if converter == str:
+                machine_value = str(machine_value).strip() if machine_value else ''
+            else:
+                machine_value = converter(machine_value)
+
+        # Обновляем только если значения различаются
+        if machine_value != equipment_value:
+            old_value = equipment_value
+            setattr(equipment, equipment_field, machine_value)
+            updated_fields.append({
+                'field': equipment_field,
+                'old_value': old_value,
+                'new_value': machine_value
+            })
+
+            # Записываем в историю машины
+            history_record = MachineHistory(
+                machine_id=machine.id,
+                changed_field=f'equipment_{equipment_field}',
+                old_value=str(old_value) if old_value else None,
+                new_value=str(machine_value) if machine_value else None,
+                comment=f'Поле ТМЦ "{equipment_field}" синхронизировано из Machine.{machine_field}'
+            )
+            db.session.add(history_record)
+
+    if updated_fields:
+        db.session.flush()  # Сохраняем изменения Equipment
+
+    return {
+        'updated': len(updated_fields) > 0,
+        'fields': [f['field'] for f in updated_fields]
+    }
+
+
+_HEALTH_STATUSES = {'GOOD': 'Здоров', 'CAUTION': 'Тревога', 'BAD': 'Неработает', 'UNKNOWN': 'Неизвестно'}
+
+
+def _health_status_ru(status):
+    """Статус здоровья диска на русском (русский статус возвращается как есть)."""
+    if not status:
+        return None
+    if status in _HEALTH_STATUSES.values():
+        return status
+    return _HEALTH_STATUSES.get(str(status).strip().upper(), 'Неизвестно')
+
+
+def _disk_comment(hostname, disk_data, info_comment):
+    """Комментарий нового диска: комментарий из данных диска имеет приоритет."""
+    if disk_data.get('comment'):
+        comment = disk_data.get('comment')
+        return f'{comment} ({info_comment})' if info_comment else comment
+    comment = f'Автоматически добавлен с {hostname} через API v2'
+    return f'{comment}. {info_comment}' if info_comment else comment
+
+
+def _text(value):
+    return (value or '').strip()
+
+
+def validate_v2_payload(data):
+    """
+    Проверяет обязательные поля запроса API v2.
+
+    Returns:
+        tuple: (раздел machine, нормализованный MAC-адрес)
+
+    Raises:
+        ValueError: текст ошибки для ответа 400
+    """
+    if not data:
+        raise ValueError('No data provided')
+    machine_data = data.get('machine')
+    if not machine_data:
+        raise ValueError('Field "machine" is required')
+    mac_address = machine_data.get('mac_address')
+    # MAC-адрес обязателен для API v2 (уникальный идентификатор машины)
+    if not mac_address or not mac_address.strip():
+        raise ValueError('Field "machine.mac_address" is required for API v2. '
+                         'Machines are identified by unique MAC address.')
+    mac_address = mac_address.strip().upper()
+    if len(mac_address) < 12 or len(mac_address) > 17:
+        raise ValueError(f'Invalid MAC address format: "{mac_address}". '
+                         f'Expected format: XX:XX:XX:XX:XX:XX or XXXXXXXXXXXX')
+    return machine_data, mac_address
+
+
+def _item_error(errors, label, error):
+    errors.append(f'{label}: {error}')
+    print(f"ERROR processing {label}: {error}")
+    print(traceback.format_exc())
+
+
+def apply_v1_payload(data):
+    """
+    Применяет данные агента API v1 (hostname и список дисков без привязки к машине).
+    Транзакцию не фиксирует — commit выполняет вызывающий код.
+
+    Raises:
+        ValueError: пустой запрос
+
+    Returns:
+        dict: ответ API v1 (processed, total, new, updated[, error_count, errors])
+    """
+    if not data:
+        raise ValueError('No data provided')
+    hostname = data.get('hostname')
+    disks = data.get('disks') or []
+    if not disks:
+        return {'error': 'No disks provided', 'processed': 0, 'total': 0, 'new': 0, 'updated': 0}
+
+    new_count = 0
+    updated_count = 0
+    errors = []
+    today = datetime.now().date()
+
+    serials = {disk_data.get('serial_number') for disk_data in disks if disk_data.get('serial_number')}
+    existing_disks = {}
+    if serials:
+        for disk in PCHardDrive.query.filter(PCHardDrive.serial_number.in_(serials)).order_by(PCHardDrive.id):
+            existing_disks.setdefault(disk.serial_number, disk)
+
+    for disk_data in disks:
+        serial = disk_data.get('serial_number')
+        try:
+            if not serial:
+                errors.append('Disk skipped: missing serial_number')
+                continue
+            existing_disk = existing_disks.get(serial)
+            if existing_disk:
+                if 'model' in disk_data:
+                    existing_disk.model = disk_data.get('model')
+                if 'size_gb' in disk_data:
+                    existing_disk.capacity_gb = disk_data.get('size_gb')
+                for field in ('interface', 'power_on_hours', 'power_on_count'):
+                    if field in disk_data:
+                        setattr(existing_disk, field, disk_data.get(field))
+                if 'health_status' in disk_data:
+                    existing_disk.health_status = _health_status_ru(disk_data.get('health_status'))
+                # Производитель — если указан явно или определяется по модели
+                manufacturer = _text(disk_data.get('manufacturer'))
+                if not manufacturer and 'model' in disk_data:
+                    manufacturer = detect_disk_manufacturer(_text(disk_data.get('model')))
+                if manufacturer:
+                    existing_disk.vendor_id = resolve_vendor_id(manufacturer)
+                existing_disk.health_check_date = today
+                if hostname:
+                    existing_disk.comment = f'Последний раз обнаружен на {hostname}'
+                # Деактивированные диски автоматически восстанавливаются при получении данных
+                existing_disk.active = True
+                history_comment = 'Обновление через API'
+                if hostname:
+                    history_comment += f' с {hostname}'
+                db.session.add(PCHardDriveHistory(
+                    hard_drive_id=existing_disk.id,
+                    check_date=today,
+                    comment=history_comment,
+                    **{column: getattr(existing_disk, column) for column in _DISK_HISTORY}
+                ))
+                updated_count += 1
+                continue
+
+            model = _text(disk_data.get('model'))
+            size_gb = disk_data.get('size_gb')
+            # size_gb = 0 считается валидным значением
+            if not model:
+                errors.append(f'Disk {serial}: missing model')
+                continue
+            if size_gb is None:
+                errors.append(f'Disk {serial}: missing size_gb')
+                continue
+            media_type = _text(disk_data.get('media_type')).upper()
+            if 'SSD' in media_type or 'SOLID' in media_type:
+                drive_type = 'SSD'
+            elif 'NVME' in model.upper():
+                drive_type = 'NVMe'
+            else:
+                drive_type = 'HDD'
+            manufacturer = _text(disk_data.get('manufacturer')) or detect_disk_manufacturer(model)
+            new_disk = PCHardDrive(
+                serial_number=serial,
+                model=model,
+                capacity_gb=size_gb,
+                drive_type=drive_type,
+                vendor_id=resolve_vendor_id(manufacturer),
+                interface=disk_data.get('interface'),
+                power_on_hours=disk_data.get('power_on_hours'),
+                power_on_count=disk_data.get('power_on_count'),
+                health_status=_health_status_ru(disk_data.get('health_status')),
+                health_check_date=today,
+                comment=f'Автоматически добавлен с {hostname}' if hostname else 'Автоматически добавлен'
+            )
+            db.session.add(new_disk)
+            # Повтор того же серийного номера в запросе обновит новый диск
+            existing_disks[serial] = new_disk
+            new_count += 1
+        except Exception as e:
+            _item_error(errors, f'Disk {serial or "unknown"}', e)
+
+    print(f"API v1: {hostname}, Disks: new={new_count}, updated={updated_count}, total_disks={len(disks)}")
+    response = {
+        'processed': new_count + updated_count,
+        'total': len(disks),
+        'new': new_count,
+        'updated': updated_count
+    }
+    if errors:
+        response['error_count'] = len(errors)
+        response['errors'] = errors[:10]
+    return response
+
+
+def _fingerprint(*parts):
+    """sha256 нормализованного JSON: ключи отсортированы, порядок элементов списков не важен."""
+    def normalize(value):
+        if isinstance(value, dict):
+            return {str(key): normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            items = [normalize(item) for item in value]
+            return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+        return value
+    raw = json.dumps(normalize(list(parts)), sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _load_states(machine_id):
+    """Отпечатки разделов машины: {раздел: (отпечаток, день применения)}."""
+    return {section: (fingerprint, reported_on) for section, fingerprint, reported_on in db.session.query(
+        MachineReportState.section, MachineReportState.fingerprint, MachineReportState.reported_on
+    ).filter(MachineReportState.machine_id == machine_id)}
+
+
+def _save_states(machine_id, fingerprints, today):
+    """Записывает отпечатки примененных разделов (одна пакетная вставка с заменой)."""
+    if not fingerprints:
+        return
+    table = MachineReportState.__table__
+    rows = [{'machine_id': machine_id, 'section': section, 'fingerprint': fingerprint, 'reported_on': today}
+            for section, fingerprint in fingerprints.items()]
+    connection = db.session.connection()
+    if connection.dialect.name == 'mysql':
+        statement = mysql_insert(table)
+        connection.execute(statement.on_duplicate_key_update(
+            fingerprint=statement.inserted.fingerprint, reported_on=statement.inserted.reported_on,
+        ), rows)
+        return
+    connection.execute(table.delete().where(
+        table.c.machine_id == machine_id, table.c.section.in_(list(fingerprints))
+    ))
+    connection.execute(table.insert(), rows)
+
+
+def _rows(table, *conditions):
+    """Строки таблицы как словари (без загрузки ORM-объектов)."""
+    return [dict(row) for row in db.session.execute(select(table).where(*conditions)).mappings()]
+
+
+def _bulk_update(table, columns, rows):
+    if not rows:
+        return
+    connection = db.session.connection()
+    connection.execute(
+        table.update().where(table.c.id == bindparam('b_id')).values(
+            **{column: bindparam(f'b_{column}') for column in columns}
+        ),
+        [{f'b_{key}': row[key] for key in ('id',) + columns} for row in rows],
+    )
+
+
+def _bulk_insert(table, rows):
+    if rows:
+        db.session.connection().execute(table.insert(), rows)
+
+
+def _apply_machine(machine_data, mac_address, collection_info, fingerprint, today):
+    """
+    Находит машину по MAC-адресу, обновляет или создает ее. Если раздел machine
+    не изменился (тот же отпечаток сегодня), поля не сравниваются и не пишутся.
+
+    Returns:
+        tuple: (Machine, 'updated' или 'created', строки истории машины,
+                отпечатки разделов машины, пропущен ли раздел machine)
+    """
+    hostname = machine_data.get('hostname')
+    if not hostname:
+        lookup_hostname = f"MAC-{mac_address.replace(':', '-')}"
+    else:
+        lookup_hostname = hostname
+    # Машина по MAC и владелец запрошенного hostname — одним запросом
+    candidates = Machine.query.filter(
+        or_(Machine.mac_address == mac_address, Machine.hostname == lookup_hostname)
+    ).all()
+    machine = next((m for m in candidates if m.mac_address == mac_address), None)
+    hostname_owner = next((m for m in candidates if m.hostname == lookup_hostname), None)
+    history = []
+    now = datetime.utcnow()
+
+    if machine is None:
+        # Создаем новую машину по уникальному MAC-адресу; если hostname занят, добавляем суффикс
+        hostname = lookup_hostname
+        if hostname_owner:
+            hostname = f"{hostname}-{mac_address.replace(':', '')[-6:]}"
+            print(f"Info: Hostname was occupied, using '{hostname}' for new machine with MAC {mac_address}")
+        os_data = machine_data.get('os') or {}
+        hardware_data = machine_data.get('hardware') or {}
+        network_data = machine_data.get('network') or {}
+        machine = Machine(
+            hostname=hostname,
+            ip_address=machine_data.get('ip_address'),
+            mac_address=mac_address,
+            os_name=os_data.get('name'),
+            os_version=fix_windows_version(os_data.get('version')),
+            os_build=os_data.get('build'),
+            os_edition=os_data.get('edition'),
+            os_architecture=os_data.get('architecture'),
+            processor=hardware_data.get('processor'),
+            memory_gb=hardware_data.get('memory_gb'),
+            motherboard=hardware_data.get('motherboard'),
+            bios_version=hardware_data.get('bios_version'),
+            domain=network_data.get('domain'),
+            computer_role=network_data.get('computer_role'),
+            dns_suffix=network_data.get('dns_suffix'),
+            first_seen=now,
+            last_seen=now
+        )
+        db.session.add(machine)
+        db.session.flush()  # Получаем ID машины
+        history.append({'machine_id': machine.id, 'changed_field': 'created', 'old_value': None,
+                        'new_value': None, 'changed_at': now,
+                        'comment': collection_info.get('comment', 'Машина создана через API v2')})
+        return machine, 'created', history, {}, False
+
+    states = _load_states(machine.id)
+    if states.get('machine') == (fingerprint, today):
+        if not machine.last_seen or now - machine.last_seen >= LAST_SEEN_PRECISION:
+            machine.last_seen = now
+        return machine, 'updated', history, states, True
+
+    print(f"Info: Machine found by MAC address '{mac_address}'. Updating data (machine ID: {machine.id})")
+    old_values = {}
+    changes = []
+
+    def assign(field, new_val):
+        old_val = getattr(machine, field, None)
+        if old_val != new_val:
+            old_values[field] = old_val
+            setattr(machine, field, new_val)
+            changes.append(field)
+
+    if 'ip_address' in machine_data:
+        assign('ip_address', machine_data.get('ip_address'))
+    # MAC-адрес не обновляем, так как он уникальный идентификатор
+    if hostname and hostname != machine.hostname:
+        if hostname_owner and hostname_owner.id != machine.id:
+            # Машина найдена по MAC-адресу (приоритет) — освобождаем hostname у другой машины
+            hostname_owner.hostname = f"OLD-{hostname_owner.hostname}-{hostname_owner.id}"
+            print(f"Info: Hostname '{hostname}' was used by machine {hostname_owner.id}. "
+                  f"Freed for machine {machine.id} (found by MAC)")
+            # Переименование должно попасть в БД раньше, чем hostname займет эта машина
+            db.session.flush()
+        print(f"Info: Hostname updated from '{machine.hostname}' to '{hostname}' for machine {machine.id}")
+        assign('hostname', hostname)
+    for section, fields in (('os', _OS_FIELDS), ('hardware', _HARDWARE_FIELDS), ('network', _NETWORK_FIELDS)):
+        section_data = machine_data.get(section) or {}
+        for field in fields:
+            key = field.replace('os_', '') if section == 'os' else field
+            if key in section_data:
+                new_val = section_data[key]
+                # Исправляем 'Windows 6' на 'Windows 7' только для os_version
+                if field == 'os_version':
+                    new_val = fix_windows_version(new_val)
+                assign(field, new_val)
+
+    machine.last_seen = now
+    machine.updated_at = now
+    sync_machine_to_equipment(machine, changed_fields=changes)
+    comment = collection_info.get('comment', 'Обновление через API v2')
+    for field in changes:
+        old_value = old_values.get(field)
+        history.append({'machine_id': machine.id, 'changed_field': field,
+                        'old_value': str(old_value) if old_value is not None else None,
+                        'new_value': str(getattr(machine, field, '')), 'changed_at': now, 'comment': comment})
+    return machine, 'updated', history, states, False
+
+
+def _section_result(items, new, updated, errors, unchanged=0, skipped=False):
+    result = {'processed': new + updated, 'total': len(items), 'new': new, 'updated': updated,
+              'unchanged': len(items) if skipped else unchanged, 'skipped': skipped}
+    if errors:
+        result['error_count'] = len(errors)
+        result['errors'] = errors[:10]
+    return result
+
+
+def _changed(row, original, columns):
+    return original is None or any(row[column] != original[column] for column in columns)
+
+
+def apply_v2_payload(data):
+    """
+    Применяет данные агента (машина, диски, видеокарты, модули ОЗУ) пакетно.
+    Разделы без изменений пропускаются (см. описание модуля), в ответе они
+    перечислены в skipped_sections. Ошибка в одном элементе не отменяет
+    обработку остальных. Транзакцию не фиксирует — commit выполняет вызывающий код.
+
+    Raises:
+        ValueError: некорректный запрос (см. validate_v2_payload)
+
+    Returns:
+        dict: ответ API v2 (success, machine, disks, graphics_cards, memory_modules)
+    """
+    machine_data, mac_address = validate_v2_payload(data)
+    collection_info = data.get('collection_info') or {}
+    disks = data.get('disks') or []
+    graphics_cards = data.get('graphics_cards') or []
+    memory_modules = data.get('memory_modules') or []
+
+    info_comment = collection_info.get('comment')
+    today = datetime.now().date()
+
+    machine, machine_status, machine_history, states, machine_skipped = _apply_machine(
+        machine_data, mac_address, collection_info, _fingerprint(machine_data, info_comment), today
+    )
+    hostname = machine.hostname
+    # Отпечатки разделов комплектующих (комментарии строк зависят от hostname и комментария сбора)
+    fingerprints = {
+        'disks': _fingerprint(disks, hostname, info_comment),
+        'graphics_cards': _fingerprint(graphics_cards, hostname, info_comment),
+        'memory_modules': _fingerprint(memory_modules, hostname, info_comment),
+    }
+    skipped = {section for section, fingerprint in fingerprints.items()
+               if states.get(section) == (fingerprint, today)}
+    if machine_skipped:
+        skipped.add('machine')
+    else:
+        fingerprints['machine'] = _fingerprint(machine_data, info_comment)
+    reported = {'disks': disks, 'graphics_cards': graphics_cards, 'memory_modules': memory_modules}
+    if 'disks' in skipped:
+        disks = []
+    if 'graphics_cards' in skipped:
+        graphics_cards = []
+    if 'memory_modules' in skipped:
+        memory_modules = []
+
+    # === ПРЕДВАРИТЕЛЬНАЯ ЗАГРУЗКА ===
+    disk_serials = {d.get('serial_number') for d in disks if d.get('serial_number')}
+    gpu_serials = {g.get('serial_number') for g in graphics_cards if g.get('serial_number')}
+    memory_serials = {m.get('serial_number') for m in memory_modules if m.get('serial_number')}
+    disk_table = PCHardDrive.__table__
+    gpu_table = PCGraphicsCard.__table__
+    memory_table = PCMemoryModule.__table__
+
+    existing_disks = {}
+    if disk_serials:
+        for row in sorted(_rows(disk_table, disk_table.c.serial_number.in_(disk_serials)), key=lambda r: r['id']):
+            existing_disks.setdefault(row['serial_number'], row)
+    # Исходные значения строк — пишутся только строки, которые действительно изменились
+    originals = {(disk_table.name, row['id']): dict(row) for row in existing_disks.values()}
+    gpu_rows = []
+    if graphics_cards:
+        gpu_rows = sorted(_rows(gpu_table, or_(gpu_table.c.serial_number.in_(gpu_serials),
+                                               gpu_table.c.machine_id == machine.id)), key=lambda r: r['id'])
+    memory_rows = []
+    if memory_modules:
+        memory_rows = sorted(_rows(memory_table, or_(memory_table.c.serial_number.in_(memory_serials),
+                                                     memory_table.c.machine_id == machine.id)),
+                             key=lambda r: r['id'])
+    for table, rows in ((gpu_table, gpu_rows), (memory_table, memory_rows)):
+        originals.update({(table.name, row['id']): dict(row) for row in rows})
+
+    # Все названия производителей запроса — через справочник процесса
+    disk_manufacturers = {}
+    for index, disk_data in enumerate(disks):
+        manufacturer = _text(disk_data.get('manufacturer'))
+        if not manufacturer and 'model' in disk_data:
+            manufacturer = detect_disk_manufacturer(_text(disk_data.get('model')))
+        disk_manufacturers[index] = manufacturer
+    gpu_manufacturers = {}
+    for index, gpu_data in enumerate(graphics_cards):
+        gpu_manufacturers[index] = _text(gpu_data.get('manufacturer')) or \
+            detect_graphics_manufacturer(_text(gpu_data.get('model')))
+    vendors = resolve_vendor_ids(list(disk_manufacturers.values()) + list(gpu_manufacturers.values()))
+
+    # === ДИСКИ ===
+    disk_updates = {}
+    disk_inserts = {}
+    disk_new = disk_updated = disk_unchanged = 0
+    disk_errors = []
+    for index, disk_data in enumerate(disks):
+        serial = disk_data.get('serial_number')
+        try:
+            if not serial:
+                disk_errors.append('Disk skipped: missing serial_number')
+                continue
+            row = existing_disks.get(serial) or disk_inserts.get(serial)
+            vendor_id = vendors.get(disk_manufacturers[index])
+            if row is not None:
+                before = dict(row)
+                if 'model' in disk_data:
+                    row['model'] = disk_data.get('model')
+                if disk_data.get('size_gb') is not None:
+                    new_capacity = int(disk_data['size_gb'])
+                    if row['capacity_gb'] != new_capacity:
+                        print(f"Info: Disk {serial} capacity updated from {row['capacity_gb']} GB "
+                              f"to {new_capacity} GB")
+                    row['capacity_gb'] = new_capacity
+                for field in ('interface', 'power_on_hours', 'power_on_count'):
+                    if field in disk_data:
+                        row[field] = disk_data.get(field)
+                if 'health_status' in disk_data:
+                    row['health_status'] = _health_status_ru(disk_data.get('health_status'))
+                if vendor_id:
+                    row['vendor_id'] = vendor_id
+                row['machine_id'] = machine.id
+                row['health_check_date'] = today
+                # Комментарий заполняется только если его еще нет
+                if not row['comment'] or row['comment'].strip() == '':
+                    row['comment'] = _disk_comment(hostname, disk_data, info_comment)
+                row['active'] = True
+                if 'id' in row:
+                    disk_updates[row['id']] = row
+                if _changed(row, before, _DISK_UPDATE):
+                    disk_updated += 1
+                else:
+                    disk_unchanged += 1
+                continue
+
+            model = _text(disk_data.get('model'))
+            size_gb = disk_data.get('size_gb')
+            if not model:
+                disk_errors.append(f'Disk {serial}: missing model')
+                continue
+            if size_gb is None:
+                disk_errors.append(f'Disk {serial}: missing size_gb')
+                continue
+            if not vendor_id:
+                disk_errors.append(f'Disk {serial}: could not create vendor for {disk_manufacturers[index]}')
+                continue
+            media_type = _text(disk_data.get('media_type')).upper()
+            if 'SSD' in media_type or 'SOLID' in media_type:
+                drive_type = 'SSD'
+            elif 'NVME' in model.upper():
+                drive_type = 'NVMe'
+            else:
+                drive_type = 'HDD'
+            disk_inserts[serial] = {
+                'serial_number': serial,
+                'model': model,
+                'capacity_gb': int(size_gb),
+                'drive_type': drive_type,
+                'vendor_id': vendor_id,
+                'interface': disk_data.get('interface'),
+                'power_on_hours': disk_data.get('power_on_hours'),
+                'power_on_count': disk_data.get('power_on_count'),
+                'health_status': _health_status_ru(disk_data.get('health_status')),
+                'health_check_date': today,
+                'machine_id': machine.id,
+                'comment': _disk_comment(hostname, disk_data, info_comment),
+                'active': True,
+            }
+            disk_new += 1
+        except Exception as e:
+            _item_error(disk_errors, f'Disk {serial or "unknown"}', e)
+
+    # === ВИДЕОКАРТЫ ===
+    gpus_by_serial = {}
+    gpus_by_model = {}
+    for row in gpu_rows:
+        if row['serial_number']:
+            gpus_by_serial.setdefault(row['serial_number'], row)
+        if row['machine_id'] == machine.id:
+            gpus_by_model.setdefault(row['model'], row)
+    gpu_updates = {}
+    gpu_inserts = []
+    gpu_new = gpu_updated = gpu_unchanged = 0
+    gpu_errors = []
+    for index, gpu_data in enumerate(graphics_cards):
+        model = _text(gpu_data.get('model'))
+        try:
+            if not model:
+                gpu_errors.append('Graphics card skipped: missing model')
+                continue
+            serial = gpu_data.get('serial_number')
+            # Ищем по серийному номеру, затем по модели на этой машине
+            row = (gpus_by_serial.get(serial) if serial else None) or gpus_by_model.get(model)
+            vendor_id = vendors.get(gpu_manufacturers[index])
+            if row is not None:
+                before = dict(row)
+                for field in ('memory_size', 'memory_type'):
+                    if field in gpu_data:
+                        row[field] = gpu_data.get(field)
+                if serial:
+                    row['serial_number'] = serial
+                if vendor_id:
+                    row['vendor_id'] = vendor_id
+                row['machine_id'] = machine.id
+                row['comment'] = f'Последний раз обнаружена на {hostname}' + \
+                    (f'. {info_comment}' if info_comment else '')
+                row['active'] = True
+                if 'id' in row:
+                    gpu_updates[row['id']] = row
+                if _changed(row, before, _GPU_UPDATE):
+                    gpu_updated += 1
+                else:
+                    gpu_unchanged += 1
+                continue
+            if not vendor_id:
+                gpu_errors.append(f'Graphics card {model}: could not create vendor for {gpu_manufacturers[index]}')
+                continue
+            row = {
+                'vendor_id': vendor_id,
+                'model': model,
+                'memory_size': gpu_data.get('memory_size'),
+                'memory_type': gpu_data.get('memory_type'),
+                'serial_number': serial,
+                'machine_id': machine.id,
+                'comment': f'Автоматически добавлена с {hostname} через API v2',
+                'active': True,
+            }
+            gpu_inserts.append(row)
+            # Повтор той же видеокарты в запросе обновит новую строку, а не создаст вторую
+            if serial:
+                gpus_by_serial[serial] = row
+            gpus_by_model.setdefault(model, row)
+            gpu_new += 1
+        except Exception as e:
+            _item_error(gpu_errors, f'Graphics card {model or "unknown"}', e)
+
+    # === МОДУЛИ ОЗУ ===
+    memory_by_serial = {}
+    memory_by_location = {}
+    for row in memory_rows:
+        if row['serial_number']:
+            memory_by_serial.setdefault(row['serial_number'], row)
+        if row['machine_id'] == machine.id and row['location']:
+            memory_by_location.setdefault(row['location'], row)
+    memory_updates = {}
+    memory_inserts = []
+    memory_new = memory_updated = memory_unchanged = 0
+    memory_errors = []
+    for memory_data in memory_modules:
+        location = memory_data.get('location')
+        try:
+            capacity_gb = memory_data.get('capacity_gb')
+            if not capacity_gb:
+                memory_errors.append('Memory module skipped: missing capacity_gb')
+                continue
+            serial = memory_data.get('serial_number')
+            row = (memory_by_serial.get(serial) if serial else None) or \
+                (memory_by_location.get(location) if location else None)
+            if row is not None:
+                before = dict(row)
+                for field in ('capacity_gb', 'memory_type', 'speed_mhz', 'manufacturer', 'part_number'):
+                    if field in memory_data:
+                        row[field] = memory_data.get(field)
+                if serial:
+                    row['serial_number'] = serial
+                if location:
+                    row['location'] = location
+                row['machine_id'] = machine.id
+                row['comment'] = f'Последний раз обнаружен на {hostname}' + \
+                    (f'. {info_comment}' if info_comment else '')
+                row['active'] = True
+                if 'id' in row:
+                    memory_updates[row['id']] = row
+                if _changed(row, before, _MEMORY_UPDATE):
+                    memory_updated += 1
+                else:
+                    memory_unchanged += 1
+                continue
+            row = {
+                'capacity_gb': capacity_gb,
+                'memory_type': memory_data.get('memory_type'),
+                'speed_mhz': memory_data.get('speed_mhz'),
+                'manufacturer': memory_data.get('manufacturer'),
+                'part_number': memory_data.get('part_number'),
+                'serial_number': serial,
+                'location': location,
+                'machine_id': machine.id,
+                'comment': f'Автоматически добавлен с {hostname} через API v2',
+                'active': True,
+            }
+            memory_inserts.append(row)
+            if serial:
+                memory_by_serial[serial] = row
+            if location:
+                memory_by_location.setdefault(location, row)
+            memory_new += 1
+        except Exception as e:
+            _item_error(memory_errors, f'Memory module {location or "unknown"}', e)
+
+    # === ЗАПИСЬ ===
+    def changed_rows(table, columns, rows):
+        return [row for row in rows if _changed(row, originals[(table.name, row['id'])], columns)]
+
+    disk_changed = changed_rows(disk_table, _DISK_UPDATE, disk_updates.values())
+    disk_state = tuple(column for column in _DISK_UPDATE if column not in _DISK_COUNTERS)
+    db.session.flush()
+    _bulk_update(disk_table, _DISK_UPDATE, disk_changed)
+    _bulk_insert(disk_table, list(disk_inserts.values()))
+    # История диска: при изменении характеристик или состояния, по счетчикам — раз в сутки
+    _bulk_insert(PCHardDriveHistory.__table__, [
+        dict({column: row[column] for column in _DISK_HISTORY},
+             hard_drive_id=row['id'], check_date=today, comment=None)
+        for row in disk_changed
+        if _changed(row, originals[(disk_table.name, row['id'])], disk_state)
+        or originals[(disk_table.name, row['id'])]['health_check_date'] != today
+    ])
+    _bulk_update(gpu_table, _GPU_UPDATE, changed_rows(gpu_table, _GPU_UPDATE, gpu_updates.values()))
+    _bulk_insert(gpu_table, gpu_inserts)
+    _bulk_update(memory_table, _MEMORY_UPDATE, changed_rows(memory_table, _MEMORY_UPDATE, memory_updates.values()))
+    _bulk_insert(memory_table, memory_inserts)
+    _bulk_insert(MachineHistory.__table__, machine_history)
+    # Раздел с ошибками не запоминаем: повторный отчет за день обработается снова
+    failed = {section for section, errors in (('disks', disk_errors), ('graphics_cards', gpu_errors),
+                                              ('memory_modules', memory_errors)) if errors}
+    _save_states(machine.id, {section: fingerprint for section, fingerprint in fingerprints.items()
+                              if section not in skipped and section not in failed}, today)
+
+    print(f"API v2: Machine {hostname} {machine_status}, Disks: new={disk_new}, updated={disk_updated}, "
+          f"Graphics: new={gpu_new}, updated={gpu_updated}, Memory: new={memory_new}, updated={memory_updated}, "
+          f"skipped: {', '.join(sorted(skipped)) or '-'}")
+    return {
+        'success': True,
+        'machine': {
+            'id': machine.id,
+            'hostname': machine.hostname,
+            'status': machine_status,
+            'message': f'Machine information {machine_status}',
+            'skipped': machine_skipped
+        },
+        'disks': _section_result(reported['disks'], disk_new, disk_updated, disk_errors,
+                                 disk_unchanged, 'disks' in skipped),
+        'graphics_cards': _section_result(reported['graphics_cards'], gpu_new, gpu_updated, gpu_errors,
+                                          gpu_unchanged, 'graphics_cards' in skipped),
+        'memory_modules': _section_result(reported['memory_modules'], memory_new, memory_updated, memory_errors,
+                                          memory_unchanged, 'memory_modules' in skipped),
+        'skipped_sections': [section for section in SECTIONS if section in skipped],
+        'timestamp': datetime.utcnow().isoformat() + 'Z'
+    }
+
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь отчетов агентов сбора (таблица ingest_queue).
+
+В режиме INGEST_MODE=queue маршруты /api/hdd_collect и /api/hdd_collect/v2 только
+проверяют отчет, записывают его в очередь и отвечают 202 с номером квитанции —
+рабочие процессы gunicorn не заняты записью комплектующих во время массового
+входа пользователей. Отчеты применяет отдельный обработчик (можно запустить
+несколько):
+
+    flask --app app ingest-worker
+
+Обработчик забирает отчеты пачками. Из нескольких отчетов одной машины
+(source_key: MAC-адрес для v2, hostname для v1) применяется только последний,
+остальные получают статус superseded со ссылкой на него. Пока отчеты машины
+обрабатываются одним обработчиком, другие ее отчеты не забирают — более старый
+отчет не перезапишет более новый.
+
+Состояние квитанции: /api/hdd_collect/receipts/<receipt>, состояние очереди:
+/api/hdd_collect/queue. При глубине очереди INGEST_QUEUE_MAX и более новые
+отчеты не принимаются (ответ 503 с Retry-After).
+"""
+import json
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, or_, select
+
+from models import IngestReceipt, db
+
+from .hdd_ingest import apply_v1_payload, apply_v2_payload, validate_v2_payload
+
+# Режим приема отчетов: 'inline' — запись в запросе, 'queue' — через очередь
+INGEST_MODE = os.environ.get('INGEST_MODE', 'inline').strip().lower()
+
+# Глубина очереди, при которой новые отчеты отклоняются (503)
+INGEST_QUEUE_MAX = int(os.environ.get('INGEST_QUEUE_MAX', 5000))
+
+# Сколько отчетов обработчик забирает за раз
+INGEST_BATCH = int(os.environ.get('INGEST_BATCH', 50))
+
+# Пауза обработчика при пустой очереди (секунды)
+INGEST_WORKER_POLL = float(os.environ.get('INGEST_WORKER_POLL', 1))
+
+# Сколько дней хранить обработанные квитанции
+INGEST_RETENTION_DAYS = int(os.environ.get('INGEST_RETENTION_DAYS', 3))
+
+# Отчет в статусе processing дольше этого времени (секунды) возвращается в очередь
+PROCESSING_TIMEOUT = 300
+
+# Сколько раз пытаться применить отчет, прежде чем пометить его как failed
+MAX_ATTEMPTS = 3
+
+STATUSES = ('queued', 'processing', 'done', 'superseded', 'failed')
+
+_APPLY = {'v1': apply_v1_payload, 'v2': apply_v2_payload}
+
+
+class IngestQueueFull(Exception):
+    """Очередь переполнена; stats — состояние очереди для ответа 503."""
+
+    def __init__(self, stats):
+        super().__init__('Ingest queue is full')
+        self.stats = stats
+
+
+def ingest_queued():
+    """Принимать ли отчеты агентов через очередь."""
+    return INGEST_MODE == 'queue'
+
+
+def _source_key(api, data):
+    """Ключ схлопывания повторных отчетов одной машины (проверяет отчет v2)."""
+    if api == 'v2':
+        _, mac_address = validate_v2_payload(data)
+        return f'mac:{mac_address}'
+    if not data:
+        raise ValueError('No data provided')
+    hostname = (data.get('hostname') or '').strip().lower()
+    return f'host:{hostname}'[:255] if hostname else None
+
+
+def queue_stats():
+    """
+    Состояние очереди (для ответов агентам и мониторинга).
+
+    Returns:
+        dict: depth, processing, oldest_age_seconds, limit, accepting, retry_after
+    """
+    counts = dict(db.session.query(IngestReceipt.status, func.count(IngestReceipt.id)).filter(
+        IngestReceipt.status.in_(('queued', 'processing'))
+    ).group_by(IngestReceipt.status).all())
+    depth = counts.get('queued', 0)
+    oldest = db.session.query(func.min(IngestReceipt.received_at)).filter(
+        IngestReceipt.status == 'queued'
+    ).scalar() if depth else None
+    oldest_age = max(0, int((datetime.utcnow() - oldest).total_seconds())) if oldest else 0
+    return {
+        'depth': depth,
+        'processing': counts.get('processing', 0),
+        'oldest_age_seconds': oldest_age,
+        'limit': INGEST_QUEUE_MAX,
+        'accepting': depth < INGEST_QUEUE_MAX,
+        # Подсказка агенту, через сколько секунд повторить отправку при отказе
+        'retry_after': max(30, min(oldest_age, 600)),
+    }
+
+
+def enqueue_payload(api, data):
+    """
+    Проверяет отчет и ставит его в очередь.
+
+    Raises:
+        ValueError: некорректный отчет (ответ 400)
+        IngestQueueFull: очередь переполнена (ответ 503)
+
+    Returns:
+        tuple: (IngestReceipt, состояние очереди)
+    """
+    source_key = _source_key(api, data)
+    stats = queue_stats()
+    if not stats['accepting']:
+        raise IngestQueueFull(stats)
+    receipt = IngestReceipt(receipt=uuid.uuid4().hex, api=api, source_key=source_key,
+                            payload=json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+                            status='queued')
+    db.session.add(receipt)
+    db.session.commit()
+    stats['depth'] += 1
+    return receipt, stats
+
+
+def receipt_status(receipt):
+    """Состояние квитанции для JSON-ответа."""
+    superseded_by = None
+    if receipt.superseded_by:
+        superseded_by = db.session.query(IngestReceipt.receipt).filter(
+            IngestReceipt.id == receipt.superseded_by
+        ).scalar()
+    return {
+        'receipt': receipt.receipt,
+        'api': receipt.api,
+        'status': receipt.status,
+        'received_at': receipt.received_at.isoformat() + 'Z' if receipt.received_at else None,
+        'started_at': receipt.started_at.isoformat() + 'Z' if receipt.started_at else None,
+        'finished_at': receipt.finished_at.isoformat() + 'Z' if receipt.finished_at else None,
+        'queue_position': _queue_position(receipt) if receipt.status == 'queued' else None,
+        'superseded_by': superseded_by,
+        'result': json.loads(receipt.result) if receipt.result else None,
+        'error': receipt.error if receipt.status == 'failed' else None,
+    }
+
+
+def _queue_position(receipt):
+    return IngestReceipt.query.filter(IngestReceipt.status == 'queued', IngestReceipt.id < receipt.id).count() + 1
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _requeue_stale():
+    """Возвращает в очередь отчеты, обработчик которых пропал (или помечает их failed)."""
+    deadline = datetime.utcnow() - timedelta(seconds=PROCESSING_TIMEOUT)
+    table = IngestReceipt.__table__
+    db.session.execute(table.update().where(
+        table.c.status == 'processing', table.c.started_at < deadline, table.c.attempts >= MAX_ATTEMPTS
+    ).values(status='failed', finished_at=datetime.utcnow(), error='Превышено время обработки отчета'))
+    db.session.execute(table.update().where(
+        table.c.status == 'processing', table.c.started_at < deadline
+    ).values(status='queued', worker=None))
+    db.session.commit()
+
+
+def _busy_sources(worker=None):
+    """Подзапрос source_key машин, отчеты которых в обработке (кроме отчетов worker)."""
+    table = IngestReceipt.__table__
+    condition = [table.c.status == 'processing', table.c.source_key.isnot(None)]
+    if worker is not None:
+        condition.append(table.c.worker != worker)
+    # Производная таблица с DISTINCT: MySQL не дает читать изменяемую таблицу
+    # в подзапросе UPDATE напрямую (ошибка 1093) и не сливает такую таблицу с внешним запросом
+    busy = select(table.c.source_key).where(*condition).distinct().subquery('busy')
+    return select(busy.c.source_key)
+
+
+def claim_batch(worker=None, limit=INGEST_BATCH):
+    """
+    Забирает пачку отчетов из очереди вместе со всеми ожидающими отчетами тех же
+    машин. Машины, отчеты которых сейчас обрабатывает другой обработчик, пропускаются.
+
+    Занятость машины проверяется и при выборе кандидатов, и в самом UPDATE. Если
+    два обработчика все же забрали отчеты одной машины одновременно, после commit
+    каждый проверяет это снова: тот, кто видит чужие отчеты машины в обработке,
+    возвращает свои в очередь — более старый отчет не перезапишет более новый.
+
+    Returns:
+        list[IngestReceipt]: отчеты, доставшиеся этому обработчику
+    """
+    worker = worker or _worker_name()
+    table = IngestReceipt.__table__
+    candidates = db.session.query(IngestReceipt.id, IngestReceipt.source_key).filter(
+        IngestReceipt.status == 'queued',
+        or_(IngestReceipt.source_key.is_(None), IngestReceipt.source_key.notin_(_busy_sources())),
+    ).order_by(IngestReceipt.id).limit(limit).all()
+    if not candidates:
+        db.session.commit()
+        return []
+    ids = [receipt_id for receipt_id, _ in candidates]
+    keys = {source_key for _, source_key in candidates if source_key}
+    condition = table.c.id.in_(ids)
+    if keys:
+        condition = or_(condition, table.c.source_key.in_(keys))
+    db.session.execute(table.update().where(
+        table.c.status == 'queued', condition,
+        or_(table.c.source_key.is_(None), table.c.source_key.notin_(_busy_sources())),
+    ).values(
+        status='processing', worker=worker, started_at=datetime.utcnow(), attempts=table.c.attempts + 1
+    ))
+    db.session.commit()
+
+    if keys:
+        conflicts = [key for key, in db.session.execute(_busy_sources(worker)) if key in keys]
+        if conflicts:
+            db.session.execute(table.update().where(
+                table.c.status == 'processing', table.c.worker == worker, table.c.source_key.in_(conflicts)
+            ).values(status='queued', worker=None, attempts=table.c.attempts - 1))
+            db.session.commit()
+    return IngestReceipt.query.filter(
+        table.c.status == 'processing', table.c.worker == worker, condition
+    ).order_by(IngestReceipt.id).all()
+
+
+def _coalesce(receipts):
+    """
+    Группирует отчеты по машине.
+
+    Returns:
+        tuple: (отчеты для применения, {id схлопнутого отчета: id применяемого})
+    """
+    latest = {}
+    superseded = {}
+    for receipt in receipts:
+        key = receipt.source_key or f'id:{receipt.id}'
+        previous = latest.get(key)
+        if previous is not None:
+            superseded[previous.id] = receipt.id
+        latest[key] = receipt
+    # Отчеты, схлопнутые ранее в уже схлопнутый, ссылаются на итоговый
+    for receipt_id, target in superseded.items():
+        while target in superseded:
+            target = superseded[target]
+        superseded[receipt_id] = target
+    return sorted(latest.values(), key=lambda r: r.id), superseded
+
+
+def process_batch(receipts):
+    """
+    Применяет пачку отчетов: по одному последнему на машину, каждый в своей
+    точке сохранения (ошибка одного отчета не отменяет остальные), один commit на пачку.
+
+    Returns:
+        dict: applied, superseded, failed
+    """
+    to_apply, superseded = _coalesce(receipts)
+    now = datetime.utcnow()
+    outcomes = []
+    failed = 0
+    for receipt in to_apply:
+        try:
+            with db.session.begin_nested():
+                result = _APPLY[receipt.api](json.loads(receipt.payload))
+            outcomes.append({'b_id': receipt.id, 'b_status': 'done', 'b_superseded_by': None,
+                             'b_result': json.dumps(result, ensure_ascii=False, default=str), 'b_error': None})
+        except Exception as e:
+            failed += 1
+            print(f"Ошибка применения отчета {receipt.receipt} ({receipt.api}): {e}")
+            print(traceback.format_exc())
+            outcomes.append({'b_id': receipt.id, 'b_status': 'failed', 'b_superseded_by': None,
+                             'b_result': None, 'b_error': f'{e.__class__.__name__}: {e}'})
+    for receipt_id, target in superseded.items():
+        outcomes.append({'b_id': receipt_id, 'b_status': 'superseded', 'b_superseded_by': target,
+                         'b_result': None, 'b_error': None})
+
+    table = IngestReceipt.__table__
+    if outcomes:
+        db.session.execute(table.update().where(table.c.id == bindparam('b_id')).values(
+            status=bindparam('b_status'), superseded_by=bindparam('b_superseded_by'),
+            result=bindparam('b_result'), error=bindparam('b_error'), finished_at=now,
+        ), outcomes)
+    db.session.commit()
+    return {'applied': len(to_apply) - failed, 'superseded': len(superseded), 'failed': failed}
+
+
+def cleanup_receipts(retention_days=INGEST_RETENTION_DAYS):
+    """Удаляет обработанные квитанции старше retention_days. Возвращает число удаленных."""
+    deadline = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.session.execute(IngestReceipt.__table__.delete().where(
+        IngestReceipt.status.in_(('done', 'superseded', 'failed')), IngestReceipt.finished_at < deadline
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def run_ingest_worker(once=False, batch=INGEST_BATCH, poll_interval=INGEST_WORKER_POLL):
+    """
+    Цикл обработчика очереди отчетов. Вызывается из CLI-команды ingest-worker
+    в контексте приложения.
+
+    Args:
+        once: обработать текущую очередь и завершиться
+        batch: сколько отчетов забирать за раз
+        poll_interval: пауза при пустой очереди (секунды)
+    """
+    worker = _worker_name()
+    print(f"Обработчик отчетов агентов {worker} запущен, пачка: {batch}")
+    last_stale_check = last_cleanup = 0
+    while True:
+        if time.time() - last_stale_check > 60:
+            _requeue_stale()
+            last_stale_check = time.time()
+        if time.time() - last_cleanup > 3600:
+            removed = cleanup_receipts()
+            if removed:
+                print(f"Удалено обработанных квитанций: {removed}")
+            last_cleanup = time.time()
+
+        receipts = claim_batch(worker, batch)
+        if not receipts:
+            db.session.remove()
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        started = time.time()
+        try:
+            summary = process_batch(receipts)
+            print(f"Отчетов: {len(receipts)}, применено: {summary['applied']}, "
+                  f"схлопнуто: {summary['superseded']}, ошибок: {summary['failed']}, "
+                  f"за {time.time() - started:.1f} с")
+        except Exception as e:
+            # Отчеты останутся в processing и вернутся в очередь по таймауту
+            db.session.rollback()
+            print(f"Ошибка обработки пачки отчетов: {e}")
+            print(traceback.format_exc())
+        db.session.remove()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Инвентаризация помещений и отделов по сеансам (таблицы inventory_audits и
+inventory_audit_scans).
+
+Пользователь открывает сеанс для помещения и (или) отдела; МОЛ — только по
+своим ТМЦ. Сканер присылает коды (штрихкоды или инвентарные номера) пачками.
+Пачка записывается одним INSERT, повторно отсканированные коды отбрасываются
+уникальным ключом (сеанс, код), поэтому несколько сканеров могут работать
+параллельно. Коды сравниваются без учета регистра, а в итоге сверки
+показываются так, как были отсканированы впервые.
+
+Сверка выполняется в памяти операциями над множествами: ТМЦ, которые числятся
+в помещении (отделе), загружаются одним запросом и раскладываются по кодам;
+отсканированные коды — вторым запросом. Результат:
+- found — ТМЦ, код которых отсканирован;
+- missing — числятся, но не отсканированы;
+- unexpected — отсканированные коды ТМЦ, которые числятся в другом месте
+  (карточки — через services/code_lookup.py одним запросом на пачку кодов);
+- unknown — коды, которых нет в учете.
+
+При закрытии сеанса итог сверки сохраняется и дальше не меняется; по нему
+формируется PDF (сличительная ведомость) через очередь отчетов
+(services/report_jobs.py, import_export.pdf_export.build_audit_pdf).
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from import_export.pdf_export import audit_filenames, build_audit_pdf
+from models import Equipment, InventoryAudit, InventoryAuditScan, Users, db
+
+from .code_lookup import card_query, code_key, equipment_card, lookup_codes
+from .report_jobs import register_report
+
+# Максимум кодов в одной пачке сканирования
+AUDIT_SCAN_BATCH = 1000
+
+# Максимальная длина кода (колонка inventory_audit_scans.code)
+_CODE_MAX_LENGTH = 100
+
+# Размер пачки кодов в одном IN-запросе
+_CHUNK = 500
+
+
+class AuditClosed(Exception):
+    """Сеанс инвентаризации уже закрыт — коды не принимаются."""
+
+
+def open_audit(place_id=None, department_id=None, user_id=None, created_by=None):
+    """
+    Открывает сеанс инвентаризации (commit).
+
+    Args:
+        place_id, department_id: проверяемые помещение и (или) отдел (хотя бы одно)
+        user_id: только ТМЦ этого МОЛ (None — все ТМЦ помещения / отдела)
+        created_by: кто открыл сеанс
+    """
+    if not place_id and not department_id:
+        raise ValueError('Укажите помещение или отдел')
+    audit = InventoryAudit(place_id=place_id or None, department_id=department_id or None,
+                           user_id=user_id, created_by=created_by, status='open')
+    db.session.add(audit)
+    db.session.commit()
+    return audit
+
+
+def expected_cards(audit):
+    """Карточки активных ТМЦ, которые числятся в помещении (отделе) сеанса, по id."""
+    query = card_query().filter(Equipment.active == True)
+    if audit.place_id:
+        query = query.filter(Equipment.placesid == audit.place_id)
+    if audit.department_id:
+        query = query.filter(Equipment.department_id == audit.department_id)
+    if audit.user_id:
+        query = query.filter(Equipment.usersid == audit.user_id)
+    return [equipment_card(row) for row in query.order_by(Equipment.id)]
+
+
+def _codes_index(cards):
+    """{ключ кода: [id ТМЦ]} по штрихкодам и инвентарным номерам."""
+    index = {}
+    for card in cards:
+        for key in {code_key(card['shtrihkod']), code_key(card['invnum'])}:
+            if key:
+                index.setdefault(key, []).append(card['id'])
+    return index
+
+
+def _scanned_codes(audit_id, keys=None):
+    """Отсканированные коды (ключи code_key) сеанса (все или только из keys)."""
+    query = db.session.query(InventoryAuditScan.code).filter(InventoryAuditScan.audit_id == audit_id)
+    if keys is None:
+        return {code for code, in query}
+    keys = sorted(keys)
+    scanned = set()
+    for start in range(0, len(keys), _CHUNK):
+        scanned.update(code for code, in query.filter(InventoryAuditScan.code.in_(keys[start:start + _CHUNK])))
+    return scanned
+
+
+def _scanned_spellings(audit_id):
+    """{ключ кода: код как отсканирован впервые} для всех кодов сеанса."""
+    return dict(db.session.query(InventoryAuditScan.code, InventoryAuditScan.scanned_code)
+                .filter(InventoryAuditScan.audit_id == audit_id))
+
+
+def _summary(expected, index, scanned):
+    found = {equipment_id for key in scanned if key in index for equipment_id in index[key]}
+    other = sum(1 for key in scanned if key not in index)
+    return {
+        'expected': len(expected),
+        'scanned': len(scanned),
+        'found': len(found),
+        'missing': len(expected) - len(found),
+        'other': other,
+    }
+
+
+def add_scans(audit, codes, user_id=None):
+    """
+    Принимает пачку отсканированных кодов (commit).
+
+    Returns:
+        dict: accepted (новых кодов), duplicates (уже отсканированные коды),
+        codes ({код: 'found' | 'unexpected' | 'unknown' | 'invalid'} — для сигнала
+        сканеру) и summary (числится, отсканировано, найдено, не найдено, прочих кодов)
+    """
+    if audit.status != 'open':
+        raise AuditClosed(f'Инвентаризация {audit.id} закрыта')
+
+    keys = {}
+    spellings = {}
+    invalid = []
+    for code in codes:
+        key = code_key(code)
+        if not key:
+            continue
+        if len(key) > _CODE_MAX_LENGTH:
+            invalid.append(code)
+            continue
+        keys.setdefault(code, key)
+        # Для показа — первое написание кода в пачке
+        spellings.setdefault(key, str(code).strip()[:_CODE_MAX_LENGTH])
+    batch = set(keys.values())
+
+    duplicates = set()
+    new = set()
+    for attempt in range(2):
+        duplicates = _scanned_codes(audit.id, batch)
+        new = batch - duplicates
+        if new:
+            now = datetime.utcnow()
+            db.session.execute(InventoryAuditScan.__table__.insert(), [
+                {'audit_id': audit.id, 'code': key, 'scanned_code': spellings[key],
+                 'scanned_at': now, 'scanned_by': user_id}
+                for key in sorted(new)
+            ])
+        # Счетчик увеличивается в SQL: пачки разных сканеров не затирают друг друга
+        audit.scans_received = InventoryAudit.scans_received + len(keys)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Те же коды одновременно записала другая пачка — перечитываем отсканированные
+            db.session.rollback()
+            if attempt:
+                raise
+
+    expected = expected_cards(audit)
+    index = _codes_index(expected)
+    statuses = {code: 'invalid' for code in invalid}
+    other = {code: key for code, key in keys.items() if key not in index}
+    cards = lookup_codes(list(other), record_stats=False) if other else {}
+    for code, key in keys.items():
+        if key in index:
+            statuses[code] = 'found'
+        else:
+            statuses[code] = 'unexpected' if cards.get(code) else 'unknown'
+
+    return {
+        'accepted': len(new),
+        'duplicates': sorted(code for code, key in keys.items() if key in duplicates),
+        'codes': statuses,
+        'summary': _summary(expected, index, _scanned_codes(audit.id)),
+    }
+
+
+def reconcile_audit(audit):
+    """
+    Итог сверки: found, missing (карточки ТМЦ), unexpected ({'code', 'items'}),
+    unknown (коды) и summary. Для закрытого сеанса — сохраненный итог.
+    """
+    if audit.status == 'closed' and audit.result:
+        return json.loads(audit.result)
+
+    expected = expected_cards(audit)
+    index = _codes_index(expected)
+    scanned = _scanned_spellings(audit.id)
+
+    found_ids = {equipment_id for key in scanned.keys() & index.keys() for equipment_id in index[key]}
+    other = sorted(scanned.keys() - index.keys())
+    cards = lookup_codes(other, record_stats=False) if other else {}
+
+    summary = _summary(expected, index, scanned)
+    # Коды сравниваются по ключу, показываются как отсканированы
+    unexpected = [{'code': scanned[key], 'items': cards[key]} for key in other if cards.get(key)]
+    unknown = [scanned[key] for key in other if not cards.get(key)]
+    summary.update(unexpected=len(unexpected), unknown=len(unknown))
+    return {
+        'found': [card for card in expected if card['id'] in found_ids],
+        'missing': [card for card in expected if card['id'] not in found_ids],
+        'unexpected': unexpected,
+        'unknown': unknown,
+        'summary': summary,
+    }
+
+
+def close_audit(audit):
+    """Закрывает сеанс и сохраняет итог сверки (commit). Возвращает итог."""
+    if audit.status == 'closed':
+        return reconcile_audit(audit)
+    result = reconcile_audit(audit)
+    audit.result = json.dumps(result, ensure_ascii=False)
+    audit.status = 'closed'
+    audit.closed_at = datetime.utcnow()
+    db.session.commit()
+    return result
+
+
+def audit_status(audit):
+    """Состояние сеанса для JSON-ответа."""
+    return {
+        'id': audit.id,
+        'place_id': audit.place_id,
+        'department_id': audit.department_id,
+        'user_id': audit.user_id,
+        'status': audit.status,
+        'created_at': audit.created_at.isoformat() if audit.created_at else None,
+        'closed_at': audit.closed_at.isoformat() if audit.closed_at else None,
+        'scans_received': audit.scans_received,
+    }
+
+
+def audit_params(audit):
+    """Параметры отчета по сеансу (для очереди отчетов)."""
+    return {'audit_id': audit.id, 'user_id': audit.user_id}
+
+
+@register_report('inventory_audit', scopes=lambda params: [])
+def render_inventory_audit(params, output):
+    """Формирует PDF итога закрытого сеанса в output и возвращает имя файла для скачивания."""
+    audit = db.session.get(InventoryAudit, params['audit_id'])
+    if audit is None:
+        raise ValueError(f"Инвентаризация {params['audit_id']} не найдена")
+    if audit.status != 'closed':
+        raise ValueError(f'Инвентаризация {audit.id} еще не закрыта')
+    user = db.session.get(Users, audit.user_id) if audit.user_id else None
+    build_audit_pdf(output, audit, reconcile_audit(audit),
+                    audit.place.name if audit.place else '',
+                    audit.department.name if audit.department else '',
+                    user.login if user else '')
+    return audit_filenames(audit)[1]
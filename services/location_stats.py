@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Количество и стоимость ТМЦ по отделам и помещениям для страниц my_departments
+и my_places.
+
+Счетчики всех отделов (помещений) считаются одним запросом с GROUP BY вместо
+пары запросов count() и SUM(cost) на каждый отдел. Администратор видит все
+активные отделы (помещения), в том числе без ТМЦ; МОЛ — только те, где есть
+его ТМЦ, и только по своим ТМЦ.
+
+Результат хранится в памяти процесса LOCATION_STATS_TTL секунд: для МОЛ — по
+пользователю, для администраторов — общий. Запись сбрасывается после коммита,
+изменившего размещение, владельца, стоимость или статус ТМЦ (перемещения),
+записи move, названия или активность отделов и помещений. В других воркерах
+gunicorn устаревшее значение живет не дольше TTL.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import and_, func, inspect
+
+from models import Department, Equipment, Move, Places, db
+
+from .cache_invalidation import ALL, CacheInvalidation, attr_values
+
+LOCATION_STATS_TTL = int(os.getenv('LOCATION_STATS_TTL', '30'))
+
+# Отдел или помещение в кэше (вместо объекта ORM, привязанного к сессии)
+Location = namedtuple('Location', 'id name active')
+
+# Поля ТМЦ, от которых зависят счетчики
+_EQUIPMENT_FIELDS = ('placesid', 'department_id', 'usersid', 'cost', 'active', 'os')
+
+_cache = {}  # (вид, id пользователя или None для администраторов) -> (время истечения, строки)
+_lock = threading.Lock()
+
+# Специальное значение: сбросить счетчики администраторов
+_ADMINS = 'admins'
+
+
+def _compute(model, column, user):
+    """Строки {'location', 'tmc_count', 'total_cost'} по убыванию суммы, при равенстве — по названию."""
+    equipment_on = and_(column == model.id, Equipment.active == True, Equipment.os == True)
+    query = db.session.query(
+        model.id, model.name, model.active,
+        func.count(Equipment.id),
+        func.coalesce(func.sum(Equipment.cost), 0),
+    )
+    if user.mode == 1:
+        query = query.outerjoin(Equipment, equipment_on)
+    else:
+        query = query.join(Equipment, and_(equipment_on, Equipment.usersid == user.id))
+    query = query.filter(model.active == True)\
+        .group_by(model.id, model.name, model.active)\
+        .order_by(model.name, model.id)
+
+    rows = [{
+        'location': Location(location_id, name, active),
+        'tmc_count': tmc_count or 0,
+        'total_cost': float(total_cost) if total_cost else 0.0,
+    } for location_id, name, active, tmc_count, total_cost in query]
+    # Сортировка по убыванию суммы (от большей к меньшей); порядок по названию сохраняется
+    rows.sort(key=lambda row: row['total_cost'], reverse=True)
+    return rows
+
+
+def _cached(kind, model, column, user):
+    key = (kind, None if user.mode == 1 else user.id)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+    rows = _compute(model, column, user)
+    with _lock:
+        _cache[key] = (now + LOCATION_STATS_TTL, rows)
+    return rows
+
+
+def get_department_stats(user):
+    """
+    Счетчики по отделам для пользователя.
+
+    Returns:
+        list: dict с ключами department (Location), tmc_count, total_cost
+    """
+    return [{'department': row['location'], 'tmc_count': row['tmc_count'], 'total_cost': row['total_cost']}
+            for row in _cached('departments', Department, Equipment.department_id, user)]
+
+
+def get_place_stats(user):
+    """
+    Счетчики по помещениям для пользователя.
+
+    Returns:
+        list: dict с ключами place (Location), tmc_count, total_cost
+    """
+    return [{'place': row['location'], 'tmc_count': row['tmc_count'], 'total_cost': row['total_cost']}
+            for row in _cached('places', Places, Equipment.placesid, user)]
+
+
+def invalidate_location_stats(user_id=None):
+    """Сбрасывает счетчики пользователя (или весь кэш, если user_id не указан)."""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+            return
+        for key in [key for key in _cache if key[1] == user_id]:
+            del _cache[key]
+
+
+def _invalidate_admins():
+    with _lock:
+        for key in [key for key in _cache if key[1] is None]:
+            del _cache[key]
+
+
+def _equipment_changed(session, obj):
+    if obj in session.new or obj in session.deleted:
+        return True
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in _EQUIPMENT_FIELDS)
+
+
+def _changed_users(session, obj):
+    """Пользователи, чьи счетчики затронуты изменением объекта."""
+    if isinstance(obj, Equipment):
+        return attr_values(obj, 'usersid') | {_ADMINS} if _equipment_changed(session, obj) else None
+    if isinstance(obj, Move):
+        return {value for value in (obj.useridfrom, obj.useridto) if value is not None} | {_ADMINS}
+    return {ALL}
+
+
+def _apply_invalidation(user_ids):
+    if user_ids is None:
+        invalidate_location_stats()
+        return
+    if _ADMINS in user_ids:
+        _invalidate_admins()
+    for user_id in user_ids - {_ADMINS}:
+        invalidate_location_stats(user_id)
+
+
+_invalidation = CacheInvalidation('location_stats_pending', (Equipment, Move, Department, Places),
+                                  _changed_users, _apply_invalidation)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Сводка по компьютерам (Machine), привязанным к набору ТМЦ.
+
+Для карточки наименования: самая частая ОС, материнская плата, видеокарта,
+модель диска и конфигурация модуля памяти с долей в процентах. Все считается
+сгруппированными запросами в БД; набор ТМЦ передается подзапросом ID,
+поэтому ни машины, ни комплектующие в память не загружаются.
+"""
+from sqlalchemy import String, cast, func
+
+from models import Machine, PCGraphicsCard, PCHardDrive, PCMemoryModule, db
+
+
+def _percent(part, total):
+    return round(part / total * 100, 1) if total else 0
+
+
+def _count(query):
+    return query.with_entities(func.count()).scalar() or 0
+
+
+def _most_common(label_expr, query):
+    """Самое частое непустое значение выражения в запросе: строка (value, cnt) или None."""
+    return query.with_entities(label_expr.label('value'), func.count().label('cnt'))\
+        .filter(label_expr.isnot(None), label_expr != '')\
+        .group_by(label_expr)\
+        .order_by(func.count().desc(), label_expr)\
+        .first()
+
+
+def _summary(top, total):
+    return {
+        'name': top.value if top else None,
+        'percent': _percent(top.cnt, total) if top else 0,
+    }
+
+
+def build_machine_stats(equipment_ids):
+    """
+    Args:
+        equipment_ids: подзапрос ID ТМЦ (например, EquipmentFilter.ids_subquery())
+
+    Returns:
+        dict или None, если машин нет: total_machines и по ключам os, motherboard,
+        graphics_card, hard_drive, memory — {'name', 'percent'}
+    """
+    machines = db.session.query(Machine).filter(Machine.equipment_id.in_(equipment_ids))
+    total_machines = _count(machines)
+    if not total_machines:
+        return None
+    machine_ids = machines.with_entities(Machine.id).scalar_subquery()
+
+    # ОС: название и версия через пробел; машины без названия ОС не учитываются
+    os_label = func.trim(Machine.os_name + ' ' + func.coalesce(Machine.os_version, ''))
+    os_top = _most_common(os_label, machines.filter(Machine.os_name.isnot(None), Machine.os_name != ''))
+    mb_top = _most_common(Machine.motherboard, machines)
+
+    gpus = db.session.query(PCGraphicsCard).filter(PCGraphicsCard.machine_id.in_(machine_ids),
+                                                   PCGraphicsCard.active == True)
+    hdds = db.session.query(PCHardDrive).filter(PCHardDrive.machine_id.in_(machine_ids),
+                                                PCHardDrive.active == True)
+    modules = db.session.query(PCMemoryModule).filter(PCMemoryModule.machine_id.in_(machine_ids),
+                                                      PCMemoryModule.active == True)
+    # ОЗУ: комбинация объема и типа памяти («8GB DDR4»)
+    ram_label = func.trim(cast(PCMemoryModule.capacity_gb, String) + 'GB '
+                          + func.coalesce(PCMemoryModule.memory_type, ''))
+    ram_top = _most_common(ram_label, modules.filter(PCMemoryModule.capacity_gb.isnot(None),
+                                                     PCMemoryModule.capacity_gb != 0))
+
+    return {
+        'total_machines': total_machines,
+        'os': _summary(os_top, total_machines),
+        'motherboard': _summary(mb_top, total_machines),
+        'graphics_card': _summary(_most_common(PCGraphicsCard.model, gpus), _count(gpus)),
+        'hard_drive': _summary(_most_common(PCHardDrive.model, hdds), _count(hdds)),
+        'memory': _summary(ram_top, _count(modules)),
+    }
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая проверка доступности сетевых устройств (таблица device_status).
+
+Страницы мониторинга больше не запускают ping внутри HTTP-запроса: отдельный
+процесс опрашивает все устройства по расписанию и записывает последний
+результат по каждому ТМЦ, а страницы только читают этот снимок:
+
+    flask --app app network-monitor
+
+Проверка одного устройства — асинхронные TCP-подключения к MONITOR_TCP_PORTS
+и (если доступна команда ping) ICMP-эхо одновременно; устройство в сети,
+если ответила хотя бы одна проверка. Число одновременных проверок ограничено
+MONITOR_CONCURRENCY, время ожидания ответа — MONITOR_TIMEOUT.
+"""
+import asyncio
+import os
+import platform
+import shutil
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from models import DeviceStatus, Equipment, GroupNome, Nome, db
+
+from .uptime import cleanup_uptime, record_cycle
+
+# Период опроса всех устройств (секунды)
+MONITOR_INTERVAL = float(os.environ.get('MONITOR_INTERVAL', 60))
+
+# Сколько устройств проверяется одновременно
+MONITOR_CONCURRENCY = int(os.environ.get('MONITOR_CONCURRENCY', 200))
+
+# Время ожидания ответа одной проверки (секунды)
+MONITOR_TIMEOUT = float(os.environ.get('MONITOR_TIMEOUT', 1.0))
+
+# TCP-порты, подключение к которым означает «устройство в сети»
+MONITOR_TCP_PORTS = tuple(
+    int(port) for port in os.environ.get('MONITOR_TCP_PORTS', '80,443,22').split(',') if port.strip()
+)
+
+# Проверять ли ICMP (команда ping); без нее остаются только TCP-подключения
+MONITOR_ICMP = os.environ.get('MONITOR_ICMP', '1') == '1'
+
+_PING = shutil.which('ping') if MONITOR_ICMP else None
+_IS_WINDOWS = platform.system().lower() == 'windows'
+
+_UPSERT_BATCH = 500
+
+
+def network_devices_query():
+    """Активные основные средства с IP из групп сетевых устройств."""
+    return db.session.query(Equipment).join(
+        Nome, Equipment.nomeid == Nome.id
+    ).join(
+        GroupNome, Nome.groupid == GroupNome.id
+    ).filter(
+        Equipment.active == True,
+        Equipment.os == True,
+        Equipment.ip != '',
+        Equipment.ip.isnot(None),
+        GroupNome.is_network_device == True,
+    )
+
+
+def probe_targets():
+    """Устройства для проверки: список (ID ТМЦ, IP)."""
+    rows = network_devices_query().with_entities(Equipment.id, Equipment.ip).all()
+    return [(equipment_id, ip.strip()) for equipment_id, ip in rows if ip and ip.strip()]
+
+
+async def _tcp_check(ip, port, timeout):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return f'tcp:{port}'
+
+
+async def _icmp_check(ip, timeout):
+    if _IS_WINDOWS:
+        args = [_PING, '-n', '1', '-w', str(int(timeout * 1000)), ip]
+    else:
+        args = [_PING, '-c', '1', '-W', str(max(1, round(timeout))), ip]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+    try:
+        returncode = await asyncio.wait_for(process.wait(), timeout + 1)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None
+    return 'icmp' if returncode == 0 else None
+
+
+async def probe_host(ip, ports=MONITOR_TCP_PORTS, timeout=MONITOR_TIMEOUT, icmp=True):
+    """
+    Проверяет одно устройство: все проверки запускаются одновременно,
+    первый успешный ответ отменяет остальные.
+
+    Returns:
+        tuple: (в сети ли, способ проверки или None, время ответа в мс или None)
+    """
+    started = time.perf_counter()
+    checks = [asyncio.ensure_future(_tcp_check(ip, port, timeout)) for port in ports]
+    if icmp and _PING:
+        checks.append(asyncio.ensure_future(_icmp_check(ip, timeout)))
+    try:
+        for check in asyncio.as_completed(checks):
+            method = await check
+            if method:
+                return True, method, round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        for check in checks:
+            check.cancel()
+        await asyncio.gather(*checks, return_exceptions=True)
+    return False, None, None
+
+
+async def probe_all(targets, concurrency=MONITOR_CONCURRENCY, timeout=MONITOR_TIMEOUT):
+    """
+    Проверяет набор устройств с ограничением одновременных проверок.
+
+    Args:
+        targets: список (ID ТМЦ, IP)
+
+    Returns:
+        dict: {ID ТМЦ: (IP, в сети, способ, время ответа)}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(equipment_id, ip):
+        async with semaphore:
+            try:
+                online, method, latency = await probe_host(ip, timeout=timeout)
+            except Exception:
+                online, method, latency = False, None, None
+            return equipment_id, (ip, online, method, latency)
+
+    results = await asyncio.gather(*(probe(equipment_id, ip) for equipment_id, ip in targets))
+    return dict(results)
+
+
+def save_statuses(results, checked_at, interval=MONITOR_INTERVAL):
+    """
+    Записывает результаты проверки в device_status. Время смены состояния
+    (changed_at) переносится из предыдущей записи, если состояние не изменилось.
+    Строки устройств, которых больше нет в списке проверки, удаляются.
+    В той же транзакции пополняются история и агрегаты доступности (services/uptime.py);
+    interval — фактический период опроса (секунды).
+
+    Returns:
+        int: число устройств, сменивших состояние
+    """
+    table = DeviceStatus.__table__
+    previous = {equipment_id: (online, last_checked) for equipment_id, online, last_checked in
+                db.session.query(DeviceStatus.equipment_id, DeviceStatus.online, DeviceStatus.checked_at)}
+    changed = 0
+    rows = []
+    for equipment_id, (ip, online, method, latency) in results.items():
+        row = {'equipment_id': equipment_id, 'ip': ip, 'online': online, 'method': method,
+               'latency_ms': latency, 'checked_at': checked_at}
+        if equipment_id not in previous or previous[equipment_id][0] != online:
+            row['changed_at'] = checked_at
+            changed += 1
+        rows.append(row)
+
+    connection = db.session.connection()
+    for start in range(0, len(rows), _UPSERT_BATCH):
+        batch = rows[start:start + _UPSERT_BATCH]
+        # Строки без смены состояния обновляются без changed_at, остальные записываются целиком
+        updates = [row for row in batch if 'changed_at' not in row]
+        inserts = [row for row in batch if 'changed_at' in row]
+        if updates:
+            connection.execute(
+                table.update().where(table.c.equipment_id == bindparam('b_equipment_id')).values(
+                    ip=bindparam('b_ip'), online=bindparam('b_online'), method=bindparam('b_method'),
+                    latency_ms=bindparam('b_latency_ms'), checked_at=bindparam('b_checked_at'),
+                ),
+                [{f'b_{key}': value for key, value in row.items()} for row in updates],
+            )
+        if inserts:
+            if connection.dialect.name == 'mysql':
+                statement = mysql_insert(table)
+                connection.execute(statement.on_duplicate_key_update(
+                    ip=statement.inserted.ip, online=statement.inserted.online,
+                    method=statement.inserted.method, latency_ms=statement.inserted.latency_ms,
+                    checked_at=statement.inserted.checked_at, changed_at=statement.inserted.changed_at,
+                ), inserts)
+            else:
+                connection.execute(table.delete().where(
+                    table.c.equipment_id.in_([row['equipment_id'] for row in inserts])
+                ))
+                connection.execute(table.insert(), inserts)
+
+    gone = set(previous) - set(results)
+    if gone:
+        connection.execute(table.delete().where(table.c.equipment_id.in_(gone)))
+    # Промежутки длиннее трех периодов опроса не засчитываются в доступность
+    record_cycle(previous, results, checked_at, max_gap=interval * 3)
+    db.session.commit()
+    return changed
+
+
+def run_probe_cycle(interval=MONITOR_INTERVAL):
+    """
+    Один цикл опроса: список устройств, асинхронная проверка, запись результатов.
+    interval — период опроса, с которым запущен опросчик (секунды).
+
+    Returns:
+        dict: total, online, changed, duration (секунды)
+    """
+    started = time.time()
+    targets = probe_targets()
+    # Соединение не держим открытым на время проверки
+    db.session.remove()
+    checked_at = datetime.utcnow()
+    results = asyncio.run(probe_all(targets)) if targets else {}
+    changed = save_statuses(results, checked_at, interval)
+    return {
+        'total': len(results),
+        'online': sum(1 for _, online, _, _ in results.values() if online),
+        'changed': changed,
+        'duration': round(time.time() - started, 1),
+    }
+
+
+def run_monitor(once=False, interval=MONITOR_INTERVAL):
+    """
+    Цикл опросчика. Вызывается из CLI-команды network-monitor в контексте приложения.
+
+    Args:
+        once: выполнить один цикл и завершиться
+        interval: период опроса (секунды)
+    """
+    icmp = 'ICMP + TCP' if _PING else 'только TCP'
+    print(f"Мониторинг сети запущен: период {interval:g} с, одновременно {MONITOR_CONCURRENCY}, "
+          f"таймаут {MONITOR_TIMEOUT:g} с, {icmp} {','.join(map(str, MONITOR_TCP_PORTS))}")
+    last_cleanup = 0
+    while True:
+        started = time.time()
+        try:
+            summary = run_probe_cycle(interval)
+            print(f"Проверено устройств: {summary['total']}, в сети: {summary['online']}, "
+                  f"сменили состояние: {summary['changed']}, за {summary['duration']} с")
+            if time.time() - last_cleanup > 3600:
+                removed = cleanup_uptime()
+                if removed:
+                    print(f"Удалено устаревших часовых агрегатов доступности: {removed}")
+                last_cleanup = time.time()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка цикла мониторинга: {e}")
+        finally:
+            db.session.remove()
+        if once:
+            return
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+def device_statuses(equipment_ids):
+    """Последние результаты проверки: {ID ТМЦ: DeviceStatus}."""
+    equipment_ids = list(equipment_ids)
+    if not equipment_ids:
+        return {}
+    return {status.equipment_id: status for status in
+            DeviceStatus.query.filter(DeviceStatus.equipment_id.in_(equipment_ids)).all()}
+
+
+def snapshot_age(statuses):
+    """
+    Возраст снимка состояний в секундах — по самой старой проверке из набора
+    (None, если проверок еще не было).
+    """
+    if not statuses:
+        return None
+    oldest = min(status.checked_at for status in statuses)
+    return max(0, int((datetime.utcnow() - oldest).total_seconds()))
+
+
+def snapshot_is_stale(age):
+    """Снимок устарел: опросчик не обновлял его дольше трех периодов опроса."""
+    return age is None or age > MONITOR_INTERVAL * 3
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Поток смен состояния сетевых устройств для страниц мониторинга (Server-Sent Events).
+
+Источник событий — таблица device_status_history (services/uptime.py): каждая
+смена состояния имеет возрастающий id, который отдается как id события SSE,
+поэтому браузер после переподключения (заголовок Last-Event-ID) получает
+только пропущенные переходы.
+
+Поток обслуживается двумя способами:
+- sse_app.py — отдельная асинхронная точка входа (ASGI): один опрос БД на все
+  подключения, клиент не занимает рабочий процесс gunicorn;
+- маршрут /events/monitoring в app.py — запасной вариант для запуска без
+  ASGI-сервера (включается SSE_FLASK_FALLBACK=1): отдает пропущенные смены и
+  отметку времени проверки и сразу закрывает соединение, браузер
+  переподключается через SSE_KEEPALIVE секунд. Рабочий процесс gunicorn не
+  удерживается дольше одного запроса. По умолчанию маршрут отвечает 204 —
+  браузер не переподключается, страница работает без живых обновлений.
+"""
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy import func
+
+from models import DeviceStatus, DeviceStatusHistory, Equipment, db
+
+# Период опроса новых смен состояния (секунды)
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 2))
+
+# Период отправки keep-alive и отметки времени последней проверки (секунды)
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
+
+# Запасной маршрут Flask /events/monitoring (без sse_app.py); выключен — ответ 204
+SSE_FLASK_FALLBACK = os.environ.get('SSE_FLASK_FALLBACK', '0').lower() in ('1', 'true', 'yes')
+
+# Сколько смен состояния отдавать за один опрос
+_BATCH = 500
+
+
+def last_transition_id():
+    """id последней записанной смены состояния (0, если их еще нет)."""
+    return db.session.query(func.max(DeviceStatusHistory.id)).scalar() or 0
+
+
+def fetch_transitions(after_id, limit=_BATCH):
+    """
+    Смены состояния после after_id вместе с помещением устройства.
+
+    Returns:
+        list[dict]: id, equipment_id, place_id, online, at
+    """
+    rows = db.session.query(
+        DeviceStatusHistory.id, DeviceStatusHistory.equipment_id, Equipment.placesid,
+        DeviceStatusHistory.online, DeviceStatusHistory.changed_at,
+    ).join(
+        Equipment, Equipment.id == DeviceStatusHistory.equipment_id
+    ).filter(
+        DeviceStatusHistory.id > after_id
+    ).order_by(DeviceStatusHistory.id).limit(limit).all()
+    return [{'id': row_id, 'equipment_id': equipment_id, 'place_id': place_id,
+             'online': online, 'at': changed_at.isoformat()}
+            for row_id, equipment_id, place_id, online, changed_at in rows]
+
+
+def last_checked_at():
+    """Время последней проверки опросчика (ISO) или None."""
+    value = db.session.query(func.max(DeviceStatus.checked_at)).scalar()
+    return value.isoformat() if value else None
+
+
+def parse_last_event_id(header_value, query_value):
+    """Позиция, с которой продолжить поток: Last-Event-ID, затем параметр after; None — с текущего момента."""
+    for value in (header_value, query_value):
+        if value and str(value).isdigit():
+            return int(value)
+    return None
+
+
+def format_transition(transition):
+    """Событие SSE 'transition' для одной смены состояния."""
+    data = json.dumps({key: transition[key] for key in ('equipment_id', 'place_id', 'online', 'at')})
+    return f"id: {transition['id']}\nevent: transition\ndata: {data}\n\n"
+
+
+def format_heartbeat(checked_at):
+    """Событие SSE 'snapshot' с временем последней проверки (заодно keep-alive)."""
+    return f"event: snapshot\ndata: {json.dumps({'checked_at': checked_at})}\n\n"
+
+
+def snapshot_events(after_id=None, place_id=None):
+    """
+    События для запасного маршрута Flask: смены состояния после after_id и
+    отметка времени проверки. Поток на этом заканчивается; браузер
+    переподключается через SSE_KEEPALIVE секунд с Last-Event-ID.
+    """
+    if after_id is None:
+        after_id = last_transition_id()
+    events = [f"retry: {int(SSE_KEEPALIVE * 1000)}\n\n"]
+    for transition in fetch_transitions(after_id):
+        after_id = transition['id']
+        if place_id is None or transition['place_id'] == place_id:
+            events.append(format_transition(transition))
+    # id у отметки времени — чтобы смены других помещений не запрашивались повторно
+    events.append(f"id: {after_id}\n" + format_heartbeat(last_checked_at()))
+    return ''.join(events)
+
+
+class TransitionBroadcaster:
+    """
+    Рассылка смен состояния подключенным клиентам асинхронной точки входа.
+
+    Одна фоновая задача опрашивает БД (в отдельном потоке, в контексте
+    приложения app_context) и раскладывает события по очередям подписчиков,
+    поэтому число запросов к БД не зависит от числа открытых экранов.
+    """
+
+    def __init__(self, app_context, poll_interval=SSE_POLL_INTERVAL, keepalive=SSE_KEEPALIVE):
+        self.app_context = app_context
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.last_id = None
+        self.subscribers = set()
+        self.task = None
+
+    def _run_in_app(self, func_, *args):
+        with self.app_context():
+            try:
+                return func_(*args)
+            finally:
+                db.session.remove()
+
+    async def _query(self, func_, *args):
+        return await asyncio.to_thread(self._run_in_app, func_, *args)
+
+    async def subscribe(self, after_id=None):
+        """
+        Новый подписчик: очередь событий (словари смен состояния и отметки
+        {'snapshot': время последней проверки}). Если указан after_id, в очередь
+        сразу кладутся пропущенные смены состояния.
+        """
+        if not self.subscribers:
+            # Без подписчиков опрос не идет — начинаем с текущей позиции
+            self.last_id = await self._query(last_transition_id)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._poll())
+        queue = asyncio.Queue(maxsize=1000)
+        if after_id is not None and after_id < self.last_id:
+            for transition in await self._query(fetch_transitions, after_id):
+                if transition['id'] > self.last_id:
+                    break
+                queue.put_nowait(transition)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def _publish(self, item):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать — отключаем, браузер переподключится с Last-Event-ID
+                self.subscribers.discard(queue)
+
+    def is_subscribed(self, queue):
+        return queue in self.subscribers
+
+    async def _poll(self):
+        last_keepalive = time.time()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.subscribers:
+                continue
+            try:
+                transitions = await self._query(fetch_transitions, self.last_id)
+                for transition in transitions:
+                    self.last_id = transition['id']
+                    self._publish(transition)
+                if time.time() - last_keepalive >= self.keepalive:
+                    self._publish({'snapshot': await self._query(last_checked_at)})
+                    last_keepalive = time.time()
+            except Exception as e:
+                print(f"Ошибка опроса смен состояния для SSE: {e}")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Разрешение ссылок в истории перемещений ТМЦ.
+
+Строка Move хранит только ID (ТМЦ, организации, помещения, пользователи).
+Вместо отдельного запроса на каждый ID резолвер собирает все ID страницы
+перемещений и загружает каждую таблицу одним запросом WHERE id IN (...),
+после чего строки для шаблонов собираются из словарей в памяти.
+"""
+from models import Equipment, Move, Org, Places, Users
+
+# Порядок вывода истории: новые перемещения сначала, при равной дате — по id
+MOVE_SORT = [(Move.dt, True), (Move.id, True)]
+
+
+def load_by_ids(model, ids):
+    """Объекты модели по набору ID одним запросом: {id: объект}."""
+    ids = {i for i in ids if i}
+    if not ids:
+        return {}
+    return {obj.id: obj for obj in model.query.filter(model.id.in_(ids)).all()}
+
+
+class MoveHistoryResolver:
+    """
+    Справочники для набора перемещений.
+
+    Args:
+        moves: строки Move (обычно одна страница)
+        with_equipment: загружать ли ТМЦ (не нужно, если история одного ТМЦ)
+        extra_user_ids: дополнительные ID пользователей (например, из временных выдач)
+    """
+
+    def __init__(self, moves, with_equipment=True, extra_user_ids=()):
+        self.moves = list(moves)
+        self.equipment = load_by_ids(Equipment, (m.eqid for m in self.moves)) if with_equipment else {}
+        self.orgs = load_by_ids(Org, [i for m in self.moves for i in (m.orgidfrom, m.orgidto)])
+        self.places = load_by_ids(Places, [i for m in self.moves for i in (m.placesidfrom, m.placesidto)])
+        self.users = load_by_ids(Users, [i for m in self.moves for i in (m.useridfrom, m.useridto)]
+                                 + list(extra_user_ids))
+
+    def rows(self):
+        """
+        Строки для таблиц перемещений: move, equipment, org_from/org_to,
+        place_from/place_to, user_from/user_to (объекты или None).
+        """
+        return [{
+            'move': move,
+            'equipment': self.equipment.get(move.eqid),
+            'org_from': self.orgs.get(move.orgidfrom),
+            'org_to': self.orgs.get(move.orgidto),
+            'place_from': self.places.get(move.placesidfrom),
+            'place_to': self.places.get(move.placesidto),
+            'user_from': self.users.get(move.useridfrom),
+            'user_to': self.users.get(move.useridto),
+        } for move in self.moves]
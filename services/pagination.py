@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Постраничная выборка по ключу (keyset/seek pagination).
+
+Вместо OFFSET страница начинается строго после (или до) последней показанной
+строки: к запросу добавляется условие по ключу сортировки, поэтому стоимость
+любой страницы одинакова и не зависит от ее номера, а в память попадает
+только одна страница.
+
+Ключ сортировки — список пар (выражение, по_убыванию). Последним элементом
+ключа должен идти уникальный столбец (обычно id), чтобы порядок был строгим.
+Выражения ключа не должны давать NULL — nullable-столбцы оборачиваются
+в func.coalesce(...).
+
+Позиция передается между запросами непрозрачным курсором (base64url от JSON
+со значениями ключа последней/первой строки страницы):
+
+    page = keyset_page(Equipment.query.filter_by(nomeid=5),
+                       [(func.coalesce(Equipment.invnum, ''), False), (Equipment.id, False)],
+                       **page_args(request.args))
+    page.items, page.next_cursor, page.prev_cursor
+"""
+import base64
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_
+
+# Размер страницы по умолчанию и верхняя граница для параметра per_page
+DEFAULT_PER_PAGE = int(os.environ.get('PAGE_SIZE', 50))
+MAX_PER_PAGE = 500
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise ValueError('Неизвестный тип значения в курсоре')
+    return value
+
+
+def encode_cursor(values):
+    """Кодирует значения ключа строки в курсор."""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Декодирует курсор в список значений ключа.
+
+    Raises:
+        ValueError: курсор поврежден или подделан
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'Некорректный курсор: {e}')
+    if not isinstance(values, list):
+        raise ValueError('Некорректный курсор')
+    return [_decode_value(v) for v in values]
+
+
+def page_args(args):
+    """
+    Параметры страницы из request.args: after, before, per_page.
+    per_page ограничивается диапазоном 1..MAX_PER_PAGE.
+    """
+    try:
+        per_page = int(args.get('per_page', DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PER_PAGE
+    return {
+        'after': args.get('after') or None,
+        'before': args.get('before') or None,
+        'per_page': max(1, min(per_page, MAX_PER_PAGE)),
+    }
+
+
+class KeysetPage:
+    """
+    Страница результата.
+
+    Attributes:
+        items: строки страницы в прямом порядке сортировки
+        per_page: размер страницы
+        has_next / has_prev: есть ли следующая / предыдущая страница
+        next_cursor / prev_cursor: курсоры для параметров after / before
+    """
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self):
+        """Метаданные страницы для JSON-ответа (без самих строк)."""
+        return {
+            'per_page': self.per_page,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+        }
+
+
+def _seek_condition(sort_keys, values, forward):
+    """
+    Условие «строго после значений ключа» в порядке сортировки:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... с учетом направления каждого столбца.
+    """
+    if len(values) != len(sort_keys):
+        raise ValueError('Курсор не соответствует ключу сортировки')
+    clauses = []
+    for i, (expr, descending) in enumerate(sort_keys):
+        greater = (not descending) == forward
+        step = expr > values[i] if greater else expr < values[i]
+        equal_prefix = [sort_keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def _ordered(query, sort_keys, forward):
+    order = []
+    for expr, descending in sort_keys:
+        if descending == forward:
+            order.append(expr.desc())
+        else:
+            order.append(expr.asc())
+    return query.order_by(None).order_by(*order)
+
+
+def _with_keys(query, sort_keys):
+    return query.add_columns(*[expr.label(f'_keyset_{i}') for i, (expr, _) in enumerate(sort_keys)])
+
+
+def _split_row(row, key_count):
+    values = list(row[-key_count:])
+    item = row[0] if len(row) == key_count + 1 else tuple(row[:-key_count])
+    return item, values
+
+
+def keyset_page(query, sort_keys, after=None, before=None, per_page=DEFAULT_PER_PAGE):
+    """
+    Выбирает одну страницу запроса.
+
+    Args:
+        query: ORM-запрос (Model.query или db.session.query(...)) с фильтрами
+        sort_keys: [(выражение, по_убыванию), ...]; последний элемент уникален
+        after: курсор — страница после указанной строки
+        before: курсор — страница перед указанной строкой
+        per_page: размер страницы
+
+    Returns:
+        KeysetPage
+
+    Raises:
+        ValueError: курсор поврежден или не подходит к ключу
+    """
+    forward = before is None
+    cursor = after if forward else before
+    query = _with_keys(query, sort_keys)
+    if cursor:
+        query = query.filter(_seek_condition(sort_keys, decode_cursor(cursor), forward))
+    rows = _ordered(query, sort_keys, forward).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    split = [_split_row(row, len(sort_keys)) for row in rows]
+    items = [item for item, _ in split]
+    if not split:
+        return KeysetPage(items, per_page)
+
+    first_values, last_values = split[0][1], split[-1][1]
+    if forward:
+        has_next, has_prev = has_more, bool(after)
+    else:
+        has_next, has_prev = True, has_more
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor(last_values) if has_next else None,
+        prev_cursor=encode_cursor(first_values) if has_prev else None,
+    )
+
+
+def iter_keyset_batches(query, sort_keys, batch_size=500):
+    """
+    Обходит весь запрос пачками по batch_size строк (для массовой обработки
+    без загрузки всей выборки в память). Возвращает списки строк.
+    """
+    after = None
+    while True:
+        page = keyset_page(query, sort_keys, after=after, per_page=batch_size)
+        if not page.items:
+            return
+        yield page.items
+        if not page.has_next:
+            return
+        after = page.next_cursor
+
+
+def nav_params(args, **route_params):
+    """
+    Параметры ссылок навигации: текущие параметры запроса без курсоров
+    (фильтры, per_page) плюс параметры маршрута.
+    """
+    params = {key: value for key, value in args.to_dict().items() if key not in ('after', 'before')}
+    params.update(route_params)
+    return params
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Дисковый кэш готовых отчетов с адресацией по содержимому.
+
+Имя файла — ключ отчета (report_jobs.report_key): тип отчета, параметры
+(отдел, область администратора или МОЛ, организация) и токен версий данных.
+Пока данные отдела не менялись, ключ тот же и файл отдается повторно;
+после изменения появляется новый ключ, а старый файл со временем вытесняется.
+
+Размер кэша ограничен REPORT_CACHE_MAX_SIZE: при превышении удаляются файлы,
+к которым дольше всего не обращались (LRU по времени доступа, которое
+обновляется явно при каждой выдаче — не зависит от опции noatime).
+"""
+import os
+import time
+
+# Каталог кэша отчетов
+REPORTS_DIR = os.environ.get(
+    'REPORTS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reports'),
+)
+
+# Максимальный суммарный размер файлов кэша (байты)
+MAX_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_MAX_SIZE', 1024 * 1024 * 1024))
+
+_TMP_SUFFIX = '.tmp'
+
+
+def artifact_path(key, extension):
+    """Путь к файлу отчета с ключом key (подкаталог по первым двум символам ключа)."""
+    return os.path.join(REPORTS_DIR, key[:2], f'{key}.{extension}')
+
+
+def touch_artifact(path):
+    """Отмечает обращение к файлу (время доступа для LRU); время изменения не трогает."""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def store_artifact(key, extension, render):
+    """
+    Формирует файл отчета через render(output) и кладет его в кэш под ключом key.
+
+    Файл пишется во временный и атомарно переименовывается, поэтому
+    читатели никогда не видят недописанный отчет.
+
+    Returns:
+        tuple: (путь к файлу, результат render)
+    """
+    path = artifact_path(key, extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}{_TMP_SUFFIX}'
+    try:
+        with open(tmp_path, 'wb') as output:
+            result = render(output)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict_artifacts()
+    return path, result
+
+
+def remove_artifact(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _cached_files():
+    """Файлы кэша: список (время доступа, размер, путь)."""
+    files = []
+    if not os.path.isdir(REPORTS_DIR):
+        return files
+    for root, _, names in os.walk(REPORTS_DIR):
+        for name in names:
+            if name.endswith(_TMP_SUFFIX):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+    return files
+
+
+def evict_artifacts(max_size=None):
+    """
+    Удаляет давно не запрошенные файлы, пока размер кэша больше max_size.
+
+    Returns:
+        int: число удаленных файлов
+    """
+    max_size = MAX_CACHE_SIZE if max_size is None else max_size
+    files = _cached_files()
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновое формирование тяжелых отчетов (таблица report_jobs).
+
+Веб-запрос только ставит задание в очередь и сразу возвращает его номер;
+отчет формирует отдельный процесс-обработчик из того же развертывания
+(без внешнего брокера — очередь хранится в БД приложения):
+
+    flask --app app report-worker
+
+Обработчик забирает задания атомарным UPDATE ... WHERE status='queued'
+и кладет готовый файл в дисковый кэш (services/report_cache.py).
+Статус задания опрашивается через /api/reports/jobs/<id>.
+
+Одинаковые запросы (тот же тип отчета, те же параметры, те же версии данных
+из services/data_versions.py) получают одно задание и один файл в кэше.
+"""
+import hashlib
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from models import ReportJob, db
+
+from .data_versions import data_token
+from .report_cache import REPORTS_DIR, evict_artifacts, remove_artifact, store_artifact
+
+# Задание в статусе running дольше этого времени (секунды) считается брошенным
+JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', 900))
+
+# Сколько раз пытаться сформировать отчет, прежде чем пометить задание как failed
+MAX_ATTEMPTS = 3
+
+# Пауза обработчика при пустой очереди (секунды)
+POLL_INTERVAL = float(os.environ.get('REPORT_WORKER_POLL', 2))
+
+# Сколько дней хранить записи о завершенных заданиях (файлы вытесняет кэш)
+RETENTION_DAYS = int(os.environ.get('REPORT_RETENTION_DAYS', 7))
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+# Зарегистрированные типы отчетов: kind -> ReportType
+_REPORTS = {}
+
+
+class ReportType:
+    """
+    Описание типа отчета.
+
+    Attributes:
+        kind: идентификатор типа ('form8')
+        render: функция render(params, output) -> имя файла для скачивания;
+            пишет отчет в бинарный файловый объект output
+        scopes: функция scopes(params) -> области версий данных (services/data_versions)
+        extension, mimetype: расширение и MIME-тип файла
+    """
+
+    def __init__(self, kind, render, scopes, extension, mimetype):
+        self.kind = kind
+        self.render = render
+        self.scopes = scopes
+        self.extension = extension
+        self.mimetype = mimetype
+
+
+def register_report(kind, scopes, extension='pdf', mimetype='application/pdf'):
+    """Декоратор: регистрирует функцию формирования отчета типа kind."""
+    def decorator(render):
+        _REPORTS[kind] = ReportType(kind, render, scopes, extension, mimetype)
+        return render
+    return decorator
+
+
+def get_report_type(kind):
+    if kind not in _REPORTS:
+        raise ValueError(f'Неизвестный тип отчета: {kind}')
+    return _REPORTS[kind]
+
+
+def _params_json(params):
+    return json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def report_key(kind, params):
+    """Ключ дедупликации: тип отчета, параметры и токен текущих версий данных."""
+    report = get_report_type(kind)
+    token = data_token(*report.scopes(params))
+    raw = f'{kind}|{_params_json(params)}|{token}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def job_params(job):
+    return json.loads(job.params)
+
+
+def artifact_exists(job):
+    return bool(job.artifact_path) and os.path.exists(job.artifact_path)
+
+
+def enqueue_report(kind, params, requested_by=None):
+    """
+    Ставит отчет в очередь или возвращает уже существующее задание
+    с тем же ключом (в очереди, в работе или готовое с файлом на диске).
+
+    Returns:
+        tuple: (ReportJob, создано ли новое задание)
+    """
+    key = report_key(kind, params)
+    existing = ReportJob.query.filter(
+        ReportJob.dedup_key == key,
+        ReportJob.status.in_(('queued', 'running', 'done')),
+    ).order_by(ReportJob.id.desc()).first()
+    if existing and (existing.status != 'done' or artifact_exists(existing)):
+        return existing, False
+
+    job = ReportJob(kind=kind, params=_params_json(params), dedup_key=key,
+                    status='queued', requested_by=requested_by)
+    db.session.add(job)
+    db.session.commit()
+    return job, True
+
+
+def job_status(job):
+    """Состояние задания для JSON-ответа."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'queue_position': _queue_position(job) if job.status == 'queued' else None,
+        'error': job.error if job.status == 'failed' else None,
+    }
+
+
+def _queue_position(job):
+    return ReportJob.query.filter(ReportJob.status == 'queued', ReportJob.id < job.id).count() + 1
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _requeue_stale():
+    """Возвращает в очередь задания, обработчик которых пропал (или помечает их failed)."""
+    deadline = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT)
+    table = ReportJob.__table__
+    db.session.execute(table.update().where(
+        table.c.status == 'running', table.c.started_at < deadline, table.c.attempts >= MAX_ATTEMPTS
+    ).values(status='failed', finished_at=datetime.utcnow(), error='Превышено время формирования отчета'))
+    db.session.execute(table.update().where(
+        table.c.status == 'running', table.c.started_at < deadline
+    ).values(status='queued', worker=None))
+    db.session.commit()
+
+
+def claim_next_job(worker=None):
+    """
+    Забирает самое старое задание из очереди. Несколько обработчиков могут
+    работать параллельно: задание достается тому, чей UPDATE изменил строку.
+
+    Returns:
+        ReportJob или None, если очередь пуста
+    """
+    worker = worker or _worker_name()
+    table = ReportJob.__table__
+    candidates = db.session.query(ReportJob.id).filter(ReportJob.status == 'queued')\
+        .order_by(ReportJob.created_at, ReportJob.id).limit(5).all()
+    for (job_id,) in candidates:
+        result = db.session.execute(table.update().where(
+            table.c.id == job_id, table.c.status == 'queued'
+        ).values(status='running', worker=worker, started_at=datetime.utcnow(),
+                 attempts=table.c.attempts + 1))
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(ReportJob, job_id)
+    return None
+
+
+def run_job(job):
+    """Формирует отчет задания и сохраняет файл в кэш; ошибка переводит задание в failed."""
+    report = get_report_type(job.kind)
+    try:
+        path, filename = store_artifact(job.dedup_key, report.extension,
+                                        lambda output: report.render(job_params(job), output))
+        job.status = 'done'
+        job.artifact_path = path
+        job.filename = filename
+        job.mimetype = report.mimetype
+        job.error = None
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.error = f'{e.__class__.__name__}: {e}'
+        print(f"Ошибка формирования отчета {job.kind} (задание {job.id}): {e}")
+        print(traceback.format_exc())
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def cleanup_jobs(retention_days=RETENTION_DAYS):
+    """
+    Удаляет завершенные задания старше retention_days. Файл удаляется вместе
+    с заданием, только если на него не ссылается другое задание. Возвращает
+    число удаленных заданий.
+    """
+    deadline = datetime.utcnow() - timedelta(days=retention_days)
+    old_jobs = ReportJob.query.filter(
+        ReportJob.status.in_(('done', 'failed')),
+        ReportJob.finished_at < deadline,
+    ).all()
+    old_ids = {job.id for job in old_jobs}
+    paths = {job.artifact_path for job in old_jobs if job.artifact_path}
+    shared = set()
+    if paths:
+        shared = {path for (path,) in db.session.query(ReportJob.artifact_path).filter(
+            ReportJob.artifact_path.in_(paths), ReportJob.id.notin_(old_ids)
+        ).distinct()}
+    for job in old_jobs:
+        db.session.delete(job)
+    db.session.commit()
+    for path in paths - shared:
+        remove_artifact(path)
+    return len(old_jobs)
+
+
+def run_worker(once=False, poll_interval=POLL_INTERVAL):
+    """
+    Цикл обработчика очереди. Вызывается из CLI-команды report-worker
+    в контексте приложения.
+
+    Args:
+        once: обработать все задания в очереди и завершиться
+        poll_interval: пауза при пустой очереди (секунды)
+    """
+    worker = _worker_name()
+    print(f"Обработчик отчетов {worker} запущен, каталог: {REPORTS_DIR}")
+    last_stale_check = last_cleanup = 0
+    while True:
+        if time.time() - last_stale_check > 60:
+            _requeue_stale()
+            last_stale_check = time.time()
+        if time.time() - last_cleanup > 3600:
+            removed = cleanup_jobs()
+            if removed:
+                print(f"Удалено устаревших заданий: {removed}")
+            evicted = evict_artifacts()
+            if evicted:
+                print(f"Вытеснено файлов из кэша отчетов: {evicted}")
+            last_cleanup = time.time()
+
+        job = claim_next_job(worker)
+        if job is None:
+            db.session.remove()
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        started = time.time()
+        run_job(job)
+        print(f"Задание {job.id} ({job.kind}): {job.status} за {time.time() - started:.1f} с")
+        db.session.remove()
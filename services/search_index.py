@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+"""
+Поисковый индекс ТМЦ в памяти процесса (/api/search и автопривязка машин).
+
+Индексируются активные ТМЦ: инвентарный и серийный номера, штрихкод,
+бухгалтерское наименование, IP, комментарий, история комментариев и hostname /
+MAC-адрес привязанной машины. Текст разбивается на слова в нижнем регистре;
+составные слова («PC-ACC-01», «10.0.0.15») индексируются целиком и по частям,
+MAC-адреса в любом написании («AA:BB:..», «aa-bb-..», «aabb..») — еще и в виде
+12 шестнадцатеричных цифр. Для слова хранится, в каких полях каких ТМЦ оно
+встречается, поэтому поиск по полю не сканирует таблицу (LIKE '%...%' не
+использует индексы).
+
+Слово запроса совпадает со словом индекса точно, по префиксу или с одной
+опечаткой (замена, вставка, удаление или перестановка соседних букв) — для
+слов от TYPO_MIN_LENGTH символов. Опечатки ищутся по словарю удалений одной
+буквы, без перебора всех слов. ТМЦ подходит, если совпали все слова запроса.
+
+Индекс строится целиком одним проходом при первом обращении, дальше
+обновляется по документам. Изменение индексируемых полей ТМЦ, машин и
+комментариев через ORM записывает id затронутых ТМЦ в журнал
+search_index_changes в той же транзакции (вставка, без общей строки-счетчика,
+поэтому пишущие ТМЦ транзакции не ждут друг друга). Процесс не чаще раза в
+SEARCH_INDEX_CHECK секунд читает новые записи журнала и перечитывает только эти
+ТМЦ; после коммита в этом процессе журнал проверяется при следующем обращении.
+Массовые UPDATE/DELETE и invalidate_search_index() пишут запись без id ТМЦ —
+индекс перестраивается целиком, как и при большом числе изменений сразу.
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect
+
+from models import Equipment, EquipmentComments, Machine, SearchIndexChange, db
+
+from .cache_invalidation import ALL, CacheInvalidation, attr_values
+
+SEARCH_INDEX_CHECK = float(os.environ.get('SEARCH_INDEX_CHECK', 5))
+
+# Минимальная длина слова запроса для поиска по префиксу и с опечаткой
+PREFIX_MIN_LENGTH = 2
+TYPO_MIN_LENGTH = 4
+# Сколько слов индекса проверять для одного префикса
+PREFIX_LIMIT = 500
+
+# Индексируемые модели: модель -> поля, изменение которых меняет индекс (None — любые)
+_INDEXED_FIELDS = {
+    Equipment: ('invnum', 'sernum', 'shtrihkod', 'buhname', 'ip', 'comment', 'active', 'os', 'usersid'),
+    Machine: ('hostname', 'mac_address', 'equipment_id'),
+    EquipmentComments: None,
+}
+
+# Журнал изменений: сколько секунд перечитывать свежие записи (транзакции
+# фиксируются не в порядке id), сколько хранить записи и сколько изменений
+# применять по одному — при большем числе индекс перестраивается целиком
+_CHANGES_LOOKBACK = 60
+_CHANGES_RETENTION = 24 * 3600
+_MAX_CHANGES = 1000
+
+# Индексируемые поля (битовые флаги в списках вхождений)
+INVNUM = 1
+SERNUM = 2
+SHTRIHKOD = 4
+BUHNAME = 8
+IP = 16
+COMMENT = 32
+COMMENT_HISTORY = 64
+HOSTNAME = 128
+MAC = 256
+ALL_FIELDS = 511
+
+FIELD_NAMES = {
+    INVNUM: 'invnum',
+    SERNUM: 'sernum',
+    SHTRIHKOD: 'shtrihkod',
+    BUHNAME: 'buhname',
+    IP: 'ip',
+    COMMENT: 'comment',
+    COMMENT_HISTORY: 'comment_history',
+    HOSTNAME: 'hostname',
+    MAC: 'mac_address',
+}
+
+# Вес совпадения: поля-идентификаторы важнее текста; точное совпадение важнее префикса и опечатки
+_FIELD_WEIGHTS = {INVNUM: 4, SERNUM: 4, SHTRIHKOD: 4, MAC: 4, HOSTNAME: 3, IP: 3,
+                  BUHNAME: 2, COMMENT: 1, COMMENT_HISTORY: 1}
+_EXACT, _PREFIX, _TYPO = 3, 2, 1
+
+# ТМЦ в индексе (без объекта ORM, привязанного к сессии)
+SearchDocument = namedtuple('SearchDocument', 'id buhname invnum sernum shtrihkod ip usersid os '
+                                              'hostname mac_address')
+
+_WORD = re.compile(r'[\w.:\-]+')
+_PARTS = re.compile(r'[.:\-_]+')
+_MAC = re.compile(r'^[0-9a-f]{2}([:\-.]?)[0-9a-f]{2}(?:\1[0-9a-f]{2}){4}$')
+# MAC-адрес внутри слова («mac:aa:bb:cc:dd:ee:01», «mac=aa-bb-...»): совпадения ищутся с
+# каждой позиции, чтобы шестнадцатеричный хвост подписи («mac:» -> «c:») не съел начало адреса
+_MAC_IN_TEXT = re.compile(r'(?=(?<![0-9a-f])([0-9a-f]{2}([:\-.]?)[0-9a-f]{2}(?:\2[0-9a-f]{2}){4})'
+                          r'(?![0-9a-f])(?!\2[0-9a-f]))')
+
+
+def normalize(text):
+    """Текст для индекса: нижний регистр, «ё» -> «е»."""
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def mac_key(value):
+    """MAC-адрес в виде 12 шестнадцатеричных цифр (None, если это не MAC-адрес)."""
+    value = normalize(value).strip()
+    if not _MAC.match(value):
+        return None
+    return re.sub(r'[:\-.]', '', value)
+
+
+def tokenize(text, query=False):
+    """
+    Слова текста без повторов. Для индекса составные слова берутся целиком и по
+    частям, MAC-адреса (в том числе внутри слова, например после «MAC:») — целиком
+    и в виде 12 цифр; для запроса составные слова не делятся, а MAC-адрес
+    заменяется 12 цифрами (совпадает с любым написанием).
+    """
+    text = normalize(text)
+    words = []
+    for word in _WORD.findall(text):
+        word = word.strip('.:-_')
+        if not word:
+            continue
+        mac = mac_key(word)
+        if query:
+            words.append(mac or word)
+        elif mac:
+            words.extend((word, mac))
+        else:
+            words.append(word)
+            words.extend(part for part in _PARTS.split(word) if part)
+    if not query:
+        words.extend(re.sub(r'[:\-.]', '', match.group(1)) for match in _MAC_IN_TEXT.finditer(text))
+    return list(dict.fromkeys(words))
+
+
+def _deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _document_words(texts):
+    """{id ТМЦ: {слово: поля}} для текстов (id ТМЦ, поле, текст)."""
+    masks_by_doc = {}
+    for doc_id, field, text in texts:
+        for word in tokenize(text):
+            masks = masks_by_doc.setdefault(doc_id, {})
+            masks[word] = masks.get(word, 0) | field
+    return masks_by_doc
+
+
+def _within_one(a, b):
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв) не больше 1."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return (len(diff) == 2 and diff[1] == diff[0] + 1
+                and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if la > lb:
+        a, b = b, a
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            return a[i:] == b[i + 1:]
+    return True
+
+
+class _Index:
+    """
+    Снимок индекса: документы, слова -> {id ТМЦ: поля}, словарь удалений для опечаток.
+
+    update() заменяет отдельные документы под блокировкой _lock. Поиск идет без
+    блокировки, поэтому списки вхождений слов, список слов и списки опечаток не
+    изменяются на месте, а заменяются новыми.
+    """
+
+    def __init__(self, documents, texts, change_floor, changes_applied):
+        self.checked = self.polled = time.monotonic()
+        self.change_floor = change_floor
+        self.changes_applied = changes_applied
+        self.documents = documents
+        self.postings = {}
+        self.doc_words = {}
+        for doc_id, masks in _document_words(texts).items():
+            self.doc_words[doc_id] = set(masks)
+            for word, mask in masks.items():
+                self.postings.setdefault(word, {})[doc_id] = mask
+        self.words = sorted(self.postings)
+        self.typos = {}
+        for word in self.words:
+            if len(word) >= TYPO_MIN_LENGTH:
+                for variant in _deletes(word):
+                    self.typos.setdefault(variant, []).append(word)
+
+    def update(self, doc_ids, documents, texts):
+        """
+        Заменяет документы doc_ids: documents — их новые версии (отсутствующие в
+        documents удаляются из индекса), texts — их тексты.
+        """
+        masks_by_doc = _document_words(texts)
+        touched = set()
+        for doc_id in doc_ids:
+            touched.update(self.doc_words.get(doc_id, ()))
+        for masks in masks_by_doc.values():
+            touched.update(masks)
+
+        added, removed = [], []
+        for word in touched:
+            entries = {doc_id: mask for doc_id, mask in self.postings.get(word, {}).items()
+                       if doc_id not in doc_ids}
+            for doc_id, masks in masks_by_doc.items():
+                if word in masks:
+                    entries[doc_id] = masks[word]
+            if entries:
+                if word not in self.postings:
+                    added.append(word)
+                self.postings[word] = entries
+            elif word in self.postings:
+                del self.postings[word]
+                removed.append(word)
+
+        for doc_id in doc_ids:
+            if doc_id in documents:
+                self.documents[doc_id] = documents[doc_id]
+                self.doc_words[doc_id] = set(masks_by_doc.get(doc_id, ()))
+            else:
+                self.documents.pop(doc_id, None)
+                self.doc_words.pop(doc_id, None)
+
+        if added or removed:
+            gone = set(removed)
+            words = [word for word in self.words if word not in gone] if gone else list(self.words)
+            for word in added:
+                insort(words, word)
+            self.words = words
+            typos = {}
+            for word in removed:
+                if len(word) >= TYPO_MIN_LENGTH:
+                    for variant in _deletes(word):
+                        typos.setdefault(variant, set()).add(word)
+            for variant, words_gone in typos.items():
+                remaining = [word for word in self.typos.get(variant, ()) if word not in words_gone]
+                if remaining:
+                    self.typos[variant] = remaining
+                else:
+                    self.typos.pop(variant, None)
+            for word in added:
+                if len(word) >= TYPO_MIN_LENGTH:
+                    for variant in _deletes(word):
+                        self.typos[variant] = self.typos.get(variant, []) + [word]
+
+    def _typo_words(self, term):
+        candidates = set(self.typos.get(term, ()))
+        for variant in _deletes(term):
+            candidates.update(self.typos.get(variant, ()))
+            if variant in self.postings:
+                candidates.add(variant)
+        return [word for word in candidates if word != term and _within_one(term, word)]
+
+    def _prefix_words(self, term):
+        words = []
+        position = bisect_left(self.words, term)
+        while position < len(self.words) and len(words) < PREFIX_LIMIT:
+            word = self.words[position]
+            if not word.startswith(term):
+                break
+            if word != term:
+                words.append(word)
+            position += 1
+        return words
+
+    def _matches(self, term, fields, prefix, typos):
+        """{id ТМЦ: (вес совпадения, поля)} для одного слова запроса."""
+        found = {}
+
+        def add(word, kind):
+            for doc_id, mask in self.postings.get(word, {}).items():
+                mask &= fields
+                if not mask:
+                    continue
+                weight = kind * max(_FIELD_WEIGHTS[field] for field in FIELD_NAMES if mask & field)
+                best = found.get(doc_id)
+                if best is None or weight > best[0]:
+                    found[doc_id] = (weight, mask if best is None else best[1] | mask)
+                else:
+                    found[doc_id] = (best[0], best[1] | mask)
+
+        add(term, _EXACT)
+        if prefix and len(term) >= PREFIX_MIN_LENGTH:
+            for word in self._prefix_words(term):
+                add(word, _PREFIX)
+        if typos and len(term) >= TYPO_MIN_LENGTH:
+            for word in self._typo_words(term):
+                add(word, _TYPO)
+        return found
+
+    def search(self, query, fields=ALL_FIELDS, prefix=True, typos=True):
+        """[(id ТМЦ, вес, поля)] — ТМЦ, где нашлись все слова запроса, по убыванию веса."""
+        terms = tokenize(query, query=True)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            found = self._matches(term, fields, prefix, typos)
+            if scores is None:
+                scores = found
+            else:
+                scores = {doc_id: (weight + found[doc_id][0], mask | found[doc_id][1])
+                          for doc_id, (weight, mask) in scores.items() if doc_id in found}
+            if not scores:
+                return []
+        return sorted(((doc_id, weight, mask) for doc_id, (weight, mask) in scores.items()),
+                      key=lambda item: (-item[1], item[0]))
+
+
+_index = None
+_lock = threading.Lock()
+_cleaned = 0.0
+
+
+def _fetch(doc_ids=None):
+    """Документы и тексты активных ТМЦ (всех или только doc_ids)."""
+    query = db.session.query(
+        Equipment.id, Equipment.buhname, Equipment.invnum, Equipment.sernum, Equipment.shtrihkod,
+        Equipment.ip, Equipment.usersid, Equipment.os, Equipment.comment,
+        Machine.hostname, Machine.mac_address,
+    ).outerjoin(Machine, Machine.equipment_id == Equipment.id)\
+        .filter(Equipment.active == True)
+    history = db.session.query(EquipmentComments.equipment_id, EquipmentComments.comment)\
+        .join(Equipment, Equipment.id == EquipmentComments.equipment_id)\
+        .filter(Equipment.active == True)
+    if doc_ids is not None:
+        query = query.filter(Equipment.id.in_(doc_ids))
+        history = history.filter(Equipment.id.in_(doc_ids))
+
+    documents = {}
+    texts = []
+    for (doc_id, buhname, invnum, sernum, shtrihkod, ip, usersid, is_os, comment,
+         hostname, mac_address) in query:
+        documents[doc_id] = SearchDocument(doc_id, buhname, invnum, sernum, shtrihkod, ip, usersid,
+                                           bool(is_os), hostname, mac_address)
+        texts.extend(((doc_id, INVNUM, invnum), (doc_id, SERNUM, sernum), (doc_id, SHTRIHKOD, shtrihkod),
+                      (doc_id, BUHNAME, buhname), (doc_id, IP, ip), (doc_id, COMMENT, comment),
+                      (doc_id, HOSTNAME, hostname), (doc_id, MAC, mac_address)))
+    texts.extend((doc_id, COMMENT_HISTORY, comment) for doc_id, comment in history)
+    return documents, texts
+
+
+def _load():
+    # Позиция в журнале читается до данных: изменения, записанные во время
+    # загрузки, применятся повторно при следующей проверке
+    cutoff = datetime.utcnow() - timedelta(seconds=_CHANGES_LOOKBACK)
+    floor = db.session.query(func.max(SearchIndexChange.id))\
+        .filter(SearchIndexChange.changed_at < cutoff).scalar() or 0
+    applied = {change_id for change_id, in db.session.query(SearchIndexChange.id)
+               .filter(SearchIndexChange.id > floor)}
+    documents, texts = _fetch()
+
+    started = time.monotonic()
+    index = _Index(documents, texts, floor, applied)
+    print(f"Поисковый индекс: {len(documents)} ТМЦ, {len(index.words)} слов, "
+          f"{time.monotonic() - started:.2f} с")
+    return index
+
+
+def _apply_changes(index):
+    """
+    Применяет к индексу новые записи журнала search_index_changes.
+
+    Returns:
+        bool: False — индекс нужно перестроить целиком (массовое изменение,
+        слишком много изменений или журнал мог быть уже очищен)
+    """
+    if time.monotonic() - index.polled > _CHANGES_RETENTION / 2:
+        return False
+    rows = db.session.query(SearchIndexChange.id, SearchIndexChange.equipment_id, SearchIndexChange.changed_at)\
+        .filter(SearchIndexChange.id > index.change_floor)\
+        .order_by(SearchIndexChange.id).limit(_MAX_CHANGES + 1).all()
+    if len(rows) > _MAX_CHANGES:
+        return False
+    new = [(change_id, equipment_id) for change_id, equipment_id, _ in rows if change_id not in index.changes_applied]
+    if any(equipment_id is None for _, equipment_id in new):
+        return False
+    doc_ids = {equipment_id for _, equipment_id in new}
+    if doc_ids:
+        documents, texts = _fetch(doc_ids)
+        index.update(doc_ids, documents, texts)
+    index.changes_applied.update(change_id for change_id, _ in new)
+
+    # Транзакции фиксируются не в порядке id: записи журнала моложе
+    # _CHANGES_LOOKBACK секунд перечитываются, пока не станут старше
+    cutoff = datetime.utcnow() - timedelta(seconds=_CHANGES_LOOKBACK)
+    for change_id, _, changed_at in rows:
+        if changed_at >= cutoff:
+            break
+        index.change_floor = change_id
+    index.changes_applied = {change_id for change_id in index.changes_applied if change_id > index.change_floor}
+    index.polled = time.monotonic()
+    return True
+
+
+def _cleanup_changes():
+    """Удаляет старые записи журнала (не чаще раза в час в процессе)."""
+    global _cleaned
+    if time.monotonic() - _cleaned < 3600:
+        return
+    _cleaned = time.monotonic()
+    deadline = datetime.utcnow() - timedelta(seconds=_CHANGES_RETENTION)
+    with db.engine.begin() as connection:
+        connection.execute(SearchIndexChange.__table__.delete().where(SearchIndexChange.changed_at < deadline))
+
+
+def _current():
+    """Актуальный снимок индекса (изменения из журнала проверяются раз в SEARCH_INDEX_CHECK секунд)."""
+    global _index
+    index = _index
+    if index is not None and time.monotonic() - index.checked < SEARCH_INDEX_CHECK:
+        return index
+    with _lock:
+        # Другой поток мог обновить индекс, пока мы ждали блокировку
+        if _index is not None and _index is not index:
+            return _index
+        if index is None or not _apply_changes(index):
+            index = _load()
+            _index = index
+        index.checked = time.monotonic()
+    _cleanup_changes()
+    return index
+
+
+def search_equipment(query, fields=ALL_FIELDS, user_id=None, os_only=False, limit=50,
+                     prefix=True, typos=True):
+    """
+    Поиск активных ТМЦ.
+
+    Args:
+        query: строка запроса (все слова должны совпасть)
+        fields: битовая маска полей (INVNUM | SERNUM | ...)
+        user_id: только ТМЦ этого МОЛ (None — все)
+        os_only: только основные средства (Equipment.os)
+        limit: максимум результатов (None — без ограничения)
+        prefix, typos: разрешить совпадение по префиксу и с одной опечаткой
+
+    Returns:
+        list: dict с ключами document (SearchDocument), score, fields (названия совпавших полей)
+    """
+    index = _current()
+    results = []
+    for doc_id, score, mask in index.search(query, fields, prefix, typos):
+        # Документ мог быть удален из индекса другим потоком во время поиска
+        document = index.documents.get(doc_id)
+        if document is None:
+            continue
+        if user_id is not None and document.usersid != user_id:
+            continue
+        if os_only and not document.os:
+            continue
+        results.append({
+            'document': document,
+            'score': score,
+            'fields': [name for field, name in FIELD_NAMES.items() if mask & field],
+        })
+        if limit is not None and len(results) >= limit:
+            break
+    return results
+
+
+def find_equipment_id(value, fields, os_only=True):
+    """
+    id активного ТМЦ, где значение встречается отдельным словом в одном из полей
+    (без префиксов и опечаток; при нескольких — с наименьшим id). None — не найдено.
+    """
+    if not tokenize(value, query=True):
+        return None
+    matches = search_equipment(value, fields, os_only=os_only, limit=None, prefix=False, typos=False)
+    return min(item['document'].id for item in matches) if matches else None
+
+
+def match_machine_equipment(hostname=None, mac_address=None, ip_address=None):
+    """
+    id основного средства для автопривязки машины: по MAC-адресу в комментарии,
+    бухгалтерском наименовании или серийном номере (приоритет), затем по hostname
+    там же, затем по IP. None — не найдено.
+    """
+    if mac_address:
+        equipment_id = find_equipment_id(mac_address, COMMENT | BUHNAME | SERNUM)
+        if equipment_id:
+            return equipment_id
+    if hostname:
+        equipment_id = find_equipment_id(hostname, COMMENT | BUHNAME | SERNUM)
+        if equipment_id:
+            return equipment_id
+    if ip_address:
+        return find_equipment_id(ip_address, IP)
+    return None
+
+
+def invalidate_search_index():
+    """
+    Перестраивает индекс во всех процессах. Вызывается в транзакции, изменившей ТМЦ
+    или машины в обход ORM (прямой SQL); изменения через ORM учитываются сами.
+    """
+    _record_changes(db.session, {ALL})
+    _invalidation.add(db.session)
+
+
+def _machine_equipment(obj):
+    """ТМЦ, к которым машина привязана сейчас и была привязана до изменения."""
+    history = inspect(obj).attrs['equipment_id'].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {value for value in values if value is not None}
+
+
+def _changed_documents(session, obj):
+    """id ТМЦ, документы которых затронуты изменением объекта."""
+    if obj not in session.new and obj not in session.deleted:
+        state = inspect(obj)
+        fields = _INDEXED_FIELDS[type(obj)] or [attr.key for attr in state.mapper.column_attrs]
+        if not any(state.attrs[name].history.has_changes() for name in fields):
+            return None
+    if isinstance(obj, Equipment):
+        return {obj.id}
+    if isinstance(obj, Machine):
+        return _machine_equipment(obj)
+    return attr_values(obj, 'equipment_id')
+
+
+def _record_changes(session, doc_ids):
+    """Записывает изменения в журнал в текущей транзакции (ALL — перестроить индекс целиком)."""
+    if ALL in doc_ids or len(doc_ids) > _MAX_CHANGES:
+        doc_ids = {None}
+    now = datetime.utcnow()
+    rows = [{'equipment_id': doc_id, 'changed_at': now} for doc_id in doc_ids]
+    session.connection().execute(SearchIndexChange.__table__.insert(), rows)
+
+
+def _check_soon(doc_ids):
+    # Изменения этого процесса применяются при следующем обращении, не дожидаясь SEARCH_INDEX_CHECK
+    index = _index
+    if index is not None:
+        index.checked = float('-inf')
+
+
+_invalidation = CacheInvalidation('search_index_pending', tuple(_INDEXED_FIELDS), _changed_documents,
+                                  _check_soon, record=_record_changes)
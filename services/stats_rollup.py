@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Материализованная статистика ТМЦ (таблица stats_rollup).
+
+Каждая строка — количество и сумма стоимости активных ТМЦ с одинаковым ключом
+(МОЛ, отдел, группа, месяц поступления, ОС/периферия, статус). Таблица
+поддерживается инкрементально: после flush для каждого добавленного,
+измененного, перемещенного, списанного или удаленного ТМЦ из старого ключа
+вычитается вклад, к новому — прибавляется, в той же транзакции.
+
+Массовые UPDATE/DELETE по equipment в обход ORM, импорт дампа и ручные правки
+в БД таблицу не обновляют — для восстановления есть полная пересборка:
+
+    flask --app app rebuild-stats-rollup
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import case, event, extract, func, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from models import Equipment, Nome, StatsRollup, db
+
+# Поля Equipment, от которых зависит ключ или вклад в статистику
+_TRACKED_FIELDS = ('active', 'usersid', 'department_id', 'nomeid', 'datepost', 'os', 'repair', 'lost', 'cost')
+
+# Ключ в session.info: на время пересборки инкрементальное обновление не нужно
+_REBUILDING_KEY = 'stats_rollup_rebuilding'
+
+
+def equipment_status(repair, lost):
+    """Статус ТМЦ для статистики: ремонт важнее потери."""
+    if repair:
+        return 'repair'
+    if lost:
+        return 'lost'
+    return 'active'
+
+
+def _status_expr():
+    return case((Equipment.repair == True, 'repair'), (Equipment.lost == True, 'lost'), else_='active')
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1) if value else date(1970, 1, 1)
+
+
+def _to_decimal(value):
+    if value is None or value == '':
+        return Decimal('0.00')
+    return Decimal(str(value))
+
+
+def _apply_deltas(connection, deltas):
+    """
+    Прибавляет к строкам stats_rollup накопленные изменения {ключ: [count, cost]}.
+    Ключ: (usersid, department_id, group_id, month, os, status).
+
+    В MySQL используется INSERT ... ON DUPLICATE KEY UPDATE (атомарно при
+    параллельных транзакциях), в остальных СУБД — UPDATE, затем INSERT.
+    """
+    table = StatsRollup.__table__
+    for key, (count, cost) in deltas.items():
+        if not count and not cost:
+            continue
+        usersid, department_id, group_id, month, is_os, status = key
+        if connection.dialect.name == 'mysql':
+            statement = mysql_insert(table).values(
+                usersid=usersid, department_id=department_id, group_id=group_id,
+                month=month, os=is_os, status=status, count=count, cost=cost,
+            )
+            connection.execute(statement.on_duplicate_key_update(
+                count=table.c.count + statement.inserted.count,
+                cost=table.c.cost + statement.inserted.cost,
+            ))
+            continue
+        where = (
+            (table.c.usersid == usersid) & (table.c.department_id == department_id)
+            & (table.c.group_id == group_id) & (table.c.month == month)
+            & (table.c.os == is_os) & (table.c.status == status)
+        )
+        result = connection.execute(
+            table.update().where(where).values(count=table.c.count + count, cost=table.c.cost + cost)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                usersid=usersid, department_id=department_id, group_id=group_id,
+                month=month, os=is_os, status=status, count=count, cost=cost,
+            ))
+
+
+def _old_and_new(obj, field):
+    """Значение поля до изменения в сессии и текущее значение."""
+    history = inspect(obj).attrs[field].history
+    new = getattr(obj, field)
+    old = history.deleted[0] if history.deleted else new
+    return old, new
+
+
+def _equipment_deltas(session, deltas):
+    """Добавляет в deltas вклады новых, измененных и удаленных в этом flush ТМЦ."""
+    contributions = []  # (знак, usersid, department_id, nomeid, месяц, os, статус, стоимость)
+
+    def add(sign, values):
+        if not values['active']:
+            return
+        contributions.append((
+            sign, values['usersid'], values['department_id'] or 0, values['nomeid'],
+            _month_start(values['datepost']), bool(values['os']),
+            equipment_status(values['repair'], values['lost']), _to_decimal(values['cost']),
+        ))
+
+    for obj in session.new:
+        if isinstance(obj, Equipment):
+            add(1, {field: getattr(obj, field) for field in _TRACKED_FIELDS})
+    for obj in session.deleted:
+        if isinstance(obj, Equipment):
+            add(-1, {field: _old_and_new(obj, field)[0] for field in _TRACKED_FIELDS})
+    for obj in session.dirty:
+        if not isinstance(obj, Equipment) or not session.is_modified(obj, include_collections=False):
+            continue
+        pairs = {field: _old_and_new(obj, field) for field in _TRACKED_FIELDS}
+        if all(old == new for old, new in pairs.values()):
+            continue
+        add(-1, {field: old for field, (old, _) in pairs.items()})
+        add(1, {field: new for field, (_, new) in pairs.items()})
+
+    if not contributions:
+        return
+
+    # Группа наименования нужна для ключа — одним запросом для всех затронутых nomeid
+    nome_ids = {item[3] for item in contributions}
+    group_by_nome = dict(session.connection().execute(
+        db.select(Nome.id, Nome.groupid).where(Nome.id.in_(nome_ids))
+    ).all())
+
+    for sign, usersid, department_id, nomeid, month, is_os, status, cost in contributions:
+        group_id = group_by_nome.get(nomeid)
+        if group_id is None:
+            continue
+        delta = deltas[(usersid, department_id, group_id, month, is_os, status)]
+        delta[0] += sign
+        delta[1] += sign * cost
+
+
+def _nome_regroup_deltas(session, deltas):
+    """Переносит вклад ТМЦ наименования в новую группу, если у Nome сменилась groupid."""
+    for obj in session.dirty:
+        if not isinstance(obj, Nome):
+            continue
+        old_group, new_group = _old_and_new(obj, 'groupid')
+        if old_group == new_group:
+            continue
+        for row in _grouped_equipment(session.connection(), Equipment.nomeid == obj.id):
+            month = date(int(row.year), int(row.month), 1)
+            for group_id, sign in ((old_group, -1), (new_group, 1)):
+                delta = deltas[(row.usersid, row.department_id or 0, group_id, month, bool(row.os), row.status)]
+                delta[0] += sign * row.count
+                delta[1] += sign * _to_decimal(row.cost)
+
+
+def _grouped_equipment(connection, *criteria):
+    """Активные ТМЦ, сгруппированные по ключу stats_rollup (месяц — как год и номер месяца)."""
+    year = extract('year', Equipment.datepost)
+    month = extract('month', Equipment.datepost)
+    status = _status_expr()
+    query = db.select(
+        Equipment.usersid, Equipment.department_id, Nome.groupid.label('group_id'),
+        year.label('year'), month.label('month'), Equipment.os, status.label('status'),
+        func.count(Equipment.id).label('count'),
+        func.coalesce(func.sum(Equipment.cost), 0).label('cost'),
+    ).join(Nome, Nome.id == Equipment.nomeid)\
+     .where(Equipment.active == True, *criteria)\
+     .group_by(Equipment.usersid, Equipment.department_id, Nome.groupid, year, month, Equipment.os, status)
+    return connection.execute(query).all()
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollup(session, flush_context):
+    if session.info.get(_REBUILDING_KEY):
+        return
+    deltas = defaultdict(lambda: [0, Decimal('0.00')])
+    _equipment_deltas(session, deltas)
+    _nome_regroup_deltas(session, deltas)
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+def rebuild_stats_rollup():
+    """
+    Полностью пересобирает stats_rollup по таблице equipment.
+
+    Returns:
+        int: количество записанных строк
+    """
+    session = db.session
+    session.info[_REBUILDING_KEY] = True
+    try:
+        connection = session.connection()
+        rows = _grouped_equipment(connection)
+        connection.execute(StatsRollup.__table__.delete())
+        values = [{
+            'usersid': row.usersid,
+            'department_id': row.department_id or 0,
+            'group_id': row.group_id,
+            'month': date(int(row.year), int(row.month), 1) if row.year else date(1970, 1, 1),
+            'os': bool(row.os),
+            'status': row.status,
+            'count': row.count,
+            'cost': _to_decimal(row.cost),
+        } for row in rows]
+        # Ключи с пустым отделом (NULL и 0) и пустой датой сливаются в одну строку
+        merged = {}
+        for item in values:
+            key = tuple(item[k] for k in ('usersid', 'department_id', 'group_id', 'month', 'os', 'status'))
+            if key in merged:
+                merged[key]['count'] += item['count']
+                merged[key]['cost'] += item['cost']
+            else:
+                merged[key] = item
+        if merged:
+            connection.execute(StatsRollup.__table__.insert(), list(merged.values()))
+        session.commit()
+        return len(merged)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(_REBUILDING_KEY, None)
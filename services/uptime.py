@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+История состояний и доступность сетевых устройств.
+
+После каждого цикла опроса (services/monitoring.py):
+- смена состояния устройства записывается одной строкой в device_status_history;
+- промежуток между предыдущей и текущей проверкой засчитывается в состояние,
+  которое было на предыдущей проверке, и добавляется к часовым и суточным
+  агрегатам device_uptime (UTC). Промежутки длиннее max_gap (опросчик не
+  работал) не засчитываются — это время считается ненаблюдаемым.
+
+Таблицы не растут с каждой проверкой: история — только смены состояния,
+агрегаты — одна строка на устройство в час и в сутки. Часовые агрегаты
+старше MONITOR_HOURLY_RETENTION_DAYS удаляются.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from models import DeviceStatusHistory, DeviceUptime, db
+
+# Сколько дней хранить часовые агрегаты (суточные хранятся без ограничения)
+HOURLY_RETENTION_DAYS = int(os.environ.get('MONITOR_HOURLY_RETENTION_DAYS', 31))
+
+PERIODS = ('hour', 'day')
+
+# Максимальное окно запроса доступности (дни)
+MAX_WINDOW_DAYS = 366
+
+
+def period_floor(moment, period):
+    """Начало часа или суток, в которые попадает moment."""
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _period_length(period):
+    return timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+
+
+def _split(start, end, period):
+    """Разбивает промежуток [start, end) по часам или суткам: [(начало периода, секунды)]."""
+    parts = []
+    step = _period_length(period)
+    bucket = period_floor(start, period)
+    while start < end:
+        bucket_end = min(bucket + step, end)
+        parts.append((bucket, (bucket_end - start).total_seconds()))
+        start = bucket_end
+        bucket += step
+    return parts
+
+
+def record_cycle(previous, results, checked_at, max_gap):
+    """
+    Записывает смены состояния и пополняет агрегаты доступности за цикл опроса.
+    Вызывается из save_statuses в той же транзакции.
+
+    Args:
+        previous: {ID ТМЦ: (в сети, время проверки)} — состояние до цикла
+        results: {ID ТМЦ: (IP, в сети, способ, время ответа)} — результаты цикла
+        checked_at: время текущей проверки
+        max_gap: максимальный засчитываемый промежуток между проверками (секунды)
+    """
+    history = []
+    increments = {}
+    for equipment_id, (_, online, _, _) in results.items():
+        prev = previous.get(equipment_id)
+        if prev is None or prev[0] != online:
+            history.append({'equipment_id': equipment_id, 'online': online, 'changed_at': checked_at})
+        if prev is None:
+            continue
+        was_online, prev_checked_at = prev
+        if not prev_checked_at or (checked_at - prev_checked_at).total_seconds() > max_gap:
+            continue
+        for period in PERIODS:
+            for bucket, seconds in _split(prev_checked_at, checked_at, period):
+                totals = increments.setdefault((equipment_id, period, bucket), [0.0, 0.0])
+                totals[0] += seconds
+                if was_online:
+                    totals[1] += seconds
+
+    connection = db.session.connection()
+    if history:
+        connection.execute(DeviceStatusHistory.__table__.insert(), history)
+    if increments:
+        _add_uptime(connection, increments)
+
+
+def _add_uptime(connection, increments):
+    """Прибавляет секунды к агрегатам (создает строки, которых еще нет)."""
+    table = DeviceUptime.__table__
+    rows = [{'equipment_id': equipment_id, 'period': period, 'period_start': bucket,
+             'observed_seconds': observed, 'online_seconds': online}
+            for (equipment_id, period, bucket), (observed, online) in increments.items()]
+    if connection.dialect.name == 'mysql':
+        statement = mysql_insert(table)
+        connection.execute(statement.on_duplicate_key_update(
+            observed_seconds=table.c.observed_seconds + statement.inserted.observed_seconds,
+            online_seconds=table.c.online_seconds + statement.inserted.online_seconds,
+        ), rows)
+        return
+    for row in rows:
+        result = connection.execute(table.update().where(
+            table.c.equipment_id == row['equipment_id'],
+            table.c.period == row['period'],
+            table.c.period_start == row['period_start'],
+        ).values(
+            observed_seconds=table.c.observed_seconds + row['observed_seconds'],
+            online_seconds=table.c.online_seconds + row['online_seconds'],
+        ))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def cleanup_uptime(retention_days=HOURLY_RETENTION_DAYS):
+    """Удаляет часовые агрегаты старше retention_days. Возвращает число удаленных строк."""
+    deadline = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.session.execute(DeviceUptime.__table__.delete().where(
+        DeviceUptime.period == 'hour', DeviceUptime.period_start < deadline
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def availability_window(args):
+    """
+    Окно запроса доступности из параметров days и granularity.
+
+    Returns:
+        tuple: (начало окна, конец окна, 'hour' или 'day')
+
+    Raises:
+        ValueError: некорректные параметры
+    """
+    days = float(args.get('days', 7))
+    if not 0 < days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'days должен быть от 0 до {MAX_WINDOW_DAYS}')
+    granularity = args.get('granularity') or ('hour' if days <= 2 else 'day')
+    if granularity not in PERIODS:
+        raise ValueError("granularity должен быть 'hour' или 'day'")
+    if granularity == 'hour' and days > HOURLY_RETENTION_DAYS:
+        raise ValueError(f'Почасовые данные хранятся {HOURLY_RETENTION_DAYS} дн.')
+    until = datetime.utcnow()
+    return until - timedelta(days=days), until, granularity
+
+
+def uptime_percent(online, observed):
+    """Процент времени в сети (None, если устройство не наблюдалось)."""
+    return round(online / observed * 100, 2) if observed else None
+
+
+def uptime_totals(equipment_ids, since, period='day'):
+    """
+    Секунды в сети и наблюдения по устройствам с начала периода, содержащего since,
+    одним запросом: {ID ТМЦ: (в сети, наблюдалось)}.
+    """
+    equipment_ids = list(equipment_ids)
+    if not equipment_ids:
+        return {}
+    rows = db.session.query(
+        DeviceUptime.equipment_id,
+        func.sum(DeviceUptime.online_seconds),
+        func.sum(DeviceUptime.observed_seconds),
+    ).filter(
+        DeviceUptime.equipment_id.in_(equipment_ids),
+        DeviceUptime.period == period,
+        DeviceUptime.period_start >= period_floor(since, period),
+    ).group_by(DeviceUptime.equipment_id).all()
+    return {equipment_id: (online or 0, observed or 0) for equipment_id, online, observed in rows}
+
+
+def uptime_by_device(equipment_ids, since, period='day'):
+    """Доступность устройств с начала периода, содержащего since: {ID ТМЦ: процент или None}."""
+    return {equipment_id: uptime_percent(online, observed)
+            for equipment_id, (online, observed) in uptime_totals(equipment_ids, since, period).items()}
+
+
+def availability(equipment_ids, since, until, granularity):
+    """
+    Доступность набора устройств за окно: итог, ряд по периодам и итог по каждому устройству.
+
+    Returns:
+        dict: uptime_percent, observed_seconds, online_seconds,
+              series [{start, uptime_percent, observed_seconds}],
+              devices {ID ТМЦ: uptime_percent}
+    """
+    equipment_ids = list(equipment_ids)
+    rows = []
+    if equipment_ids:
+        rows = db.session.query(
+            DeviceUptime.equipment_id, DeviceUptime.period_start,
+            DeviceUptime.online_seconds, DeviceUptime.observed_seconds,
+        ).filter(
+            DeviceUptime.equipment_id.in_(equipment_ids),
+            DeviceUptime.period == granularity,
+            DeviceUptime.period_start >= period_floor(since, granularity),
+            DeviceUptime.period_start <= until,
+        ).all()
+
+    series = {}
+    devices = {}
+    for equipment_id, start, online, observed in rows:
+        for totals in (series.setdefault(start, [0.0, 0.0]), devices.setdefault(equipment_id, [0.0, 0.0])):
+            totals[0] += online
+            totals[1] += observed
+
+    online_total = sum(online for online, _ in series.values())
+    observed_total = sum(observed for _, observed in series.values())
+    return {
+        'from': since.isoformat(),
+        'to': until.isoformat(),
+        'granularity': granularity,
+        'uptime_percent': uptime_percent(online_total, observed_total),
+        'online_seconds': round(online_total),
+        'observed_seconds': round(observed_total),
+        'series': [{'start': start.isoformat(), 'uptime_percent': uptime_percent(online, observed),
+                    'observed_seconds': round(observed)}
+                   for start, (online, observed) in sorted(series.items())],
+        'devices': {equipment_id: uptime_percent(online, observed)
+                    for equipment_id, (online, observed) in devices.items()},
+    }
+
+
+def status_changes(equipment_id, since, limit=500):
+    """Смены состояния устройства с момента since (новые в конце)."""
+    rows = DeviceStatusHistory.query.filter(
+        DeviceStatusHistory.equipment_id == equipment_id,
+        DeviceStatusHistory.changed_at >= since,
+    ).order_by(DeviceStatusHistory.changed_at.desc(), DeviceStatusHistory.id.desc()).limit(limit).all()
+    return [{'at': row.changed_at.isoformat(), 'online': row.online} for row in reversed(rows)]
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш «шапки» пользователя для контекстного процессора inject_user_data.
+
+Шапка (количество и стоимость ТМЦ, фото, организация, флаги ролей) считается
+одним агрегирующим запросом и хранится в памяти процесса с ограниченным сроком
+жизни (USER_SUMMARY_TTL, секунды). Запись сбрасывается после коммита, если
+изменились ТМЦ пользователя, его профиль, роли или учетная запись. Изменение
+любого ТМЦ сбрасывает шапки администраторов, так как они видят все ТМЦ.
+
+Кэш локален для процесса: в других воркерах gunicorn устаревшее значение
+живет не дольше TTL.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import exists, func
+
+from models import Equipment, Org, Users, UsersProfile, UsersRoles, db
+
+from .cache_invalidation import ALL, CacheInvalidation, attr_values
+
+USER_SUMMARY_TTL = int(os.getenv('USER_SUMMARY_TTL', '60'))
+
+# Роль МОЛ в таблице usersroles
+MOL_ROLE_ID = 1
+
+_cache = {}  # user_id -> (время истечения, шапка)
+_lock = threading.Lock()
+
+# Специальное значение: сбросить шапки администраторов
+_ADMINS = 'admins'
+
+
+def compute_user_summary(user):
+    """
+    Считает шапку пользователя одним запросом к БД.
+
+    Количество и сумма стоимости ТМЦ берутся агрегатом по equipment,
+    фото, организация и роль МОЛ — скалярными подзапросами в том же SELECT.
+
+    Returns:
+        dict: tmc_count, total_cost, photo, org_name, is_admin, is_mol
+    """
+    is_admin = user.mode == 1
+
+    photo_sq = db.session.query(UsersProfile.jpegphoto)\
+        .filter(UsersProfile.usersid == user.id)\
+        .limit(1)\
+        .scalar_subquery()
+    org_sq = db.session.query(Org.name)\
+        .filter(Org.id == user.orgid)\
+        .limit(1)\
+        .scalar_subquery()
+    mol_sq = exists().where(UsersRoles.userid == user.id, UsersRoles.role == MOL_ROLE_ID)
+
+    query = db.session.query(
+        func.count(Equipment.id),
+        func.coalesce(func.sum(Equipment.cost), 0),
+        photo_sq,
+        org_sq,
+        mol_sq,
+    ).filter(Equipment.active == True, Equipment.os == True)
+    if not is_admin:
+        query = query.filter(Equipment.usersid == user.id)
+
+    tmc_count, total_cost, photo, org_name, is_mol = query.one()
+
+    return {
+        'tmc_count': tmc_count or 0,
+        'total_cost': total_cost or 0,
+        'photo': photo if photo and photo != 'noimage.jpg' else None,
+        'org_name': org_name,
+        'is_admin': is_admin,
+        'is_mol': bool(is_mol),
+    }
+
+
+def get_user_summary(user):
+    """Возвращает шапку пользователя из кэша, при необходимости пересчитывая её."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user.id)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    summary = compute_user_summary(user)
+    with _lock:
+        _cache[user.id] = (now + USER_SUMMARY_TTL, summary)
+    return summary
+
+
+def invalidate_user_summary(user_id=None):
+    """Сбрасывает шапку пользователя (или весь кэш, если user_id не указан)."""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def _invalidate_admins():
+    """Сбрасывает шапки всех администраторов."""
+    with _lock:
+        for user_id in [uid for uid, (_, s) in _cache.items() if s['is_admin']]:
+            del _cache[user_id]
+
+
+def _changed_users(session, obj):
+    """Пользователи, чьи шапки затронуты изменением объекта."""
+    if isinstance(obj, Equipment):
+        return attr_values(obj, 'usersid') | {_ADMINS}
+    if isinstance(obj, UsersProfile):
+        return attr_values(obj, 'usersid')
+    if isinstance(obj, UsersRoles):
+        return attr_values(obj, 'userid')
+    if isinstance(obj, Users):
+        return {obj.id}
+    return {ALL}
+
+
+def _apply_invalidation(user_ids):
+    if user_ids is None:
+        invalidate_user_summary()
+        return
+    if _ADMINS in user_ids:
+        _invalidate_admins()
+    for user_id in user_ids - {_ADMINS}:
+        invalidate_user_summary(user_id)
+
+
+_invalidation = CacheInvalidation('user_summary_pending', (Equipment, UsersProfile, UsersRoles, Users, Org),
+                                  _changed_users, _apply_invalidation)
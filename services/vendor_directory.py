@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Справочник производителей в памяти процесса для агентов сбора и обогащения данных.
+
+Названия производителей приходят от агентов и внешних источников в разном
+написании («WDC», «Western Digital Corporation», «ST», «Advanced Micro Devices,
+Inc.»). Справочник хранит активных производителей по нормализованному ключу
+(регистр, пунктуация и юридические суффиксы отбрасываются) и по каноническому
+имени из таблицы псевдонимов VENDOR_ALIASES, поэтому поиск не делает запросов
+вида lower(name) = ..., которые не используют индекс.
+
+Справочник загружается целиком одним запросом (таблица vendor небольшая) и
+перечитывается, когда меняется версия области 'vendor' в data_versions: ее
+увеличивает любое изменение названия или активности производителя через ORM
+(services/data_versions.py) и invalidate_vendors() для изменений в обход ORM.
+Версия проверяется не чаще раза в VENDOR_DIRECTORY_CHECK секунд.
+
+Недостающие производители создаются под блокировкой: в MySQL — в отдельной
+транзакции под именованной блокировкой GET_LOCK, поэтому параллельные агенты
+не создают дубликаты, а созданная запись сразу видна другим процессам.
+В остальных СУБД запись добавляется в текущую транзакцию.
+
+Определение производителя видеокарты по модели (когда агент его не передал) —
+по таблице правил GPU_MODEL_RULES вместо цепочки условий.
+"""
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import DataVersion, Vendor, db
+
+from .cache_invalidation import ALL, CacheInvalidation
+from .data_versions import VENDOR_SCOPE, bump_versions
+
+VENDOR_DIRECTORY_CHECK = float(os.environ.get('VENDOR_DIRECTORY_CHECK', 5))
+
+# Производитель, если его не удалось определить
+UNKNOWN_VENDOR = 'Unknown'
+
+# Каноническое имя -> другие написания
+VENDOR_ALIASES = {
+    'Western Digital': ('WDC', 'WD', 'Western Digital Technologies'),
+    'Seagate': ('ST', 'Seagate Technology'),
+    'Toshiba': ('Toshiba America',),
+    'HP': ('Hewlett-Packard', 'Hewlett Packard', 'HPE', 'Hewlett Packard Enterprise'),
+    'Samsung': ('Samsung Electronics',),
+    'Kingston': ('Kingston Technology',),
+    'SanDisk': ('San Disk',),
+    'ADATA': ('A-DATA', 'ADATA Technology'),
+    'AMD': ('Advanced Micro Devices', 'ATI', 'ATI Technologies'),
+    'NVIDIA': ('nVidia Corporation',),
+    'Intel': ('Intel Corporation',),
+    'БЕШТАУ': ('Beshtau',),
+}
+
+# Правила определения производителя видеокарты по модели: (производитель, подстроки, префиксы).
+# Проверяются по порядку, модель сравнивается в верхнем регистре. Правила для
+# дисков — в data/disk_rules.json (services/disk_rules.py).
+GPU_MODEL_RULES = (
+    ('NVIDIA', ('NVIDIA', 'GEFORCE', 'RTX', 'GTX'), ()),
+    ('AMD', ('AMD', 'RADEON', 'RX'), ()),
+    ('Intel', ('INTEL',), ()),
+)
+
+# Юридические суффиксы, не влияющие на ключ производителя
+_LEGAL_SUFFIXES = {'inc', 'corp', 'corporation', 'co', 'ltd', 'llc', 'gmbh', 'ag', 'plc', 'limited'}
+
+# Имя именованной блокировки MySQL для создания производителей
+_CREATE_LOCK = 'vendor_directory_create'
+_CREATE_LOCK_TIMEOUT = 10
+
+
+def vendor_key(name):
+    """Нормализованный ключ названия: нижний регистр, без пунктуации и юридических суффиксов."""
+    words = re.sub(r'[\W_]+', ' ', (name or '').casefold()).split()
+    while len(words) > 1 and words[-1] in _LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+
+_ALIAS_KEYS = {}
+for _canonical, _aliases in VENDOR_ALIASES.items():
+    for _alias in (_canonical,) + _aliases:
+        _ALIAS_KEYS[vendor_key(_alias)] = vendor_key(_canonical)
+_CANONICAL_NAMES = {vendor_key(name): name for name in VENDOR_ALIASES}
+
+
+def canonical_key(name):
+    """Ключ канонического производителя (псевдонимы сводятся к одному ключу)."""
+    key = vendor_key(name)
+    return _ALIAS_KEYS.get(key, key)
+
+
+def canonical_name(name):
+    """Каноническое написание названия (для создания нового производителя)."""
+    name = (name or '').strip()
+    return _CANONICAL_NAMES.get(canonical_key(name), name)
+
+
+def _compile_rules(rules):
+    compiled = []
+    for vendor, substrings, prefixes in rules:
+        parts = [re.escape(value) for value in substrings] + ['^' + re.escape(value) for value in prefixes]
+        compiled.append((re.compile('|'.join(parts)), vendor))
+    return compiled
+
+
+_GPU_MATCHER = _compile_rules(GPU_MODEL_RULES)
+
+
+def _match(matcher, model):
+    model = (model or '').upper()
+    if model:
+        for pattern, vendor in matcher:
+            if pattern.search(model):
+                return vendor
+    return UNKNOWN_VENDOR
+
+
+def detect_graphics_manufacturer(model):
+    """Производитель видеокарты по модели ('Unknown', если ни одно правило не подошло)."""
+    return _match(_GPU_MATCHER, model)
+
+
+class _Directory:
+    """Снимок активных производителей: точные ключи, канонические ключи, названия."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.checked = time.monotonic()
+        self.exact = {}
+        self.canonical = {}
+        self.names = {}
+        for vendor_id, name in rows:
+            self.names[vendor_id] = name
+            self.exact.setdefault(vendor_key(name), vendor_id)
+            self.canonical.setdefault(canonical_key(name), vendor_id)
+
+    def find(self, name):
+        key = vendor_key(name)
+        if not key:
+            return None
+        return self.exact.get(key) or self.canonical.get(_ALIAS_KEYS.get(key, key))
+
+
+_directory = None
+_lock = threading.Lock()
+
+
+def _version(connection=None):
+    statement = db.select(DataVersion.version).where(DataVersion.scope == VENDOR_SCOPE)
+    return (connection or db.session).execute(statement).scalar() or 0
+
+
+def _load(connection=None):
+    version = _version(connection)
+    statement = db.select(Vendor.id, Vendor.name).where(Vendor.active == True).order_by(Vendor.id)
+    rows = (connection or db.session).execute(statement).all()
+    return _Directory(version, rows)
+
+
+def _current():
+    """Актуальный снимок справочника (перечитывается при смене версии 'vendor')."""
+    global _directory
+    directory = _directory
+    now = time.monotonic()
+    if directory is not None and now - directory.checked < VENDOR_DIRECTORY_CHECK:
+        return directory
+    if directory is not None and _version() == directory.version:
+        directory.checked = now
+        return directory
+    directory = _load()
+    with _lock:
+        _directory = directory
+    return directory
+
+
+def find_vendor_id(name):
+    """id активного производителя по названию или псевдониму (None — не найден, не создается)."""
+    return _current().find(name)
+
+
+def find_vendor_name(vendor_id):
+    """Название активного производителя по id (None — не найден)."""
+    return _current().names.get(vendor_id)
+
+
+def _create_locked(connection, names):
+    """Перечитывает справочник на соединении и создает отсутствующих производителей."""
+    directory = _load(connection)
+    missing = {}
+    for name in names:
+        if directory.find(name) is None:
+            missing.setdefault(canonical_key(name), canonical_name(name))
+    if missing:
+        connection.execute(Vendor.__table__.insert(),
+                           [{'name': name, 'active': True, 'comment': ''} for name in missing.values()])
+        directory = _load(connection)
+    return directory
+
+
+def resolve_vendor_ids(names):
+    """
+    id производителей по названиям; отсутствующие создаются (под каноническим именем).
+
+    Returns:
+        dict: {название: id} для непустых названий (id = None, если создать не удалось)
+    """
+    global _directory
+    names = [name for name in dict.fromkeys(names) if name and vendor_key(name)]
+    directory = _current()
+    result = {name: directory.find(name) for name in names}
+    missing = [name for name, vendor_id in result.items() if vendor_id is None]
+    if not missing:
+        return result
+
+    with _lock:
+        if db.session.get_bind().dialect.name == 'mysql':
+            # Отдельная транзакция: новые производители видны всем процессам сразу
+            with db.engine.begin() as connection:
+                locked = connection.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                                            {'name': _CREATE_LOCK, 'timeout': _CREATE_LOCK_TIMEOUT}).scalar()
+                if not locked:
+                    print(f"Справочник производителей: не удалось получить блокировку для {missing}")
+                    return result
+                try:
+                    directory = _create_locked(connection, missing)
+                finally:
+                    connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': _CREATE_LOCK})
+            _directory = directory
+        else:
+            # Запись в текущей транзакции: кэш процесса сбрасывается после commit
+            directory = _create_locked(db.session.connection(), missing)
+            _invalidation.add(db.session)
+    result.update({name: directory.find(name) for name in missing})
+    return result
+
+
+def resolve_vendor_id(name):
+    """id производителя по названию; создается, если его нет (None для пустого названия)."""
+    return resolve_vendor_ids([name]).get(name)
+
+
+def invalidate_vendors():
+    """
+    Сбрасывает справочник во всех процессах. Вызывается в транзакции, изменившей
+    производителей в обход ORM (прямой SQL); изменения через ORM учитываются сами.
+    """
+    bump_versions(db.session.connection(), {VENDOR_SCOPE})
+    _invalidation.add(db.session)
+
+
+def _reset():
+    global _directory
+    with _lock:
+        _directory = None
+
+
+# Другие процессы узнают об изменении по версии 'vendor', этот — сразу после commit.
+# После rollback справочник тоже перечитывается: снимок мог захватить откаченные строки
+_invalidation = CacheInvalidation('vendor_directory_pending', (Vendor,), lambda session, obj: {ALL},
+                                  lambda keys: _reset(), apply_on_rollback=True)
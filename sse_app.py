@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронная точка входа (ASGI) для потока событий мониторинга сети.
+
+Страницы мониторинга подписываются на /events/monitoring и получают смены
+состояния устройств без перезагрузки. Каждое подключение здесь — корутина,
+а не рабочий процесс gunicorn; БД опрашивается один раз на все подключения
+(services/monitoring_events.py).
+
+Запуск (нужен ASGI-сервер, например uvicorn):
+
+    uvicorn sse_app:app --host 127.0.0.1 --port 5001
+
+В nginx путь /events/ проксируется на этот процесс (см. README, раздел Nginx).
+Авторизация — по cookie сессии основного приложения Flask.
+"""
+import asyncio
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from app import app as flask_app, load_user
+from services.monitoring_events import (SSE_KEEPALIVE, SSE_POLL_INTERVAL, TransitionBroadcaster,
+                                        format_heartbeat, format_transition, parse_last_event_id)
+
+EVENTS_PATH = '/events/monitoring'
+
+broadcaster = TransitionBroadcaster(flask_app.app_context)
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def _session_user_id(headers):
+    """ID пользователя из подписанной cookie сессии Flask (None — не авторизован)."""
+    cookie = SimpleCookie()
+    try:
+        cookie.load(headers.get('cookie', ''))
+    except Exception:
+        return None
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        session = serializer.loads(morsel.value,
+                                   max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    return session.get('_user_id')
+
+
+def _is_active_user(user_id):
+    with flask_app.app_context():
+        user = load_user(user_id)
+        return bool(user and user.is_active)
+
+
+async def _send_text(send, status, text):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _stream(send, queue, place_id):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+    await send({'type': 'http.response.body', 'body': f'retry: {int(SSE_POLL_INTERVAL * 1000)}\n\n'.encode(),
+                'more_body': True})
+    while broadcaster.is_subscribed(queue) or not queue.empty():
+        try:
+            item = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+        except asyncio.TimeoutError:
+            chunk = ': keep-alive\n\n'
+        else:
+            if 'snapshot' in item:
+                chunk = format_heartbeat(item['snapshot'])
+            elif place_id is None or item['place_id'] == place_id:
+                chunk = format_transition(item)
+            else:
+                continue
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    # Подписка снята (клиент не успевал читать) — закрываем поток, браузер переподключится
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def app(scope, receive, send):
+    """ASGI-приложение: единственный маршрут GET /events/monitoring[?place_id=&after=]."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] != EVENTS_PATH or scope['method'] != 'GET':
+        await _send_text(send, 404, 'Not Found')
+        return
+
+    headers = _headers(scope)
+    user_id = _session_user_id(headers)
+    if user_id is None or not await asyncio.to_thread(_is_active_user, user_id):
+        await _send_text(send, 401, 'Unauthorized')
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    place_id = query.get('place_id', [''])[0]
+    place_id = int(place_id) if place_id.isdigit() else None
+    after_id = parse_last_event_id(headers.get('last-event-id'), query.get('after', [''])[0])
+
+    queue = await broadcaster.subscribe(after_id)
+    stream = asyncio.create_task(_stream(send, queue, place_id))
+    disconnect = asyncio.create_task(_wait_disconnect(receive))
+    try:
+        await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        broadcaster.unsubscribe(queue)
+        for task in (stream, disconnect):
+            task.cancel()
+        await asyncio.gather(stream, disconnect, return_exceptions=True)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты обогащения процессоров (services/cpu_enrichment.py) на сохраненных
+страницах cpubenchmark.net из tests/fixtures/cpubenchmark, без обращений к сети.
+"""
+import os
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+from models import PCCPU, EnrichmentJob, Vendor, db
+from services.cpu_enrichment import (CpuBenchmarkClient, PageCache, cpu_page_path, group_cpus,
+                                     parse_cpu_page, run_cpu_enrichment)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'cpubenchmark')
+
+# Сохраненные страницы: название процессора -> файл
+PAGES = {
+    'Intel Core i5-3450': 'intel_core_i5-3450.html',
+    'AMD Ryzen 5 3600': 'amd_ryzen_5_3600.html',
+}
+
+
+def read_page(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    """Любая попытка открыть сетевое соединение проваливает тест."""
+    def forbidden(*args, **kwargs):
+        raise AssertionError('Обращение к сети в офлайн-режиме')
+
+    monkeypatch.setattr(socket, 'create_connection', forbidden)
+    monkeypatch.setattr(socket.socket, 'connect', forbidden)
+    monkeypatch.setattr(CpuBenchmarkClient, '_get_session', forbidden)
+
+
+@pytest.fixture
+def page_cache(tmp_path):
+    """Кэш страниц во временном каталоге, заполненный сохраненными страницами."""
+    cache = PageCache(str(tmp_path / 'pages'), ttl=0)
+    for cpu_name, filename in PAGES.items():
+        cache.put(cpu_name, read_page(filename))
+    return cache
+
+
+def test_parse_intel_page():
+    data = parse_cpu_page(read_page('intel_core_i5-3450.html'))
+    assert data == {
+        'benchmark_rating': 3452,
+        'socket': 'LGA1155',
+        'cores': 4,
+        'threads': 4,
+        'base_clock_mhz': 3100,
+        'boost_clock_mhz': 3500,
+        'tdp_watts': 77,
+        'cache_l2_kb': 1024,
+        'cache_l3_kb': 6144,
+    }
+
+
+def test_parse_cores_from_table():
+    # Ядра и потоки этой страницы есть только в таблице характеристик
+    data = parse_cpu_page(read_page('amd_ryzen_5_3600.html'))
+    assert data['benchmark_rating'] == 17731
+    assert data['socket'] == 'AM4'
+    assert (data['cores'], data['threads']) == (6, 12)
+    assert (data['base_clock_mhz'], data['boost_clock_mhz']) == (3600, 4200)
+    assert data['cache_l3_kb'] == 32768
+
+
+def test_parse_empty_page():
+    assert parse_cpu_page('<html><body><p>Not found</p></body></html>') is None
+
+
+def test_group_cpus_deduplicates_models():
+    intel = SimpleNamespace(name='Intel')
+    cpus = [
+        SimpleNamespace(id=1, model='Core i5-3450 @ 3.10GHz', vendor=intel),
+        SimpleNamespace(id=2, model='  core i5-3450  ', vendor=intel),
+        SimpleNamespace(id=3, model='Core  i5-3450 @ 3100 MHz', vendor=intel),
+        SimpleNamespace(id=4, model='Ryzen 5 3600', vendor=SimpleNamespace(name='AMD')),
+        SimpleNamespace(id=5, model='Ryzen 5 3600', vendor=None),
+        SimpleNamespace(id=6, model='', vendor=intel),
+        SimpleNamespace(id=7, model=None, vendor=None),
+    ]
+    groups, skipped = group_cpus(cpus)
+
+    assert set(groups) == {'intel core i5-3450', 'amd ryzen 5 3600', 'ryzen 5 3600'}
+    full_name, model_name, group = groups['intel core i5-3450']
+    assert full_name == 'Intel Core i5-3450 @ 3.10GHz'
+    assert model_name == 'Core i5-3450 @ 3.10GHz'
+    assert [cpu.id for cpu in group] == [1, 2, 3]
+    assert [cpu.id for cpu in skipped] == [6, 7]
+
+
+def test_offline_client_reads_cache_only(no_network, page_cache):
+    client = CpuBenchmarkClient(cache=page_cache, offline=True)
+    assert os.path.exists(cpu_page_path('Intel Core i5-3450 @ 3.10GHz', page_cache.directory))
+
+    data, cached = client.cpu_data('Intel Core i5-3450 @ 3.10GHz')
+    assert cached and data['benchmark_rating'] == 3452
+    assert client.fetch_page('Intel Core i9-99999') == (None, False)
+
+
+def test_run_cpu_enrichment_offline(app, no_network, page_cache):
+    intel = Vendor(name='Intel', active=True)
+    amd = Vendor(name='AMD', active=True)
+    db.session.add_all([intel, amd])
+    db.session.flush()
+    db.session.add_all([
+        PCCPU(vendor_id=intel.id, model='Core i5-3450 @ 3.10GHz', active=True),
+        PCCPU(vendor_id=intel.id, model='core i5-3450', active=True),
+        PCCPU(vendor_id=amd.id, model='Ryzen 5 3600', active=True),
+        PCCPU(vendor_id=intel.id, model='Pentium G9999', active=True),
+        PCCPU(vendor_id=intel.id, model='Core i5-3450', active=False),
+    ])
+    job = EnrichmentJob(kind='cpu', status='running')
+    db.session.add(job)
+    db.session.commit()
+
+    run_cpu_enrichment(job, CpuBenchmarkClient(cache=page_cache, offline=True))
+
+    assert job.status == 'done'
+    assert (job.total, job.processed, job.cached) == (3, 3, 2)
+    assert (job.updated_count, job.not_found_count) == (3, 1)
+    ratings = {cpu.model: cpu.benchmark_rating for cpu in PCCPU.query.filter_by(active=True)}
+    assert ratings == {
+        'Core i5-3450 @ 3.10GHz': 3452,
+        'core i5-3450': 3452,
+        'Ryzen 5 3600': 17731,
+        'Pentium G9999': None,
+    }
+    assert PCCPU.query.filter_by(active=False).one().benchmark_rating is None
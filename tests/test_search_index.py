@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты поискового индекса ТМЦ (services/search_index.py): слова индекса и
+автопривязка машин по MAC-адресу, записанному с подписью («MAC:», «mac=»).
+"""
+import pytest
+
+from models import Equipment, db
+from services import search_index
+from services.search_index import match_machine_equipment, tokenize
+
+
+@pytest.fixture
+def index(app, monkeypatch):
+    """Пустой индекс процесса: каждый тест строит его заново по своей базе."""
+    monkeypatch.setattr(search_index, '_index', None)
+
+
+def add_equipment(**fields):
+    equipment = Equipment(orgid=1, placesid=1, usersid=1, nomeid=1, os=True, **fields)
+    db.session.add(equipment)
+    db.session.commit()
+    return equipment.id
+
+
+@pytest.mark.parametrize('text', [
+    'AA:BB:CC:DD:EE:01',
+    'MAC:AA:BB:CC:DD:EE:01',
+    'mac=aa-bb-cc-dd-ee-01',
+    'Системный блок (MAC.aabbccddee01)',
+])
+def test_tokenize_indexes_mac_inside_word(text):
+    assert 'aabbccddee01' in tokenize(text)
+
+
+def test_tokenize_mac_query():
+    assert tokenize('AA-BB-CC-DD-EE-01', query=True) == ['aabbccddee01']
+
+
+def test_tokenize_ignores_longer_hex():
+    assert tokenize('deadbeefcafe0001') == ['deadbeefcafe0001']
+
+
+def test_match_labelled_mac(index):
+    add_equipment(buhname='Системный блок', comment='ПК бухгалтерии')
+    by_comment = add_equipment(buhname='Системный блок', comment='MAC:AA:BB:CC:DD:EE:01')
+    by_sernum = add_equipment(buhname='Моноблок', sernum='mac=aa-bb-cc-dd-ee-02')
+
+    assert match_machine_equipment(mac_address='AA:BB:CC:DD:EE:01') == by_comment
+    assert match_machine_equipment(mac_address='aa-bb-cc-dd-ee-02') == by_sernum
+    assert match_machine_equipment(mac_address='AA:BB:CC:DD:EE:03') is None